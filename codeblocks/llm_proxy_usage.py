@@ -9,6 +9,9 @@ import time
 import json
 import requests
 
+# The LLM proxy runs locally (on port 4000, unless the sandbox has assigned it a different port)
+LLM_PROXY_URL = "http://localhost:" + os.environ.get("LLM_PROXY_PORT", "4000")
+
 # Get an LLM response from the LLM proxy
 # Returns a tuple of (success:bool, responseText:str)
 # If 'success' is FALSE, the program should probably stop making LLM calls, exit, and the issue should be investigated.
@@ -46,7 +49,7 @@ def llm_response(prompt:str, model:str, temperature:float=0, max_tokens:int=100,
     }
 
     # Send this packet to the LLM proxy, at localhost:4000, and wait for the response
-    response = requests.post("http://localhost:4000/chat/completions", json=packet)
+    response = requests.post(LLM_PROXY_URL + "/chat/completions", json=packet)
     response = response.json()
 
     # Check for an error response from the proxy
@@ -92,7 +95,7 @@ def llm_get_embedding(strings_to_embed:list[str], model:str):
     }
 
     # Send this packet to the LLM proxy, at localhost:4000, and wait for the response
-    response = requests.post("http://localhost:4000/embeddings", json=packet)
+    response = requests.post(LLM_PROXY_URL + "/embeddings", json=packet)
     response = response.json()
 
     # Check for an error response from the proxy
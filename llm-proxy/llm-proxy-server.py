@@ -1,14 +1,18 @@
 # llm-proxy-server.py
+# An (asyncio) proxy between the experiment code and the LLM APIs, that keeps track of (and limits) the cost of the LLM calls.  The LLM calls are made
+# with litellm's async API, so many parallel requests can be in flight at once, up to a configurable limit (`LLM_PROXY_MAX_CONCURRENT_REQUESTS`).
 
-import http.server
-import socketserver
+import asyncio
+import hashlib
 import json
 import litellm
-import signal
 import threading
 import os
+from aiohttp import web
 
-PORT = 4000
+PORT = int(os.environ.get("LLM_PROXY_PORT", 4000))     # Overridable, so that several sandboxes can run on the same host
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("LLM_PROXY_MAX_CONCURRENT_REQUESTS", 64))     # The maximum number of LLM calls in flight at once (any others wait their turn)
+MAX_REQUEST_SIZE_BYTES = 100 * 1024 * 1024
 FILENAME_API_KEYS = "api_keys.donotcommit.json"
 
 # Keep track of any errors, to stop early if something is wrong
@@ -25,28 +29,69 @@ MAX_COST_USD = 0.00     # The maximum cost.  If zero, all calls will be refused.
 ALLOWED_LLMS = None     # If 'None', all LLMs are allowed. If a list, only the LLMs in the list are allowed.
 RESTRICTED_LLMS = None  # If 'None', no LLMs are restricted. If a list, the LLMs in the list are restricted.
 
+# RESPONSE CACHE (optional, enabled with `response_cache` in the experiment setup)
+# Deterministic requests (i.e. temperature 0, and all embedding requests) are answered from a cache of previous responses, if the same request has been
+# made before.  The cache is saved next to the proxy (in `llm-proxy/`), and the experiment runner carries it over to the next run of the experiment as an
+# opaque file -- NOTE: not in `retain/`, since retained files are parsed into the experiment's history, and the cache can be several megabytes.
+FILENAME_RESPONSE_CACHE = "llm-proxy-response-cache.json"     # Relative to the run path (i.e. `llm-proxy/`)
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_ALLOW_NONZERO_TEMPERATURE = False    # If True, requests with a temperature above zero are cached too (i.e. they'll always get the same response)
+RESPONSE_CACHE_MAX_BYTES = 4 * 1024 * 1024          # Kept below the sandbox's maximum downloadable file size.  The oldest responses are removed first.
+
+# The folder that the setup is read from, and the usage is written to.  The proxy can be kept running between several runs of an experiment's code
+# (in a warm sandbox), in which case each run sets its own folder (see `/start-run`).
+RUN_PATH = "."
+PREVIOUS_RUNS_COST_USD = 0.0    # The total cost of any previous runs served by this proxy
+NUM_RUNS = 1
+
 # Load the experiment setup
-try:
-    with open(FILENAME_EXPERIMENT_SETUP, 'r') as f:
-        print("Loading LLM proxy experiment setup...")
-        experiment_setup = json.load(f)
-        if ("max_cost_usd" in experiment_setup):
-            MAX_COST_USD = experiment_setup["max_cost_usd"]
-            print("Maximum cost for this experiment: " + str(MAX_COST_USD))
-        if ("allowed_llms" in experiment_setup):
-            ALLOWED_LLMS = experiment_setup["allowed_llms"]
-            print("Allowed LLMs for this experiment: " + str(ALLOWED_LLMS))
-        if ("restricted_llms" in experiment_setup):
-            RESTRICTED_LLMS = experiment_setup["restricted_llms"]
-            print("Restricted LLMs for this experiment: " + str(RESTRICTED_LLMS))
-except FileNotFoundError:
-    print("WARNING: Experiment setup file not found. LLM access will not be available through this proxy.")
+def load_experiment_setup():
+    global MAX_COST_USD
+    global ALLOWED_LLMS
+    global RESTRICTED_LLMS
+    global RESPONSE_CACHE_ENABLED
+    global RESPONSE_CACHE_ALLOW_NONZERO_TEMPERATURE
+    global RESPONSE_CACHE_MAX_BYTES
+    try:
+        with open(os.path.join(RUN_PATH, FILENAME_EXPERIMENT_SETUP), 'r') as f:
+            print("Loading LLM proxy experiment setup...")
+            experiment_setup = json.load(f)
+            if ("max_cost_usd" in experiment_setup):
+                MAX_COST_USD = experiment_setup["max_cost_usd"]
+                print("Maximum cost for this experiment: " + str(MAX_COST_USD))
+            if ("allowed_llms" in experiment_setup):
+                ALLOWED_LLMS = experiment_setup["allowed_llms"]
+                print("Allowed LLMs for this experiment: " + str(ALLOWED_LLMS))
+            if ("restricted_llms" in experiment_setup):
+                RESTRICTED_LLMS = experiment_setup["restricted_llms"]
+                print("Restricted LLMs for this experiment: " + str(RESTRICTED_LLMS))
+            if ("response_cache" in experiment_setup) and (type(experiment_setup["response_cache"]) == dict):
+                RESPONSE_CACHE_ENABLED = (experiment_setup["response_cache"].get("enabled", False) == True)
+                RESPONSE_CACHE_ALLOW_NONZERO_TEMPERATURE = (experiment_setup["response_cache"].get("allow_nonzero_temperature", False) == True)
+                if ("max_size_mb" in experiment_setup["response_cache"]):
+                    RESPONSE_CACHE_MAX_BYTES = int(experiment_setup["response_cache"]["max_size_mb"] * 1024 * 1024)
+                print("Response cache for this experiment: " + ("enabled" if RESPONSE_CACHE_ENABLED else "disabled") + " (cache responses with temperature > 0: " + str(RESPONSE_CACHE_ALLOW_NONZERO_TEMPERATURE) + ")")
+    except FileNotFoundError:
+        print("WARNING: Experiment setup file not found. LLM access will not be available through this proxy.")
+
+load_experiment_setup()
 
 # DEFAULT COST INFORMATION
 # If an LLM isn't specified in the cost information, we'll use these default values
 DEFAULT_COST_PER_1M_TOKENS = 20.0   # A very high cost -- generally higher than most LLMs, to be safe
 DEFAULT_COST_PER_1M_TOKENS_EMBEDDING = 1.0   # A very high cost -- generally higher than most embedding models, to be safe
 
+# EMBEDDINGS
+# Large embedding requests are split into batches (that providers accept), which are sent concurrently, and the results reassembled in order.
+EMBEDDING_BATCH_SIZE = int(os.environ.get("LLM_PROXY_EMBEDDING_BATCH_SIZE", 256))   # The maximum number of inputs per request to the provider
+# Token counts for embeddings are taken from the provider's `usage`.  If a provider doesn't report them, they're counted with tiktoken (if available),
+# or estimated from the length of the text.
+try:
+    import tiktoken
+    EMBEDDING_TOKENIZER = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    EMBEDDING_TOKENIZER = None
+
 
 # The total cost of all LLM usage so far.
 TOTAL_LLM_COST = 0.0            # Running cost
@@ -56,8 +101,170 @@ LLM_COST_EXCEEDED = False       # Flag to indicate if the cost has been exceeded
 if (TOTAL_LLM_COST >= MAX_COST_USD):
     LLM_COST_EXCEEDED = True
 
-# A threading lock to make sure the usage information isn't being read/written to by more than one thread at a time.
+# The LLM cost information (loaded once, at startup), and the usage information.  The usage is kept in memory (so that the budget check is always exact,
+# and there's no disk I/O per request), and written to the usage file periodically, whenever the cost limit is reached, and when the proxy stops.
+LLM_COST_INFO = {}
+LLM_USAGE_INFO = None
+LLM_USAGE_CHANGED = False       # Whether the usage has changed since it was last written
+USAGE_FLUSH_INTERVAL_SEC = float(os.environ.get("LLM_PROXY_USAGE_FLUSH_INTERVAL_SEC", 1.0))
+
+# A threading lock to make sure the usage information isn't being read/written to by more than one thread at a time.  (The usage file is written in a
+# worker thread, so that the event loop isn't blocked.)
 LLM_USAGE_LOCK = threading.Lock()
+LLM_USAGE_FILE_LOCK = threading.Lock()      # Held while writing the usage file, so that an older version is never written after a newer one
+
+
+# Make a new (empty) usage record
+def make_empty_usage_information():
+    return {"metadata": {"total_cost_usd": 0.0, "max_cost_usd": MAX_COST_USD, "llm_cost_exceeded": False, "num_errors": 0, "num_cost_quota_refusals": 0}, "usage": {}}
+
+# Load the LLM cost information, and any existing usage information, for the current run (RUN_PATH).  NOTE: Call with LLM_USAGE_LOCK held (or at startup).
+def load_usage_information():
+    global LLM_COST_INFO
+    global LLM_USAGE_INFO
+    global LLM_USAGE_CHANGED
+
+    try:
+        with open(os.path.join(RUN_PATH, FILENAME_LLM_COST), 'r') as f:
+            LLM_COST_INFO = json.load(f)
+    except FileNotFoundError:
+        LLM_COST_INFO = {}
+
+    try:
+        with open(os.path.join(RUN_PATH, FILENAME_LLM_USAGE), 'r') as f:
+            LLM_USAGE_INFO = json.load(f)
+    except FileNotFoundError:
+        LLM_USAGE_INFO = make_empty_usage_information()
+    LLM_USAGE_CHANGED = False
+
+load_usage_information()
+
+# Get the usage information to write (if it's changed), as (filename, JSON string).  Returns None if there's nothing new to write.
+# NOTE: Call with LLM_USAGE_LOCK held.
+def pack_usage_information():
+    global LLM_USAGE_CHANGED
+    if (not LLM_USAGE_CHANGED):
+        return None
+    LLM_USAGE_CHANGED = False
+    return (os.path.join(RUN_PATH, FILENAME_LLM_USAGE), json.dumps(LLM_USAGE_INFO, indent=4))
+
+# Write the usage information (from pack_usage_information()), or the response cache (from pack_response_cache()), to disk.  Written to a temporary file
+# first, so that a reader never sees a partial file.
+def write_packed_file(packed):
+    if (packed is None):
+        return
+    filename, usage_json = packed
+    with LLM_USAGE_FILE_LOCK:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + ".tmp", 'w') as f:
+            f.write(usage_json)
+        os.replace(filename + ".tmp", filename)
+
+# Write the usage information (and the response cache) to disk, if they've changed since they were last written
+def flush_usage_information():
+    with LLM_USAGE_LOCK:
+        packed = [pack_usage_information(), pack_response_cache()]
+    for packedFile in packed:
+        write_packed_file(packedFile)
+
+
+#
+#   Response cache
+#
+
+RESPONSE_CACHE = {}             # Request key -> response (in the order they were added, so the oldest can be removed first)
+RESPONSE_CACHE_SIZES = {}       # Request key -> size of the response (in bytes, as JSON)
+RESPONSE_CACHE_TOTAL_BYTES = 0
+RESPONSE_CACHE_CHANGED = False
+
+# Load the response cache for the current run (RUN_PATH), if it's enabled.  NOTE: Call with LLM_USAGE_LOCK held (or at startup).
+def load_response_cache():
+    global RESPONSE_CACHE
+    global RESPONSE_CACHE_SIZES
+    global RESPONSE_CACHE_TOTAL_BYTES
+    global RESPONSE_CACHE_CHANGED
+
+    RESPONSE_CACHE = {}
+    RESPONSE_CACHE_SIZES = {}
+    RESPONSE_CACHE_TOTAL_BYTES = 0
+    RESPONSE_CACHE_CHANGED = False
+    if (not RESPONSE_CACHE_ENABLED):
+        return
+    try:
+        with open(os.path.join(RUN_PATH, FILENAME_RESPONSE_CACHE), 'r') as f:
+            entries = json.load(f).get("entries", {})
+        for key, response_data in entries.items():
+            add_to_response_cache(key, response_data, changed=False)
+        print("Loaded " + str(len(RESPONSE_CACHE)) + " cached LLM responses.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print("WARNING: Could not load the LLM response cache (starting with an empty cache): " + str(e))
+
+# Get the cache key for a request -- or None, if the request shouldn't be cached (i.e. it's not deterministic)
+def get_response_cache_key(path:str, request_data:dict):
+    if (not RESPONSE_CACHE_ENABLED):
+        return None
+    if (path != '/embeddings') and (not RESPONSE_CACHE_ALLOW_NONZERO_TEMPERATURE):
+        temperature = request_data.get("temperature", None)
+        if (type(temperature) not in [int, float]) or (temperature != 0):
+            return None
+    # Normalize the request: keys that aren't set don't change the request, the order of the keys doesn't matter, and neither does `0` vs `0.0`
+    normalized = {key: value for key, value in request_data.items() if (value is not None)}
+    if (type(normalized.get("temperature", None)) in [int, float]):
+        normalized["temperature"] = float(normalized["temperature"])
+    return hashlib.sha256((path + "\n" + json.dumps(normalized, sort_keys=True, separators=(",", ":"))).encode("utf-8")).hexdigest()
+
+# Add a response to the cache, removing the oldest responses if the cache is too large.  NOTE: Call with LLM_USAGE_LOCK held.
+def add_to_response_cache(key:str, response_data:dict, changed:bool=True):
+    global RESPONSE_CACHE_TOTAL_BYTES
+    global RESPONSE_CACHE_CHANGED
+    response_json = json.dumps(response_data)
+    if (len(response_json) > RESPONSE_CACHE_MAX_BYTES):
+        return
+    if (key in RESPONSE_CACHE):
+        del RESPONSE_CACHE[key]
+        RESPONSE_CACHE_TOTAL_BYTES -= RESPONSE_CACHE_SIZES.pop(key)
+    RESPONSE_CACHE[key] = json.loads(response_json)     # A copy, so that later changes to the response (e.g. adding the cost keys) aren't cached
+    RESPONSE_CACHE_SIZES[key] = len(response_json)
+    RESPONSE_CACHE_TOTAL_BYTES += len(response_json)
+    while (RESPONSE_CACHE_TOTAL_BYTES > RESPONSE_CACHE_MAX_BYTES):
+        oldest = next(iter(RESPONSE_CACHE))
+        del RESPONSE_CACHE[oldest]
+        RESPONSE_CACHE_TOTAL_BYTES -= RESPONSE_CACHE_SIZES.pop(oldest)
+    if (changed):
+        RESPONSE_CACHE_CHANGED = True
+
+# Count a cache hit/miss in the usage information.  NOTE: Call with LLM_USAGE_LOCK held.
+def count_response_cache_lookup(model_name, hit:bool):
+    global LLM_USAGE_CHANGED
+    cache_info = LLM_USAGE_INFO["metadata"].setdefault("response_cache", {"hits": 0, "misses": 0})
+    llm_usage = LLM_USAGE_INFO["usage"].setdefault(model_name, {})
+    if (hit):
+        cache_info["hits"] += 1
+        llm_usage["num_cache_hits"] = llm_usage.get("num_cache_hits", 0) + 1
+    else:
+        cache_info["misses"] += 1
+    LLM_USAGE_CHANGED = True
+
+# Look up a request in the cache.  Returns the cached response (a copy), or None.
+def get_cached_response(key:str, model_name):
+    with LLM_USAGE_LOCK:
+        response_data = RESPONSE_CACHE.get(key, None)
+        count_response_cache_lookup(model_name, hit=(response_data is not None))
+        if (response_data is None):
+            return None
+        return json.loads(json.dumps(response_data))
+
+# Get the response cache to write (if it's changed), as (filename, JSON string).  NOTE: Call with LLM_USAGE_LOCK held.
+def pack_response_cache():
+    global RESPONSE_CACHE_CHANGED
+    if (not RESPONSE_CACHE_CHANGED):
+        return None
+    RESPONSE_CACHE_CHANGED = False
+    return (os.path.join(RUN_PATH, FILENAME_RESPONSE_CACHE), json.dumps({"entries": RESPONSE_CACHE}))
+
+load_response_cache()
 
 # Load the API keys and set them as environment variables
 try:
@@ -77,440 +284,462 @@ except FileNotFoundError:
 
 
 
-# Main handler for the proxy server
-class Handler(http.server.BaseHTTPRequestHandler):
-
-    # NOTE: Needs to allow only one thread at a time, to avoid competing writes.
-    def save_cost_information(self, num_tokens_prompt, num_tokens_completion, model_name, embedding:bool=False, num_embeddings:int=0):
-        global TOTAL_LLM_COST
-        global LLM_COST_EXCEEDED
-
-        with LLM_USAGE_LOCK:    # Acquire the lock to make sure we're the only thread reading/writing to the usage information.
-            # Step 1: Import the LLM cost information
-            try:
-                with open(FILENAME_LLM_COST, 'r') as f:
-                    llm_cost = json.load(f)
-            except FileNotFoundError:
-                llm_cost = {}
-
-            # Step 2: Import the LLM usage information
-            try:
-                with open(FILENAME_LLM_USAGE, 'r') as f:
-                    llm_usage_info = json.load(f)
-            except FileNotFoundError:
-                llm_usage_info = {"metadata": {"total_cost_usd": 0.0, "max_cost_usd": MAX_COST_USD, "llm_cost_exceeded": False, "num_errors": 0, "num_cost_quota_refusals": 0}, "usage": {}}
-
-            llm_usage_metadata = llm_usage_info["metadata"]
-            llm_usage = llm_usage_info["usage"]
-
-            # Step 3: Update the LLM usage information
-            # Step 3A: First, update the token counts
-            if (model_name in llm_usage):
-                if (embedding == False):
-                    if ("prompt_tokens" not in llm_usage[model_name]):
-                        llm_usage[model_name]["prompt_tokens"] = num_tokens_prompt
-                    else:
-                        llm_usage[model_name]["prompt_tokens"] += num_tokens_prompt
-
-                    if ("completion_tokens" not in llm_usage[model_name]):
-                        llm_usage[model_name]["completion_tokens"] = num_tokens_completion
-                    else:
-                        llm_usage[model_name]["completion_tokens"] += num_tokens_completion
-
-                    if ("number_of_requests" not in llm_usage[model_name]):
-                        llm_usage[model_name]["number_of_requests"] = 1
-                    else:
-                        llm_usage[model_name]["number_of_requests"] += 1
-                else:
-                    if ("num_embedding_requests" not in llm_usage[model_name]):
-                        llm_usage[model_name]["num_embedding_requests"] = num_embeddings
-                    else:
-                        llm_usage[model_name]["num_embedding_requests"] += num_embeddings
 
-            else:
-                if (embedding == False):
-                    llm_usage[model_name] = {
-                        "prompt_tokens": num_tokens_prompt,
-                        "completion_tokens": num_tokens_completion,
-                        "number_of_requests": 1,
-                        "cost_usd": 0.0
-                    }
+# Add the tokens used by a request to the (in-memory) usage information, and update the total cost.  Returns True if this request reached the cost limit.
+def save_cost_information(num_tokens_prompt, num_tokens_completion, model_name, embedding:bool=False, num_embeddings:int=0):
+    global TOTAL_LLM_COST
+    global LLM_COST_EXCEEDED
+    global LLM_USAGE_CHANGED
+
+    with LLM_USAGE_LOCK:    # Acquire the lock to make sure we're the only thread reading/writing to the usage information.
+        # Step 1: The LLM cost information, and the usage information so far
+        llm_cost = LLM_COST_INFO
+        llm_usage_info = LLM_USAGE_INFO
+        llm_usage = llm_usage_info["usage"]
+        limit_reached = False
+
+        # Step 2: Update the LLM usage information
+        # Step 2A: First, update the token counts
+        if (model_name in llm_usage):
+            if (embedding == False):
+                if ("prompt_tokens" not in llm_usage[model_name]):
+                    llm_usage[model_name]["prompt_tokens"] = num_tokens_prompt
                 else:
-                    llm_usage[model_name] = {
-                        "embedding_model": True,
-                        "num_embedding_requests": num_embeddings,
-                        "cost_usd": 0.0
-                    }
-
-            # Step 3B: Next, update the total cost
-            cost_per_1M_prompt_tokens = 0.0
-            cost_per_1M_completion_tokens = 0.0
-            if (model_name in llm_cost):
-                if ("embedding_model" not in llm_usage[model_name]) or (llm_usage[model_name]["embedding_model"] == False):
-                    cost_per_1M_prompt_tokens = llm_cost[model_name]["cost_per_1M_prompt_tokens"]
-                    cost_per_1M_completion_tokens = llm_cost[model_name]["cost_per_1M_completion_tokens"]
-                    # Calculate the cost for all tokens so far
-                    cost_prompt = (float(llm_usage[model_name]["prompt_tokens"]) / 1000000) * cost_per_1M_prompt_tokens
-                    cost_completion = (float(llm_usage[model_name]["completion_tokens"]) / 1000000) * cost_per_1M_completion_tokens
-                    llm_usage[model_name]["cost_usd"] = round(cost_prompt + cost_completion, 4)
+                    llm_usage[model_name]["prompt_tokens"] += num_tokens_prompt
+
+                if ("completion_tokens" not in llm_usage[model_name]):
+                    llm_usage[model_name]["completion_tokens"] = num_tokens_completion
                 else:
-                    cost_per_1M_tokens = llm_cost[model_name]["cost_per_1M_tokens"]
-                    # Calculate the cost for all tokens so far
-                    # Just estimate at 8192 tokens per request
-                    num_tokens = 8192 * llm_usage[model_name]["num_embedding_requests"]
-                    cost_embedding = (float(num_tokens) / 1000000) * cost_per_1M_tokens
-                    llm_usage[model_name]["cost_usd"] = round(cost_embedding, 4)
+                    llm_usage[model_name]["completion_tokens"] += num_tokens_completion
 
-            else:
-                if ("embedding_model" not in llm_usage[model_name]) or (llm_usage[model_name]["embedding_model"] == False):
-                    # If we don't have cost information for this LLM, use the default (high) cost
-                    cost_per_1M_prompt_tokens = DEFAULT_COST_PER_1M_TOKENS
-                    cost_per_1M_completion_tokens = DEFAULT_COST_PER_1M_TOKENS
-                    # Calculate the cost for all tokens so far
-                    cost_prompt = (float(llm_usage[model_name]["prompt_tokens"]) / 1000000) * cost_per_1M_prompt_tokens
-                    cost_completion = (float(llm_usage[model_name]["completion_tokens"]) / 1000000) * cost_per_1M_completion_tokens
-                    llm_usage[model_name]["cost_usd_estimate"] = round(cost_prompt + cost_completion, 4)  # Note, uses a different key to mark that this is only an estimated cost
+                if ("number_of_requests" not in llm_usage[model_name]):
+                    llm_usage[model_name]["number_of_requests"] = 1
                 else:
-                    # If we don't have cost information for the embedding model, use the default (high) cost
-                    cost_per_1M_tokens = DEFAULT_COST_PER_1M_TOKENS_EMBEDDING
-                    # Calculate the cost for all tokens so far
-                    # Just estimate at 8192 tokens per request
-                    num_tokens = 8192 * llm_usage[model_name]["num_embedding_requests"]
-                    cost_embedding = (float(num_tokens) / 1000000) * cost_per_1M_tokens
-                    llm_usage[model_name]["cost_usd_estimate"] = round(cost_embedding, 4)  # Note, uses a different key to mark that this is only an estimated cost
-
-
-            # Calculate the total cost
-            total_cost = 0.0
-            for llm in llm_usage:
-                if ("cost_usd" in llm_usage[llm]):
-                    total_cost += llm_usage[llm]["cost_usd"]
-                if ("cost_usd_estimate" in llm_usage[llm]):
-                    total_cost += llm_usage[llm]["cost_usd_estimate"]
-            llm_usage_info["metadata"]["total_cost_usd"] = round(total_cost, 4)
-            TOTAL_LLM_COST = total_cost
-
-            # Check to see if the limit was met or exceeded
-            if (total_cost >= MAX_COST_USD):
-                llm_usage_info["metadata"]["llm_cost_exceeded"] = True
-                LLM_COST_EXCEEDED = True
-
-            # Count the number of errors
-            num_errors = 0
-            num_cost_quota_refusals = 0
-            for llm in llm_usage:
-                if ("num_errors" in llm_usage[llm]):
-                    num_errors += llm_usage[llm]["num_errors"]
-                if ("num_cost_quota_refusals" in llm_usage[llm]):
-                    num_cost_quota_refusals += llm_usage[llm]["num_cost_quota_refusals"]
-            llm_usage_info["metadata"]["num_errors"] = num_errors
-            llm_usage_info["metadata"]["num_cost_quota_refusals"] = num_cost_quota_refusals
-
-
-            # Step 4: Save the updated LLM usage information
-            with open(FILENAME_LLM_USAGE, 'w') as f:
-                packed = {"metadata": llm_usage_metadata, "usage": llm_usage}
-                json.dump(packed, f, indent=4)
-
-
-    # Another method that marks whether specific models have had errors, in the usage information.
-    def mark_error(self, model_name, generic_error:bool, exceeded_cost_quota:bool):
-        with LLM_USAGE_LOCK:
-            # Step 1: Import the LLM usage information
-            try:
-                with open(FILENAME_LLM_USAGE, 'r') as f:
-                    llm_usage_info = json.load(f)
-            except FileNotFoundError:
-                llm_usage_info = {"metadata": {"total_cost_usd": 0.0, "max_cost_usd": MAX_COST_USD, "llm_cost_exceeded": False}, "usage": {}}
-
-            llm_usage_metadata = llm_usage_info["metadata"]
-            llm_usage = llm_usage_info["usage"]
-
-            # Step 2: Mark the error
-            if (model_name not in llm_usage):
-                llm_usage[model_name] = {
-                    "num_errors": 0,
-                    "num_cost_quota_refusals": 0
-                }
+                    llm_usage[model_name]["number_of_requests"] += 1
             else:
-                if ("num_errors" not in llm_usage[model_name]):
-                    llm_usage[model_name]["num_errors"] = 0
-                if ("num_cost_quota_refusals" not in llm_usage[model_name]):
-                    llm_usage[model_name]["num_cost_quota_refusals"] = 0
-
-            if (generic_error):
-                llm_usage[model_name]["num_errors"] += 1
-            if (exceeded_cost_quota):
-                llm_usage[model_name]["num_cost_quota_refusals"] += 1
-
-            # Count the number of errors
-            num_errors = 0
-            num_cost_quota_refusals = 0
-            for llm in llm_usage:
-                if ("num_errors" in llm_usage[llm]):
-                    num_errors += llm_usage[llm]["num_errors"]
-                if ("num_cost_quota_refusals" in llm_usage[llm]):
-                    num_cost_quota_refusals += llm_usage[llm]["num_cost_quota_refusals"]
-            llm_usage_info["metadata"]["num_errors"] = num_errors
-            llm_usage_info["metadata"]["num_cost_quota_refusals"] = num_cost_quota_refusals
-
-            # Step 3: Save the updated LLM usage information
-            with open(FILENAME_LLM_USAGE, 'w') as f:
-                packed = {"metadata": llm_usage_metadata, "usage": llm_usage}
-                json.dump(packed, f, indent=4)
-
-
-
-    def do_POST(self):
-        global errors
-
-        print("Received a request: " + self.path)
-
-        #print("Received a request:")
-        #print(f"Method: {self.command}")
-        #print(f"Path: {self.path}")
-        #print("Headers:")
-        #for key, value in self.headers.items():
-        #    print(f"{key}: {value}")
-
-        # Read and print the request body
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length)
-        print("Body:")
-        print(body.decode('utf-8'))
-
-        # Parse the request body as JSON
-        try:
-            request_data = json.loads(body.decode('utf-8'))
-        except json.JSONDecodeError:
-            print("400: Invalid JSON")
-            self.send_error(400, 'Invalid JSON')
-            return
-
-        # ERROR CHECKING: Check if the cost limit is exceeded -- if so, return an error.
-        cost_exceeded = False
-        with LLM_USAGE_LOCK:
-            cost_exceeded = LLM_COST_EXCEEDED
+                llm_usage[model_name]["embedding_model"] = True     # (The entry may have been added by an error, or a cache hit)
+                if ("num_embedding_requests" not in llm_usage[model_name]):
+                    llm_usage[model_name]["num_embedding_requests"] = num_embeddings
+                else:
+                    llm_usage[model_name]["num_embedding_requests"] += num_embeddings
 
-        if (cost_exceeded):
-            errorStr = "ERROR: Cost limit exceeded ($" + str(round(MAX_COST_USD, 2)) + "). No further requests will be processed."
-            print(errorStr)
-            errors.append(errorStr)
+                if ("embedding_tokens" not in llm_usage[model_name]):
+                    llm_usage[model_name]["embedding_tokens"] = num_tokens_prompt
+                else:
+                    llm_usage[model_name]["embedding_tokens"] += num_tokens_prompt
 
-            # Keep track of these types of errors
-            model_name = "unknown"
-            if ("model" in request_data):
-                model_name = request_data["model"]
-            self.mark_error(model_name, generic_error=False, exceeded_cost_quota=True)
-
-            # Prepare the error response
-            error_response = {
-                'error': {
-                    'message': errorStr,
-                    'type': 'cost_limit_exceeded',
-                    'param': None,
-                    'code': None
-                }
-            }
-            response_json = json.dumps(error_response)
-
-            # Send error response
-            self.send_response(402)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
-            self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
-            return
-
-
-        # ERROR CHECKING: Check if the number of errors exceeds the maximum allowed.
-        if (len(errors) >= MAX_ERRORS):
-            # Prepare the error response
-            error_response = {
-                'error': {
-                    'message': "Too many LLM errors have occurred (" + len(errors) + "), which exceeds the maximum threshold. No further requests will be processed.",
-                    'type': 'too_many_errors',
-                    'param': None,
-                    'code': None
+        else:
+            if (embedding == False):
+                llm_usage[model_name] = {
+                    "prompt_tokens": num_tokens_prompt,
+                    "completion_tokens": num_tokens_completion,
+                    "number_of_requests": 1,
+                    "cost_usd": 0.0
                 }
-            }
-            response_json = json.dumps(error_response)
-
-            # Send error response
-            self.send_response(402)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
-            self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
-            return
-
-
-        # Prepare a response based on the endpoint
-        try:
-            if self.path == '/chat/completions' or self.path == '/completions':
-                # Forward the request to litellm.completion
-                response = litellm.completion(**request_data, drop_params=True)
-
-                # Convert the ModelResponse object to a dictionary
-                response_data = response.to_dict()
-
-            elif self.path == '/embeddings':
-                # Forward the request to litellm.embedding
-                response = litellm.embedding(**request_data, drop_params=True)
-
-                # Convert the ModelResponse object to a dictionary
-                response_data = response.to_dict()
-
             else:
-                # Default response for other endpoints
-                response_data = {'message': 'Endpoint not supported'}
-
-        # Catch BadRequestError and send back an error in OpenAI API error format
-        except litellm.BadRequestError as e:
-            # Add to the errors
-            errorStr = "ERROR: BadRequestError occurred: " + e.message
-            print(errorStr)
-            errors.append(errorStr)
-
-            # Keep track of these types of errors
-            model_name = "unknown"
-            if ("model" in request_data):
-                model_name = request_data["model"]
-            self.mark_error(model_name, generic_error=True, exceeded_cost_quota=False)
-
-            # Prepare the error response
-            error_response = {
-                'error': {
-                    'message': e.message,
-                    'type': 'invalid_request',
-                    'param': e.param,
-                    'code': e.code
+                llm_usage[model_name] = {
+                    "embedding_model": True,
+                    "num_embedding_requests": num_embeddings,
+                    "embedding_tokens": num_tokens_prompt,
+                    "cost_usd": 0.0
                 }
-            }
-            response_json = json.dumps(error_response)
 
-            # Send error response
-            self.send_response(400)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
-            self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
-            return
-
-
-        except Exception as e:
-            # Add to the errors
-            errorStr = "ERROR: Exception occurred: " + str(e)
-            print(errorStr)
-            errors.append(errorStr)
-
-            # Keep track of these types of errors
-            model_name = "unknown"
-            if ("model" in request_data):
-                model_name = request_data["model"]
-            self.mark_error(model_name, generic_error=True, exceeded_cost_quota=False)
-
-            # Log the exception (optional)
-            print(f"Exception occurred: {e}")
-
-            # If an exception occurs, send back an error in OpenAI API error format
-            error_response = {
-                'error': {
-                    'message': 'An internal error occurred.',
-                    'type': 'internal_error',
-                    'param': None,
-                    'code': None
-                }
-            }
-            response_json = json.dumps(error_response)
-
-            # Send error response
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
-            self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
-            return
-
-        # Parse the response for token/costing information.
-        if (self.path == '/chat/completions' or self.path == '/completions'):
-            num_tokens_prompt = 0
-            num_tokens_completion = 0
-            if ("usage" in response_data) and ("prompt_tokens" in response_data["usage"]):
-                num_tokens_prompt = response_data["usage"]["prompt_tokens"]
-            if ("usage" in response_data) and ("completion_tokens" in response_data["usage"]):
-                num_tokens_completion = response_data["usage"]["completion_tokens"]
-
-            # If the number of tokens in the prompt and/or completion are zero, this is likely an error -- keep track of these, so we can exit early if something is wrong.
-            if (num_tokens_prompt == 0) or (num_tokens_completion == 0):
-                errorStr = "WARNING: Number of tokens in prompt or completion is zero. This may indicate an error."
-                print(errorStr)
-                errors.append(errorStr)
-
-            # Save the token/costing information
-            model_name = "unknown"
-            if ("model" in request_data):
-                model_name = request_data["model"]
-            self.save_cost_information(num_tokens_prompt, num_tokens_completion, model_name)
-
-            # Add the cost keys to the response data
-            response_data["cost"] = {
-                "total_running_cost_usd": TOTAL_LLM_COST,
-                "llm_cost_limit_usd": MAX_COST_USD,
-                "llm_cost_exceeded": LLM_COST_EXCEEDED
+        # Step 2B: Next, update the total cost
+        cost_per_1M_prompt_tokens = 0.0
+        cost_per_1M_completion_tokens = 0.0
+        if (model_name in llm_cost):
+            if ("embedding_model" not in llm_usage[model_name]) or (llm_usage[model_name]["embedding_model"] == False):
+                cost_per_1M_prompt_tokens = llm_cost[model_name]["cost_per_1M_prompt_tokens"]
+                cost_per_1M_completion_tokens = llm_cost[model_name]["cost_per_1M_completion_tokens"]
+                # Calculate the cost for all tokens so far
+                cost_prompt = (float(llm_usage[model_name]["prompt_tokens"]) / 1000000) * cost_per_1M_prompt_tokens
+                cost_completion = (float(llm_usage[model_name]["completion_tokens"]) / 1000000) * cost_per_1M_completion_tokens
+                llm_usage[model_name]["cost_usd"] = round(cost_prompt + cost_completion, 4)
+            else:
+                cost_per_1M_tokens = llm_cost[model_name]["cost_per_1M_tokens"]
+                # Calculate the cost for all tokens so far
+                num_tokens = llm_usage[model_name].get("embedding_tokens", 0)
+                cost_embedding = (float(num_tokens) / 1000000) * cost_per_1M_tokens
+                llm_usage[model_name]["cost_usd"] = round(cost_embedding, 4)
+
+        else:
+            if ("embedding_model" not in llm_usage[model_name]) or (llm_usage[model_name]["embedding_model"] == False):
+                # If we don't have cost information for this LLM, use the default (high) cost
+                cost_per_1M_prompt_tokens = DEFAULT_COST_PER_1M_TOKENS
+                cost_per_1M_completion_tokens = DEFAULT_COST_PER_1M_TOKENS
+                # Calculate the cost for all tokens so far
+                cost_prompt = (float(llm_usage[model_name]["prompt_tokens"]) / 1000000) * cost_per_1M_prompt_tokens
+                cost_completion = (float(llm_usage[model_name]["completion_tokens"]) / 1000000) * cost_per_1M_completion_tokens
+                llm_usage[model_name]["cost_usd_estimate"] = round(cost_prompt + cost_completion, 4)  # Note, uses a different key to mark that this is only an estimated cost
+            else:
+                # If we don't have cost information for the embedding model, use the default (high) cost
+                cost_per_1M_tokens = DEFAULT_COST_PER_1M_TOKENS_EMBEDDING
+                # Calculate the cost for all tokens so far
+                num_tokens = llm_usage[model_name].get("embedding_tokens", 0)
+                cost_embedding = (float(num_tokens) / 1000000) * cost_per_1M_tokens
+                llm_usage[model_name]["cost_usd_estimate"] = round(cost_embedding, 4)  # Note, uses a different key to mark that this is only an estimated cost
+
+
+        # Calculate the total cost
+        total_cost = 0.0
+        for llm in llm_usage:
+            if ("cost_usd" in llm_usage[llm]):
+                total_cost += llm_usage[llm]["cost_usd"]
+            if ("cost_usd_estimate" in llm_usage[llm]):
+                total_cost += llm_usage[llm]["cost_usd_estimate"]
+        llm_usage_info["metadata"]["total_cost_usd"] = round(total_cost, 4)
+        if (NUM_RUNS > 1):
+            llm_usage_info["metadata"]["previous_runs_cost_usd"] = round(PREVIOUS_RUNS_COST_USD, 4)
+        TOTAL_LLM_COST = total_cost
+
+        # Check to see if the limit was met or exceeded
+        if (total_cost >= MAX_COST_USD):
+            llm_usage_info["metadata"]["llm_cost_exceeded"] = True
+            limit_reached = (LLM_COST_EXCEEDED == False)
+            LLM_COST_EXCEEDED = True
+
+        # Count the number of errors
+        num_errors = 0
+        num_cost_quota_refusals = 0
+        for llm in llm_usage:
+            if ("num_errors" in llm_usage[llm]):
+                num_errors += llm_usage[llm]["num_errors"]
+            if ("num_cost_quota_refusals" in llm_usage[llm]):
+                num_cost_quota_refusals += llm_usage[llm]["num_cost_quota_refusals"]
+        llm_usage_info["metadata"]["num_errors"] = num_errors
+        llm_usage_info["metadata"]["num_cost_quota_refusals"] = num_cost_quota_refusals
+
+        # Step 3: Mark the usage information as changed (it's written to disk by flush_usage_information())
+        LLM_USAGE_CHANGED = True
+        return limit_reached
+
+
+# Another method that marks whether specific models have had errors, in the (in-memory) usage information.
+def mark_error(model_name, generic_error:bool, exceeded_cost_quota:bool):
+    global LLM_USAGE_CHANGED
+
+    with LLM_USAGE_LOCK:
+        # Step 1: The LLM usage information so far
+        llm_usage_info = LLM_USAGE_INFO
+        llm_usage = llm_usage_info["usage"]
+
+        # Step 2: Mark the error
+        if (model_name not in llm_usage):
+            llm_usage[model_name] = {
+                "num_errors": 0,
+                "num_cost_quota_refusals": 0
             }
+        else:
+            if ("num_errors" not in llm_usage[model_name]):
+                llm_usage[model_name]["num_errors"] = 0
+            if ("num_cost_quota_refusals" not in llm_usage[model_name]):
+                llm_usage[model_name]["num_cost_quota_refusals"] = 0
+
+        if (generic_error):
+            llm_usage[model_name]["num_errors"] += 1
+        if (exceeded_cost_quota):
+            llm_usage[model_name]["num_cost_quota_refusals"] += 1
+
+        # Count the number of errors
+        num_errors = 0
+        num_cost_quota_refusals = 0
+        for llm in llm_usage:
+            if ("num_errors" in llm_usage[llm]):
+                num_errors += llm_usage[llm]["num_errors"]
+            if ("num_cost_quota_refusals" in llm_usage[llm]):
+                num_cost_quota_refusals += llm_usage[llm]["num_cost_quota_refusals"]
+        llm_usage_info["metadata"]["num_errors"] = num_errors
+        llm_usage_info["metadata"]["num_cost_quota_refusals"] = num_cost_quota_refusals
+
+        # Step 3: Mark the usage information as changed (it's written to disk by flush_usage_information())
+        LLM_USAGE_CHANGED = True
+
+
+# Start a new run (of the experiment code), when the proxy is kept running between runs: read the setup from, and write the usage to, the given
+# folder, and start counting the cost (and errors) for the new run from zero.  The cost of the previous runs is kept in `previous_runs_cost_usd`.
+def start_run(request_data:dict):
+    global RUN_PATH
+    global TOTAL_LLM_COST
+    global LLM_COST_EXCEEDED
+    global PREVIOUS_RUNS_COST_USD
+    global NUM_RUNS
+    global errors
+
+    with LLM_USAGE_LOCK:
+        # Any usage (or cached responses) of the previous run that haven't been written yet are written to the previous run's folder
+        packed_previous_run = [pack_usage_information(), pack_response_cache()]
+
+        PREVIOUS_RUNS_COST_USD += TOTAL_LLM_COST
+        NUM_RUNS += 1
+        RUN_PATH = request_data.get("path", RUN_PATH)
+        load_experiment_setup()
+        load_usage_information()
+        load_response_cache()
+        TOTAL_LLM_COST = 0.0
+        LLM_COST_EXCEEDED = (TOTAL_LLM_COST >= MAX_COST_USD)
+        errors = []
+        response = {"run": NUM_RUNS, "path": RUN_PATH, "max_cost_usd": MAX_COST_USD, "previous_runs_cost_usd": round(PREVIOUS_RUNS_COST_USD, 4)}
+
+    for packedFile in packed_previous_run:
+        write_packed_file(packedFile)
+    print("Started run " + str(response["run"]) + " (path: " + str(response["path"]) + ", cost of previous runs: $" + str(response["previous_runs_cost_usd"]) + ")")
+    return response
+
+
+# Run a blocking function (e.g. writing the usage file) in a worker thread, without blocking the event loop
+async def run_blocking(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: func(*args, **kwargs))
+
+# Send a response (in the OpenAI API format)
+def json_response(data:dict, status:int=200):
+    return web.Response(text=json.dumps(data), status=status, content_type='application/json')
+
+# Send an error response (in the OpenAI API error format)
+def error_response(message:str, error_type:str, status:int, param=None, code=None):
+    return json_response({
+        'error': {
+            'message': message,
+            'type': error_type,
+            'param': param,
+            'code': code
+        }
+    }, status=status)
+
+
+# Count the tokens in some embedding inputs (strings, or lists of token IDs), for providers that don't report them
+def count_embedding_tokens(inputs:list):
+    num_tokens = 0
+    for embedding_input in inputs:
+        if (type(embedding_input) == list):
+            num_tokens += len(embedding_input)
+        elif (EMBEDDING_TOKENIZER is not None):
+            num_tokens += len(EMBEDDING_TOKENIZER.encode(str(embedding_input), disallowed_special=()))
+        else:
+            num_tokens += (len(str(embedding_input)) // 4) + 1     # A rough estimate (~4 characters per token)
+    return num_tokens
+
+# Get the embeddings for a request, splitting its inputs into batches of (at most) EMBEDDING_BATCH_SIZE that are sent concurrently.
+# Returns one response (in the same format as a single request, with the embeddings in the order of the inputs), and the total number of tokens.
+# If any batch fails, the tokens of the batches that succeeded are still counted (they've been paid for), and the error is raised.
+async def get_embeddings_batched(request_data:dict, model_name):
+    inputs = request_data.get("input", [])
+    if (type(inputs) != list) or ((len(inputs) > 0) and (type(inputs[0]) == int)):
+        inputs = [inputs]       # A single input (a string, or one list of token IDs)
+    batches = [inputs[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(inputs), EMBEDDING_BATCH_SIZE)]
+    if (len(batches) == 0):
+        batches = [inputs]
+
+    async def embed_batch(batch:list):
+        async with LLM_REQUEST_SEMAPHORE:
+            response = await litellm.aembedding(**dict(request_data, input=batch), drop_params=True)
+        response_data = response.to_dict()
+        num_tokens = 0
+        if (type(response_data.get("usage", None)) == dict):
+            num_tokens = response_data["usage"].get("prompt_tokens", None) or response_data["usage"].get("total_tokens", None) or 0
+        if (num_tokens == 0):
+            num_tokens = count_embedding_tokens(batch)
+        return response_data, num_tokens
+
+    results = await asyncio.gather(*[embed_batch(batch) for batch in batches], return_exceptions=True)
+
+    # Reassemble the batches (the indices in each batch's response are relative to that batch)
+    response_data = None
+    embeddings = []
+    num_tokens = 0
+    first_exception = None
+    for batch_idx, result in enumerate(results):
+        if (isinstance(result, BaseException)):
+            if (first_exception is None):
+                first_exception = result
+            continue
+        batch_response, batch_tokens = result
+        num_tokens += batch_tokens
+        if (response_data is None):
+            response_data = batch_response
+        for position, embedding in enumerate(batch_response.get("data", [])):
+            embedding["index"] = (batch_idx * EMBEDDING_BATCH_SIZE) + embedding.get("index", position)
+            embeddings.append(embedding)
+
+    if (first_exception is not None):
+        if (num_tokens > 0):
+            save_cost_information(num_tokens, 0, model_name, embedding=True, num_embeddings=sum([len(batches[i]) for i in range(len(batches)) if (not isinstance(results[i], BaseException))]))
+        raise first_exception
+
+    response_data["data"] = sorted(embeddings, key=lambda x: x["index"])
+    response_data["usage"] = {"prompt_tokens": num_tokens, "total_tokens": num_tokens}
+    return response_data, num_tokens
 
-        elif (self.path == '/embeddings'):
-            # Save the token/costing information
-            model_name = "unknown"
-            if ("model" in request_data):
-                model_name = request_data["model"]
-
-            # To keep the proxy light, we'll just assume each embedding request is the max tokens (8192).
-            num_embeddings = 0
-            if ("input" in request_data):
-                num_embeddings = len(request_data["input"])
-
-            num_tokens = 8192 * num_embeddings  # TODO: Use actual count
 
-            self.save_cost_information(0, 0, model_name, embedding=True, num_embeddings=num_embeddings)
-
-            # Add the cost keys to the response data
+# Main handler for the proxy server
+async def handle_post(request):
+    print("Received a request: " + request.path)
+
+    # Parse the request body as JSON
+    try:
+        request_data = json.loads(await request.text())
+    except json.JSONDecodeError:
+        print("400: Invalid JSON")
+        return web.Response(status=400, text='Invalid JSON')
+
+    model_name = "unknown"
+    if (type(request_data) == dict) and ("model" in request_data):
+        model_name = request_data["model"]
+
+    # Starting a new run (warm sandboxes only)
+    if (request.path == '/start-run'):
+        return json_response(await run_blocking(start_run, request_data))
+
+    # ERROR CHECKING: Check if the cost limit is exceeded -- if so, return an error.
+    if (LLM_COST_EXCEEDED):
+        errorStr = "ERROR: Cost limit exceeded ($" + str(round(MAX_COST_USD, 2)) + "). No further requests will be processed."
+        print(errorStr)
+        errors.append(errorStr)
+
+        # Keep track of these types of errors
+        mark_error(model_name, generic_error=False, exceeded_cost_quota=True)
+        return error_response(errorStr, 'cost_limit_exceeded', 402)
+
+    # ERROR CHECKING: Check if the number of errors exceeds the maximum allowed.
+    if (len(errors) >= MAX_ERRORS):
+        return error_response("Too many LLM errors have occurred (" + str(len(errors)) + "), which exceeds the maximum threshold. No further requests will be processed.", 'too_many_errors', 402)
+
+    # Check the response cache (deterministic requests only, if the cache is enabled).  A cached response costs nothing.
+    cache_key = None
+    if (request.path in ['/chat/completions', '/completions', '/embeddings']):
+        cache_key = get_response_cache_key(request.path, request_data)
+    if (cache_key is not None):
+        response_data = get_cached_response(cache_key, model_name)
+        if (response_data is not None):
             response_data["cost"] = {
                 "total_running_cost_usd": TOTAL_LLM_COST,
                 "llm_cost_limit_usd": MAX_COST_USD,
-                "llm_cost_exceeded": LLM_COST_EXCEEDED
+                "llm_cost_exceeded": LLM_COST_EXCEEDED,
+                "cached_response": True
             }
+            print("200: Response sent (from the response cache).")
+            return json_response(response_data)
+
+    # Prepare a response based on the endpoint
+    try:
+        if request.path == '/chat/completions' or request.path == '/completions':
+            # Forward the request to litellm.acompletion
+            async with LLM_REQUEST_SEMAPHORE:
+                response = await litellm.acompletion(**request_data, drop_params=True)
+
+            # Convert the ModelResponse object to a dictionary
+            response_data = response.to_dict()
+
+        elif request.path == '/embeddings':
+            # Forward the request to litellm.aembedding (in batches, if it's large)
+            response_data, num_tokens_embedding = await get_embeddings_batched(request_data, model_name)
+
+        else:
+            # Default response for other endpoints
+            response_data = {'message': 'Endpoint not supported'}
+
+    # Catch BadRequestError and send back an error in OpenAI API error format
+    except litellm.BadRequestError as e:
+        # Add to the errors
+        errorStr = "ERROR: BadRequestError occurred: " + e.message
+        print(errorStr)
+        errors.append(errorStr)
+
+        # Keep track of these types of errors
+        mark_error(model_name, generic_error=True, exceeded_cost_quota=False)
+        return error_response(e.message, 'invalid_request', 400, param=getattr(e, "param", None), code=getattr(e, "code", None))
+
+    except Exception as e:
+        # Add to the errors
+        errorStr = "ERROR: Exception occurred: " + str(e)
+        print(errorStr)
+        errors.append(errorStr)
+
+        # Keep track of these types of errors
+        mark_error(model_name, generic_error=True, exceeded_cost_quota=False)
+
+        # If an exception occurs, send back an error in OpenAI API error format
+        return error_response('An internal error occurred.', 'internal_error', 500)
+
+    # Add the response to the cache (before the cost keys are added)
+    if (cache_key is not None):
+        with LLM_USAGE_LOCK:
+            add_to_response_cache(cache_key, response_data)
+
+    # Parse the response for token/costing information.
+    if (request.path == '/chat/completions' or request.path == '/completions'):
+        num_tokens_prompt = 0
+        num_tokens_completion = 0
+        if ("usage" in response_data) and ("prompt_tokens" in response_data["usage"]):
+            num_tokens_prompt = response_data["usage"]["prompt_tokens"]
+        if ("usage" in response_data) and ("completion_tokens" in response_data["usage"]):
+            num_tokens_completion = response_data["usage"]["completion_tokens"]
+
+        # If the number of tokens in the prompt and/or completion are zero, this is likely an error -- keep track of these, so we can exit early if something is wrong.
+        if (num_tokens_prompt == 0) or (num_tokens_completion == 0):
+            errorStr = "WARNING: Number of tokens in prompt or completion is zero. This may indicate an error."
+            print(errorStr)
+            errors.append(errorStr)
 
-        # Convert the response data to JSON
-        response_json = json.dumps(response_data)
-
-        # Send response
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Content-Length', str(len(response_json)))
-        self.end_headers()
-        self.wfile.write(response_json.encode('utf-8'))
-        print("200: Response sent.")
-
-
-# Function to handle graceful shutdown
-def signal_handler(sig, frame):
-    print("\nShutting down gracefully...")
-    httpd.shutdown()  # Stop the server
+        # Save the token/costing information (and write it to disk right away if this request reached the cost limit)
+        if (save_cost_information(num_tokens_prompt, num_tokens_completion, model_name)):
+            await run_blocking(flush_usage_information)
+
+        # Add the cost keys to the response data
+        response_data["cost"] = {
+            "total_running_cost_usd": TOTAL_LLM_COST,
+            "llm_cost_limit_usd": MAX_COST_USD,
+            "llm_cost_exceeded": LLM_COST_EXCEEDED
+        }
+
+    elif (request.path == '/embeddings'):
+        num_embeddings = len(response_data.get("data", []))
+
+        # Save the token/costing information (and write it to disk right away if this request reached the cost limit)
+        if (save_cost_information(num_tokens_embedding, 0, model_name, embedding=True, num_embeddings=num_embeddings)):
+            await run_blocking(flush_usage_information)
+
+        # Add the cost keys to the response data
+        response_data["cost"] = {
+            "total_running_cost_usd": TOTAL_LLM_COST,
+            "llm_cost_limit_usd": MAX_COST_USD,
+            "llm_cost_exceeded": LLM_COST_EXCEEDED
+        }
+
+    # Send response
+    print("200: Response sent.")
+    return json_response(response_data)
+
+
+# Limits the number of LLM calls in flight at once (created when the server starts, so that it belongs to the server's event loop)
+LLM_REQUEST_SEMAPHORE = None
+
+async def on_startup(app):
+    global LLM_REQUEST_SEMAPHORE
+    LLM_REQUEST_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    app["usage_flush_task"] = asyncio.create_task(flush_usage_periodically())
+    print("Serving at port " + str(PORT) + " (at most " + str(MAX_CONCURRENT_REQUESTS) + " concurrent LLM requests)")
+
+# Write the usage information to disk every few seconds (if it's changed)
+async def flush_usage_periodically():
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL_SEC)
+        try:
+            await run_blocking(flush_usage_information)
+        except Exception as e:
+            print("ERROR: Could not write the LLM usage information: " + str(e))
+
+# When the server stops, write any usage that hasn't been written yet
+async def on_shutdown(app):
+    app["usage_flush_task"].cancel()
+    flush_usage_information()
+    print("LLM usage information saved.")
+
+
+# Start the server.  (Handles SIGINT (Ctrl+C) and SIGTERM (termination) by shutting down gracefully.)
+if __name__ == "__main__":
+    app = web.Application(client_max_size=MAX_REQUEST_SIZE_BYTES)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.router.add_post('/{tail:.*}', handle_post)
+    web.run_app(app, port=PORT, print=None)
     print("Server has been stopped.")
-
-# Set up signal handling for SIGINT (Ctrl+C) and SIGTERM (termination)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
-# Start the server in a separate thread to allow for graceful shutdown
-with socketserver.ThreadingTCPServer(("", PORT), Handler) as httpd:
-    print(f"Serving at port {PORT}")
-
-    # Run the server in a separate thread
-    server_thread = threading.Thread(target=httpd.serve_forever)
-    server_thread.start()
-
-    # Wait for the server thread to complete
-    server_thread.join()
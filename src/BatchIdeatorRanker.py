@@ -78,7 +78,7 @@ def convert_to_simpler_idea(idea, model_str:str, condition_on_codeblocks:bool=Tr
     # Load the codeblock store
     codeblockStore = None
     if (condition_on_codeblocks):
-        codeblockStore = CodeBlockStore(PATH_CODEBLOCKS)
+        codeblockStore = getCodeBlockStore(PATH_CODEBLOCKS)
 
 
     # Original ID
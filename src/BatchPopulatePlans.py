@@ -28,8 +28,8 @@ def loadBenchmark(filenameIn:str):
 
 
 def populate_operationalization_one_idea_simple_method(idea:dict, model_str:str, extra_conditioning_text:str=None, include_expert_notes:bool=False):
-        # Load a copy of the ideastore
-        ideaStore = IdeaStore()
+        # Get the (shared) ideastore
+        ideaStore = getIdeaStore()
 
         # Sanitize the idea
         import copy
@@ -441,6 +441,9 @@ def main(filename_ideastore_benchmark:str, conditioning_text:str, batch_name:str
 
     run_in_threads(randomized_paper_sets, model_str, ideator_to_use, ideaStore)
 
+    # New ideas are appended to the idea store's log -- write them all into the idea store file, so it can be read directly (e.g. by the ranker)
+    ideaStore.save_ideas()
+
 
 
 #
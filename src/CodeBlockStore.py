@@ -3,6 +3,7 @@
 import os
 import re
 import tqdm
+import threading
 import difflib
 from copy import deepcopy
 
@@ -13,22 +14,70 @@ PATH_CODEBLOCKS = "codeblocks/"
 FILENAME_CODEBLOCK_SUMMARIES = "codeblock_summaries.json"
 FILENAME_COMMON_LIBRARY = "experiment_common_library.py"
 
+# Shared CodeBlockStore instances (one per codeblock path), so callers don't each have to re-load and re-parse every codeblock
+THREAD_LOCK_SHARED_CODEBLOCKSTORES = threading.Lock()
+shared_codeblockstores = {}
+
+
+# Get the shared (process-wide) CodeBlockStore for a codeblock path.  Codeblock files that were added, changed, or removed since the last call are re-loaded.
+def getCodeBlockStore(path_codeblocks:str=None):
+    if (path_codeblocks is None):
+        path_codeblocks = PATH_CODEBLOCKS
+    key = os.path.abspath(path_codeblocks)
+    with THREAD_LOCK_SHARED_CODEBLOCKSTORES:
+        if (key not in shared_codeblockstores):
+            shared_codeblockstores[key] = CodeBlockStore(path_codeblocks)
+            return shared_codeblockstores[key]
+        codeblockStore = shared_codeblockstores[key]
+    # Pick up any changes to the codeblock files
+    codeblockStore.refresh()
+    return codeblockStore
+
+
 # Class to load/store the codeblocks
 class CodeBlockStore():
     # Constructor
     def __init__(self, path_codeblocks):
         self.path_codeblocks = path_codeblocks
         self.codeblocks = []
+        self.codeblocks_by_name = {}        # Index: codeblock name -> codeblock
+        self.codeblock_files = {}           # Filename -> (modification time, size, parsed codeblock), so unchanged files aren't re-parsed
+        self.summaries_mtime = None
+        self.lock = threading.RLock()
 
         # Load the codeblocks
         self.loadCodeblocks()
 
         # Load the codeblock summaries
+        self.summaries_mtime = self._getSummariesMTime()
         self.codeblockSummaries = self.loadCodeblockSummaries(PATH_CODEBLOCKS + "/" + FILENAME_CODEBLOCK_SUMMARIES)
 
         # Summarize any codeblocks without summaries
         self.summarizeAllCodeblocks(justUpdate=True)
         #self.summarizeAllCodeblocks(justUpdate=False)       # Force a complete update
+        self.summaries_mtime = self._getSummariesMTime()
+
+    # Get the modification time of the codeblock summaries file (or None if it doesn't exist)
+    def _getSummariesMTime(self):
+        try:
+            return os.stat(PATH_CODEBLOCKS + "/" + FILENAME_CODEBLOCK_SUMMARIES).st_mtime_ns
+        except OSError:
+            return None
+
+    # Re-load any codeblock files that were added/changed/removed (and the summaries, if they changed on disk) since they were last loaded.
+    # Only the files' modification times are checked, so this is cheap when nothing has changed.
+    def refresh(self):
+        with self.lock:
+            codeblocksChanged = self.loadCodeblocks()
+
+            summariesMTime = self._getSummariesMTime()
+            summariesChanged = (summariesMTime != self.summaries_mtime)
+            if (summariesChanged):
+                self.codeblockSummaries = self.loadCodeblockSummaries(PATH_CODEBLOCKS + "/" + FILENAME_CODEBLOCK_SUMMARIES)
+
+            if (codeblocksChanged or summariesChanged):
+                self.summarizeAllCodeblocks(justUpdate=True)
+                self.summaries_mtime = self._getSummariesMTime()
 
     # Get a (string listing of) the common library
     def getCommonLibrary(self):
@@ -53,26 +102,54 @@ class CodeBlockStore():
 
     # Get a codeblock by name
     def getCodeblockByName(self, name):
-        for codeblock in self.codeblocks:
-            if ("name" in codeblock) and (codeblock["name"] is not None) and (codeblock["name"] == name):
-                return codeblock
-        return None
+        return self.codeblocks_by_name.get(name, None)
 
-    # Load the codeblocks
+    # Load the codeblocks.  Files that haven't changed since they were last loaded aren't re-read.  Returns True if any codeblock files were added, changed, or removed.
     def loadCodeblocks(self):
-        # Recursively find all .py files in the codeblocks directory
-        print("* Loading codeblocks from: " + self.path_codeblocks)
-        numCodeblocksAdded = 0
-        for root, dirs, files in os.walk(self.path_codeblocks):
-            for file in files:
-                if file.endswith(".py"):
-                    # Load the codeblock
-                    parsedCodeblock = self.loadCodeblock(os.path.join(root, file))
-                    if (parsedCodeblock is not None):
-                        self.codeblocks.append(parsedCodeblock)
-                        numCodeblocksAdded += 1
-
-        print("* Added " + str(numCodeblocksAdded) + " codeblocks from: " + self.path_codeblocks)
+        with self.lock:
+            # Recursively find all .py files in the codeblocks directory
+            changed = False
+            codeblocks = []
+            codeblockFiles = {}
+            for root, dirs, files in os.walk(self.path_codeblocks):
+                for file in files:
+                    if file.endswith(".py"):
+                        filename = os.path.join(root, file)
+                        try:
+                            stat = os.stat(filename)
+                        except OSError:
+                            continue
+                        cached = self.codeblock_files.get(filename, None)
+                        if (cached is not None) and (cached[0] == stat.st_mtime_ns) and (cached[1] == stat.st_size):
+                            parsedCodeblock = cached[2]
+                        else:
+                            # Load the codeblock
+                            parsedCodeblock = self.loadCodeblock(filename)
+                            changed = True
+                        codeblockFiles[filename] = (stat.st_mtime_ns, stat.st_size, parsedCodeblock)
+                        if (parsedCodeblock is not None):
+                            codeblocks.append(parsedCodeblock)
+
+            # Check for removed files
+            if (len(codeblockFiles) != len(self.codeblock_files)):
+                changed = True
+
+            if (not changed):
+                return False
+
+            # Rebuild the name index (if two codeblocks have the same name, the first one found is used)
+            codeblocksByName = {}
+            for codeblock in codeblocks:
+                if ("name" in codeblock) and (codeblock["name"] is not None) and (codeblock["name"] not in codeblocksByName):
+                    codeblocksByName[codeblock["name"]] = codeblock
+
+            # Swap in the new lists (so concurrent readers always see a complete list)
+            self.codeblocks = codeblocks
+            self.codeblocks_by_name = codeblocksByName
+            self.codeblock_files = codeblockFiles
+
+            print("* Loaded " + str(len(codeblocks)) + " codeblocks from: " + self.path_codeblocks)
+            return True
 
 
 
@@ -310,7 +387,8 @@ class CodeBlockStore():
     #
 
     # Combine the codeblocks for a particular purpose
-    def combineCodeblocks(self, instructionStr:str, codeblockNames:list, modelStr="gpt-4o-mini", max_tokens=4096, temperature=0.0, additionalInstructionStr:str=""):
+    # useCache: Passed to getLLMResponseJSON (None uses the default cache policy, False bypasses the LLM response cache, e.g. when retrying after a bad response)
+    def combineCodeblocks(self, instructionStr:str, codeblockNames:list, modelStr="gpt-4o-mini", max_tokens=4096, temperature=0.0, additionalInstructionStr:str="", useCache:bool=None):
         # First, try to retrieve all the codeblocks mentioned
         retrievedCodeblocks = []
         retrievedCodeblockDict = {}
@@ -423,7 +501,7 @@ class CodeBlockStore():
 
 
         # Now, get the response from the LLM
-        responseJSON, responseText, cost = getLLMResponseJSON(promptStr=prompt, model=modelStr, maxTokens=max_tokens, temperature=temperature, jsonOut=False)
+        responseJSON, responseText, cost = getLLMResponseJSON(promptStr=prompt, model=modelStr, maxTokens=max_tokens, temperature=temperature, jsonOut=False, useCache=useCache)
 
         # Parse the codeblocks
         requirements = None
@@ -433,7 +511,8 @@ class CodeBlockStore():
         # Check if `responseJSON` is None -- if it is, there was some kind of error.  Try again once more
         if (success is False):
             print("ERROR: Could not extract codeblocks from response.  Trying again once more.")
-            responseJSON, responseText, cost_ = getLLMResponseJSON(promptStr=prompt, model=modelStr, maxTokens=max_tokens, temperature=temperature, jsonOut=False)
+            # NOTE: Bypass the LLM response cache here, otherwise the (cached) response that just failed to parse would be returned again
+            responseJSON, responseText, cost_ = getLLMResponseJSON(promptStr=prompt, model=modelStr, maxTokens=max_tokens, temperature=temperature, jsonOut=False, useCache=False)
             cost += cost_
             success, requirements, code = self.parseRequirementsAndCodeFromLLM(responseText)
 
@@ -630,27 +709,65 @@ class CodeBlockStore():
 
     # This is a general function for trimming -- use the logging-specific one for logs.
     def trimPromptComponent(self, componentIn:str, maxTokens:int=10000):
-        lines = componentIn.split('\n')
         # If it's below the max tokens, return it
         token_count = countTokens(componentIn)
         if (token_count <= maxTokens):
             return componentIn
 
         # If it's above the max tokens, try to trim it
-        # Try to trim the lines from the middle out
+        # Try to trim the lines from the middle out.  Each line is tokenized once, and the size of the trimmed component (for a given window size) is
+        # estimated from prefix sums of those counts, so the smallest window that fits can be found with a binary search.
+        lines = componentIn.split('\n')
+        numLines = len(lines)
+        middleIdx = numLines // 2
+        tokenCountsPerLine = countTokensBatch([line + "\n" for line in lines])
+        tokenPrefixSums = [0] * (numLines + 1)
+        for idx in range(numLines):
+            tokenPrefixSums[idx+1] = tokenPrefixSums[idx] + tokenCountsPerLine[idx]
+        token_count_marker = countTokens("# (Up to " + str(numLines) + " lines trimmed for space)\n")
+
+        # Trim out the middle lines, +/- windowSize
+        def getTrimBounds(windowSize:int):
+            return max(0, middleIdx - windowSize), min(numLines, middleIdx + windowSize)
+
+        def trimWithWindow(windowSize:int):
+            trimStartIdx, trimEndIdx = getTrimBounds(windowSize)
+            trimmedLines = lines[:trimStartIdx] + ["# (Up to " + str(windowSize) + " lines trimmed for space)"] + lines[trimEndIdx:]
+            return "\n".join(trimmedLines)
+
+        def estimateWithWindow(windowSize:int):
+            trimStartIdx, trimEndIdx = getTrimBounds(windowSize)
+            return tokenPrefixSums[trimStartIdx] + token_count_marker + (tokenPrefixSums[numLines] - tokenPrefixSums[trimEndIdx])
+
+        # Smallest window size (at least `minWindowSize`) whose estimated token count is within `targetTokens`
+        def findWindowSize(targetTokens:int, minWindowSize:int):
+            lo = minWindowSize
+            hi = numLines - 1
+            if (estimateWithWindow(hi) > targetTokens):
+                return hi
+            while (lo < hi):
+                mid = (lo + hi) // 2
+                if (estimateWithWindow(mid) <= targetTokens):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return lo
+
+        # The estimate can be a little off (tokens can merge across line boundaries), so check the actual token count -- and if it's too high,
+        # lower the target by the difference and search again (with a larger window)
         windowSize = 1
+        targetTokens = maxTokens
         trimmedComponent = ""
-        while (token_count > maxTokens) and (windowSize < len(lines)):
-            # Trim out the middle lines, +/- windowSize
-            trimmedLines = []
-            middleIdx = len(lines) // 2
-            trimStartIdx = max(0, middleIdx - windowSize)
-            trimEndIdx = min(len(lines), middleIdx + windowSize)
-            trimmedLines = lines[:trimStartIdx] + ["# (Up to " + str(windowSize) + " lines trimmed for space)"] + lines[trimEndIdx:]
-            trimmedComponent = "\n".join(trimmedLines)
+        MAX_ATTEMPTS = 10
+        for attempt in range(MAX_ATTEMPTS):
+            if (windowSize >= numLines):
+                break
+            windowSize = findWindowSize(targetTokens, windowSize)
+            trimmedComponent = trimWithWindow(windowSize)
             token_count = countTokens(trimmedComponent)
-
-            # Increase the window size
+            if (token_count <= maxTokens):
+                break
+            targetTokens -= (token_count - maxTokens)
             windowSize += 1
 
         if (token_count > maxTokens):
@@ -660,7 +777,10 @@ class CodeBlockStore():
         return trimmedComponent
 
     # This is a function for trimming the log file, that (tries to) keeps all things marked as 'error', since those are likely high-importance.
+    # The log entries are tokenized once (each on its own), and the trimmed sizes are estimated from prefix sums of those counts -- so finding the window
+    # to trim (a binary search) doesn't re-count anything.  Only the final trimmed log is tokenized as a whole.
     def trimPromptComponentLog(self, logIn:list, maxTokens:int=10000):
+        import bisect
         print("Trimming log with " + str(len(logIn)) + " lines to fit within " + str(maxTokens) + " tokens.")
         # Each element in the log is a dictionary with two keys: `type` and `message`.  We want to, at a minimum, keep all `error` types.
         # First, check if the log is already below the token limit
@@ -672,113 +792,110 @@ class CodeBlockStore():
             print("##########################################")
             return ["ERROR: component provided to `trimPromptComponentLog` is not a list (type is " + str(type(logIn)) + ")"]
 
-        token_count = countTokens(json.dumps(logIn, indent=4))
+        logStr = json.dumps(logIn, indent=4)
+        token_count = countTokens(logStr)
         if (token_count <= maxTokens):
-            return json.dumps(logIn, indent=4)
+            return logStr
         initial_token_count = token_count
+        numLines = len(logIn)
 
-        # Pre-compute the token counts for each line -- this is a slow step, so if we pre-compute it, it speeds everything up.
-        #tokenCountsPerLine = []
-        tokenCountsPerLine = [0] * len(logIn)
-        for idx in range(len(logIn)):
-            tokenCountsPerLine[idx] = countTokens(json.dumps(logIn[idx], indent=4))
+        # Pre-compute the token counts for each line (the only per-line tokenization), and their prefix sums
+        tokenCountsPerLine = countTokensBatch([json.dumps(logEntry, indent=4) for logEntry in logIn])
+        tokenPrefixSums = [0] * (numLines + 1)
+        for idx in range(numLines):
+            tokenPrefixSums[idx+1] = tokenPrefixSums[idx] + tokenCountsPerLine[idx]
+
+        # Index the entries with type `error` (these are kept, even in the trimmed part of the log), and the prefix sums of their token counts
+        errorIndices = []
+        for idx, logEntry in enumerate(logIn):
+            try:
+                if (logEntry["type"].lower() == "error"):
+                    errorIndices.append(idx)
+            except:
+                pass
+        errorPrefixSums = [0] * (len(errorIndices) + 1)
+        for i, idx in enumerate(errorIndices):
+            errorPrefixSums[i+1] = errorPrefixSums[i] + tokenCountsPerLine[idx]
 
         messageJSON = [{"type": "meta", "message": "# (Up to " + str(1234567890) + " lines trimmed for space, but messages with type `error` retained)"}]
         token_count_message = countTokens(json.dumps(messageJSON, indent=4))
 
-        # If it's above the max tokens, try to trim it
-        # Try to trim the lines from the middle out
-        windowSize = 1
-        trimmedLog = []
-        iterations = 0
-        windowSizeStep = 1
-        if (len(logIn) > 10000):
-            windowSizeStep = len(logIn) // 1000
-
-        while (token_count > maxTokens) and (windowSize < len(logIn)):
-            iterations += 1
-            #print("Iteration: " + str(iterations))
-
-            # Trim out the middle lines, +/- windowSize
-            trimmedLog = []
-
-            # Find the boundaries of the part of the middle that we'll trim out
-            middleIdx = len(logIn) // 2
-            trimStartIdx = max(0, middleIdx - windowSize)
-            trimEndIdx = min(len(logIn), middleIdx + windowSize)
-
-            # But, we have to keep the errors
-            middleErrors = []
-            middleErrorTokenCounts = []
-            token_count_middle_errors = 0
-            for middleIdx1 in range(trimStartIdx, trimEndIdx):
-                logEntry = logIn[middleIdx1]
-                try:
-                    if (logEntry["type"].lower() == "error"):
-                        middleErrors.append(logEntry)
-                        middleErrorTokenCounts.append(tokenCountsPerLine[middleIdx1])
-                        token_count_middle_errors += tokenCountsPerLine[middleIdx1]
-                except:
-                    pass
-            # If the number of tokens in the middle errors ends up being more than 25% of the message, then start subsampling the middle errors (just include the ones at the start and end)
-            if (token_count_middle_errors > 0.25 * maxTokens):
-                #print("*** Token count of middle errors is more than 25% of the message.  Subsampling the middle errors.")
-
-                # Try to ratchet it up a bit
-                middleWindowSize = 1
-                found = False
-                for middleWindowSize in range(1, len(middleErrors)//2):
-                    candidateMiddleErrors = middleErrors[:middleWindowSize] + middleErrors[-middleWindowSize:]
-                    # Use middleErrorTokenCounts
-                    token_count_candidate_middle_errors = sum(middleErrorTokenCounts[:middleWindowSize]) + sum(middleErrorTokenCounts[-middleWindowSize:])
-                    if (token_count_candidate_middle_errors > 0.25 * maxTokens):
-                        found = True
-                        break
-
-                #print("Window size: " + str(middleWindowSize))
-
-                # If we still can't get it down, then just take the first and last 5
-                if (found == True):
-                    middleErrors = middleErrors[:middleWindowSize] + middleErrors[-middleWindowSize:]
-                    token_count_candidate_middle_errors = sum(middleErrorTokenCounts[:middleWindowSize]) + sum(middleErrorTokenCounts[-middleWindowSize:])
-
-                else:
-                    min_middle_errors = 5
-                    if (len(middleErrors) < 2 * min_middle_errors):
-                        min_middle_errors = len(middleErrors) // 2
-
-                    middleErrors = middleErrors[:min_middle_errors] + middleErrors[-min_middle_errors:]
-                    token_count_candidate_middle_errors = sum(middleErrorTokenCounts[:middleWindowSize]) + sum(middleErrorTokenCounts[-middleWindowSize:])
-
-                token_count_middle_errors = token_count_candidate_middle_errors
-
+        MINIMUM_LINES_TO_INCLUDE = 20       # If we have less than this many lines, stop trimming the log.
+        middleIdx = numLines // 2
+
+        # The part of the middle that's trimmed out, for a given window size
+        def getTrimBounds(windowSize:int):
+            return max(0, middleIdx - windowSize), min(numLines, middleIdx + windowSize)
+
+        # Which of the error entries (positions in `errorIndices`) inside the trimmed part to keep, and their token count.
+        # If there are too many (more than 25% of the token limit), only the ones at the start and end of the trimmed part are kept.
+        def getMiddleErrors(trimStartIdx:int, trimEndIdx:int):
+            errorStart = bisect.bisect_left(errorIndices, trimStartIdx)
+            errorEnd = bisect.bisect_left(errorIndices, trimEndIdx)
+            numMiddleErrors = errorEnd - errorStart
+            # Token count of the first/last `n` middle errors (with the same semantics as slicing `[:n]` and `[-n:]`)
+            def tokensFirst(n:int):
+                return errorPrefixSums[errorStart + min(n, numMiddleErrors)] - errorPrefixSums[errorStart]
+            def tokensLast(n:int):
+                if (n == 0):
+                    return errorPrefixSums[errorEnd] - errorPrefixSums[errorStart]
+                return errorPrefixSums[errorEnd] - errorPrefixSums[errorEnd - min(n, numMiddleErrors)]
+
+            allPositions = list(range(errorStart, errorEnd))
+            token_count_middle_errors = tokensFirst(numMiddleErrors)
+            if (token_count_middle_errors <= 0.25 * maxTokens):
+                return allPositions, token_count_middle_errors
+
+            # Find the smallest number of errors from each end that exceeds 25% of the token limit (the token count grows with the number of errors, so this is a binary search)
+            lo = 1
+            hi = (numMiddleErrors // 2) - 1
+            if (lo <= hi) and (tokensFirst(hi) + tokensLast(hi) > 0.25 * maxTokens):
+                while (lo < hi):
+                    mid = (lo + hi) // 2
+                    if (tokensFirst(mid) + tokensLast(mid) > 0.25 * maxTokens):
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                return allPositions[:lo] + allPositions[-lo:], tokensFirst(lo) + tokensLast(lo)
+
+            # If we still can't get it down, then just take the first and last 5
+            min_middle_errors = 5
+            if (numMiddleErrors < 2 * min_middle_errors):
+                min_middle_errors = numMiddleErrors // 2
+            middleWindowSize = max(1, (numMiddleErrors // 2) - 1)
+            return allPositions[:min_middle_errors] + allPositions[-min_middle_errors:], tokensFirst(middleWindowSize) + tokensLast(middleWindowSize)
+
+        # Is the (estimated) trimmed log small enough with this window size?
+        def fitsWithWindow(windowSize:int):
+            trimStartIdx, trimEndIdx = getTrimBounds(windowSize)
+            _, token_count_middle_errors = getMiddleErrors(trimStartIdx, trimEndIdx)
             # Add the token counts from the first half and second half, plus any that we have to keep in the middle (that are 'errors')
-            token_count_first_half = sum(tokenCountsPerLine[:trimStartIdx])
-            token_count_second_half = sum(tokenCountsPerLine[trimEndIdx:])
-
-            token_count_estimate = token_count_first_half + token_count_message + token_count_middle_errors + token_count_second_half
-
+            token_count_estimate = tokenPrefixSums[trimStartIdx] + token_count_message + token_count_middle_errors + (tokenPrefixSums[numLines] - tokenPrefixSums[trimEndIdx])
             # Count the number of lines that are included
-            numLinesIncluded = trimStartIdx + (len(logIn) - trimEndIdx)
-
-            MINIMUM_LINES_TO_INCLUDE = 20       # If we have less than this many lines, stop trimming the log.
-            if (token_count_estimate > maxTokens) and (numLinesIncluded > 20):
-                # If the estimate is too high, then increase the window size
-                #windowSize += 1
-                windowSize += windowSizeStep        # Makes it faster for large log files
-                continue
+            numLinesIncluded = trimStartIdx + (numLines - trimEndIdx)
+            return (token_count_estimate <= maxTokens) or (numLinesIncluded <= MINIMUM_LINES_TO_INCLUDE)
 
-            #print("Window: 0 -> " + str(trimStartIdx) + " and " + str(trimEndIdx) + " -> " + str(len(logIn)) + " (including " + str(len(middleErrors)) + " middle errors)")
-            #print("Token count estimate: " + str(token_count_estimate) + " (first_half: " + str(token_count_first_half) + ", message: " + str(token_count_message) + ", middle_errors: " + str(token_count_middle_errors) + ", second_half: " + str(token_count_second_half) + ")")
+        # Binary search for the smallest window size that fits
+        trimmedLog = []
+        if (numLines > 1):
+            lo = 1
+            hi = numLines - 1           # Always fits (the whole log is trimmed)
+            while (lo < hi):
+                mid = (lo + hi) // 2
+                if (fitsWithWindow(mid)):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            windowSize = lo
 
-            # If we reach here, then the estimate is below the max tokens, so we can assemble the trimmed log
+            # Assemble the trimmed log
+            trimStartIdx, trimEndIdx = getTrimBounds(windowSize)
+            middleErrorPositions, _ = getMiddleErrors(trimStartIdx, trimEndIdx)
+            middleErrors = [logIn[errorIndices[pos]] for pos in middleErrorPositions]
             trimmedLogMiddle = [{"type": "meta", "message": "# (Up to " + str(windowSize) + " lines trimmed for space, but messages with type `error` retained)"}]
             trimmedLogMiddle2 = [{"type": "meta", "message": "# (End of trimming)"}]
             trimmedLog = logIn[:trimStartIdx] + trimmedLogMiddle + middleErrors + trimmedLogMiddle2 + logIn[trimEndIdx:]
 
-            # End here
-            break
-
         # Check the final token count
         token_count = countTokens(json.dumps(trimmedLog, indent=4))
         print("Final token count: " + str(token_count) + " . (Max tokens: " + str(maxTokens) + ", initial_token_count = " + str(initial_token_count) + ")")
@@ -787,34 +904,36 @@ class CodeBlockStore():
         TOKEN_COUNT_TOLERANCE = 1000
         if (token_count > (maxTokens + TOKEN_COUNT_TOLERANCE)):
             print("WARNING: Could not trim the log to fit within the token limit.  Trying back-off method.")
-            # Use a backoff method -- just start adding in lines (alternating from the top/bottom) until we're within the token limit
-            trimmedLog = []
-            logTop = []
-            logBottom = []
-            topIdx = 0
-            bottomIdx = len(logIn) - 1
+            # Use a backoff method -- keep the most lines from the top/bottom (the same number from each) that fit within the token limit
             middleMessage = [{"type": "meta", "message": "# (This is only a partial log -- lines trimmed for space"}]
+            token_count_middle_message = countTokens(json.dumps(middleMessage, indent=4))
+
+            # Estimated token count when keeping `numTop` lines from the top (and `numTop+1` from the bottom)
+            def backoffEstimate(numTop:int):
+                bottomIdx = numLines - 1 - numTop
+                return (2 * token_count_middle_message) + tokenPrefixSums[numTop] + (tokenPrefixSums[numLines] - tokenPrefixSums[bottomIdx])
+
+            # The top and bottom can't meet
+            maxNumTop = max(0, (numLines - 2) // 2)
+            trimmedLog = []
+            if (numLines > 0) and (backoffEstimate(0) < (maxTokens + TOKEN_COUNT_TOLERANCE)):
+                lo = 0
+                hi = maxNumTop
+                while (lo < hi):
+                    mid = (lo + hi + 1) // 2
+                    if (backoffEstimate(mid) < (maxTokens + TOKEN_COUNT_TOLERANCE)):
+                        lo = mid
+                    else:
+                        hi = mid - 1
+                trimmedLog = middleMessage + logIn[:lo] + middleMessage + logIn[numLines - 1 - lo:]
 
-            cycleCount = 0
-            while (token_count < (maxTokens + TOKEN_COUNT_TOLERANCE)) and (cycleCount < 1000):     # Add a hard limit of 1000 cycles here, for the backoff, just in case
-                # Check to see if adding these lines will put us over the token limit
-                logTop = logIn[:topIdx]
-                logBottom = logIn[bottomIdx:]
-                tempTrimmedLog = middleMessage + logTop + middleMessage + logBottom
-                token_count = countTokens(json.dumps(tempTrimmedLog, indent=4))
-                if (token_count < (maxTokens + TOKEN_COUNT_TOLERANCE)):
-                    trimmedLog = tempTrimmedLog
-
-                # Increment the top and bottom indices
-                topIdx += 1
-                bottomIdx -= 1
-
-                # If the top and bottom have met, then break
-                if (topIdx >= bottomIdx):
-                    break
-
-                cycleCount += 1
-                print("Cycle: " + str(cycleCount) + "  Token count: " + str(token_count) + "  Max tokens: " + str(maxTokens) + " topIdx: " + str(topIdx) + " bottomIdx: " + str(bottomIdx))
+                # The estimate counts each line on its own, so it can be a little low -- if the result is still too large, shrink it in proportion (a few times, at most)
+                for attempt in range(5):
+                    token_count = countTokens(json.dumps(trimmedLog, indent=4))
+                    if (token_count < (maxTokens + TOKEN_COUNT_TOLERANCE)) or (lo == 0):
+                        break
+                    lo = int(lo * (maxTokens / token_count))
+                    trimmedLog = middleMessage + logIn[:lo] + middleMessage + logIn[numLines - 1 - lo:]
 
             #return "# WARNING: Could not trim the log to fit within the token limit.  This may mean single lines exceed the token limit.\n" + json.dumps(logIn, indent=4)
 
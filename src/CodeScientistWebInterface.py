@@ -340,12 +340,37 @@ def getKnownCodeblockNames():
 
 # Helper Function: Get a list of all experiments
 def getExperimentList():
+    response_data = getExperimentListPage()
+    if (response_data is None):
+        return None
+    return response_data['experiment_list']
+
+# Helper Function: Get a (filtered, sorted, projected) page of the experiment list -- see the server's `/getexperimentlist` for the parameters.
+# Returns the server's response (`experiment_list`, and the `total` number of matching experiments).
+# The last response for each set of parameters is kept, and is reused (without being sent again) if the server says it hasn't changed.
+MAX_EXPERIMENT_LIST_CACHE_SIZE = 20
+experimentListCache = {}        # parameters -> (ETag, response)
+def getExperimentListPage(params:dict=None):
+    if (params is None):
+        params = {}
+    cacheKey = json.dumps(params, sort_keys=True)
+    cached = experimentListCache.get(cacheKey, None)
+    headers = {}
+    if (cached is not None):
+        headers['If-None-Match'] = cached[0]
     try:
-        response = requests.get('http://localhost:5001/getexperimentlist')
+        response = requests.get('http://localhost:5001/getexperimentlist', params=params, headers=headers)
+        if (response.status_code == 304) and (cached is not None):
+            return cached[1]
         if response.status_code == 200:
             response_data = response.json()
-            experiment_list = response_data['experiment_list']
-            return experiment_list
+            etag = response.headers.get('ETag', None)
+            if (etag is not None):
+                experimentListCache.pop(cacheKey, None)
+                while (len(experimentListCache) >= MAX_EXPERIMENT_LIST_CACHE_SIZE):
+                    experimentListCache.pop(next(iter(experimentListCache)), None)
+                experimentListCache[cacheKey] = (etag, response_data)
+            return response_data
         else:
             put_text(f"Server returned an error: {response.status_code}")
             return None
@@ -1075,9 +1100,10 @@ def showExperimentList():
     # This function just redirects to an endpoint
     run_js('window.location.href="/experimentlist";')
 
+EXPERIMENT_LIST_PAGE_SIZE = 50
+
 @app.route('/experimentlist', methods=['GET', 'POST'])
 def _showExperimentList():
-    experimentList = []
     def pywebio_show():
         # Inject JavaScript to reload the page when navigating back (otherwise table doesn't populate)
         run_js(""" window.onpageshow = function(event) { if (event.persisted) { window.location.reload() } }; """)
@@ -1091,39 +1117,35 @@ def _showExperimentList():
         # Ideation
         put_markdown("# Experiment List")
 
-        # Fetch the list of experiments
-        experimentList = getExperimentList()
-        if (experimentList is None):
-            put_text("Error fetching experiment list.  Is the back-end server running?")
-            return
-
         # Show task queue
         showQueueStatus()
 
-        def show_experiment_table(experimentList):
-            # TODO: Re-enable the sort-by
-            sortBy = pin.sort_by
+        # The page of the experiment list being shown.  The sorting, filtering, and paging are done by the server, which only sends the page being shown.
+        currentPage = {"page": 0}
 
-            # By default, just show them in reverse order of when they were created (which is the order they were added to the list)
-            experimentList = reversed(experimentList)
+        def show_experiment_table(page:int=None):
+            if (page is not None):
+                currentPage["page"] = max(0, page)
 
-            # Perform any sorting
-            experimentListSorted = experimentList
-            if (sortBy == "id_desc"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["id"], reverse=True)
-            elif (sortBy == "id_asc"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["id"], reverse=False)
-            elif (sortBy == "newest_first"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["timestamp_created"], reverse=True)
-            elif (sortBy == "oldest_first"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["timestamp_created"], reverse=False)
-            elif (sortBy == "recently_modified"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["timestamp_finished"], reverse=True)
-            elif (sortBy == "rating_desc"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["rating"], reverse=True)
-            elif (sortBy == "rating_asc"):
-                experimentListSorted = sorted(experimentList, key=lambda x: x["rating"], reverse=False)
-            experimentList = experimentListSorted
+            # Fetch the page of experiments
+            params = {
+                "sort_by": pin.sort_by,
+                "fields": "summary",
+                "offset": currentPage["page"] * EXPERIMENT_LIST_PAGE_SIZE,
+                "limit": EXPERIMENT_LIST_PAGE_SIZE
+            }
+            for filterName in ["status", "batch_name", "created_after", "created_before"]:
+                filterValue = pin["filter_" + filterName]
+                if (filterValue is not None) and (len(filterValue.strip()) > 0):
+                    params[filterName] = filterValue.strip()
+            response_data = getExperimentListPage(params)
+            if (response_data is None):
+                clear('experiment_table_container')
+                with use_scope('experiment_table_container'):
+                    put_text("Error fetching experiment list.  Is the back-end server running?")
+                return
+            experimentList = response_data['experiment_list']
+            total = response_data.get('total', len(experimentList))
 
             # Show the list of experiments in a table -- one row per experiment.  A button should exist for each experiment to view the details.
             tableData = [
@@ -1260,6 +1282,7 @@ def _showExperimentList():
                 showPDF = False
                 pdfLink = ""
                 showFollowOnExperimentButton = False
+                showLiveLog = False
 
                 # Check whether a ZIP file is likely available
                 if (experiment_path is not None):
@@ -1272,6 +1295,8 @@ def _showExperimentList():
                     pdfLink = f"localhost:5001/pdfreport/{uuid}"
                 if (status.startswith("completed") or status.startswith("failed") or status.startswith("interrupted")):
                     showFollowOnExperimentButton = True
+                if (status == "running") and (experiment_path is not None):
+                    showLiveLog = True
 
 
                 # Add the buttons
@@ -1280,6 +1305,8 @@ def _showExperimentList():
                     buttons.append(put_button("Details", onclick=lambda id=uuid: showExperimentDetails(id)))
                 if (showZIP):
                     buttons.append(put_button("ZIP", onclick=lambda id=uuid: getExperimentZIP(id)))
+                if (showLiveLog):
+                    buttons.append(put_button("Live Log", onclick=lambda id=uuid: showExperimentLiveLog(id)))
                 if (showCodeAndResults):
                     buttons.append(put_button("Code & Results", onclick=lambda id=uuid: showExperimentCodeAndResults(id)))
                 if (showPDF):
@@ -1297,6 +1324,14 @@ def _showExperimentList():
             # Update the table content
             clear('experiment_table_container')
             with use_scope('experiment_table_container'):
+                firstShown = currentPage["page"] * EXPERIMENT_LIST_PAGE_SIZE
+                numPages = max(1, (total + EXPERIMENT_LIST_PAGE_SIZE - 1) // EXPERIMENT_LIST_PAGE_SIZE)
+                pageButtons = [put_text("Showing " + str(min(firstShown + 1, total)) + "-" + str(firstShown + len(experimentList)) + " of " + str(total) + " experiments (page " + str(currentPage["page"] + 1) + " of " + str(numPages) + ")")]
+                if (currentPage["page"] > 0):
+                    pageButtons.append(put_button("Previous Page", onclick=lambda: show_experiment_table(currentPage["page"] - 1)))
+                if (firstShown + len(experimentList) < total):
+                    pageButtons.append(put_button("Next Page", onclick=lambda: show_experiment_table(currentPage["page"] + 1)))
+                put_row(pageButtons)
                 put_table(tableData)
 
 
@@ -1315,10 +1350,20 @@ def _showExperimentList():
                                            ], value='newest_first')
         ])
 
-        pin_on_change("sort_by", onchange=lambda _:show_experiment_table(experimentList))
+        # Add filtering options (applied when changed)
+        put_row([
+            put_input('filter_status', label="Status", placeholder="e.g. completed"),
+            put_input('filter_batch_name', label="Batch Name"),
+            put_input('filter_created_after', label="Created On/After", placeholder="YYYY-MM-DD"),
+            put_input('filter_created_before', label="Created Before", placeholder="YYYY-MM-DD")
+        ])
+
+        # Changing the sorting or filtering goes back to the first page
+        for pinName in ["sort_by", "filter_status", "filter_batch_name", "filter_created_after", "filter_created_before"]:
+            pin_on_change(pinName, onchange=lambda _:show_experiment_table(0))
 
         # Show the default table
-        show_experiment_table(experimentList)
+        show_experiment_table(0)
 
     # Get the response from webio_view
     response = webio_view(pywebio_show)()
@@ -1565,6 +1610,80 @@ def _showExperimentCodeAndResults(uuid):
     return response
 
 
+#
+#   Show the live log of a running experiment
+#
+def showExperimentLiveLog(uuid):
+    run_js(f'window.location.href="/experimentlivelog/{uuid}";')
+
+@app.route('/experimentlivelog/<uuid>', methods=['GET', 'POST'])
+def _showExperimentLiveLog(uuid):
+    def pywebio_show():
+        # Clear the output
+        clear()
+
+        # Header
+        showHeader()
+
+        put_markdown("# Experiment Live Log (" + str(uuid) + ")")
+        put_markdown("The output of the most recent run of this experiment's code, updated every few seconds while it runs.")
+        put_scope("live_log_status")
+        put_markdown("## Log")
+        put_scrollable(put_scope("live_log_entries"), height=400, keep_bottom=True)
+        put_markdown("## stdout")
+        put_scrollable(put_scope("live_log_stdout"), height=400, keep_bottom=True)
+        put_markdown("## stderr")
+        put_scrollable(put_scope("live_log_stderr"), height=200, keep_bottom=True)
+
+        # Poll the server for anything new
+        offsets = {"stdout_offset": 0, "stderr_offset": 0, "log_offset": 0}
+        run_folder = None
+        while True:
+            try:
+                response = requests.post('http://localhost:5001/experimentlivelog', json={"experiment_id": uuid, "run_folder": run_folder, **offsets})
+                response_data = response.json()
+            except Exception as e:
+                with use_scope("live_log_status", clear=True):
+                    put_text(f"Error communicating with the server: {str(e)}")
+                return
+
+            if (response.status_code != 200):
+                with use_scope("live_log_status", clear=True):
+                    put_text(response_data.get("error", f"Server returned an error: {response.status_code}"))
+                # The experiment may not have started running its code yet
+                time.sleep(5)
+                continue
+
+            # A new run has started -- the server has read it from the start, so clear the output of the previous run
+            if (run_folder is not None) and (response_data.get("run_folder_changed", False) or (response_data.get("run_folder", None) != run_folder)):
+                for scope_name in ["live_log_entries", "live_log_stdout", "live_log_stderr"]:
+                    clear(scope_name)
+            run_folder = response_data.get("run_folder", None)
+
+            for entry in response_data.get("log", []):
+                put_text(json.dumps(entry), scope="live_log_entries")
+            if (len(response_data.get("stdout", "")) > 0):
+                put_text(response_data["stdout"], scope="live_log_stdout")
+            if (len(response_data.get("stderr", "")) > 0):
+                put_text(response_data["stderr"], scope="live_log_stderr")
+            for key in offsets:
+                offsets[key] = response_data.get(key, offsets[key])
+
+            experimentStatus = response_data.get("status", None)
+            with use_scope("live_log_status", clear=True):
+                put_text("Experiment status: " + str(experimentStatus) + "  |  Run folder: " + str(response_data.get("run_folder", None)) + "  |  Running: " + str(response_data.get("running", False)))
+
+            # Stop once the experiment is no longer running (and everything has been read)
+            if (experimentStatus != "running") and (not response_data.get("running", False)) and (len(response_data.get("stdout", "")) == 0) and (len(response_data.get("stderr", "")) == 0):
+                with use_scope("live_log_status"):
+                    put_text("The experiment is no longer running.")
+                return
+
+            time.sleep(3)
+
+    return webio_view(pywebio_show)()
+
+
 def showExperimentDetails(uuid):
     # This function just redirects to the "/ideation" endpoint
     # Redirect to the /ideation endpoint
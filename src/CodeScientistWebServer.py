@@ -2,7 +2,8 @@
 # Copy/pasted from the DiscoveryKnowledgeGraph -- needs adapting.
 
 import json
-from flask import Flask, request, jsonify
+import hashlib
+from flask import Flask, request, jsonify, make_response
 import threading
 import random
 import queue
@@ -26,6 +27,14 @@ from PaperStore import *
 from IdeaStore import *
 # MetaAnalysis
 from MetaAnalysis import *
+# ExperimentStore
+from ExperimentStore import *
+# ExperimentScheduler
+from ExperimentScheduler import *
+# ExperimentRunner (runs each experiment in its own worker process)
+from ExperimentRunner import *
+# Live logs (following a running experiment)
+from modules.SandboxLiveLog import findLatestLiveRunFolder, readLiveLog
 
 # Critical stop thread event
 EVENT_CRITICAL_STOP = threading.Event()
@@ -33,51 +42,25 @@ EVENT_CRITICAL_STOP = threading.Event()
 # Flash app
 app = Flask(__name__)
 
-# Global task queue
-taskQueue = queue.Queue()
-
-# Lock for shared resources (if needed)
-resource_lock = threading.Lock()
-CURRENT_TASK_BEING_PROCESSED = None     # Reference to the current task being processed
-
-# Codeblock store path
-PATH_CODEBLOCKS = "codeblocks/"
+# Global task queue (split into one lane per task type -- see `TaskLanePool`, below)
+taskQueue = None
 
 # Filenames (NEW)
 FILENAME_PROCESSED_TASKS = "data/processedTasks.json"         # The list of processed tasks (with time/cost information)
-FILENAME_EXPERIMENTS = "data/all-experiments.json"
+FILENAME_EXPERIMENTS = "data/all-experiments.json"                # Legacy experiment list (migrated into the ExperimentStore once).  Now only written as a snapshot, for the meta-analysis.
 FILENAME_METAANALYSIS_LIST = "data/metaanalysis-list.json"    # List of meta-analyses
 
 # Thread locks
-THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON = threading.Lock()
 THREAD_LOCK_FILE_METAANALYSIS_JSON = threading.Lock()
 
+# The experiment records (`experimentStore`), and the experiment status constants, are in ExperimentRunner.py
+
 
 # Experiment Threads
 DEFAULT_MAX_EXPERIMENT_THREADS = 5
 MAX_EXPERIMENT_THREADS = DEFAULT_MAX_EXPERIMENT_THREADS     # Now dynamically controllable from a file (`config_threads.json`)
-THREAD_LOCK_EXPERIMENT_WORKERS = threading.Lock()
-worker_thread_count = {"experiment_threads": 0}
-
-
-# Constants (experiment statuses)
-STATUS_CREATED      = "created"
-STATUS_RUNNING      = "running"
-STATUS_COMPLETED    = "completed"
-STATUS_FAILED       = "failed (generic)"
-STATUS_FAILED_TO_CREATE             = "failed to create"
-STATUS_FAILED_TO_CREATE_UNKNOWN_BUILDER = "failed to create (unknown experiment building agent)"
-STATUS_FAILED_TO_CREATE_FOLLOW_ON   = "failed to create (follow-on experiment)"
-STATUS_INTERRUPTED                  = "interrupted"
-STATUS_FAILED_TOO_MANY_ITERATIONS   = "failed (too many debug iterations)"
-STATUS_FAILED_COST_LIMIT            = "failed (cost limit exceeded)"
-STATUS_FAILED_CONTAINER_ERROR       = "failed (container error)"
-STATUS_FAILED_FILEIO                = "failed (file I/O error)"
-STATUS_FAILED_WORKER_EXCEPTION      = "failed (generic error in worker thread)"
-STATUS_FAILED_AFTER_RUNNING         = "failed (after running)"
-STATUS_CODE_COMPLETE_CRITICAL_ERROR = "failed (partial code generated)"
-STATUS_CODE_PARSING_ISSUE           = "failed (code parsing issue)"
-STATUS_HARD_RUNTIME_LIMIT_REACHED   = "failed (hard experiment runtime limit reached)"
+EXPERIMENT_SCHEDULER_RESYNC_SEC = 60                        # How often to check the experiment store for waiting experiments the scheduler doesn't know about (e.g. added by another process)
+
 
 
 #
@@ -211,7 +194,7 @@ def task_do_autonomous_experiment_minibatch(payload:dict):
 
     # Step 2: Operationalize the ideas/turn them into experiment prompts with the experiment maker.  (This needs to be conditioned on the `experiment_additional_operationalization_instructions`)
     # Get the IdeaStore
-    ideaStore = IdeaStore()
+    ideaStore = getIdeaStore()
 
     experiments_to_submit = []
     for idx, idea_id in enumerate(idea_ids):
@@ -306,7 +289,10 @@ def task_do_autonomous_experiment_minibatch(payload:dict):
             "original_idea": idea,
             "automatically_generated_experiment_prompt": experiment_prompt,
             "max_experiment_cost": max_experiment_cost,
-            "batch_name": payload.get("batch_name_short", None)
+            "batch_name": payload.get("batch_name_short", None),
+            "sandbox_backend": payload.get("sandbox_backend", SANDBOX_BACKEND_MODAL),
+            "keep_sandbox_warm": payload.get("keep_sandbox_warm", False),
+            "llm_response_cache": payload.get("llm_response_cache", False)
         }
 
         # Submit the experiment
@@ -329,153 +315,35 @@ def task_do_autonomous_experiment_minibatch(payload:dict):
     return result
 
 
-def get_unique_experiment_id(experiments_data:dict):
-    import random
-    new_experiment_id = str(random.randint(1000, 999999999999))
-    print("get_unique_experiment_id(): Started generating unique ID... ")
-    existing_experiment_ids = set()
-
-    # Add the new experiment to the list of experiments
-    if ("experiment_list" not in experiments_data):
-        # Error
-        print("get_unique_experiment_id(): ERROR: Could not find 'experiment_list' in experiments data.")
-        #return {"success": False, "error": "Could not find 'experiment_list' in experiments data."}
-    else:
-        for experiment in experiments_data["experiment_list"]:
-            if ("id" in experiment):
-                existing_experiment_ids.add(experiment["id"])
-
-        # Keep generating a new experiment ID until it's unique
-        while (new_experiment_id in existing_experiment_ids):
-            new_experiment_id = str(random.randint(1000, 999999999999))
-
-    print("get_unique_experiment_id(): Generated unique ID: " + str(new_experiment_id) + " (" + str(len(existing_experiment_ids)) + " existing experiments)")
-    return new_experiment_id
-
-# A check function to ensure that the experiment ID is unique
-def is_experiment_id_unique(experiment_id:str, experiments_data:dict):
-    existing_experiment_ids = []
-    count = 0
-
-    # Add the new experiment to the list of experiments
-    if ("experiment_list" not in experiments_data):
-        # Error
-        print("ensure_experiment_id_unique(): ERROR: Could not find 'experiment_list' in experiments data.")
-        return False
-    else:
-        for experiment in experiments_data["experiment_list"]:
-            if ("id" in experiment):
-                existing_experiment_ids.append(experiment["id"])
-
-    # Check if the experiment ID is in the list of existing experiment IDs
-    # Count how many times we see the experiment ID
-    for existing_id in existing_experiment_ids:
-        if (existing_id == experiment_id):
-            count += 1
-
-    if (count > 1):
-        print("ensure_experiment_id_unique(): ERROR: Experiment ID is not unique: " + str(experiment_id))
-        return False
-
-    # If we reach here, the experiment ID is unique
-    print("ensure_experiment_id_unique(): Experiment ID is unique: " + str(experiment_id))
-    return True
-
-
-# A check to ensure all experiment IDs are unique
-# Should likely only be run once, at the start (since it hits the THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON)
-def ensure_all_experiment_ids_unique():
-    print("ensure_all_experiment_ids_unique(): Checking all experiment IDs are unique...")
-    # Use a counter
-    id_counter = {}
-    non_unique_ids = set()
-
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        existing_experiment_ids = []
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ensure_all_experiment_ids_unique(): ERROR: Could not load experiments file: " + str(e))
-            return False
-
-        # Add the new experiment to the list of experiments
-        if ("experiment_list" not in experiments_data):
-            # Error
-            print("ensure_all_experiment_ids_unique(): ERROR: Could not find 'experiment_list' in experiments data.")
-            return False
-        else:
-            for experiment in experiments_data["experiment_list"]:
-                if ("id" in experiment):
-                    existing_experiment_ids.append(experiment["id"])
-
-        print("ensure_all_experiment_ids_unique(): Found " + str(len(existing_experiment_ids)) + " existing experiments.")
-
-        # Check if the experiment ID is in the list of existing experiment IDs
-        for experiment_id in existing_experiment_ids:
-            if (experiment_id in id_counter):
-                id_counter[experiment_id] += 1
-                non_unique_ids.add(experiment_id)
-            else:
-                id_counter[experiment_id] = 1
-
-    print("ensure_all_experiment_ids_unique(): Found " + str(len(non_unique_ids)) + " non-unique experiment IDs.")
-
-    if (len(non_unique_ids) > 0):
-        print("ensure_all_experiment_ids_unique(): ERROR: Found non-unique experiment IDs: " + str(non_unique_ids))
-        return False
-    else:
-        print("ensure_all_experiment_ids_unique(): All experiment IDs are unique.")
-        return True
-
-
 # Task: Design/Create a new experiment with the experiment builder
 ## TODO: MAKE THIS THREAD SAFE, SO THAT ONLY ONE FUNCTION CAN HAVE WRITE ACCESS AT A TIME
 def task_start_new_experiment(payload:dict):
     from datetime import datetime       # No idea why it's not importing from the top correctly
     startTime = datetime.now()
 
-    # Load the experiments file
-    experiments_data = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return {"success": False, "error": "Could not load experiments file: " + str(e)}
-
-        # Add the new experiment to the list of experiments
-        if ("experiment_list" not in experiments_data):
-            # Error
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return {"success": False, "error": "Could not find 'experiment_list' in experiments data."}
-
-        # Add the experiment
-        payload["id"] = get_unique_experiment_id(experiments_data=experiments_data)
-
-        payload["timestamp_created"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        payload["timestamp_finished"] = ""
-        payload["status"] = "created"
-        payload["num_iterations_run"] = 0
-        payload["cost_so_far"] = 0.00
-        payload["results_summary"] = ""
-        payload["experiment_path"] = None
-        payload["results_summary"] = None
-        payload["results_summary_short"] = None
-        payload["runtime_seconds"] = 0
-        if ("max_experiment_cost" not in payload):
-            payload["max_experiment_cost"] = 0.00       # Default to zero cost, so it will exit quickly if not set
-
-        experiments_data["experiment_list"].append(payload)
-
-        # Save the experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "w") as f:
-                json.dump(experiments_data, f, indent=4)
-        except Exception as e:
-            print("ERROR: Could not save experiments file: " + str(e))
-            return {"success": False, "error": "Could not save experiments file: " + str(e)}
+    # Add the experiment
+    payload["timestamp_created"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    payload["timestamp_finished"] = ""
+    payload["status"] = "created"
+    payload["num_iterations_run"] = 0
+    payload["cost_so_far"] = 0.00
+    payload["results_summary"] = ""
+    payload["experiment_path"] = None
+    payload["results_summary"] = None
+    payload["results_summary_short"] = None
+    payload["runtime_seconds"] = 0
+    if ("max_experiment_cost" not in payload):
+        payload["max_experiment_cost"] = 0.00       # Default to zero cost, so it will exit quickly if not set
+
+    # Save the experiment (this also assigns it a unique ID)
+    try:
+        experiment_id = experimentStore.add_experiment(payload)
+    except Exception as e:
+        print("ERROR: Could not save experiment: " + str(e))
+        return {"success": False, "error": "Could not save experiment: " + str(e)}
+
+    # Queue it to run (it starts right away if there's a free experiment slot)
+    experimentScheduler.submit(experiment_id, payload.get("batch_name", None))
 
     # Return
     deltaTime = datetime.now() - startTime
@@ -558,7 +426,7 @@ def task_create_new_ideas(payload:dict):
         return {"success": False, "error": "No papers were successfully loaded."}
 
     # Load the Idea Store
-    ideaStore = IdeaStore()
+    ideaStore = getIdeaStore()
 
     # Generate some new ideas
     result = ideaStore.generate_new_ideas(paperText=paperText, additional_conditioning_text=conditionalGenerationStr, discourage_similar_to_existing_ideas=deduplicationEnabled, condition_on_codeblocks=conditionOnCodeblocks, model_str=modelStr, num_ideas=5, add_to_idea_store=True, mark_as_batch_idea=isBatchJob, batch_name=batch_name)
@@ -631,8 +499,198 @@ def run_start_autonomous_batch_experiment(payload):
 #
 
 processedTaskResults = []
+THREAD_LOCK_PROCESSED_TASKS = threading.Lock()
+
+
+#
+#   Task lanes
+#   Each task type is assigned to a lane, and each lane has its own queue and its own pool of worker threads -- so that (for example) a slow
+#   ideation task doesn't block the experiment creation or autonomous batch tasks queued behind it.
+#   The number of workers per lane can be changed while the server is running, using the `task_lane_workers` key of `config_threads.json`.
+#
+TASK_LANE_IDEATION = "ideation"
+TASK_LANE_EXPERIMENTS = "experiments"
+TASK_LANE_AUTONOMOUS_BATCH = "autonomous_batch"
+TASK_LANE_DEFAULT = "default"                   # Anything not assigned to a lane (e.g. unknown task types)
+
+DEFAULT_TASK_LANE_WORKERS = {
+    TASK_LANE_IDEATION: 2,
+    TASK_LANE_EXPERIMENTS: 2,
+    TASK_LANE_AUTONOMOUS_BATCH: 2,
+    TASK_LANE_DEFAULT: 1,
+}
+TASK_LANE_CONFIG_RELOAD_SEC = 10                # How often to re-read the lane limits from `config_threads.json`
+TASK_LANE_LATENCY_WINDOW = 100                  # The number of recent tasks (per lane) to use for the wait/run time statistics
+
+def get_task_lane(task_type:str):
+    if (task_type == TASK_IDEATION_CREATE_NEW_IDEAS):
+        return TASK_LANE_IDEATION
+    if (task_type in [TASK_START_NEW_EXPERIMENT, TASK_START_FOLLOWON_EXPERIMENT]):
+        return TASK_LANE_EXPERIMENTS
+    if (task_type == TASK_START_NEW_AUTONOMOUS_BATCH_EXPERIMENT):
+        return TASK_LANE_AUTONOMOUS_BATCH
+    return TASK_LANE_DEFAULT
+
+
+# A pool of task queues (one per lane), each with its own worker threads.
+# Has the same `put()`/`qsize()`/`queue` interface as the single `queue.Queue` it replaced, so tasks are submitted the same way.
+class TaskLanePool():
+    def __init__(self, lane_workers:dict):
+        from collections import deque
+        self.lock = threading.Lock()
+        self.lanes = {}
+        for lane_name in DEFAULT_TASK_LANE_WORKERS:
+            self.lanes[lane_name] = {
+                "queue": queue.Queue(),
+                "max_workers": max(1, int(lane_workers.get(lane_name, DEFAULT_TASK_LANE_WORKERS[lane_name]))),
+                "num_workers": 0,                   # Number of worker threads currently alive
+                "running_tasks": [],                # Tasks currently being processed
+                "num_processed": 0,
+                "recent_latencies": deque(maxlen=TASK_LANE_LATENCY_WINDOW),     # (wait_sec, run_sec) for the most recent tasks
+            }
+        self.started = False
+
+    # Add a task to the queue for its lane
+    def put(self, task:dict):
+        lane_name = get_task_lane(task.get("task_type", None))
+        self.lanes[lane_name]["queue"].put( (time.time(), task) )
+
+    # Total number of queued (not yet started) tasks, across all lanes
+    def qsize(self):
+        return sum([lane["queue"].qsize() for lane in self.lanes.values()])
+
+    # A snapshot of all the queued tasks (across all lanes)
+    @property
+    def queue(self):
+        tasks = []
+        for lane in self.lanes.values():
+            tasks.extend([task for (_, task) in list(lane["queue"].queue)])
+        return tasks
+
+    # A snapshot of all the tasks currently being processed (across all lanes)
+    def get_running_tasks(self):
+        with self.lock:
+            tasks = []
+            for lane in self.lanes.values():
+                tasks.extend(lane["running_tasks"])
+            return tasks
+
+    # Start the worker threads for every lane
+    def start(self):
+        with self.lock:
+            self.started = True
+            for lane_name in self.lanes:
+                self._spawn_workers(lane_name)
+
+    # Change the number of workers per lane.  Extra workers are started immediately; surplus workers exit once they finish their current task.
+    def set_lane_workers(self, lane_workers:dict):
+        with self.lock:
+            for lane_name, lane in self.lanes.items():
+                new_max_workers = max(1, int(lane_workers.get(lane_name, DEFAULT_TASK_LANE_WORKERS[lane_name])))
+                if (new_max_workers != lane["max_workers"]):
+                    print("Task lane '" + lane_name + "': changing number of workers from " + str(lane["max_workers"]) + " to " + str(new_max_workers))
+                    lane["max_workers"] = new_max_workers
+                if (self.started):
+                    self._spawn_workers(lane_name)
+
+    # NOTE: Must be called with `self.lock` held
+    def _spawn_workers(self, lane_name:str):
+        lane = self.lanes[lane_name]
+        while (lane["num_workers"] < lane["max_workers"]):
+            lane["num_workers"] += 1
+            thread = threading.Thread(target=self._lane_worker, args=(lane_name,), daemon=True)
+            thread.start()
+
+    # Worker thread for one lane
+    def _lane_worker(self, lane_name:str):
+        lane = self.lanes[lane_name]
+        print("Task worker (lane: " + lane_name + "): Started!")
+
+        while not EVENT_CRITICAL_STOP.is_set():
+            # Exit if this lane has more workers than it's allowed (i.e. the limit was lowered)
+            with self.lock:
+                if (lane["num_workers"] > lane["max_workers"]):
+                    lane["num_workers"] -= 1
+                    print("Task worker (lane: " + lane_name + "): Stopped (lane limit lowered).")
+                    return
+
+            # Get a task from this lane's queue
+            try:
+                enqueued_time, task = lane["queue"].get(timeout=1)
+            except queue.Empty:
+                continue
+
+            print("Task worker (lane: " + lane_name + "): Processing task (" + str(task.get("task_type", None)) + ")...")
+            start_time = time.time()
+            with self.lock:
+                lane["running_tasks"].append(task)
+
+            # Perform the task
+            try:
+                result = process_task(task)
+            except Exception as e:
+                import traceback
+                print("ERROR: Task worker (lane: " + lane_name + "): Task raised an exception: " + str(e))
+                traceback.print_exc()
+                result = {"task_type": task.get("task_type", None), "success": False, "error": str(e)}
+
+            with self.lock:
+                lane["running_tasks"].remove(task)
+                lane["num_processed"] += 1
+                lane["recent_latencies"].append( (start_time - enqueued_time, time.time() - start_time) )
+            lane["queue"].task_done()
+
+            # Save the processed task information
+            with THREAD_LOCK_PROCESSED_TASKS:
+                processedTaskResults.append(result)
+                saveProcessedTasks()
+
+        with self.lock:
+            lane["num_workers"] -= 1
+        print("Task worker (lane: " + lane_name + "): Stopped!")
+
+    # Per-lane statistics (queue depth, running tasks, worker limits, and wait/run times over the most recent tasks)
+    def get_lane_stats(self):
+        stats = {}
+        with self.lock:
+            for lane_name, lane in self.lanes.items():
+                latencies = list(lane["recent_latencies"])
+                wait_times = [wait for (wait, _) in latencies]
+                run_times = [run for (_, run) in latencies]
+                stats[lane_name] = {
+                    "queue_depth": lane["queue"].qsize(),
+                    "running": len(lane["running_tasks"]),
+                    "running_task_types": [task.get("task_type", "unknown") for task in lane["running_tasks"]],
+                    "max_workers": lane["max_workers"],
+                    "num_processed": lane["num_processed"],
+                    "avg_wait_sec": round(sum(wait_times) / len(wait_times), 2) if (len(wait_times) > 0) else None,
+                    "max_wait_sec": round(max(wait_times), 2) if (len(wait_times) > 0) else None,
+                    "avg_runtime_sec": round(sum(run_times) / len(run_times), 2) if (len(run_times) > 0) else None,
+                    "max_runtime_sec": round(max(run_times), 2) if (len(run_times) > 0) else None,
+                }
+        return stats
+
+
+# Load the 'config_threads.json' file (returns an empty dictionary if it can't be loaded, so the defaults are used)
+def load_config_threads():
+    try:
+        with open(FILENAME_CONFIG_THREADS, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print("ERROR: Could not load 'config_threads.json' file.  Using default thread limits: " + str(e))
+    return {}
+
+# Get the number of workers per lane from the thread config (missing lanes use the defaults)
+def get_task_lane_workers(config_data:dict):
+    lane_workers = dict(DEFAULT_TASK_LANE_WORKERS)
+    lane_workers.update(config_data.get("task_lane_workers", {}))
+    return lane_workers
 
-# Function to process tasks
+taskQueue = TaskLanePool(get_task_lane_workers(load_config_threads()))
+
+
+# Function to process tasks.  The tasks themselves are run by the lane worker threads (see `TaskLanePool`), and the experiments by the
+# experiment scheduler -- this thread starts them, and keeps their limits up to date.
 def task_worker():
     global EVENT_CRITICAL_STOP
     print("Task worker: Started!")
@@ -645,43 +703,33 @@ def task_worker():
 
     # Sleep for 5 seconds to allow the system checks to start up (and EVENT_CRITICAL_STOP to fire if something happened during the initialization)
     time.sleep(5)
+    if (EVENT_CRITICAL_STOP.is_set()):
+        print("Task worker: Stopped!")
+        return
+
+    # Start the lane workers, and the experiment scheduler (queueing any experiments that were waiting to run when the server was last stopped)
+    taskQueue.start()
+    set_max_experiment_threads(load_config_threads())
+    resync_experiment_scheduler()
+    experimentScheduler.start()
+    last_config_load = time.time()
+    last_scheduler_resync = time.time()
 
     #while (True):
     while not EVENT_CRITICAL_STOP.is_set():
-        # Start up to 5 experiments per cycle
-        for i in range(5):
-            result = check_for_experiments_to_spawn()
-            if (result == False):   # Result will be true if it found an experiment to spawn.  If False, then there are no more experiments to spawn, and we can end early.
-                break
-
-        # Print the queue size (optional)
-        print("Task Queue Size: " + str(taskQueue.qsize()))
-
-        # Get a task from the queue
-        task = None
-        try:
-            task = taskQueue.get(timeout=1)
-        except queue.Empty:
-            pass
-
-        print("Task: " + str(task))
-
-        if (task is None):
-            # The queue is empty -- sleep briefly
-            print("Task worker: Queue is empty. Sleeping...")
-            time.sleep(1)
-            continue
-
-        print("Task worker: Processing task...")
-        # Perform the task
-        result = process_task(task)
-        processedTaskResults.append(result)
+        # Periodically reload the lane/experiment limits
+        if (time.time() - last_config_load > TASK_LANE_CONFIG_RELOAD_SEC):
+            config_data = load_config_threads()
+            taskQueue.set_lane_workers(get_task_lane_workers(config_data))
+            set_max_experiment_threads(config_data)
+            last_config_load = time.time()
 
-        # Mark the task as done (optional if you're tracking task completion)
-        taskQueue.task_done()
+        # Periodically check for waiting experiments that weren't submitted to the scheduler
+        if (time.time() - last_scheduler_resync > EXPERIMENT_SCHEDULER_RESYNC_SEC):
+            resync_experiment_scheduler()
+            last_scheduler_resync = time.time()
 
-        # Save the processed task information
-        saveProcessedTasks()
+        time.sleep(1)
 
     print("Task worker: Stopped!")
 
@@ -712,76 +760,61 @@ def loadProcessedTasks():
 
 
 # The main functin that parses a given task in the worker queue
+# NOTE: Called from several lane worker threads at once, so tasks run concurrently (the stores they use are thread-safe).
 def process_task(task):
     from datetime import datetime
-    global CURRENT_TASK_BEING_PROCESSED
-
-    # Access shared resources safely if needed
-    with resource_lock:
-        startTime = datetime.now()
-
-        submissionTime = "unknown"
-        if ("submission_time" in task):
-            submissionTime = task["submission_time"]
-        result = {
-            "task_type": task.get("task_type", None),
-            "submission_time": submissionTime,
-            "start_time": startTime.isoformat(),
-            "success": False,
-            "error": None
-        }
 
-        # Update the current task being processed
-        CURRENT_TASK_BEING_PROCESSED = task
-
-        # Process which task to run
-        task_type = task.get("task_type", None)
-
-        # TASK: Ideation/Create new ideas
-        if (task_type == TASK_IDEATION_CREATE_NEW_IDEAS):
-            payload = task.get("payload", None)
-            result_ = task_create_new_ideas(payload)
-            result.update(result_)
-            # Reset the current task being processed
-            CURRENT_TASK_BEING_PROCESSED = None
-
-        # TASK: Design a new experiment
-        elif (task_type == TASK_START_NEW_EXPERIMENT):
-            payload = task.get("payload", None)
-            result_ = task_start_new_experiment(payload)
-            result.update(result_)
-            # Reset the current task being processed
-            CURRENT_TASK_BEING_PROCESSED = None
-
-        # TASK: Run a follow-on experiment
-        elif (task_type == TASK_START_FOLLOWON_EXPERIMENT):
-            payload = task.get("payload", None)
-            result_ = task_start_new_experiment(payload)         # NOTE: Handled in the same way -- the experiment executer checks to see whether it's a follow-on or not
-            result.update(result_)
-            # Reset the current task being processed
-            CURRENT_TASK_BEING_PROCESSED = None
-
-        # TASK: Run an autonomous batch experiment
-        elif (task_type == TASK_START_NEW_AUTONOMOUS_BATCH_EXPERIMENT):
-            payload = task.get("payload", None)
-            result_ = task_do_autonomous_experiment_minibatch(payload)
-            result.update(result_)
-            # Reset the current task being processed
-            CURRENT_TASK_BEING_PROCESSED = None
-
-        # Unknown task type
-        else:
-            print("ERROR: Unknown task type: " + str(task_type))
-            result["success"] = False
-            result["error"] = "Unknown task type"
-            # Reset the current task being processed
-            CURRENT_TASK_BEING_PROCESSED = None
-
-        # Add end time
-        endTime = datetime.now()
-        deltaTimeSeconds = (endTime - startTime).total_seconds()
-        result["end_time"] = endTime.isoformat()
-        result["runtime_seconds"] = round(deltaTimeSeconds, 2)
+    startTime = datetime.now()
+
+    submissionTime = "unknown"
+    if ("submission_time" in task):
+        submissionTime = task["submission_time"]
+    result = {
+        "task_type": task.get("task_type", None),
+        "submission_time": submissionTime,
+        "start_time": startTime.isoformat(),
+        "success": False,
+        "error": None
+    }
+
+    # Process which task to run
+    task_type = task.get("task_type", None)
+
+    # TASK: Ideation/Create new ideas
+    if (task_type == TASK_IDEATION_CREATE_NEW_IDEAS):
+        payload = task.get("payload", None)
+        result_ = task_create_new_ideas(payload)
+        result.update(result_)
+
+    # TASK: Design a new experiment
+    elif (task_type == TASK_START_NEW_EXPERIMENT):
+        payload = task.get("payload", None)
+        result_ = task_start_new_experiment(payload)
+        result.update(result_)
+
+    # TASK: Run a follow-on experiment
+    elif (task_type == TASK_START_FOLLOWON_EXPERIMENT):
+        payload = task.get("payload", None)
+        result_ = task_start_new_experiment(payload)         # NOTE: Handled in the same way -- the experiment executer checks to see whether it's a follow-on or not
+        result.update(result_)
+
+    # TASK: Run an autonomous batch experiment
+    elif (task_type == TASK_START_NEW_AUTONOMOUS_BATCH_EXPERIMENT):
+        payload = task.get("payload", None)
+        result_ = task_do_autonomous_experiment_minibatch(payload)
+        result.update(result_)
+
+    # Unknown task type
+    else:
+        print("ERROR: Unknown task type: " + str(task_type))
+        result["success"] = False
+        result["error"] = "Unknown task type"
+
+    # Add end time
+    endTime = datetime.now()
+    deltaTimeSeconds = (endTime - startTime).total_seconds()
+    result["end_time"] = endTime.isoformat()
+    result["runtime_seconds"] = round(deltaTimeSeconds, 2)
 
     # Return
     return result
@@ -792,611 +825,26 @@ def process_task(task):
 #   Experiment execution threading
 #
 
-# Check to see if there are experiments waiting to be run.  If there are, and there are available threads, start one.
-def check_for_experiments_to_spawn():
-    global MAX_EXPERIMENT_THREADS
-    print("check_for_experiment_to_spawn: started...")
-    # First, check to see if the maximum number of experiment threads are already running
-    with THREAD_LOCK_EXPERIMENT_WORKERS:
-        # Try to load the maximum number of experiment threads from the 'config_threads.json" file
-        FILENAME_CONFIG_THREADS = "config_threads.json"
-        try:
-            MAX_EXPERIMENT_THREADS = DEFAULT_MAX_EXPERIMENT_THREADS
-            with open(FILENAME_CONFIG_THREADS, "r") as f:
-                config_data = json.load(f)
-                MAX_EXPERIMENT_THREADS = config_data.get("max_experiment_threads", DEFAULT_MAX_EXPERIMENT_THREADS)
-        except Exception as e:
-            print("ERROR: Could not load 'config_threads.json' file.  Using default maximum experimental threads (" + str(MAX_EXPERIMENT_THREADS) + "): " + str(e))
-
-
-        num_running_experiment_threads = worker_thread_count["experiment_threads"]
-        print("Experiment Worker Threads (Running: " + str(num_running_experiment_threads) + " / Max: " + str(MAX_EXPERIMENT_THREADS) + ")")
-        if (worker_thread_count["experiment_threads"] >= MAX_EXPERIMENT_THREADS):
-            # Maximum number of threads are already running -- return
-            return
-
-    # Next, check to see if there are any experiments that need to be spawned
-    next_experiment_id_to_start = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Load the experiments file
-        experiments_data = None
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return
-
-        if ("experiment_list" not in experiments_data):
-            # Error
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return
-
-
-        # Count how many experiments are currently waiting for processing (i.e. have the "created" status)
-        num_experiments_waiting = 0
-        experiment_ids_waiting = []
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["status"] == "created"):
-                num_experiments_waiting += 1
-                experiment_ids_waiting.append(experiment["id"])
-
-        print("Experiments waiting in queue: " + str(num_experiments_waiting))
-
-        # If there are no experiments waiting to run, return
-        if (num_experiments_waiting == 0):
-            print("No experiments waiting to run.  Returning...")
-            return False
-
-        # If there are experiments waiting, and there are available threads, start one
-        next_experiment_id_to_start = experiment_ids_waiting[0]
-        # Extra check (just to make sure) -- check if the experiment ID is unique.
-        # NOTE: If we run a non-unique ID, then it essentially spawns the same experiment over and over, pausing the queue, and spending money/resources until the hard limits are reached.
-        print("check_for_experiments_to_spawn: Checking if experiment ID is unique: " + str(next_experiment_id_to_start))
-        while (is_experiment_id_unique(next_experiment_id_to_start, experiments_data=experiments_data) == False):
-            print("CRITICAL ERROR: Experiment ID is not unique: " + str(next_experiment_id_to_start))
-            # Remove the experiment from the list of experiments waiting
-            experiment_ids_waiting.pop(0)
-            if (len(experiment_ids_waiting) == 0):
-                print("ERROR: No more experiments to run.")
-                return False
-            next_experiment_id_to_start = experiment_ids_waiting[0]
-            print("check_for_experiments_to_spawn: Checking if experiment ID is unique: " + str(next_experiment_id_to_start))
-
-
-    # Start the experiment worker thread
-    # NOTE: Slightly wonky that we're starting a new thread from outside the thread lock (that's exited above after we confirm one is available), but this function should only be running a single time anyway -- so should be okay.
-    # Can always wrap this function around another thread lock, to be extra sure.
-    if (next_experiment_id_to_start is not None):
-        print("Starting new experiment worker thread (Experiment ID: " + str(next_experiment_id_to_start) + ")")
-        #experiment_worker_thread = threading.Thread(target=start_new_experiment_thread(next_experiment_id_to_start), daemon=True)
-        experiment_worker_thread = threading.Thread(target=start_new_experiment_thread, args=(next_experiment_id_to_start,), daemon=True)
-        experiment_worker_thread.start()
-        print("Thread started...")
-        # Sleep for 2 seconds between experiment spawns
-        time.sleep(2)
-        return True
-
-
-
-# A thread wrapper for running one experiment, while keeping track of the number of experiment worker threads
-def start_new_experiment_thread(id:str):
-    import traceback
-    with THREAD_LOCK_EXPERIMENT_WORKERS:
-        # Increment the number of experiment threads running
-        worker_thread_count["experiment_threads"] += 1
-        print("Starting new experiment worker thread (Experiment ID: " + str(id) + ")")
-        sys.stdout.flush()  # Flush output to ensure it appears
-
-    # Set the status of the experiment to 'running'
-    change_experiment_status(id, STATUS_RUNNING)
-
-    # Keys from the 'benchmark' submission packet
-        # experiment_submission_packed = {
-        #     "experiment_name_short": original_idea_sanitized.get("research_idea_name", "Unknown"),
-        #     "model_str": data.get("model_str", None),
-        #     "experiment_building_agent_name": data.get("experiment_building_agent_name", None),
-        #     "run_notes": data.get("run_notes", None),
-        #     "experiment_description": experiment_builder_prompt,
-        #     "codeblock_names_to_use": experiment_builder_codeblocks,
-        #     "max_time_per_iteration_mins": data.get("max_time_per_iteration_mins", 1),
-        #     "max_time_per_iteration_pilot_mins": data.get("max_time_per_iteration_pilot_mins", 1),
-        #     "max_debug_iterations": data.get("max_debug_iterations", 1),
-        #     "max_llm_cost_container": data.get("max_llm_cost_container", 0.00),
-        #     "num_copies": data.get("num_experiments", 1),
-        #     "submission_mode": "benchmark",
-        #     "idea_id": benchmark_idea_id,
-        #     "original_idea": original_idea_sanitized,
-        #     "automatically_generated_experiment_prompt": experiment_builder_prompt,
-        #     "max_experiment_cost": data.get("max_experiment_cost", 0.0),
-        #     "batch_name": data.get("batch_name_short", None),
-        #     "benchmark": benchmark_to_run,
-        #     "operationalization": operationalization,                   # Full copy of the operationalization
-        #     "full_original_benchmark_problem": benchmark_problem        # Full copy of the benchmark problem
-        # }
-
-    # Try to get which agent we should be using to execute this experiment
-    experiment_record = get_experiment_info(id)
-    if (experiment_record is None):
-        print("ERROR: Could not find experiment with ID: " + str(id))
-        new_status = STATUS_FAILED_TO_CREATE
-        change_experiment_status(id, new_status)
-        return
-
-    experiment_building_agent_name = experiment_record.get("experiment_building_agent_name", None)
-    print("Experiment (id: " + str(id) + ") requests Experiment Building Agent Name: " + str(experiment_building_agent_name))
-
-    try:
-        # Run the experiment
-        # TODO: These agent names should come from a list/defines.
-        # We can keep these in for examples of how to add new agents to the system.
-        if (experiment_building_agent_name == "simple1") or (experiment_building_agent_name is None):
-            new_status = run_experiment(id, use_faithfulness_reflection=False)                    # Original experiment agent
-
-        elif (experiment_building_agent_name == "simple1-with-faithfulness-reflection"):
-            new_status = run_experiment(id, use_faithfulness_reflection=True)                     # Original experiment agent with faithfulness reflection
-
-        else:
-            print("ERROR: Unknown Experiment Building Agent Name: " + str(experiment_building_agent_name))
-            new_status = STATUS_FAILED_TO_CREATE_UNKNOWN_BUILDER
-
-        # Set the run to 'completed'
-        change_experiment_status(id, new_status)
+# The experiment scheduler: experiments are submitted when they're created, and started as soon as a slot is free
+experimentScheduler = ExperimentScheduler(run_experiment_in_worker_process, max_running=MAX_EXPERIMENT_THREADS)
 
-    except Exception as e:
-        traceback.print_exc()
-        print("ERROR: Exception in experiment worker thread: " + str(e) + " (Experiment ID: " + str(id) + ")\n" + traceback.format_exc())
-        new_status = STATUS_FAILED_WORKER_EXCEPTION
-        change_experiment_status(id, new_status)
-
-    finally:
-        with THREAD_LOCK_EXPERIMENT_WORKERS:
-            # Decrement the number of experiment threads running
-            worker_thread_count["experiment_threads"] -= 1
-            print("Experiment worker thread finished (Experiment ID: " + str(id) + ")")
-
-
-# Update an experiment's status string in the experiments JSON file
-def change_experiment_status(id:str, new_status:str):
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Open the experiments JSON file
-        experiments_data = None
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == id):
-                experiment["status"] = new_status
-                break
-
-        # Save the updated experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "w") as f:
-                json.dump(experiments_data, f, indent=4)
-        except Exception as e:
-            print("ERROR: Could not save experiments file: " + str(e))
-            return
-
-
-# This function essentially tries to recreate the `createExperiment` function, but with the final code from the previous experiment, mixed with the parameters from the new (follow-on) experiment.
-def follow_on_experiment_get_previous_experiment_info(previous_experiment_id, new_experiment):
-    # Load the experiments file
-    previous_experiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        experiments_data = None
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return None
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == previous_experiment_id):
-                previous_experiment = experiment
-                break
-
-        # If the experiment was not found, return
-        if (previous_experiment is None):
-            print("ERROR: Follow-on experiment lookup: could not find previous experiment with ID: " + str(previous_experiment_id))
-            return None
-
-    # Look through the previous experiment file to find some relevant information.
-    # First, get the output directory
-    previous_experiment_path = previous_experiment.get("experiment_path", None)
-    if (previous_experiment_path is None):
-        print("ERROR: Follow-on experiment lookup: Could not find previous experiment path.")
-        return None
+# Set the maximum number of experiment threads from the thread config
+def set_max_experiment_threads(config_data:dict):
+    global MAX_EXPERIMENT_THREADS
+    MAX_EXPERIMENT_THREADS = config_data.get("max_experiment_threads", DEFAULT_MAX_EXPERIMENT_THREADS)
+    experimentScheduler.set_max_running(MAX_EXPERIMENT_THREADS)
 
-    # Load the history from the last run
-    historyPacked = None
-    filenameIn = previous_experiment_path + "/history.json"
+# Submit any waiting ('created') experiments in the experiment store that the scheduler doesn't already know about
+def resync_experiment_scheduler():
     try:
-        with open(filenameIn, "r") as f:
-            historyPacked = json.load(f)
+        for experiment_id in experimentStore.get_experiment_ids_by_status(STATUS_CREATED):
+            if (experimentScheduler.is_known(experiment_id)):
+                continue
+            experiment = experimentStore.get_experiment(experiment_id)
+            if (experiment is not None):
+                experimentScheduler.submit(experiment_id, experiment.get("batch_name", None))
     except Exception as e:
-        print("ERROR: Follow-on experiment lookup: Could not load history file (" + str(filenameIn) + "): " + str(e))
-        return None
-
-    if (historyPacked is None):
-        print("ERROR: Follow-on experiment lookup: Could not load history file (" + str(filenameIn) + ")")
-        return None
-    if ("history" not in historyPacked):
-        print("ERROR: Follow-on experiment lookup: Could not find 'history' key in history file (" + str(filenameIn) + ")")
-        return None
-    history = historyPacked["history"]
-    if (len(history) == 0):
-        print("ERROR: Follow-on experiment lookup: No history entries found in history file (" + str(filenameIn) + ")")
-        return None
-
-
-    # Now generate the starting code, which will be the final code from the previous experiment
-
-    # This is what needs to be returned, as if it was returning from the createExperiment function.
-        #     # Return the response
-        # packedOut = {
-        #     "success": True,
-        #     "instruction_str": instructionStr,        # From new experiment
-        #     "codeblock_names": codeblockNames,        # From new experiment
-        #     "requirements": requirements,             # From last experiment
-        #     "code": code,                             # From last experiment
-        #     "codeblock_code": retrievedCodeblockDict, # From new experiment
-        #     "model": modelStr,                        # From last experiment
-        #     "max_tokens": max_tokens,                 # From last experiment
-        #     "temperature": temperature,               # From last experiment
-        #     "responseJSON": responseJSON,             # Set to None?
-        #     "responseText": responseText,             # Set to None?
-        #     "cost": cost,                             # Set to 0.0001
-        #     "errors": errors                          # Set to []
-        # }
-
-    # Get the last history entry
-    lastHistoryEntry = history[-1]
-
-    # Get the codeblocks (the new ones, that were selected for the follow-on experiment)
-    codeblock_names = new_experiment.get("codeblock_names_to_use", [])
-    codeblock_code = {}
-    codeblockStore = CodeBlockStore(PATH_CODEBLOCKS)
-    for codeblock_name in codeblock_names:
-        codeblock = codeblockStore.getCodeblockByName(codeblock_name)
-        if (codeblock is None):
-            print("ERROR: Could not find codeblock with name: " + str(codeblock_name))
-        else:
-            codeblock_code[codeblock_name] = codeblock
-    print("Retrieved codeblocks: " + str(codeblock_code.keys()))
-
-    # Repackage the last history entry into the format expected by the createExperiment function
-    packed = {
-        "success": True,
-        "instruction_str": new_experiment.get("experiment_description", None),    # New
-        "codeblock_names": new_experiment.get("codeblock_names_to_use", []),      # New
-        "requirements": lastHistoryEntry.get("requirements", ""),                 # Last
-        "code": lastHistoryEntry.get("code", ""),                                 # Last
-        "codeblock_code": codeblock_code,                                         # New
-        "model": lastHistoryEntry.get("model", ""),                               # Last
-        "max_tokens": lastHistoryEntry.get("max_tokens", 0),                      # Last
-        "temperature": lastHistoryEntry.get("temperature", 0.0),                  # Last
-        "responseJSON": None,                                                     # Blank out
-        "responseText": "",                                                       # Blank out
-        "cost": 0.0000001,                                                        # Set to a small value (effectively blanking it out, but making it non-zero in case that causes some issues)
-        "errors": []                                                              # Blank out
-    }
-
-    return packed
-
-
-
-# Get the record for one experiment
-def get_experiment_info(id:str):
-    # Load the experiment data
-    experiments_data = None
-    targetExperiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return None
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == id):
-                targetExperiment = experiment
-                return targetExperiment
-
-        # If the experiment was not found, return
-        if (targetExperiment is None):
-            print("ERROR: Could not find experiment with ID: " + str(id))
-            return None
-
-
-# Run one experiment
-# This is the main function for the agent that essentially takes the idea/plan, and runs a single complete experiment
-# (from code generation, debugging, through report generation)
-def run_experiment(id:str, use_faithfulness_reflection:bool=False):
-    exit_status = STATUS_FAILED
-    import datetime
-
-    print("run_experiment(): Running experiment (ID: " + str(id) + ")")
-
-    # Load the API keys
-    from ExtractionUtils import loadAPIKeys
-    loadAPIKeys()
-
-    # Load the experiment data
-    experiments_data = None
-    targetExperiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return STATUS_FAILED_FILEIO
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == id):
-                targetExperiment = experiment
-                break
-
-        # If the experiment was not found, return
-        if (targetExperiment is None):
-            print("ERROR: Could not find experiment with ID: " + str(id))
-            return STATUS_FAILED_FILEIO
-
-    # Experiment parameters
-    # Examples:
-    #experimentName = "react-causal-memory-persistent"
-    #instructionStr = "Please investigate whether adding a causal memory to a ReAct agent helps improve its performance over a baseline ReAct agent.  The causal memory should be *abstractive*, abstracting how single actions (or sequences of actions) helped achieve subgoals or larger goals.  The memory should be persistent, saved across episodes (and framed as `lessons` in the prompt, that may or may not be from the current episode, so it doesn't get confused). The memory should be displayed in the log file, so you can inspect it to make sure it's behaving correctly. Please test this on CookingWorld, using the default CookingWorld environment parameters (except 3 rooms, and no doors). The base model should be `gpt-4o-mini`.  The agent should use the first 5 parametric variations (i.e. the first five episodes, seeds 1-5) of the CookingWorld game, and end after this, report the score/success of each episode, and final average score.  The maximum steps per episode should be 25. The full trajectory (i.e. observation, score, possible valid actions, chosen action at each step) should be in the log file. The results file should include number of steps per episode, as well as an average of this.  Report whether the baseline and experimental condition are significantly different."
-    #additionalInstructionStr = "Please use the Python programming language."
-    #codeblocksToCombine = ["Logger/Debugging", "LLM example through proxy server", "ReAct Agent Example", "TextWorldExpress API Example", "Non-parametric Bootstrap Resampling"]
-    #max_container_llm_cost = 5.00
-    #max_runtime_seconds = 60 * 30   # 30 minutes
-
-    experimentName = targetExperiment.get("experiment_name_short")
-    instructionStr = targetExperiment.get("experiment_description")
-    additionalInstructionStr = "Please use the Python programming language."
-    codeblocksToCombine = targetExperiment.get("codeblock_names_to_use")
-    modelStr = targetExperiment.get("model_str")
-    max_container_llm_cost = targetExperiment.get("max_llm_cost_container")
-    max_runtime_seconds = targetExperiment.get("max_time_per_iteration_mins") * 60
-    max_runtime_seconds_pilot = targetExperiment.get("max_time_per_iteration_pilot_mins", 10) * 60            # Default to 10 minutes if not set.
-    max_reflections = targetExperiment.get("max_debug_iterations")
-    max_experiment_cost = targetExperiment.get("max_experiment_cost", 0.00)     # Note: This is not enforced until the debugging/reflection steps.  So a really expensive initial generation may exceed this.
-    hard_runtime_cutoff_seconds = targetExperiment.get("hard_runtime_cutoff_seconds", (60*60*6))  # 6 hours (if not otherwise specified)
-
-    temperature = targetExperiment.get("temperature", 0.1)
-    max_tokens = 8192
-    if (modelStr.startswith("o1-mini")):
-        max_tokens = 32000  # Technically larger, but limiting here
-    elif (modelStr.startswith("o3-mini")):
-        max_tokens = 32000  # Technically larger, but limiting here
-
-
-    # Check to see if no cost limit was set
-    if (max_experiment_cost <= 0.01):
-        print("ERROR: No cost limit set, or cost limit was very low (" + str(max_experiment_cost) + ") for experiment with ID: " + str(id) + ".  Exiting.")
-        return STATUS_FAILED_COST_LIMIT
-
-
-    # Check to see if this is a follow-on experiment (and if so, set a few variables)
-    is_follow_on_experiment = False
-    follow_on_experiment_previous_experiment_id = None
-    if ("follow_on_experiment" in targetExperiment) and (targetExperiment["follow_on_experiment"] == True):
-        is_follow_on_experiment = True
-        follow_on_experiment_previous_experiment_id = targetExperiment.get("follow_on_to_experiment_id", None)
-
-    # Re-sanitize the experiment name, since it's being used in the path
-    experimentNameForPath = experimentName
-    # Use a regex to remove all non-alphanumeric characters.  Convert spaces to dashes.
-    experimentNameForPath = re.sub(r'\W+', '', experimentNameForPath)
-    experimentNameForPath = experimentNameForPath.replace(" ", "-")
-
-    # Create the experiment output directory
-    experimentNameWithDate = experimentNameForPath + "-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    pathExperimentOutput = "generated-experiments/" + experimentNameWithDate + "/"
-    if (not os.path.exists(pathExperimentOutput)):
-        os.makedirs(pathExperimentOutput)
-
-    print("run_experiment(): Running experiment (ID: " + str(id) + "): Output folder is: " + str(pathExperimentOutput))
-
-    # Save the experiment output path to the experiment data
-    targetExperiment["experiment_path"] = pathExperimentOutput
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Re-load the experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return STATUS_FAILED_FILEIO
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == id):
-                experiment.update(targetExperiment)
-                break
-
-        # Save the updated experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "w") as f:
-                json.dump(experiments_data, f, indent=4)
-        except Exception as e:
-            print("ERROR: Could not save experiments file: " + str(e))
-            return STATUS_FAILED_FILEIO
-
-    startTime = datetime.datetime.now()
-
-    # Instantiate the ExperimentMaker
-    experimentMaker = ExperimentMaker(PATH_CODEBLOCKS)
-
-    # Create the experiment
-    # First: Check if this is a new experiment, or a follow-on experiment
-    combinedCodeblock = None
-    follow_on_description = None
-    if (is_follow_on_experiment == False):
-        # New experiment
-        # NOTE: I'm not sure initial code generation is currently included in the total experiment cost calculation.
-        print("New Experiment")
-        combinedCodeblock = experimentMaker.createExperiment(instructionStr, additionalInstructionStr, codeblocksToCombine, modelStr, max_tokens, temperature)
-
-        # Make sure the codeblock contains code -- if not, retry one time.
-        if (combinedCodeblock is None) or ("success" in combinedCodeblock and combinedCodeblock["success"] == False) or ("code" not in combinedCodeblock) or (combinedCodeblock["code"] == None):
-            # Something went wrong -- retry once
-            print("Retrying experiment creation...")
-            combinedCodeblock = experimentMaker.createExperiment(instructionStr, additionalInstructionStr, codeblocksToCombine, modelStr, max_tokens, temperature)
-
-    else:
-        # Follow-on experiment
-        print("Follow-on Experiment")
-        combinedCodeblock = follow_on_experiment_get_previous_experiment_info(follow_on_experiment_previous_experiment_id, targetExperiment)
-
-        # Get the follow-on description
-        follow_on_description = targetExperiment.get("experiment_description_follow_on", None)
-        print("Follow-on description: " + str(follow_on_description))
-
-        if (combinedCodeblock is None):
-            print("ERROR: Could not create follow-on experiment.")
-
-
-    # If the codeblock is still None, return
-    # This suggests that -- for whatever reason -- we were unable to generate the initial code for the experiment.
-    continue_experiment = True
-    if (combinedCodeblock is None) or ("success" in combinedCodeblock and combinedCodeblock["success"] == False) or ("code" not in combinedCodeblock) or (combinedCodeblock["code"] == None):
-        print("ERROR: Could not create experiment.")
-        continue_experiment = False
-        if (is_follow_on_experiment == True):
-            exit_status = STATUS_FAILED_TO_CREATE_FOLLOW_ON
-        else:
-            exit_status = STATUS_FAILED_TO_CREATE
-
-    # Main experiment cycle: Run the experiment, reflect on the output, and continue until a stop condition is reached.
-    # The main stop conditions are: (1) The experiment appears to be complete/work, or (2) some kind of limit is reached (e.g. cost, time, etc.)
-    history = None
-    historyPacked = None
-    if (continue_experiment == True):
-        history, historyPacked = experimentMaker.runAndReflectExperimentWithPackedHistory(combinedCodeblock, modelStr, MAX_REFLECTIONS=max_reflections, max_tokens=max_tokens, pathLogOutput=pathExperimentOutput, max_container_llm_cost_usd=max_container_llm_cost, max_runtime_seconds=max_runtime_seconds, max_runtime_seconds_pilot=max_runtime_seconds_pilot, max_experiment_cost=max_experiment_cost, follow_on_description=follow_on_description, use_faithfulness_reflection=use_faithfulness_reflection, hard_runtime_cutoff_seconds=hard_runtime_cutoff_seconds, temperature=temperature)
-
-    # Record how long it took to run the experiment
-    totalTimeSeconds = (datetime.datetime.now() - startTime).total_seconds()
-
-    # If the experiment failed, and returned a generic error, then change the error status to mark that the experiment failed AFTER running/reflection, for some reason (i.e. 'we got this far')
-    if (exit_status == STATUS_FAILED):
-        exit_status = STATUS_FAILED_AFTER_RUNNING
-
-    # Check the last step of the history to see if the experiment was successful (`is_ok` should be True)
-    if (history is not None) and (len(history) > 0):
-        lastStep = history[-1]
-        if ("is_ok" in lastStep) and (lastStep["is_ok"] == True):
-            exit_status = STATUS_COMPLETED
-
-        # Get (and save) the number of iterations run from the history
-        numIterationsRun = len(history)
-        targetExperiment["num_iterations_run"] = numIterationsRun
-        # Also look for the 'summary' and 'summary_short' keys in the history metadata
-        summary = None
-        summaryShort = None
-        interestingResults = None
-        if (historyPacked is not None) and ("summary" in historyPacked["metadata"]):
-            summary = historyPacked["metadata"]["summary"]
-        if (historyPacked is not None) and ("summary_short" in historyPacked["metadata"]):
-            summaryShort = historyPacked["metadata"]["summary_short"]
-        if (historyPacked is not None) and ("interesting_results" in historyPacked["metadata"]):
-            interestingResults = historyPacked["metadata"]["interesting_results"]
-        targetExperiment["results_summary"] = summary
-        targetExperiment["results_summary_short"] = summaryShort
-        targetExperiment["interesting_results"] = interestingResults
-
-        # Update the cost
-        cost_so_far = 0
-        cost_build_debug = 0
-        cost_llm_proxy = 0
-        if (historyPacked is not None) and ("total_cost" in historyPacked["metadata"]):
-            cost_so_far = historyPacked["metadata"]["total_cost"]
-            cost_build_debug = historyPacked["metadata"]["total_cost_build_debug"]
-            cost_llm_proxy = historyPacked["metadata"]["total_cost_llm_proxy"]
-
-        targetExperiment["cost_so_far"] = cost_so_far
-        targetExperiment["total_cost_build_debug"] = cost_build_debug
-        targetExperiment["total_cost_llm_proxy"] = cost_llm_proxy
-
-    # Update timestamp_finished
-    targetExperiment["timestamp_finished"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # Update time
-    targetExperiment["runtime_seconds"] = totalTimeSeconds
-
-    # Check to see if the experiment had any number of errors, and if so, update the status to reflect which kind of error.
-    if (history is not None) and (len(history) > 0):
-        lastStep = history[-1]
-        if ("is_ok" in lastStep) and (lastStep["is_ok"] == False):
-            # TODO: Check for max iterations
-            history_length = len(historyPacked["history"])
-            if (history_length >= max_reflections):
-                exit_status = STATUS_FAILED_TOO_MANY_ITERATIONS
-
-        # Check for cost limit exceeded
-        if (historyPacked["metadata"]["cost_limit_exceeded"] == True):
-            exit_status = STATUS_FAILED_COST_LIMIT
-
-        # Check for a container error
-        if (historyPacked["metadata"]["container_failure"] == True):
-            exit_status = STATUS_FAILED_CONTAINER_ERROR
-
-        # Check for code_complete_critical_error
-        if (historyPacked["metadata"]["code_complete_critical_error"] == True):
-            exit_status = STATUS_CODE_COMPLETE_CRITICAL_ERROR
-
-        # Check for error_code_parsing_issue
-        if (historyPacked["metadata"]["error_code_parsing_issue"] == True):
-            exit_status = STATUS_CODE_PARSING_ISSUE
-
-        # Check for hitting the hard runtime limit (hard_time_limit_reached)
-        if (historyPacked["metadata"]["hard_time_limit_reached"] == True):
-            exit_status = STATUS_HARD_RUNTIME_LIMIT_REACHED
-
-        # Add the experiment model to the metadata
-        historyPacked["metadata"]["experiment_building_agent_name"] = targetExperiment.get("experiment_building_agent_name", None)
-
-
-    # Save the experiment status/information back to the experiments JSON file
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Re-load the experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return STATUS_FAILED_FILEIO
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == id):
-                experiment.update(targetExperiment)
-                break
-
-        # Save the updated experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "w") as f:
-                json.dump(experiments_data, f, indent=4)
-        except Exception as e:
-            print("ERROR: Could not save experiments file: " + str(e))
-            return STATUS_FAILED_FILEIO
-
-    # Print the exit status
-    print("run_experiment(): Experiment (ID: " + str(id) + ") finished.  Exit status: " + str(exit_status))
-
-    # Return
-    return exit_status
-
+        print("ERROR: Could not check the experiment store for waiting experiments: " + str(e))
 
 
 #
@@ -1436,10 +884,9 @@ def process_request():
 @app.route('/queuestatus', methods=['GET', 'POST'])
 def get_task_stats():
 
-    # Get the number of currently active experiment workers
-    num_running_experiment_threads = 0
-    with THREAD_LOCK_EXPERIMENT_WORKERS:
-        num_running_experiment_threads = worker_thread_count["experiment_threads"]
+    # Get the number of currently active experiment workers (and the experiments waiting for one)
+    experimentSchedulerStats = experimentScheduler.get_stats()
+    num_running_experiment_threads = experimentSchedulerStats["num_running"]
 
     # Make a histogram of the different task types currently waiting in the queue
     taskTypeHist = {}
@@ -1449,9 +896,11 @@ def get_task_stats():
             taskTypeHist[taskType] = 0
         taskTypeHist[taskType] += 1
 
+    # Several tasks can be running at once (one or more per lane)
+    runningTaskTypes = [task.get("task_type", "unknown") for task in taskQueue.get_running_tasks()]
     currentTaskTypeBeingProcessed = None
-    if (CURRENT_TASK_BEING_PROCESSED is not None):
-        currentTaskTypeBeingProcessed = CURRENT_TASK_BEING_PROCESSED.get("task_type", "unknown")
+    if (len(runningTaskTypes) > 0):
+        currentTaskTypeBeingProcessed = ", ".join(runningTaskTypes)
 
     # Pack a response
     response_data = {
@@ -1459,8 +908,12 @@ def get_task_stats():
         'processed_tasks': len(processedTaskResults),
         'queued_task_type_histogram': taskTypeHist,
         'current_task_being_processed': currentTaskTypeBeingProcessed,
+        'running_task_types': runningTaskTypes,
+        'task_lanes': taskQueue.get_lane_stats(),
         "num_running_experiment_threads": num_running_experiment_threads,
-        "max_experiment_threads": MAX_EXPERIMENT_THREADS
+        "max_experiment_threads": MAX_EXPERIMENT_THREADS,
+        "experiment_scheduler": experimentSchedulerStats,
+        "experiment_workers": get_experiment_worker_status()
     }
 
     return jsonify(response_data), 200
@@ -1536,10 +989,12 @@ def get_task_stats_details():
 
 
     # Also add task currently being processed:
+    runningTaskTypes = [task.get("task_type", "unknown") for task in taskQueue.get_running_tasks()]
     currentTaskTypeBeingProcessed = None
-    if (CURRENT_TASK_BEING_PROCESSED is not None):
-        currentTaskTypeBeingProcessed = CURRENT_TASK_BEING_PROCESSED.get("task_type", "unknown")
+    if (len(runningTaskTypes) > 0):
+        currentTaskTypeBeingProcessed = ", ".join(runningTaskTypes)
     response['current_task_being_processed'] = currentTaskTypeBeingProcessed
+    response['task_lanes'] = taskQueue.get_lane_stats()
 
 
     # Show the last 10 tasks completed
@@ -1561,7 +1016,7 @@ def get_known_codeblock_names():
     import traceback
     try:
         # Load the codeblock store
-        codeblockStore = CodeBlockStore(PATH_CODEBLOCKS)
+        codeblockStore = getCodeBlockStore(PATH_CODEBLOCKS)
         # Get a list of all the codeblock names
         codeblockNames = codeblockStore.listCodeblocks()
         # Return
@@ -1856,34 +1311,69 @@ def process_request_startfollowonexperiment1():
 #
 #   Getting the experiment list
 #
+# Optional query parameters (with none, every full experiment record is returned, in the order they were added):
+#   status, batch_name:             Only experiments with this status/batch name
+#   created_after, created_before:  Only experiments created on/after (before) this date (`YYYY-MM-DD`, or `YYYY-MM-DD HH:MM:SS`)
+#   sort_by:                        One of EXPERIMENT_SORT_ORDERS (e.g. `newest_first`)
+#   offset, limit:                  The page of (matching, sorted) experiments to return
+#   fields:                         `summary` (only the keys needed to list the experiments -- see EXPERIMENT_SUMMARY_FIELDS), or a comma-separated list of keys
+# The response has an ETag (which changes whenever any experiment is added or changed), so a client can send it back (`If-None-Match`) to get an empty
+# `304 Not Modified` response if nothing has changed.
 @app.route('/getexperimentlist', methods=['GET'])
 def process_request_get_experiment_list():
-    # Get a list of all current/past experiments
-    allExperiments = []
-    experiments_data = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Actually, load the experiments from the file
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return jsonify({'error': 'Could not load experiments file: ' + str(e)}), 500
-
-    # Check for the experiment list
-    if ("experiment_list" not in experiments_data):
-        print("ERROR: Could not find 'experiment_list' in experiments data.")
-        return jsonify({'error': 'Could not find "experiment_list" in experiments data.'}), 500
-
-    # Add the experiments to the list
-    allExperiments = experiments_data["experiment_list"]
-
+    # Parse the query parameters
+    args = request.args
+    fields = None
+    if (args.get("fields", "") == "summary"):
+        fields = EXPERIMENT_SUMMARY_FIELDS
+    elif (len(args.get("fields", "")) > 0):
+        fields = [field.strip() for field in args.get("fields").split(",") if (len(field.strip()) > 0)]
+    try:
+        offset = int(args.get("offset", 0))
+        limit = None
+        if (args.get("limit", None) is not None):
+            limit = int(args.get("limit"))
+    except ValueError:
+        return jsonify({'error': '`offset` and `limit` must be integers'}), 400
+    if (offset < 0) or ((limit is not None) and (limit < 0)):
+        return jsonify({'error': '`offset` and `limit` must not be negative'}), 400
+    sort_by = args.get("sort_by", "added_asc")
+    if (sort_by not in EXPERIMENT_SORT_ORDERS):
+        return jsonify({'error': 'Unknown `sort_by` (known: ' + ", ".join(EXPERIMENT_SORT_ORDERS.keys()) + ')'}), 400
+
+    # If the client already has the current version of this list, there's nothing to send
+    try:
+        version = experimentStore.get_version()
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
+    etag = hashlib.sha256((version + "?" + json.dumps(sorted(args.items(multi=True)))).encode("utf-8")).hexdigest()[:32]
+    if (request.if_none_match.contains(etag)):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    # Get the (page of) experiments
+    experiments = []
+    total = 0
+    try:
+        experiments, total = experimentStore.query_experiments(status=args.get("status", None), batch_name=args.get("batch_name", None),
+                                                               created_after=args.get("created_after", None), created_before=args.get("created_before", None),
+                                                               sort_by=sort_by, offset=offset, limit=limit, fields=fields)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
 
     # Return the response
     response_data = {
-        'experiment_list': allExperiments
+        'experiment_list': experiments,
+        'total': total,
+        'offset': offset,
+        'limit': limit
     }
-    return jsonify(response_data), 200
+    response = make_response(jsonify(response_data), 200)
+    response.set_etag(etag)
+    return response
 
 
 # Endpoint to request that a specific experiment (by ID) is ZIPPED, with a link returned.
@@ -1905,28 +1395,13 @@ def process_request_zip_experiment():
     if (not isinstance(experiment_id, str)):
         experiment_id = str(experiment_id)
 
-    # Load the experiment file, and get the path to the experiment
-    experiments_data = None
+    # Load the experiment record, and get the path to the experiment
     targetExperiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Load the experiments from the file
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return jsonify({'error': 'Could not load experiments file: ' + str(e)}), 500
-
-        # Check for the experiment list
-        if ("experiment_list" not in experiments_data):
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return jsonify({'error': 'Could not find "experiment_list" in experiments data.'}), 500
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == experiment_id):
-                targetExperiment = experiment
-                break
+    try:
+        targetExperiment = experimentStore.get_experiment(experiment_id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
 
     # Check if the experiment was found
     if (targetExperiment is None):
@@ -2004,28 +1479,13 @@ def process_request_get_experiment_code():
     if (not isinstance(experiment_id, str)):
         experiment_id = str(experiment_id)
 
-    # Load the experiment file, and get the path to the experiment
-    experiments_data = None
+    # Load the experiment record, and get the path to the experiment
     targetExperiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Load the experiments from the file
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return jsonify({'error': 'Could not load experiments file: ' + str(e)}), 500
-
-        # Check for the experiment list
-        if ("experiment_list" not in experiments_data):
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return jsonify({'error': 'Could not find "experiment_list" in experiments data.'}), 500
-
-        # Find the experiment with the given ID
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["id"] == experiment_id):
-                targetExperiment = experiment
-                break
+    try:
+        targetExperiment = experimentStore.get_experiment(experiment_id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
 
     # Check if the experiment was found
     if (targetExperiment is None):
@@ -2048,29 +1508,22 @@ def process_request_get_experiment_code():
     if (not os.path.exists(experimentPath)):
         return jsonify({'error': 'The path for an experiment does not appear to exist on disk (ID: ' + str(experiment_id)} + ")"), 404
 
-    # Load the 'history.json' file from the experiment path
-    historyFilename = os.path.join(experimentPath, "history.json")
-    historyData = None
+    # Load the last step of the history (and its metadata) from the experiment path
     try:
-        with open(historyFilename, "r") as f:
-            historyData = json.load(f)
+        metadata, lastStep = loadLastHistoryStep(experimentPath)
     except Exception as e:
         print("ERROR: Could not load history file: " + str(e))
         return jsonify({'error': 'Could not load history file: ' + str(e)}), 500
 
     # Get the changelog in the metadata
-    metadata = historyData.get("metadata", None)
     change_log = None
     if (metadata is not None):
         change_log = metadata.get("change_log", None)
 
-    # Get the 'history' key (a list)
-    history = historyData.get("history", None)
-    if (history is None) or (not isinstance(history, list)) or (len(history) == 0):
-        return jsonify({'error': 'Could not find "history" key in history file.'}), 500
+    # Get the last step in the history
+    if (lastStep is None):
+        return jsonify({'error': 'Could not find any history for this experiment.'}), 500
 
-    # Get the last element in the history list
-    lastStep = history[-1]
     instruction_str = lastStep.get("instruction_str", None)
     requirements = lastStep.get("requirements", None)
     code = lastStep.get("code", None)
@@ -2111,33 +1564,71 @@ def process_request_get_experiment_code():
     return jsonify(response_data), 200
 
 
+# Live log for a (running) experiment: the stdout, stderr, and log entries of the most recent run of its code, read from the given offsets.
+# Poll with the offsets (and `run_folder`) from the previous response to get only what's new.  If a newer run has started since then, the offsets
+# refer to the old run's files -- so the new run is read from the start, and `run_folder_changed` is set (the client should clear what it has shown).
+@app.route('/experimentlivelog', methods=['GET', 'POST'])
+def process_request_get_experiment_live_log():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    experiment_id = data.get("experiment_id", None)
+    if (experiment_id is None):
+        return jsonify({'error': 'No experiment ID provided'}), 400
+    if (not isinstance(experiment_id, str)):
+        experiment_id = str(experiment_id)
+
+    # Load the experiment record, and get the path to the experiment
+    targetExperiment = None
+    try:
+        targetExperiment = experimentStore.get_experiment(experiment_id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
+
+    if (targetExperiment is None):
+        return jsonify({'error': 'Could not find experiment with ID: ' + str(experiment_id)}), 404
+
+    experimentPath = targetExperiment.get("experiment_path", None)
+    if (experimentPath is None) or (not os.path.exists(experimentPath)):
+        return jsonify({'error': 'Could not find path for experiment with ID: ' + str(experiment_id)}), 404
+
+    # Find the most recent run, and read its live log
+    runFolder = findLatestLiveRunFolder(experimentPath)
+    if (runFolder is None):
+        return jsonify({'error': 'No live log is available for this experiment (yet).'}), 404
+
+    offsets = {"stdout_offset": int(data.get("stdout_offset", 0)), "stderr_offset": int(data.get("stderr_offset", 0)), "log_offset": int(data.get("log_offset", 0))}
+    clientRunFolder = data.get("run_folder", None)
+    runFolderChanged = (clientRunFolder is not None) and (clientRunFolder != runFolder)
+    if (runFolderChanged):
+        offsets = {"stdout_offset": 0, "stderr_offset": 0, "log_offset": 0}
+
+    try:
+        response_data = readLiveLog(runFolder, max_bytes=int(data.get("max_bytes", 65536)), **offsets)
+    except Exception as e:
+        print("ERROR: Could not read live log: " + str(e))
+        return jsonify({'error': 'Could not read live log: ' + str(e)}), 500
+
+    response_data["experiment_id"] = experiment_id
+    response_data["status"] = targetExperiment.get("status", None)
+    response_data["run_folder_changed"] = runFolderChanged
+    return jsonify(response_data), 200
+
+
 # PDF Report serving
 # When getting a url request of the kind /pdfreport/<experiment_id>, this function will serve the PDF report for the experiment with the given ID.
 @app.route('/pdfreport/<experiment_id>', methods=['GET'])
 def serve_pdf_report(experiment_id):
     print("SERVING PDF REPORT (" + str(experiment_id) + ")")
-    # Open the experiment list, to find the path for this experiment
-    experiment_data = None
+    # Find the record for this experiment, to find the path for this experiment
     targetExperiment = None
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        # Load the experiments from the file
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiment_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return jsonify({'error': 'Could not load experiments file: ' + str(e)}), 500
-
-        # Check for the experiment list
-        if ("experiment_list" not in experiment_data):
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return jsonify({'error': 'Could not find "experiment_list" in experiments data.'}), 500
-
-        # Find the experiment with the given ID
-        for experiment in experiment_data["experiment_list"]:
-            if (experiment["id"] == experiment_id):
-                targetExperiment = experiment
-                break
+    try:
+        targetExperiment = experimentStore.get_experiment(experiment_id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return jsonify({'error': 'Could not load experiments: ' + str(e)}), 500
 
     # Check if the experiment was found
     if (targetExperiment is None):
@@ -2267,7 +1758,7 @@ def add_paper():
 @app.route('/getidealist', methods=['GET'])
 def get_idea_list():
     # Get the IdeaStore
-    ideaStore = IdeaStore()
+    ideaStore = getIdeaStore()
     # Get the list of ideas
     all_ideas = ideaStore.get_all_ideas()
 
@@ -2283,14 +1774,9 @@ def get_idea_list():
 @app.route('/getidea/<id>', methods=['GET'])
 def get_idea_single(id):
     # Get the IdeaStore
-    ideaStore = IdeaStore()
-    # Get the list of ideas
-    all_ideas = ideaStore.get_all_ideas()
-    query_idea = None
-    for idea in all_ideas:
-        if (idea["id"] == id):
-            query_idea = idea
-            break
+    ideaStore = getIdeaStore()
+    # Get the idea
+    query_idea = ideaStore.get_idea_by_id(id)
 
     # Return
     response_data = {
@@ -2304,7 +1790,7 @@ def get_idea_single(id):
 @app.route('/convertideatoexperimentprompt/<id>', methods=['GET'])
 def convert_idea_to_experiment(id):
     # Get the IdeaStore
-    ideaStore = IdeaStore()
+    ideaStore = getIdeaStore()
 
     # Get the list of ideas
     model_str = "claude-3-5-sonnet-20241022"
@@ -2389,7 +1875,8 @@ def metaanalysis_list():
 # App route: Get a list of all possible valid batch runs for the meta-analysis
 @app.route('/metaanalysis-batchruns-list', methods=['GET'])
 def metaanalysis_batchruns_list():
-    # Get the list of all batch runs
+    # Get the list of all batch runs (the meta-analysis reads the experiments from a JSON snapshot)
+    experimentStore.export_json(FILENAME_EXPERIMENTS)
     batch_prefixes_result = find_experiment_prefixes_for_metaanalysis(FILENAME_EXPERIMENTS)
     batches = []
     multi_run_experiments = {}
@@ -2487,6 +1974,9 @@ def metaanalysis():
         if (not os.path.exists("metaanalysis/")):
             os.makedirs("metaanalysis/")
 
+        # The meta-analysis reads the experiments from a JSON snapshot
+        experimentStore.export_json(FILENAME_EXPERIMENTS)
+
         # Check which case (batch run or bulk experiment run) we are dealing with
         if (batch_run_to_analyze is not None):
             # Perform the batch meta-analysis
@@ -2553,67 +2043,24 @@ def metaanalysis():
 #   Helpers
 #
 
-# Create a blank experiments filename
-def initialize_blank_experiment_list():
-    # Check for existing file
-    if (os.path.exists(FILENAME_EXPERIMENTS)):
-        print("Experiments file already exists.")
-        return
-
-    # Create a blank experiments file
-    experiments_data = {
-        "metadata": {},
-        "experiment_list": []
-    }
-
-    # Save the experiments data
-    try:
-        with open(FILENAME_EXPERIMENTS, "w") as f:
-            json.dump(experiments_data, f, indent=4)
-    except Exception as e:
-        print("ERROR: Could not save experiments file: " + str(e))
-        return {"success": False, "error": "Could not save experiments file: " + str(e)}
-
-    print("Created blank experiments file: " + str(FILENAME_EXPERIMENTS))
+# Initialize the experiment store, migrating any experiments from the (legacy) experiments JSON file the first time it's run.
+def initialize_experiment_store():
+    success = experimentStore.migrate_from_json(FILENAME_EXPERIMENTS)
+    print("Experiment store contains " + str(experimentStore.count_experiments()) + " experiments (" + str(experimentStore.db_filename) + ")")
+    return success
 
 
 # Check experiment list
 # This runs once, right when the program starts -- any experiments that were marked as 'running' will be marked as 'interrupted' if the server was restarted.
 def mark_running_experiments_as_interrupted():
-    # Thread lock
-    print("Fresh start: Checking experiments file for experiments listed as 'running', which should be set to 'interrupted'...")
-    with THREAD_LOCK_FILE_ALL_EXPERIMENTS_JSON:
-        count = 0
-
-        # Load all the experiments
-        experiment_data = None
-        try:
-            with open(FILENAME_EXPERIMENTS, "r") as f:
-                experiments_data = json.load(f)
-        except Exception as e:
-            print("ERROR: Could not load experiments file: " + str(e))
-            return {"success": False, "error": "Could not load experiments file: " + str(e)}
-
-        # Check for the experiment list
-        if ("experiment_list" not in experiments_data):
-            print("ERROR: Could not find 'experiment_list' in experiments data.")
-            return {"success": False, "error": "Could not find 'experiment_list' in experiments data."}
-
-        # Go through every experiment -- if it's status is 'running', change it to 'interrupted'
-        for experiment in experiments_data["experiment_list"]:
-            if (experiment["status"] == STATUS_RUNNING):
-                experiment["status"] = STATUS_INTERRUPTED
-                count += 1
-
-        # Save the updated experiments data
-        try:
-            with open(FILENAME_EXPERIMENTS, "w") as f:
-                json.dump(experiments_data, f, indent=4)
-        except Exception as e:
-            print("ERROR: Could not save experiments file: " + str(e))
-            return {"success": False, "error": "Could not save experiments file: " + str(e)}
+    print("Fresh start: Checking experiments for experiments listed as 'running', which should be set to 'interrupted'...")
+    try:
+        count = experimentStore.change_all_experiment_statuses(STATUS_RUNNING, STATUS_INTERRUPTED)
+    except Exception as e:
+        print("ERROR: Could not update experiments: " + str(e))
+        return {"success": False, "error": "Could not update experiments: " + str(e)}
 
-        print("Marked " + str(count) + " 'running' experiments as 'interrupted'.")
+    print("Marked " + str(count) + " 'running' experiments as 'interrupted'.")
 
 
 
@@ -2622,25 +2069,23 @@ def mark_running_experiments_as_interrupted():
 #   Main Server Entry-Point
 #
 
-# Start the background worker thread
-worker_thread = threading.Thread(target=task_worker, daemon=True)
-worker_thread.start()
-
+# NOTE: Everything that starts threads or the server has to stay inside the `__main__` check -- the experiment worker processes re-import this file
+# (as `__mp_main__`) when they start.
 if __name__ == '__main__':
-    # Check/validate the experiment list file
-    initialize_blank_experiment_list()
+    # Check/validate the experiment store (and migrate the legacy experiment list file, if needed)
+    # Critical error check -- the migration fails if the experiment IDs are not unique (if so, stop the server -- otherwise the worker thread will get stuck spawning the same experiment, and cost a lot of money)
+    store_initialized = initialize_experiment_store()
+    if (store_initialized == False):
+        print("ERROR: Could not initialize the experiment store (are all experiment IDs unique?). Stopping.")
+        # Exit
+        sys.exit(1)
+
     # If the server was interrupted with experiments running, mark those running experiments as 'interrupted'
     mark_running_experiments_as_interrupted()
 
-    # Critical error check -- make sure all the experiment IDs are unique (if not, stop the server -- otherwise the worker thread will get stuck spawning the same experiment, and cost a lot of money)
-    all_unique_result = ensure_all_experiment_ids_unique()
-    if (all_unique_result == False):
-        print("ERROR: Could not ensure all experiment IDs are unique. Stopping.")
-        # Signal to the worker thread to stop
-        EVENT_CRITICAL_STOP.set()
-        worker_thread.join()
-        # Exit
-        sys.exit(1)
+    # Start the background worker thread
+    worker_thread = threading.Thread(target=task_worker, daemon=True)
+    worker_thread.start()
 
     # Run the server on port 5001
     app.run(port=5001, debug=False)
@@ -5,6 +5,7 @@ import os
 import re
 import tqdm
 import difflib
+import threading
 from copy import deepcopy
 
 from ExtractionUtils import *
@@ -12,6 +13,213 @@ from ExtractionUtils import *
 from CodeBlockStore import *
 
 LLM_PROXY_BASE_PATH = "llm-proxy/"
+FILENAME_LLM_PROXY_RESPONSE_CACHE = "llm-proxy/llm-proxy-response-cache.json"       # Written by the LLM proxy (if its response cache is enabled), relative to the run folder
+
+# Sandbox backends that experiments can be run in
+SANDBOX_BACKEND_MODAL = "modal"
+SANDBOX_BACKEND_LOCAL_VENV = "local"               # Local (cached) Python virtual environment
+SANDBOX_BACKEND_LOCAL_DOCKER = "local-docker"      # Local container runtimes
+SANDBOX_BACKEND_LOCAL_PODMAN = "local-podman"
+SANDBOX_BACKENDS = [SANDBOX_BACKEND_MODAL, SANDBOX_BACKEND_LOCAL_VENV, SANDBOX_BACKEND_LOCAL_DOCKER, SANDBOX_BACKEND_LOCAL_PODMAN]
+
+# Get the module that runs programs in a given sandbox backend.  All of them implement the same `ACTION_RUN_PROGRAM` action and output format.
+def getSandboxModule(sandbox_backend:str):
+    if (sandbox_backend == SANDBOX_BACKEND_LOCAL_VENV):
+        from modules.ModuleRunPythonLocal import ModuleRunPythonLocal, LOCAL_RUNTIME_VENV
+        return ModuleRunPythonLocal(runtime=LOCAL_RUNTIME_VENV)
+    elif (sandbox_backend == SANDBOX_BACKEND_LOCAL_DOCKER):
+        from modules.ModuleRunPythonLocal import ModuleRunPythonLocal, LOCAL_RUNTIME_DOCKER
+        return ModuleRunPythonLocal(runtime=LOCAL_RUNTIME_DOCKER)
+    elif (sandbox_backend == SANDBOX_BACKEND_LOCAL_PODMAN):
+        from modules.ModuleRunPythonLocal import ModuleRunPythonLocal, LOCAL_RUNTIME_PODMAN
+        return ModuleRunPythonLocal(runtime=LOCAL_RUNTIME_PODMAN)
+
+    if (sandbox_backend != SANDBOX_BACKEND_MODAL):
+        print("WARNING: Unknown sandbox backend (" + str(sandbox_backend) + ").  Valid backends are: " + str(SANDBOX_BACKENDS) + ".  Defaulting to `" + SANDBOX_BACKEND_MODAL + "`.")
+    from modules.ModuleRunPythonInModal import ModuleRunPythonInModal
+    return ModuleRunPythonInModal()
+
+# Release any sandbox resources that are kept between the iterations of an experiment (i.e. the experiment's Modal volume, and any warm sandbox/container).
+# Called when an experiment finishes (however it finishes), and by the server if an experiment's worker process crashes.  Never raises.
+def releaseSandbox(sandbox_backend:str, basePath:str):
+    try:
+        if (sandbox_backend == SANDBOX_BACKEND_MODAL):
+            from modules.ModuleRunPythonInModal import deleteExperimentVolume, releaseWarmSandbox
+            releaseWarmSandbox(basePath)
+            deleteExperimentVolume(basePath)
+        else:
+            from modules.ModuleRunPythonLocal import releaseWarmContainer, LOCAL_RUNTIME_DOCKER, LOCAL_RUNTIME_PODMAN
+            runtime = None
+            if (sandbox_backend == SANDBOX_BACKEND_LOCAL_DOCKER):
+                runtime = LOCAL_RUNTIME_DOCKER
+            elif (sandbox_backend == SANDBOX_BACKEND_LOCAL_PODMAN):
+                runtime = LOCAL_RUNTIME_PODMAN
+            releaseWarmContainer(basePath, runtime=runtime)
+    except Exception as e:
+        print("WARNING: Could not release the sandbox resources for experiment (" + str(basePath) + "): " + str(e))
+
+
+#
+#   Supporting files
+#
+# The static supporting files (API keys, the LLM proxy, the common library) are read once per process, and only re-read if they change on disk.
+# The sandbox modules upload supporting files by content hash, so files that haven't changed since the last iteration aren't re-uploaded.
+THREAD_LOCK_STATIC_SUPPORTING_FILES = threading.Lock()
+static_supporting_files = {}        # local path -> (mtime_ns, size, contents)
+
+# Read a static supporting file (through the cache)
+def readStaticSupportingFile(localPath:str):
+    stat = os.stat(localPath)
+    with THREAD_LOCK_STATIC_SUPPORTING_FILES:
+        if (localPath in static_supporting_files):
+            mtime_ns, size, contents = static_supporting_files[localPath]
+            if (mtime_ns == stat.st_mtime_ns) and (size == stat.st_size):
+                return contents
+
+    with open(localPath, 'r') as file:
+        contents = file.read()
+    with THREAD_LOCK_STATIC_SUPPORTING_FILES:
+        static_supporting_files[localPath] = (stat.st_mtime_ns, stat.st_size, contents)
+    return contents
+
+# Add any `retain_files` in the `exec_result` of a history step to `retained_files` (later steps overwrite earlier ones)
+def collectRetainedFiles(histStep:dict, retained_files:dict):
+    if ("exec_result" in histStep):
+        for execResultStep in histStep["exec_result"]:
+            if ("retain_files" in execResultStep):
+                try:
+                    for retained_filename in execResultStep["retain_files"].keys():
+                        retained_files[retained_filename] = execResultStep["retain_files"][retained_filename]
+                except Exception as e:
+                    print("ERROR: Could not retain file from this step in history: " + str(e))
+
+
+# Read the LLM proxy's response cache from the output of the most recent run in a history step (or None, if there isn't one).  The cache is passed on to
+# the next run as-is, and is deliberately kept out of the history (unlike `retain_files`), since it can be several megabytes.
+def readLLMProxyResponseCache(histStep:dict):
+    execResults = histStep.get("exec_result", [])
+    if (len(execResults) == 0) or (not isinstance(execResults[-1], dict)) or (execResults[-1].get("file_path", None) is None):
+        return None
+    filenameCache = os.path.join(execResults[-1]["file_path"], FILENAME_LLM_PROXY_RESPONSE_CACHE)
+    if (not os.path.exists(filenameCache)):
+        return None
+    try:
+        with open(filenameCache, 'r') as f:
+            return f.read()
+    except Exception as e:
+        print("WARNING: Could not read the LLM proxy response cache (" + filenameCache + "): " + str(e))
+        return None
+
+
+#
+#   Experiment history files
+#
+# While an experiment is running, its history is saved incrementally: each step is appended (as one JSON line) to `history-steps.jsonl`, and the
+# metadata (costs, pilot mode, change log, etc.) is saved to the small `history-manifest.json`.  A step is re-appended when it changes (i.e. when
+# it's been executed, and has an `exec_result`) -- the last record for a given step index wins.  The full `history.json` is written once, when the
+# experiment finishes.
+FILENAME_HISTORY = "history.json"
+FILENAME_HISTORY_STEPS = "history-steps.jsonl"
+FILENAME_HISTORY_MANIFEST = "history-manifest.json"
+
+# Remove the (large) supporting files from a history step before it's saved
+def sanitizeHistoryStep(step:dict):
+    return {key: value for key, value in step.items() if key != "supporting_files"}
+
+# Append one history step to the experiment's step log
+def saveHistoryStep(pathLogOutput:str, stepIdx:int, step:dict):
+    record = {"step_index": stepIdx, "step": sanitizeHistoryStep(step)}
+    with open(os.path.join(pathLogOutput, FILENAME_HISTORY_STEPS), 'a') as file:
+        file.write(json.dumps(record) + "\n")
+
+# Save the history metadata (atomically, so readers never see a partially written manifest)
+def saveHistoryManifest(pathLogOutput:str, metadata:dict, numSteps:int):
+    filenameOut = os.path.join(pathLogOutput, FILENAME_HISTORY_MANIFEST)
+    filenameTemp = filenameOut + ".tmp"
+    with open(filenameTemp, 'w') as file:
+        json.dump({"metadata": metadata, "num_steps": numSteps}, file, indent=4)
+    os.replace(filenameTemp, filenameOut)
+
+# Load the history metadata from the manifest (returns None if there's no manifest)
+def loadHistoryManifest(pathExperiment:str):
+    filenameIn = os.path.join(pathExperiment, FILENAME_HISTORY_MANIFEST)
+    if (not os.path.exists(filenameIn)):
+        return None
+    with open(filenameIn, 'r') as file:
+        return json.load(file)
+
+# Load the packed history (`{"metadata": ..., "history": [...]}`) for an experiment.  Uses `history.json` if it exists (i.e. the experiment has
+# finished), otherwise reassembles it from the step log and manifest.  Returns None if no history could be found.
+def loadPackedHistory(pathExperiment:str):
+    filenameHistory = os.path.join(pathExperiment, FILENAME_HISTORY)
+    if (os.path.exists(filenameHistory)):
+        with open(filenameHistory, 'r') as file:
+            return json.load(file)
+
+    filenameSteps = os.path.join(pathExperiment, FILENAME_HISTORY_STEPS)
+    if (not os.path.exists(filenameSteps)):
+        return None
+
+    stepsByIdx = {}
+    with open(filenameSteps, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue        # A partially written last line (e.g. if the experiment was interrupted)
+            stepsByIdx[record["step_index"]] = record["step"]
+
+    manifest = loadHistoryManifest(pathExperiment)
+    metadata = {}
+    if (manifest is not None):
+        metadata = manifest.get("metadata", {})
+    return {"metadata": metadata, "history": [stepsByIdx[idx] for idx in sorted(stepsByIdx.keys())]}
+
+# Read the last complete line of a (JSONL) file, without reading the whole file
+def _readLastJSONLRecord(filenameIn:str, chunkSize:int=65536):
+    with open(filenameIn, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        buffer = b""
+        while (position > 0):
+            readSize = min(chunkSize, position)
+            position -= readSize
+            file.seek(position)
+            buffer = file.read(readSize) + buffer
+            chunkSize *= 2      # (steps can be large -- grow the read size, so long lines don't take many passes)
+            # Try the complete lines in the buffer, last first (the first line in the buffer is only complete if we've reached the start of the file)
+            lines = buffer.split(b"\n")
+            firstCompleteLine = 0 if (position == 0) else 1
+            for line in reversed(lines[firstCompleteLine:]):
+                if (len(line.strip()) == 0):
+                    continue
+                try:
+                    return json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    return None
+
+# Load the metadata and the last step of an experiment's history, without loading the full history.  Returns (metadata, lastStep), or (None, None)
+# if no history could be found.
+def loadLastHistoryStep(pathExperiment:str):
+    filenameSteps = os.path.join(pathExperiment, FILENAME_HISTORY_STEPS)
+    if (os.path.exists(filenameSteps)):
+        record = _readLastJSONLRecord(filenameSteps)
+        if (record is not None):
+            manifest = loadHistoryManifest(pathExperiment)
+            metadata = {}
+            if (manifest is not None):
+                metadata = manifest.get("metadata", {})
+            return metadata, record["step"]
+
+    # Fall back to the full history (e.g. experiments that were run before the step log existed)
+    historyPacked = loadPackedHistory(pathExperiment)
+    if (historyPacked is None):
+        return None, None
+    history = historyPacked.get("history", [])
+    if (len(history) == 0):
+        return historyPacked.get("metadata", {}), None
+    return historyPacked.get("metadata", {}), history[-1]
 
 class ExperimentMaker():
     # Constructor
@@ -19,7 +227,7 @@ class ExperimentMaker():
         self.PATH_CODEBLOCKS = PATH_CODEBLOCKS
 
         # Instantiate the CodeBlockStore
-        self.codeBlockStore = CodeBlockStore(PATH_CODEBLOCKS)
+        self.codeBlockStore = getCodeBlockStore(PATH_CODEBLOCKS)
 
         pass
 
@@ -29,15 +237,68 @@ class ExperimentMaker():
     # codeblocksToCombine = ["Logger/Debugging", "OpenAI/Anthropic LLM Example", "Together.ai LLM Example", "Non-parametric Bootstrap Resampling"]
     # instructionStr = "Please create a program that creates a dataset of 20 2-digit multiplication problems, and tests two different LLM models on this dataset.  Show the average performance of each model (in terms of correctness), and whether the better model is statistically significantly better than the other."
     # combinedCodeblock = codeblockStore.combineCodeblocks(instructionStr, codeblocksToCombine, modelStr=modelStr, max_tokens=16384, temperature=0.0)
-    def createExperiment(self, instructionStr:str, additionalInstructionStr:str, codeblocksToCombine:list, modelStr:str, max_tokens:int, temperature:float):
+    def createExperiment(self, instructionStr:str, additionalInstructionStr:str, codeblocksToCombine:list, modelStr:str, max_tokens:int, temperature:float, useCache:bool=None):
         # Create the combined codeblock
-        combinedCodeblock = self.codeBlockStore.combineCodeblocks(instructionStr, codeblocksToCombine, modelStr=modelStr, max_tokens=max_tokens, temperature=temperature, additionalInstructionStr=additionalInstructionStr)
+        combinedCodeblock = self.codeBlockStore.combineCodeblocks(instructionStr, codeblocksToCombine, modelStr=modelStr, max_tokens=max_tokens, temperature=temperature, additionalInstructionStr=additionalInstructionStr, useCache=useCache)
         return combinedCodeblock
 
 
+    # Get the supporting files that every experiment needs (API keys, the LLM proxy and its configuration, and the common library)
+    # llm_response_cache: Whether the LLM proxy should answer repeated deterministic (temperature 0) requests from a cache (kept across the experiment's runs -- see readLLMProxyResponseCache()).
+    # Either True/False, or the proxy's `response_cache` configuration (e.g. `{"enabled": true, "allow_nonzero_temperature": false, "max_size_mb": 4}`).
+    def getSupportingFiles(self, max_container_llm_cost_usd:float, llm_response_cache=False):
+        supportingFiles = []
+
+        # Add the `api_keys.donotcommit.json` file
+        supportingFiles.append({"filename": "llm-proxy/api_keys.donotcommit.json", "contents": readStaticSupportingFile("api_keys.donotcommit.json")})
+
+        # Add the LLM proxy files
+        # Proxy file 1: `llm-proxy-server.py`
+        supportingFiles.append({"filename": "llm-proxy/llm-proxy-server.py", "contents": readStaticSupportingFile(LLM_PROXY_BASE_PATH + "llm-proxy-server.py")})
+
+        # Proxy file 2: `experiment-llm-cost.json`
+        supportingFiles.append({"filename": "llm-proxy/experiment-llm-cost.json", "contents": readStaticSupportingFile(LLM_PROXY_BASE_PATH + "experiment-llm-cost.json")})
+
+        # Proxy file 3: `experiment-setup.json`
+        # Automatically generate the experiment cost/setup file for the LLM proxy.
+        # NOTE: This file can also be used to allow/disallow certain LLM models.
+        experiment_llm_setup_json = {
+            "notes": "This is an automatically-generated file that sets the maximum allowable cost to go through the LLM proxy server.",
+            "max_cost_usd": max_container_llm_cost_usd
+        }
+        if (type(llm_response_cache) == dict):
+            experiment_llm_setup_json["response_cache"] = llm_response_cache
+        elif (llm_response_cache == True):
+            experiment_llm_setup_json["response_cache"] = {"enabled": True}
+        supportingFiles.append({"filename": "llm-proxy/experiment-setup.json", "contents": json.dumps(experiment_llm_setup_json, indent=4)})
+
+        # Proxy file 4: The LLM library
+        supportingFiles.append({"filename": "llm_proxy_usage.py", "contents": readStaticSupportingFile(LLM_PROXY_BASE_PATH + "llm_proxy_usage.py")})
+
+        # Add the common library of experimental functions
+        commonLibrary = ""
+        commonLibraryPath = os.path.join(self.codeBlockStore.path_codeblocks, FILENAME_COMMON_LIBRARY)
+        try:
+            commonLibrary = readStaticSupportingFile(commonLibraryPath)
+        except Exception as e:
+            print("ERROR: Could not load common library from: " + commonLibraryPath)
+            print("ERROR: " + str(e))
+        supportingFiles.append({"filename": "experiment_common_library.py", "contents": commonLibrary})
+
+        return supportingFiles
+
+
+    # Release any sandbox resources that are kept between the iterations of an experiment (i.e. the experiment's Modal volume, and any warm sandbox)
+    def releaseSandbox(self, sandbox_backend:str, basePath:str):
+        releaseSandbox(sandbox_backend, basePath)
+
+
     # Execute an experiment in a container
-    def executeExperiment(self, codeStruct, basePath:str=None, max_runtime_seconds:int=600, apt_packages = ["git", "wget", "curl", "openjdk-17-jre"]):
-        print("MODAL DEBUG: executeExperiment() started.... (basePath = " + str(basePath) + ")")
+    # sandbox_backend: Where to run the experiment -- one of SANDBOX_BACKENDS (`modal`, or a local virtual environment/container runtime)
+    # watchdog_config: When to stop a run before its timeout (cost limit exceeded, repeated errors, no output) -- see SandboxWatchdog.  None uses the defaults.
+    # keep_sandbox_warm: Keep the sandbox running after the run, so the next run (of the same experiment, i.e. `basePath`) can reuse it -- see releaseSandbox().
+    def executeExperiment(self, codeStruct, basePath:str=None, max_runtime_seconds:int=600, apt_packages = ["git", "wget", "curl", "openjdk-17-jre"], sandbox_backend:str=SANDBOX_BACKEND_MODAL, watchdog_config:dict=None, keep_sandbox_warm:bool=False):
+        print("MODAL DEBUG: executeExperiment() started.... (basePath = " + str(basePath) + ", sandbox_backend = " + str(sandbox_backend) + ")")
         # Get the code
         code = codeStruct["code"]
         # Get the requirements
@@ -45,9 +306,8 @@ class ExperimentMaker():
         # Get the supporting files
         supportingFiles = codeStruct["supporting_files"]
 
-        # Run the code in a Modal container
-        from modules.ModuleRunPythonInModal import ModuleRunPythonInModal
-        moduleModal = ModuleRunPythonInModal()
+        # Run the code in a Modal container, or locally
+        moduleSandbox = getSandboxModule(sandbox_backend)
 
         # Assemble the packet
         # Faux payload
@@ -59,13 +319,15 @@ class ExperimentMaker():
                 "supporting_files": supportingFiles,
                 "base_path": basePath,
                 "max_runtime_seconds": max_runtime_seconds,
-                "apt_packages": apt_packages
+                "apt_packages": apt_packages,
+                "watchdog": watchdog_config,
+                "keep_sandbox_warm": keep_sandbox_warm
             }
         }
 
         # Run the action
         #result = moduleDocker.runAction(moduleDocker.ACTION_RUN_PROGRAM["name"], payload)
-        result = moduleModal.runAction(moduleModal.ACTION_RUN_PROGRAM["name"], payload)
+        result = moduleSandbox.runAction(moduleSandbox.ACTION_RUN_PROGRAM["name"], payload)
 
         # Print result
         print("Result:")
@@ -79,6 +341,10 @@ class ExperimentMaker():
             # Also copy over 'errors'
             if ("errors" in result):
                 packedOutput["execution_errors"] = result["errors"]
+            # If the run was stopped early, make sure the reason is visible alongside the other errors
+            if (packedOutput is not None) and (packedOutput.get("watchdog_abort", None) is not None):
+                watchdogAbort = packedOutput["watchdog_abort"]
+                packedOutput["execution_errors"] = list(packedOutput.get("execution_errors", [])) + ["The program was stopped early, before its time limit, because it didn't appear to be making progress (" + str(watchdogAbort.get("reason", None)) + "): " + str(watchdogAbort.get("message", ""))]
             # Store the output
             codeStruct["exec_result"].append(packedOutput)
 
@@ -91,11 +357,11 @@ class ExperimentMaker():
     # This is the main function that runs an experiment, reflects on the results of the experiment, and generates new code to fix any issues.
     # max_container_llm_cost_usd: The maximum cost of the container that is allowed to be used for the LLM proxy server.  If the cost exceeds this amount, the code will receive an error.
     # NOTE: The experiment cost currently does not include the Modal container cost, since this is typically small.
-    def runAndReflectExperiment(self, codeStructIn_:dict, modelStr:str, MAX_REFLECTIONS = 5, pathLogOutput:str="generated/", max_tokens:int=32000, max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_experiment_cost:float=0.00, follow_on_description=None, use_faithfulness_reflection:bool=False, hard_runtime_cutoff_seconds:float=60*60*6, temperature=0.0):
-        history, historyPacked = self.runAndReflectExperimentWithPackedHistory(codeStructIn_, modelStr, MAX_REFLECTIONS, pathLogOutput, max_tokens, max_container_llm_cost_usd, max_runtime_seconds, max_experiment_cost=max_experiment_cost, follow_on_description=follow_on_description, use_faithfulness_reflection=use_faithfulness_reflection, hard_runtime_cutoff_seconds=hard_runtime_cutoff_seconds, temperature=temperature)
+    def runAndReflectExperiment(self, codeStructIn_:dict, modelStr:str, MAX_REFLECTIONS = 5, pathLogOutput:str="generated/", max_tokens:int=32000, max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_experiment_cost:float=0.00, follow_on_description=None, use_faithfulness_reflection:bool=False, hard_runtime_cutoff_seconds:float=60*60*6, temperature=0.0, sandbox_backend:str=SANDBOX_BACKEND_MODAL, keep_sandbox_warm:bool=False, llm_response_cache=False):
+        history, historyPacked = self.runAndReflectExperimentWithPackedHistory(codeStructIn_, modelStr, MAX_REFLECTIONS, pathLogOutput, max_tokens, max_container_llm_cost_usd, max_runtime_seconds, max_experiment_cost=max_experiment_cost, follow_on_description=follow_on_description, use_faithfulness_reflection=use_faithfulness_reflection, hard_runtime_cutoff_seconds=hard_runtime_cutoff_seconds, temperature=temperature, sandbox_backend=sandbox_backend, keep_sandbox_warm=keep_sandbox_warm, llm_response_cache=llm_response_cache)
         return history
 
-    def runAndReflectExperimentWithPackedHistory(self, codeStructIn_:dict, modelStr:str, MAX_REFLECTIONS = 5, pathLogOutput:str="generated/", max_tokens:int=32000, max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_runtime_seconds_pilot=600, max_experiment_cost:float=0.00, follow_on_description=None, use_faithfulness_reflection:bool=False, hard_runtime_cutoff_seconds:float=60*60*6, temperature=0.0):
+    def runAndReflectExperimentWithPackedHistory(self, codeStructIn_:dict, modelStr:str, MAX_REFLECTIONS = 5, pathLogOutput:str="generated/", max_tokens:int=32000, max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_runtime_seconds_pilot=600, max_experiment_cost:float=0.00, follow_on_description=None, use_faithfulness_reflection:bool=False, hard_runtime_cutoff_seconds:float=60*60*6, temperature=0.0, sandbox_backend:str=SANDBOX_BACKEND_MODAL, keep_sandbox_warm:bool=False, llm_response_cache=False):
         startTime = time.time()
 
         # Make sure the codeStructIn_ contains code
@@ -110,46 +376,8 @@ class ExperimentMaker():
         for key in codeStructIn_:
             codeStructIn[key] = codeStructIn_[key]
 
-        # Add the `api_keys.donotcommit.json` file
-        supportingFileAPIKeys = {"filename": "llm-proxy/api_keys.donotcommit.json", "contents": None}
-        with open("api_keys.donotcommit.json", 'r') as file:
-            supportingFileAPIKeys["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileAPIKeys)
-
-        # Add the LLM proxy files
-        # Proxy file 1: `llm-proxy-server.py`
-        supportingFileLLMProxy = {"filename": "llm-proxy/llm-proxy-server.py", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "llm-proxy-server.py", 'r') as file:
-            supportingFileLLMProxy["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxy)
-
-        # Proxy file 2: `experiment-llm-cost.json`
-        supportingFileLLMProxyCost = {"filename": "llm-proxy/experiment-llm-cost.json", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "experiment-llm-cost.json", 'r') as file:
-            supportingFileLLMProxyCost["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxyCost)
-
-        # Proxy file 3: `experiment-setup.json`
-        supportingFileLLMProxySetup = {"filename": "llm-proxy/experiment-setup.json", "contents": None}
-        # Automatically generate the experiment cost/setup file for the LLM proxy.
-        # NOTE: This file can also be used to allow/disallow certain LLM models.
-        experiment_llm_setup_json = {
-            "notes": "This is an automatically-generated file that sets the maximum allowable cost to go through the LLM proxy server.",
-            "max_cost_usd": max_container_llm_cost_usd
-        }
-        supportingFileLLMProxySetup["contents"] = json.dumps(experiment_llm_setup_json, indent=4)
-        codeStructIn["supporting_files"].append(supportingFileLLMProxySetup)
-
-        # Proxy file 4: The LLM library
-        supportingFileLLMProxyLib = {"filename": "llm_proxy_usage.py", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "llm_proxy_usage.py", 'r') as file:
-            supportingFileLLMProxyLib["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxyLib)
-
-        # Add the common library of experimental functions
-        supportingFileCommonLib = {"filename": "experiment_common_library.py", "contents": None}
-        supportingFileCommonLib["contents"] = self.codeBlockStore.getCommonLibrary()
-        codeStructIn["supporting_files"].append(supportingFileCommonLib)
+        # Add the supporting files (API keys, LLM proxy, common library)
+        codeStructIn["supporting_files"].extend(self.getSupportingFiles(max_container_llm_cost_usd, llm_response_cache=llm_response_cache))
 
 
         # Keep track of whether the cost limit has been exceeded
@@ -160,152 +388,150 @@ class ExperimentMaker():
         history.append(codeStructIn)
         historyPacked = {}
 
+        # Start a new step log for this run (the history is saved incrementally -- see `saveHistoryStep()`)
+        if (pathLogOutput[-1] != "/"):
+            pathLogOutput += "/"
+        if (not os.path.exists(pathLogOutput)):
+            os.makedirs(pathLogOutput)
+        if (os.path.exists(pathLogOutput + FILENAME_HISTORY_STEPS)):
+            os.remove(pathLogOutput + FILENAME_HISTORY_STEPS)
+
+        # Files retained across container runs (from the `exec_result` of each history step).  Updated as each step is executed, rather than re-scanning the whole history.
+        retained_files = {}
+        collectRetainedFiles(codeStructIn, retained_files)
+        # The LLM proxy's response cache (if enabled), carried from each run to the next
+        llm_proxy_response_cache = None
+
         # Keep track of the number of consecutive container errors.
         consecutive_container_errors = 0        # Keep track of consecutive container errors.  Exit if this exceeds a certain number.
         MAX_CONSECUTIVE_CONTAINER_ERRORS = 3     # The maximum number of consecutive container errors before exiting.
         container_failure = False
         hard_time_limit_reached = False
-        # Run the code, and reflect on it's output.  Repeat until the model believes the execution is correct, and that it's fixed any issues.
-        for i in range(MAX_REFLECTIONS):
-            deltaTimeSeconds = time.time() - startTime
-            print("-" * 80)
-            print("Reflection " + str(i+1) + " of " + str(MAX_REFLECTIONS))
-            print("Elapsed experiment time: " + str(round(deltaTimeSeconds, 2)) + " seconds (hard time limit: " + str(int(hard_runtime_cutoff_seconds)) + " seconds)")
-            print("-" * 80)
-
-            # Check the hard time limit
-            if (deltaTimeSeconds >= hard_runtime_cutoff_seconds):
-                print("ERROR: Exceeded the hard runtime cutoff of " + str(hard_runtime_cutoff_seconds) + " seconds (Current runtime: " + str(deltaTimeSeconds) + " seconds). Exiting.")
-                hard_time_limit_reached = True
-                break
-
-            # Check what mode we're in -- MINI_PILOT, or something else.  If we're in MINI_PILOT mode, we'll use a shorter runtime.
-            currentMode = "MINI_PILOT"
-            if (len(history) > 1):
-                lastHistoryStep = history[-1]
-                if ("next_pilot_mode" in lastHistoryStep):
-                    currentMode = lastHistoryStep["next_pilot_mode"]
-            currentMaxRuntime = max_runtime_seconds
-            if (currentMode == "MINI_PILOT"):
-                currentMaxRuntime = max_runtime_seconds_pilot
-            print("Current mode: " + currentMode)
-            print("Current max runtime for this mode: " + str(currentMaxRuntime) + " seconds")
-
-            # Collect all `retained_files` from the history, and add them to the supporting files.  `retained_files` are in the `exec_result` of each history step.
-            retained_files = {}
-            for histStep in history:
-                if ("exec_result" in histStep):
-                    for execResultStep in histStep["exec_result"]:
-                        if ("retain_files" in execResultStep):
-                            try:
-                                for retained_filename in execResultStep["retain_files"].keys():
-                                    retained_files[retained_filename] = execResultStep["retain_files"][retained_filename]
-                            except Exception as e:
-                                print("ERROR: Could not retain file from this step in history: " + str(e))
-
-            print("Found " + str(len(retained_files)) + " retained files from the history.")
-
-            # Remove any past `retained_files` from the supporting files
-            supporting_files_before = len(codeStructIn["supporting_files"])
-            codeStructIn["supporting_files"] = [x for x in codeStructIn["supporting_files"] if x["filename"] not in retained_files]
-            print("Removed " + str(supporting_files_before - len(codeStructIn["supporting_files"])) + " retained files from the supporting files, that should be overwritten with new copies.")
-
-            # Add the retained files to the supporting files
-            print("Adding retained files to supporting files... (total files: " + str(len(retained_files)) + ")")
-            for retained_filename in retained_files:
-                print("Adding retained file to supporting files: " + retained_filename)
-                contents = retained_files[retained_filename]
-                if (not isinstance(contents, str)):
-                    try:
-                        contents = json.dumps(retained_files[retained_filename], indent=4)
-                    except:
-                        contents = str(retained_files[retained_filename])
-                supportingFileRetained = {"filename": retained_filename, "contents": contents}
-                codeStructIn["supporting_files"].append(supportingFileRetained)
-
-
-            # Execute the experiment
-            codeStructOut = self.executeExperiment(codeStructIn, basePath=pathLogOutput, max_runtime_seconds=currentMaxRuntime)
-
-            # Early stopping -- look for consecutive container errors
-            if ("exec_result" in codeStructOut):
-                execResult = codeStructOut["exec_result"]
-                if ("modal_container_completed" in execResult):
-                    if (execResult["modal_container_completed"] == False):
-                        print("ERROR: The Modal container did not complete successfully.")
-                        consecutive_container_errors += 1
+        # NOTE: The sandbox resources kept between runs (volume, warm sandbox/container) are released however the loop exits (including on an exception)
+        try:
+            # Run the code, and reflect on it's output.  Repeat until the model believes the execution is correct, and that it's fixed any issues.
+            for i in range(MAX_REFLECTIONS):
+                deltaTimeSeconds = time.time() - startTime
+                print("-" * 80)
+                print("Reflection " + str(i+1) + " of " + str(MAX_REFLECTIONS))
+                print("Elapsed experiment time: " + str(round(deltaTimeSeconds, 2)) + " seconds (hard time limit: " + str(int(hard_runtime_cutoff_seconds)) + " seconds)")
+                print("-" * 80)
+
+                # Check the hard time limit
+                if (deltaTimeSeconds >= hard_runtime_cutoff_seconds):
+                    print("ERROR: Exceeded the hard runtime cutoff of " + str(hard_runtime_cutoff_seconds) + " seconds (Current runtime: " + str(deltaTimeSeconds) + " seconds). Exiting.")
+                    hard_time_limit_reached = True
+                    break
+
+                # Check what mode we're in -- MINI_PILOT, or something else.  If we're in MINI_PILOT mode, we'll use a shorter runtime.
+                currentMode = "MINI_PILOT"
+                if (len(history) > 1):
+                    lastHistoryStep = history[-1]
+                    if ("next_pilot_mode" in lastHistoryStep):
+                        currentMode = lastHistoryStep["next_pilot_mode"]
+                currentMaxRuntime = max_runtime_seconds
+                if (currentMode == "MINI_PILOT"):
+                    currentMaxRuntime = max_runtime_seconds_pilot
+                print("Current mode: " + currentMode)
+                print("Current max runtime for this mode: " + str(currentMaxRuntime) + " seconds")
+
+                # Add the `retained_files` from the history to the supporting files.
+                print("Found " + str(len(retained_files)) + " retained files from the history.")
+
+                # Remove any past `retained_files` from the supporting files
+                supporting_files_before = len(codeStructIn["supporting_files"])
+                codeStructIn["supporting_files"] = [x for x in codeStructIn["supporting_files"] if x["filename"] not in retained_files]
+                print("Removed " + str(supporting_files_before - len(codeStructIn["supporting_files"])) + " retained files from the supporting files, that should be overwritten with new copies.")
+
+                # Add the retained files to the supporting files
+                print("Adding retained files to supporting files... (total files: " + str(len(retained_files)) + ")")
+                for retained_filename in retained_files:
+                    print("Adding retained file to supporting files: " + retained_filename)
+                    contents = retained_files[retained_filename]
+                    if (not isinstance(contents, str)):
+                        try:
+                            contents = json.dumps(retained_files[retained_filename], indent=4)
+                        except:
+                            contents = str(retained_files[retained_filename])
+                    supportingFileRetained = {"filename": retained_filename, "contents": contents}
+                    codeStructIn["supporting_files"].append(supportingFileRetained)
+
+                # Add the LLM proxy's response cache from the previous run
+                codeStructIn["supporting_files"] = [x for x in codeStructIn["supporting_files"] if x["filename"] != FILENAME_LLM_PROXY_RESPONSE_CACHE]
+                if (llm_proxy_response_cache is not None):
+                    codeStructIn["supporting_files"].append({"filename": FILENAME_LLM_PROXY_RESPONSE_CACHE, "contents": llm_proxy_response_cache})
+
+
+                # Execute the experiment
+                codeStructOut = self.executeExperiment(codeStructIn, basePath=pathLogOutput, max_runtime_seconds=currentMaxRuntime, sandbox_backend=sandbox_backend, keep_sandbox_warm=keep_sandbox_warm)
+                collectRetainedFiles(codeStructOut, retained_files)
+                if (llm_response_cache != False):
+                    llm_proxy_response_cache = readLLMProxyResponseCache(codeStructOut) or llm_proxy_response_cache
+
+                # Early stopping -- look for consecutive container errors
+                if ("exec_result" in codeStructOut):
+                    execResult = codeStructOut["exec_result"]
+                    if ("modal_container_completed" in execResult):
+                        if (execResult["modal_container_completed"] == False):
+                            print("ERROR: The Modal container did not complete successfully.")
+                            consecutive_container_errors += 1
+                        else:
+                            consecutive_container_errors = 0
                     else:
                         consecutive_container_errors = 0
                 else:
                     consecutive_container_errors = 0
-            else:
-                consecutive_container_errors = 0
-
-            if (consecutive_container_errors >= MAX_CONSECUTIVE_CONTAINER_ERRORS):
-                container_failure = True
-                print("ERROR: Exceeded the maximum number of consecutive container errors (" + str(MAX_CONSECUTIVE_CONTAINER_ERRORS) + ").  Exiting.")
-                break
-
-
-            # Step 4: Reflect
-            # Reflect on the code execution
-            codeblockStore = CodeBlockStore(self.PATH_CODEBLOCKS)
-            # Assemble a changelog for the debugger
-            change_log = []
-            for histStep1 in history:
-                    # Deep copy
-                histStep = deepcopy(histStep1)
-                packedStep = {}
-                packedStep["issues"] = []
-                packedStep["summary_of_changes"] = []
-                if ("issues" in histStep):
-                    packedStep["issues"] = histStep["issues"]
-                if ("summary_of_changes" in histStep):
-                    packedStep["summary_of_changes"] = histStep["summary_of_changes"]
-                if ("additional_simulated_code_issues" in histStep):
-                    packedStep["additional_simulated_code_issues"] = histStep["additional_simulated_code_issues"]
-                change_log.append(packedStep)
-
-            reflectionCodeblock = codeblockStore.reflectCodeblocks(codeStructOut, modelStr=modelStr, max_tokens=max_tokens, temperature=temperature, follow_on_description=follow_on_description, max_runtime_seconds=currentMaxRuntime, change_log=change_log, use_faithfulness_reflection=use_faithfulness_reflection)
-            history.append(reflectionCodeblock)
-
-            # Make the reflection the new codeStructIn
-            codeStructIn = reflectionCodeblock
-
-            # Save
-            # Check that the output directory exists exists
-            if (pathLogOutput[-1] != "/"):
-                pathLogOutput += "/"
-            if (not os.path.exists(pathLogOutput)):
-                os.makedirs(pathLogOutput)
-
-            print(json.dumps(reflectionCodeblock, indent=4))
-            print("Saving `" + str(pathLogOutput) + "/" + "reflectionCodeblock.json`...")
-
-            with open(pathLogOutput + "reflectionCodeblock.json", 'w') as file:
-                reflectedCodeblock1 = deepcopy(reflectionCodeblock)
-                # Delete the 'supporting files' key
-                if ("supporting_files" in reflectedCodeblock1):
-                    del reflectedCodeblock1["supporting_files"]
-
-                json.dump(reflectedCodeblock1, file, indent=4)
-
-            # Save the history
-            print("Saving `" + str(pathLogOutput) + "/" + "history.json`...")
-            with open(pathLogOutput + "history.json", 'w') as file:
-                sanitizedHistory = []
-                for histStep1 in history:
-                    # Deep copy
-                    histStep = deepcopy(histStep1)
-
-                    if ("supporting_files" in histStep1):
-                        del histStep["supporting_files"]
-                    sanitizedHistory.append(histStep)
+
+                if (consecutive_container_errors >= MAX_CONSECUTIVE_CONTAINER_ERRORS):
+                    container_failure = True
+                    print("ERROR: Exceeded the maximum number of consecutive container errors (" + str(MAX_CONSECUTIVE_CONTAINER_ERRORS) + ").  Exiting.")
+                    break
+
+
+                # Step 4: Reflect
+                # Reflect on the code execution
+                codeblockStore = getCodeBlockStore(self.PATH_CODEBLOCKS)
+                # Assemble a changelog for the debugger
+                change_log = []
+                for histStep in history:
+                    packedStep = {}
+                    packedStep["issues"] = []
+                    packedStep["summary_of_changes"] = []
+                    if ("issues" in histStep):
+                        packedStep["issues"] = histStep["issues"]
+                    if ("summary_of_changes" in histStep):
+                        packedStep["summary_of_changes"] = histStep["summary_of_changes"]
+                    if ("additional_simulated_code_issues" in histStep):
+                        packedStep["additional_simulated_code_issues"] = histStep["additional_simulated_code_issues"]
+                    change_log.append(packedStep)
+
+                reflectionCodeblock = codeblockStore.reflectCodeblocks(codeStructOut, modelStr=modelStr, max_tokens=max_tokens, temperature=temperature, follow_on_description=follow_on_description, max_runtime_seconds=currentMaxRuntime, change_log=change_log, use_faithfulness_reflection=use_faithfulness_reflection)
+                history.append(reflectionCodeblock)
+
+                # Make the reflection the new codeStructIn
+                codeStructIn = reflectionCodeblock
+
+                # Save
+                # Check that the output directory exists exists
+                if (pathLogOutput[-1] != "/"):
+                    pathLogOutput += "/"
+                if (not os.path.exists(pathLogOutput)):
+                    os.makedirs(pathLogOutput)
+
+                print(json.dumps(reflectionCodeblock, indent=4))
+                print("Saving `" + str(pathLogOutput) + "/" + "reflectionCodeblock.json`...")
+
+                with open(pathLogOutput + "reflectionCodeblock.json", 'w') as file:
+                    json.dump(sanitizeHistoryStep(reflectionCodeblock), file, indent=4)
+
+                # Save the history.  Only the steps that changed are appended to the step log: the step that was just executed (which now has an `exec_result`), and the new reflection.
+                saveHistoryStep(pathLogOutput, len(history)-2, history[-2])
+                saveHistoryStep(pathLogOutput, len(history)-1, history[-1])
 
                 # Pack the history with some metadata
                 # Metadata 1: Cost
                 totalCost = 0
-                for histStep in sanitizedHistory:
+                for histStep in history:
                     if ("cost" in histStep) and (type(histStep["cost"]) == float):
                         totalCost += histStep["cost"]
                 # Metadata 2: Is the final reflection OK?
@@ -320,10 +546,10 @@ class ExperimentMaker():
                     next_pilot_mode = reflectionCodeblock["next_pilot_mode"]
 
                 # Metadata 3: Total number of reflections
-                numReflections = len(sanitizedHistory)
+                numReflections = len(history)
                 # Metadata 4: The issues/changelog
                 changeLog = []
-                for histStep in sanitizedHistory:
+                for histStep in history:
                     packedStep = {}
                     packedStep["issues"] = []
                     packedStep["summary_of_changes"] = []
@@ -338,7 +564,7 @@ class ExperimentMaker():
 
                 # Metadata 6: LLM Proxy cost
                 # Get the 'exec_result' of the last history step
-                lastHistoryStep = sanitizedHistory[-1]
+                lastHistoryStep = history[-1]
                 llm_proxy_total_cost = 0
                 if ("exec_result" in lastHistoryStep):
                     for execResult in lastHistoryStep["exec_result"]:
@@ -403,8 +629,7 @@ class ExperimentMaker():
                     "hard_runtime_cutoff_seconds": hard_runtime_cutoff_seconds,
                     "change_log": changeLog
                 }
-                historyPacked["history"] = sanitizedHistory
-                json.dump(historyPacked, file, indent=4)
+                saveHistoryManifest(pathLogOutput, historyPacked["metadata"], len(history))
 
 
                 # Check if we're done
@@ -425,6 +650,10 @@ class ExperimentMaker():
                 if (error_code_parsing_issue == True):
                     print("*** Code parsing issue detected.  Exiting at step " + str(i+1) + " of " + str(MAX_REFLECTIONS) + " reflections.")
                     break
+        finally:
+            # No more runs for this experiment
+            self.releaseSandbox(sandbox_backend, pathLogOutput)
+
 
         # Learn lessons: Reflect on the reflection, to see if there are any lessons that can be learned from any mistakes that occurred, that we can store to improve future code generation.
         print("-" * 80)
@@ -513,9 +742,11 @@ class ExperimentMaker():
             historyPacked["metadata"]["error_code_parsing_issue"] = False
 
 
-        # Save the history
-        print("Saving `" + str(pathLogOutput) + "/" + "history.json`...")
-        with open(pathLogOutput + "history.json", 'w') as file:
+        # Save the history (the full history is only written once, at the end)
+        print("Saving `" + str(pathLogOutput) + "/" + FILENAME_HISTORY + "`...")
+        historyPacked["history"] = [sanitizeHistoryStep(histStep) for histStep in history]
+        saveHistoryManifest(pathLogOutput, historyPacked["metadata"], len(history))
+        with open(pathLogOutput + FILENAME_HISTORY, 'w') as file:
             json.dump(historyPacked, file, indent=4)
 
         print("Done.")
@@ -545,7 +776,7 @@ class ExperimentMaker():
         return newCodeStruct
 
     # Execute the most recent code, and save the output
-    def executeCurrentCode(self, lastCodeStruct:dict, pathLogOutput:str="generated/", max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_runtime_seconds_pilot=600, apt_packages = ["git", "wget", "curl", "openjdk-17-jre"]):
+    def executeCurrentCode(self, lastCodeStruct:dict, pathLogOutput:str="generated/", max_container_llm_cost_usd:float=0.25, max_runtime_seconds=600, max_runtime_seconds_pilot=600, apt_packages = ["git", "wget", "curl", "openjdk-17-jre"], sandbox_backend:str=SANDBOX_BACKEND_MODAL):
         startTime = time.time()
 
         # Make sure the codeStructIn_ contains code
@@ -566,53 +797,16 @@ class ExperimentMaker():
         # Add supporting files
         codeStructIn["supporting_files"] = []
 
-        # Add the `api_keys.donotcommit.json` file
-        supportingFileAPIKeys = {"filename": "llm-proxy/api_keys.donotcommit.json", "contents": None}
-        with open("api_keys.donotcommit.json", 'r') as file:
-            supportingFileAPIKeys["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileAPIKeys)
-
-        # Add the LLM proxy files
-        # Proxy file 1: `llm-proxy-server.py`
-        supportingFileLLMProxy = {"filename": "llm-proxy/llm-proxy-server.py", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "llm-proxy-server.py", 'r') as file:
-            supportingFileLLMProxy["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxy)
-
-        # Proxy file 2: `experiment-llm-cost.json`
-        supportingFileLLMProxyCost = {"filename": "llm-proxy/experiment-llm-cost.json", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "experiment-llm-cost.json", 'r') as file:
-            supportingFileLLMProxyCost["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxyCost)
-
-        # Proxy file 3: `experiment-setup.json`
-        supportingFileLLMProxySetup = {"filename": "llm-proxy/experiment-setup.json", "contents": None}
-
-        # Automatically generate the experiment cost/setup file for the LLM proxy.
-        # NOTE: This file can also be used to allow/disallow certain LLM models.
-        experiment_llm_setup_json = {
-            "notes": "This is an automatically-generated file that sets the maximum allowable cost to go through the LLM proxy server.",
-            "max_cost_usd": max_container_llm_cost_usd
-        }
-        supportingFileLLMProxySetup["contents"] = json.dumps(experiment_llm_setup_json, indent=4)
-        codeStructIn["supporting_files"].append(supportingFileLLMProxySetup)
-
-        # Proxy file 4: The LLM library
-        supportingFileLLMProxyLib = {"filename": "llm_proxy_usage.py", "contents": None}
-        with open(LLM_PROXY_BASE_PATH + "llm_proxy_usage.py", 'r') as file:
-            supportingFileLLMProxyLib["contents"] = file.read()
-        codeStructIn["supporting_files"].append(supportingFileLLMProxyLib)
-
-        # Add the common library of experimental functions
-        supportingFileCommonLib = {"filename": "experiment_common_library.py", "contents": None}
-        supportingFileCommonLib["contents"] = self.codeBlockStore.getCommonLibrary()
-        codeStructIn["supporting_files"].append(supportingFileCommonLib)
+        codeStructIn["supporting_files"].extend(self.getSupportingFiles(max_container_llm_cost_usd))
 
         # TODO: Fix this to use the current pilot mode
         currentMaxRuntime = max_runtime_seconds
 
         # Execute the experiment
-        codeStructOut = self.executeExperiment(codeStructIn, basePath=pathLogOutput, max_runtime_seconds=currentMaxRuntime, apt_packages=apt_packages)
+        try:
+            codeStructOut = self.executeExperiment(codeStructIn, basePath=pathLogOutput, max_runtime_seconds=currentMaxRuntime, apt_packages=apt_packages, sandbox_backend=sandbox_backend)
+        finally:
+            self.releaseSandbox(sandbox_backend, pathLogOutput)
 
         # Clear the execution output
         lastCodeStruct["pip.stdout"] = None
@@ -626,6 +820,8 @@ class ExperimentMaker():
         lastCodeStruct["files_errors"] = None
         lastCodeStruct["files_and_sizes"] = None
         lastCodeStruct["files_too_big"] = None
+        lastCodeStruct["files_skipped"] = None
+        lastCodeStruct["watchdog_abort"] = None
         lastCodeStruct["return_code"] = None
         lastCodeStruct["runtime_seconds"] = None
 
@@ -701,6 +897,10 @@ class ExperimentMaker():
             lastCodeStruct["files_and_sizes"] = execResult["files_and_sizes"]
         if ("files_too_big" in execResult):
             lastCodeStruct["files_too_big"] = execResult["files_too_big"]
+        if ("files_skipped" in execResult):
+            lastCodeStruct["files_skipped"] = execResult["files_skipped"]
+        if ("watchdog_abort" in execResult):
+            lastCodeStruct["watchdog_abort"] = execResult["watchdog_abort"]
         if ("return_code" in execResult):
             lastCodeStruct["return_code"] = execResult["return_code"]
         if ("other_errors" in execResult):
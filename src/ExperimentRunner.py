@@ -0,0 +1,633 @@
+# ExperimentRunner.py
+# Runs single experiments (code generation, debugging/reflection, and reports), each in its own worker process.
+# Experiments used to run in threads inside the web server process, so all their CPU-heavy work (token counting, copying/serializing the history,
+# report generation) competed for the same interpreter lock as the web server's request handling.  Now each running experiment gets its own process,
+# supervised by a thread in the server: the worker reports its progress back over a pipe, and if the worker dies (e.g. runs out of memory, or segfaults),
+# the experiment is marked as failed instead of taking the server down with it.
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+import multiprocessing
+
+from ExtractionUtils import *
+from ExperimentMaker import *
+from ExperimentStore import *
+
+
+# Codeblock store path
+PATH_CODEBLOCKS = "codeblocks/"
+
+# Constants (experiment statuses)
+STATUS_CREATED      = "created"
+STATUS_RUNNING      = "running"
+STATUS_COMPLETED    = "completed"
+STATUS_FAILED       = "failed (generic)"
+STATUS_FAILED_TO_CREATE             = "failed to create"
+STATUS_FAILED_TO_CREATE_UNKNOWN_BUILDER = "failed to create (unknown experiment building agent)"
+STATUS_FAILED_TO_CREATE_FOLLOW_ON   = "failed to create (follow-on experiment)"
+STATUS_INTERRUPTED                  = "interrupted"
+STATUS_FAILED_TOO_MANY_ITERATIONS   = "failed (too many debug iterations)"
+STATUS_FAILED_COST_LIMIT            = "failed (cost limit exceeded)"
+STATUS_FAILED_CONTAINER_ERROR       = "failed (container error)"
+STATUS_FAILED_FILEIO                = "failed (file I/O error)"
+STATUS_FAILED_WORKER_EXCEPTION      = "failed (generic error in worker thread)"
+STATUS_FAILED_AFTER_RUNNING         = "failed (after running)"
+STATUS_CODE_COMPLETE_CRITICAL_ERROR = "failed (partial code generated)"
+STATUS_CODE_PARSING_ISSUE           = "failed (code parsing issue)"
+STATUS_HARD_RUNTIME_LIMIT_REACHED   = "failed (hard experiment runtime limit reached)"
+STATUS_FAILED_WORKER_CRASHED        = "failed (experiment worker process crashed)"
+STATUS_FAILED_WORKER_UNRESPONSIVE   = "failed (experiment worker process stopped responding)"
+
+# The experiment records
+experimentStore = ExperimentStore()
+
+# Experiment worker processes
+EXPERIMENT_WORKER_START_METHOD = "spawn"                    # Start each worker as a fresh interpreter (forking the multi-threaded web server isn't safe)
+EXPERIMENT_WORKER_HEARTBEAT_SEC = 30                        # How often a worker reports that it's still alive
+EXPERIMENT_WORKER_POLL_SEC = 1                              # How often the supervisor checks its worker's pipe
+EXPERIMENT_WORKER_HEARTBEAT_TIMEOUT_SEC = 10 * 60           # A worker that hasn't reported anything (not even a heartbeat) for this long is assumed to be hung, and is killed
+
+
+#
+#   Worker processes
+#
+
+# Status of each experiment currently running in a worker process (experiment ID -> status dictionary), for the queue status endpoints
+experiment_worker_status = {}
+THREAD_LOCK_EXPERIMENT_WORKER_STATUS = threading.Lock()
+
+# (Inside a worker process) The pipe back to the supervisor, if this is a worker process
+worker_status_conn = {"conn": None}
+THREAD_LOCK_WORKER_STATUS_CONN = threading.Lock()
+
+
+# (Inside a worker process) Send a status message back to the supervising server.  Does nothing if not running in a worker process.
+def report_worker_status(event:str, message:str=None, **kwargs):
+    with THREAD_LOCK_WORKER_STATUS_CONN:
+        if (worker_status_conn["conn"] is None):
+            return
+        packet = {"event": event, "message": message, "time": time.time()}
+        packet.update(kwargs)
+        try:
+            worker_status_conn["conn"].send(packet)
+        except Exception as e:
+            print("WARNING: Could not send experiment worker status: " + str(e))
+
+
+# (Inside a worker process) Periodically report that the worker is still alive
+def _worker_heartbeat_thread():
+    while True:
+        time.sleep(EXPERIMENT_WORKER_HEARTBEAT_SEC)
+        report_worker_status("heartbeat")
+
+
+# Entry point for a worker process: run one experiment, and report the final status.
+# `llm_rate_limiter_proxy` is the server's shared LLM rate limiter, so that all the workers share one rate limit budget.
+def _experiment_worker_process_main(id:str, conn, llm_rate_limiter_proxy=None):
+    worker_status_conn["conn"] = conn
+    useSharedLLMRateLimiter(llm_rate_limiter_proxy)
+    report_worker_status("started", "Worker process started", pid=os.getpid())
+    threading.Thread(target=_worker_heartbeat_thread, daemon=True).start()
+
+    new_status = run_experiment_with_agent(id)
+
+    report_worker_status("finished", "Experiment finished", status=new_status)
+    with THREAD_LOCK_WORKER_STATUS_CONN:
+        conn.close()
+        worker_status_conn["conn"] = None
+    sys.stdout.flush()
+
+
+# Run one experiment in a new worker process, and wait for it to finish.  Called by the experiment scheduler (in the experiment's own thread).
+# If the worker process exits without reporting that it finished (or stops reporting anything, even heartbeats), the experiment is marked as failed.
+def run_experiment_in_worker_process(id:str):
+    id = str(id)
+    ctx = multiprocessing.get_context(EXPERIMENT_WORKER_START_METHOD)
+    conn_parent, conn_child = ctx.Pipe(duplex=False)
+    llm_rate_limiter_proxy = startSharedLLMRateLimiter()
+    process = ctx.Process(target=_experiment_worker_process_main, args=(id, conn_child, llm_rate_limiter_proxy), name="experiment-" + id, daemon=True)
+
+    with THREAD_LOCK_EXPERIMENT_WORKER_STATUS:
+        experiment_worker_status[id] = {"pid": None, "start_time": time.time(), "last_event": "starting", "last_message": None, "last_update_time": time.time()}
+
+    print("Starting experiment worker process (Experiment ID: " + str(id) + ")")
+    process.start()
+    conn_child.close()      # The child has its own copy -- closing ours means we get an EOF when the child exits
+
+    final_status = None
+    unresponsive = False
+    last_packet_time = time.time()
+    try:
+        while True:
+            try:
+                if (not conn_parent.poll(EXPERIMENT_WORKER_POLL_SEC)):
+                    if (not process.is_alive()):
+                        break
+                    # The worker is alive, but hasn't even sent a heartbeat in a long time -- assume it's hung, and kill it
+                    if (time.time() - last_packet_time > EXPERIMENT_WORKER_HEARTBEAT_TIMEOUT_SEC):
+                        print("ERROR: Experiment worker process has not reported in " + str(round(time.time() - last_packet_time)) + " seconds -- killing it (Experiment ID: " + str(id) + ")")
+                        unresponsive = True
+                        process.kill()
+                        break
+                    continue
+                packet = conn_parent.recv()
+                last_packet_time = time.time()
+            except (EOFError, OSError):
+                break       # The worker closed its end of the pipe (i.e. it exited)
+
+            with THREAD_LOCK_EXPERIMENT_WORKER_STATUS:
+                worker_status = experiment_worker_status[id]
+                if (packet.get("pid", None) is not None):
+                    worker_status["pid"] = packet["pid"]
+                worker_status["last_event"] = packet.get("event", None)
+                if (packet.get("message", None) is not None):
+                    worker_status["last_message"] = packet["message"]
+                worker_status["last_update_time"] = packet.get("time", time.time())
+            if (packet.get("event", None) == "finished"):
+                final_status = packet.get("status", None)
+
+        process.join()
+    finally:
+        conn_parent.close()
+        with THREAD_LOCK_EXPERIMENT_WORKER_STATUS:
+            experiment_worker_status.pop(id, None)
+
+    # If the worker didn't report that it finished, then it crashed (or was killed) -- mark the experiment as failed
+    if (final_status is None):
+        crash_status = STATUS_FAILED_WORKER_UNRESPONSIVE if (unresponsive) else STATUS_FAILED_WORKER_CRASHED
+        print("ERROR: Experiment worker process exited unexpectedly (Experiment ID: " + str(id) + ", exit code: " + str(process.exitcode) + ")")
+        try:
+            experimentStore.update_experiment(id, {"status": crash_status, "worker_exit_code": process.exitcode})
+        except Exception as e:
+            print("ERROR: Could not save experiment status: " + str(e))
+        # The worker didn't get to release the sandbox resources kept between the experiment's runs (e.g. its Modal volume), so release them here
+        release_crashed_worker_sandbox(id)
+        # Likewise for any LLM requests it had in flight (otherwise their slots in the shared rate limiter would never be freed)
+        if (process.pid is not None):
+            LLM_RATE_LIMITER.releaseHolder(process.pid)
+        return crash_status
+
+    print("Experiment worker process finished (Experiment ID: " + str(id) + ", status: " + str(final_status) + ")")
+    return final_status
+
+
+# Release the sandbox resources of an experiment whose worker process crashed (or was killed)
+def release_crashed_worker_sandbox(id:str):
+    try:
+        experiment = experimentStore.get_experiment(id)
+    except Exception as e:
+        print("ERROR: Could not load experiment to release its sandbox (Experiment ID: " + str(id) + "): " + str(e))
+        return
+    if (experiment is None) or (experiment.get("experiment_path", None) is None):
+        return      # The worker crashed before the experiment got as far as running anything
+    print("Releasing sandbox resources of crashed experiment worker (Experiment ID: " + str(id) + ", path: " + str(experiment["experiment_path"]) + ")")
+    releaseSandbox(experiment.get("sandbox_backend", SANDBOX_BACKEND_MODAL), experiment["experiment_path"])
+
+
+# Get a snapshot of the status of the experiments currently running in worker processes
+def get_experiment_worker_status():
+    with THREAD_LOCK_EXPERIMENT_WORKER_STATUS:
+        snapshot = {}
+        for id, worker_status in experiment_worker_status.items():
+            snapshot[id] = dict(worker_status)
+            snapshot[id]["runtime_seconds"] = round(time.time() - worker_status["start_time"], 1)
+            snapshot[id]["seconds_since_last_update"] = round(time.time() - worker_status["last_update_time"], 1)
+        return snapshot
+
+
+#
+#   Running experiments
+#
+
+# Run one experiment with the experiment building agent it requests, and set its final status.  Returns the final status.
+# (Runs inside an experiment worker process -- see `run_experiment_in_worker_process()`)
+def run_experiment_with_agent(id:str):
+    import traceback
+    print("Starting experiment (Experiment ID: " + str(id) + ", PID: " + str(os.getpid()) + ")")
+    sys.stdout.flush()  # Flush output to ensure it appears
+
+    # Set the status of the experiment to 'running'
+    change_experiment_status(id, STATUS_RUNNING)
+
+    # Keys from the 'benchmark' submission packet
+        # experiment_submission_packed = {
+        #     "experiment_name_short": original_idea_sanitized.get("research_idea_name", "Unknown"),
+        #     "model_str": data.get("model_str", None),
+        #     "experiment_building_agent_name": data.get("experiment_building_agent_name", None),
+        #     "run_notes": data.get("run_notes", None),
+        #     "experiment_description": experiment_builder_prompt,
+        #     "codeblock_names_to_use": experiment_builder_codeblocks,
+        #     "max_time_per_iteration_mins": data.get("max_time_per_iteration_mins", 1),
+        #     "max_time_per_iteration_pilot_mins": data.get("max_time_per_iteration_pilot_mins", 1),
+        #     "max_debug_iterations": data.get("max_debug_iterations", 1),
+        #     "max_llm_cost_container": data.get("max_llm_cost_container", 0.00),
+        #     "num_copies": data.get("num_experiments", 1),
+        #     "submission_mode": "benchmark",
+        #     "idea_id": benchmark_idea_id,
+        #     "original_idea": original_idea_sanitized,
+        #     "automatically_generated_experiment_prompt": experiment_builder_prompt,
+        #     "max_experiment_cost": data.get("max_experiment_cost", 0.0),
+        #     "batch_name": data.get("batch_name_short", None),
+        #     "benchmark": benchmark_to_run,
+        #     "operationalization": operationalization,                   # Full copy of the operationalization
+        #     "full_original_benchmark_problem": benchmark_problem        # Full copy of the benchmark problem
+        # }
+
+    # Try to get which agent we should be using to execute this experiment
+    experiment_record = get_experiment_info(id)
+    if (experiment_record is None):
+        print("ERROR: Could not find experiment with ID: " + str(id))
+        new_status = STATUS_FAILED_TO_CREATE
+        change_experiment_status(id, new_status)
+        return new_status
+
+    experiment_building_agent_name = experiment_record.get("experiment_building_agent_name", None)
+    print("Experiment (id: " + str(id) + ") requests Experiment Building Agent Name: " + str(experiment_building_agent_name))
+
+    try:
+        # Run the experiment
+        # TODO: These agent names should come from a list/defines.
+        # We can keep these in for examples of how to add new agents to the system.
+        if (experiment_building_agent_name == "simple1") or (experiment_building_agent_name is None):
+            new_status = run_experiment(id, use_faithfulness_reflection=False)                    # Original experiment agent
+
+        elif (experiment_building_agent_name == "simple1-with-faithfulness-reflection"):
+            new_status = run_experiment(id, use_faithfulness_reflection=True)                     # Original experiment agent with faithfulness reflection
+
+        else:
+            print("ERROR: Unknown Experiment Building Agent Name: " + str(experiment_building_agent_name))
+            new_status = STATUS_FAILED_TO_CREATE_UNKNOWN_BUILDER
+
+        # Set the run to 'completed'
+        change_experiment_status(id, new_status)
+
+    except Exception as e:
+        traceback.print_exc()
+        print("ERROR: Exception in experiment worker: " + str(e) + " (Experiment ID: " + str(id) + ")\n" + traceback.format_exc())
+        new_status = STATUS_FAILED_WORKER_EXCEPTION
+        change_experiment_status(id, new_status)
+
+    print("Experiment finished (Experiment ID: " + str(id) + ")")
+    return new_status
+
+
+# Update an experiment's status string in the experiment store
+def change_experiment_status(id:str, new_status:str):
+    try:
+        if (experimentStore.set_experiment_status(id, new_status) is None):
+            print("ERROR: Could not find experiment with ID: " + str(id))
+    except Exception as e:
+        print("ERROR: Could not save experiment status: " + str(e))
+        return
+
+
+# This function essentially tries to recreate the `createExperiment` function, but with the final code from the previous experiment, mixed with the parameters from the new (follow-on) experiment.
+def follow_on_experiment_get_previous_experiment_info(previous_experiment_id, new_experiment):
+    # Load the previous experiment
+    previous_experiment = None
+    try:
+        previous_experiment = experimentStore.get_experiment(previous_experiment_id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return None
+
+    # If the experiment was not found, return
+    if (previous_experiment is None):
+        print("ERROR: Follow-on experiment lookup: could not find previous experiment with ID: " + str(previous_experiment_id))
+        return None
+
+    # Look through the previous experiment file to find some relevant information.
+    # First, get the output directory
+    previous_experiment_path = previous_experiment.get("experiment_path", None)
+    if (previous_experiment_path is None):
+        print("ERROR: Follow-on experiment lookup: Could not find previous experiment path.")
+        return None
+
+    # Load the last step of the history from the last run (the rest of the history isn't needed)
+    lastHistoryEntry = None
+    try:
+        _, lastHistoryEntry = loadLastHistoryStep(previous_experiment_path)
+    except Exception as e:
+        print("ERROR: Follow-on experiment lookup: Could not load history (" + str(previous_experiment_path) + "): " + str(e))
+        return None
+
+    if (lastHistoryEntry is None):
+        print("ERROR: Follow-on experiment lookup: No history entries found for previous experiment (" + str(previous_experiment_path) + ")")
+        return None
+
+
+    # Now generate the starting code, which will be the final code from the previous experiment
+
+    # This is what needs to be returned, as if it was returning from the createExperiment function.
+        #     # Return the response
+        # packedOut = {
+        #     "success": True,
+        #     "instruction_str": instructionStr,        # From new experiment
+        #     "codeblock_names": codeblockNames,        # From new experiment
+        #     "requirements": requirements,             # From last experiment
+        #     "code": code,                             # From last experiment
+        #     "codeblock_code": retrievedCodeblockDict, # From new experiment
+        #     "model": modelStr,                        # From last experiment
+        #     "max_tokens": max_tokens,                 # From last experiment
+        #     "temperature": temperature,               # From last experiment
+        #     "responseJSON": responseJSON,             # Set to None?
+        #     "responseText": responseText,             # Set to None?
+        #     "cost": cost,                             # Set to 0.0001
+        #     "errors": errors                          # Set to []
+        # }
+
+    # Get the codeblocks (the new ones, that were selected for the follow-on experiment)
+    codeblock_names = new_experiment.get("codeblock_names_to_use", [])
+    codeblock_code = {}
+    codeblockStore = getCodeBlockStore(PATH_CODEBLOCKS)
+    for codeblock_name in codeblock_names:
+        codeblock = codeblockStore.getCodeblockByName(codeblock_name)
+        if (codeblock is None):
+            print("ERROR: Could not find codeblock with name: " + str(codeblock_name))
+        else:
+            codeblock_code[codeblock_name] = codeblock
+    print("Retrieved codeblocks: " + str(codeblock_code.keys()))
+
+    # Repackage the last history entry into the format expected by the createExperiment function
+    packed = {
+        "success": True,
+        "instruction_str": new_experiment.get("experiment_description", None),    # New
+        "codeblock_names": new_experiment.get("codeblock_names_to_use", []),      # New
+        "requirements": lastHistoryEntry.get("requirements", ""),                 # Last
+        "code": lastHistoryEntry.get("code", ""),                                 # Last
+        "codeblock_code": codeblock_code,                                         # New
+        "model": lastHistoryEntry.get("model", ""),                               # Last
+        "max_tokens": lastHistoryEntry.get("max_tokens", 0),                      # Last
+        "temperature": lastHistoryEntry.get("temperature", 0.0),                  # Last
+        "responseJSON": None,                                                     # Blank out
+        "responseText": "",                                                       # Blank out
+        "cost": 0.0000001,                                                        # Set to a small value (effectively blanking it out, but making it non-zero in case that causes some issues)
+        "errors": []                                                              # Blank out
+    }
+
+    return packed
+
+
+
+# Get the record for one experiment
+def get_experiment_info(id:str):
+    # Load the experiment data
+    targetExperiment = None
+    try:
+        targetExperiment = experimentStore.get_experiment(id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return None
+
+    # If the experiment was not found, return
+    if (targetExperiment is None):
+        print("ERROR: Could not find experiment with ID: " + str(id))
+    return targetExperiment
+
+
+# Run one experiment
+# This is the main function for the agent that essentially takes the idea/plan, and runs a single complete experiment
+# (from code generation, debugging, through report generation)
+def run_experiment(id:str, use_faithfulness_reflection:bool=False):
+    exit_status = STATUS_FAILED
+    import datetime
+
+    print("run_experiment(): Running experiment (ID: " + str(id) + ")")
+
+    # Load the API keys
+    from ExtractionUtils import loadAPIKeys
+    loadAPIKeys()
+
+    # Load the experiment data
+    targetExperiment = None
+    try:
+        targetExperiment = experimentStore.get_experiment(id)
+    except Exception as e:
+        print("ERROR: Could not load experiments: " + str(e))
+        return STATUS_FAILED_FILEIO
+
+    # If the experiment was not found, return
+    if (targetExperiment is None):
+        print("ERROR: Could not find experiment with ID: " + str(id))
+        return STATUS_FAILED_FILEIO
+
+    # Experiment parameters
+    # Examples:
+    #experimentName = "react-causal-memory-persistent"
+    #instructionStr = "Please investigate whether adding a causal memory to a ReAct agent helps improve its performance over a baseline ReAct agent.  The causal memory should be *abstractive*, abstracting how single actions (or sequences of actions) helped achieve subgoals or larger goals.  The memory should be persistent, saved across episodes (and framed as `lessons` in the prompt, that may or may not be from the current episode, so it doesn't get confused). The memory should be displayed in the log file, so you can inspect it to make sure it's behaving correctly. Please test this on CookingWorld, using the default CookingWorld environment parameters (except 3 rooms, and no doors). The base model should be `gpt-4o-mini`.  The agent should use the first 5 parametric variations (i.e. the first five episodes, seeds 1-5) of the CookingWorld game, and end after this, report the score/success of each episode, and final average score.  The maximum steps per episode should be 25. The full trajectory (i.e. observation, score, possible valid actions, chosen action at each step) should be in the log file. The results file should include number of steps per episode, as well as an average of this.  Report whether the baseline and experimental condition are significantly different."
+    #additionalInstructionStr = "Please use the Python programming language."
+    #codeblocksToCombine = ["Logger/Debugging", "LLM example through proxy server", "ReAct Agent Example", "TextWorldExpress API Example", "Non-parametric Bootstrap Resampling"]
+    #max_container_llm_cost = 5.00
+    #max_runtime_seconds = 60 * 30   # 30 minutes
+
+    experimentName = targetExperiment.get("experiment_name_short")
+    instructionStr = targetExperiment.get("experiment_description")
+    additionalInstructionStr = "Please use the Python programming language."
+    codeblocksToCombine = targetExperiment.get("codeblock_names_to_use")
+    modelStr = targetExperiment.get("model_str")
+    max_container_llm_cost = targetExperiment.get("max_llm_cost_container")
+    max_runtime_seconds = targetExperiment.get("max_time_per_iteration_mins") * 60
+    max_runtime_seconds_pilot = targetExperiment.get("max_time_per_iteration_pilot_mins", 10) * 60            # Default to 10 minutes if not set.
+    max_reflections = targetExperiment.get("max_debug_iterations")
+    max_experiment_cost = targetExperiment.get("max_experiment_cost", 0.00)     # Note: This is not enforced until the debugging/reflection steps.  So a really expensive initial generation may exceed this.
+    hard_runtime_cutoff_seconds = targetExperiment.get("hard_runtime_cutoff_seconds", (60*60*6))  # 6 hours (if not otherwise specified)
+    sandbox_backend = targetExperiment.get("sandbox_backend", SANDBOX_BACKEND_MODAL)             # Where to run the experiment code (Modal, or locally)
+    keep_sandbox_warm = targetExperiment.get("keep_sandbox_warm", False)                        # Keep one sandbox running for all the debug iterations
+    llm_response_cache = targetExperiment.get("llm_response_cache", False)                      # Cache deterministic LLM proxy responses across the debug iterations
+
+    temperature = targetExperiment.get("temperature", 0.1)
+    max_tokens = 8192
+    if (modelStr.startswith("o1-mini")):
+        max_tokens = 32000  # Technically larger, but limiting here
+    elif (modelStr.startswith("o3-mini")):
+        max_tokens = 32000  # Technically larger, but limiting here
+
+
+    # Check to see if no cost limit was set
+    if (max_experiment_cost <= 0.01):
+        print("ERROR: No cost limit set, or cost limit was very low (" + str(max_experiment_cost) + ") for experiment with ID: " + str(id) + ".  Exiting.")
+        return STATUS_FAILED_COST_LIMIT
+
+
+    # Check to see if this is a follow-on experiment (and if so, set a few variables)
+    is_follow_on_experiment = False
+    follow_on_experiment_previous_experiment_id = None
+    if ("follow_on_experiment" in targetExperiment) and (targetExperiment["follow_on_experiment"] == True):
+        is_follow_on_experiment = True
+        follow_on_experiment_previous_experiment_id = targetExperiment.get("follow_on_to_experiment_id", None)
+
+    # Re-sanitize the experiment name, since it's being used in the path
+    experimentNameForPath = experimentName
+    # Use a regex to remove all non-alphanumeric characters.  Convert spaces to dashes.
+    experimentNameForPath = re.sub(r'\W+', '', experimentNameForPath)
+    experimentNameForPath = experimentNameForPath.replace(" ", "-")
+
+    # Create the experiment output directory
+    experimentNameWithDate = experimentNameForPath + "-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    pathExperimentOutput = "generated-experiments/" + experimentNameWithDate + "/"
+    if (not os.path.exists(pathExperimentOutput)):
+        os.makedirs(pathExperimentOutput)
+
+    print("run_experiment(): Running experiment (ID: " + str(id) + "): Output folder is: " + str(pathExperimentOutput))
+
+    # Save the experiment output path to the experiment data
+    targetExperiment["experiment_path"] = pathExperimentOutput
+    try:
+        experimentStore.update_experiment(id, targetExperiment)
+    except Exception as e:
+        print("ERROR: Could not save experiment: " + str(e))
+        return STATUS_FAILED_FILEIO
+
+    startTime = datetime.datetime.now()
+
+    # Instantiate the ExperimentMaker
+    experimentMaker = ExperimentMaker(PATH_CODEBLOCKS)
+
+    # Create the experiment
+    # First: Check if this is a new experiment, or a follow-on experiment
+    combinedCodeblock = None
+    follow_on_description = None
+    report_worker_status("progress", "Generating experiment code")
+    if (is_follow_on_experiment == False):
+        # New experiment
+        # NOTE: I'm not sure initial code generation is currently included in the total experiment cost calculation.
+        print("New Experiment")
+        combinedCodeblock = experimentMaker.createExperiment(instructionStr, additionalInstructionStr, codeblocksToCombine, modelStr, max_tokens, temperature)
+
+        # Make sure the codeblock contains code -- if not, retry one time.
+        if (combinedCodeblock is None) or ("success" in combinedCodeblock and combinedCodeblock["success"] == False) or ("code" not in combinedCodeblock) or (combinedCodeblock["code"] == None):
+            # Something went wrong -- retry once
+            print("Retrying experiment creation...")
+            # NOTE: Bypass the LLM response cache, so the retry gets a fresh generation rather than the same (cached) response
+            combinedCodeblock = experimentMaker.createExperiment(instructionStr, additionalInstructionStr, codeblocksToCombine, modelStr, max_tokens, temperature, useCache=False)
+
+    else:
+        # Follow-on experiment
+        print("Follow-on Experiment")
+        combinedCodeblock = follow_on_experiment_get_previous_experiment_info(follow_on_experiment_previous_experiment_id, targetExperiment)
+
+        # Get the follow-on description
+        follow_on_description = targetExperiment.get("experiment_description_follow_on", None)
+        print("Follow-on description: " + str(follow_on_description))
+
+        if (combinedCodeblock is None):
+            print("ERROR: Could not create follow-on experiment.")
+
+
+    # If the codeblock is still None, return
+    # This suggests that -- for whatever reason -- we were unable to generate the initial code for the experiment.
+    continue_experiment = True
+    if (combinedCodeblock is None) or ("success" in combinedCodeblock and combinedCodeblock["success"] == False) or ("code" not in combinedCodeblock) or (combinedCodeblock["code"] == None):
+        print("ERROR: Could not create experiment.")
+        continue_experiment = False
+        if (is_follow_on_experiment == True):
+            exit_status = STATUS_FAILED_TO_CREATE_FOLLOW_ON
+        else:
+            exit_status = STATUS_FAILED_TO_CREATE
+
+    # Main experiment cycle: Run the experiment, reflect on the output, and continue until a stop condition is reached.
+    # The main stop conditions are: (1) The experiment appears to be complete/work, or (2) some kind of limit is reached (e.g. cost, time, etc.)
+    history = None
+    historyPacked = None
+    if (continue_experiment == True):
+        report_worker_status("progress", "Running/reflecting on experiment")
+        history, historyPacked = experimentMaker.runAndReflectExperimentWithPackedHistory(combinedCodeblock, modelStr, MAX_REFLECTIONS=max_reflections, max_tokens=max_tokens, pathLogOutput=pathExperimentOutput, max_container_llm_cost_usd=max_container_llm_cost, max_runtime_seconds=max_runtime_seconds, max_runtime_seconds_pilot=max_runtime_seconds_pilot, max_experiment_cost=max_experiment_cost, follow_on_description=follow_on_description, use_faithfulness_reflection=use_faithfulness_reflection, hard_runtime_cutoff_seconds=hard_runtime_cutoff_seconds, temperature=temperature, sandbox_backend=sandbox_backend, keep_sandbox_warm=keep_sandbox_warm, llm_response_cache=llm_response_cache)
+
+    # Record how long it took to run the experiment
+    totalTimeSeconds = (datetime.datetime.now() - startTime).total_seconds()
+
+    # If the experiment failed, and returned a generic error, then change the error status to mark that the experiment failed AFTER running/reflection, for some reason (i.e. 'we got this far')
+    if (exit_status == STATUS_FAILED):
+        exit_status = STATUS_FAILED_AFTER_RUNNING
+
+    # Check the last step of the history to see if the experiment was successful (`is_ok` should be True)
+    if (history is not None) and (len(history) > 0):
+        lastStep = history[-1]
+        if ("is_ok" in lastStep) and (lastStep["is_ok"] == True):
+            exit_status = STATUS_COMPLETED
+
+        # Get (and save) the number of iterations run from the history
+        numIterationsRun = len(history)
+        targetExperiment["num_iterations_run"] = numIterationsRun
+        # Also look for the 'summary' and 'summary_short' keys in the history metadata
+        summary = None
+        summaryShort = None
+        interestingResults = None
+        if (historyPacked is not None) and ("summary" in historyPacked["metadata"]):
+            summary = historyPacked["metadata"]["summary"]
+        if (historyPacked is not None) and ("summary_short" in historyPacked["metadata"]):
+            summaryShort = historyPacked["metadata"]["summary_short"]
+        if (historyPacked is not None) and ("interesting_results" in historyPacked["metadata"]):
+            interestingResults = historyPacked["metadata"]["interesting_results"]
+        targetExperiment["results_summary"] = summary
+        targetExperiment["results_summary_short"] = summaryShort
+        targetExperiment["interesting_results"] = interestingResults
+
+        # Update the cost
+        cost_so_far = 0
+        cost_build_debug = 0
+        cost_llm_proxy = 0
+        if (historyPacked is not None) and ("total_cost" in historyPacked["metadata"]):
+            cost_so_far = historyPacked["metadata"]["total_cost"]
+            cost_build_debug = historyPacked["metadata"]["total_cost_build_debug"]
+            cost_llm_proxy = historyPacked["metadata"]["total_cost_llm_proxy"]
+
+        targetExperiment["cost_so_far"] = cost_so_far
+        targetExperiment["total_cost_build_debug"] = cost_build_debug
+        targetExperiment["total_cost_llm_proxy"] = cost_llm_proxy
+
+    # Update timestamp_finished
+    targetExperiment["timestamp_finished"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Update time
+    targetExperiment["runtime_seconds"] = totalTimeSeconds
+
+    # Check to see if the experiment had any number of errors, and if so, update the status to reflect which kind of error.
+    if (history is not None) and (len(history) > 0):
+        lastStep = history[-1]
+        if ("is_ok" in lastStep) and (lastStep["is_ok"] == False):
+            # TODO: Check for max iterations
+            history_length = len(historyPacked["history"])
+            if (history_length >= max_reflections):
+                exit_status = STATUS_FAILED_TOO_MANY_ITERATIONS
+
+        # Check for cost limit exceeded
+        if (historyPacked["metadata"]["cost_limit_exceeded"] == True):
+            exit_status = STATUS_FAILED_COST_LIMIT
+
+        # Check for a container error
+        if (historyPacked["metadata"]["container_failure"] == True):
+            exit_status = STATUS_FAILED_CONTAINER_ERROR
+
+        # Check for code_complete_critical_error
+        if (historyPacked["metadata"]["code_complete_critical_error"] == True):
+            exit_status = STATUS_CODE_COMPLETE_CRITICAL_ERROR
+
+        # Check for error_code_parsing_issue
+        if (historyPacked["metadata"]["error_code_parsing_issue"] == True):
+            exit_status = STATUS_CODE_PARSING_ISSUE
+
+        # Check for hitting the hard runtime limit (hard_time_limit_reached)
+        if (historyPacked["metadata"]["hard_time_limit_reached"] == True):
+            exit_status = STATUS_HARD_RUNTIME_LIMIT_REACHED
+
+        # Add the experiment model to the metadata
+        historyPacked["metadata"]["experiment_building_agent_name"] = targetExperiment.get("experiment_building_agent_name", None)
+
+
+    # Save the experiment status/information back to the experiment store
+    try:
+        experimentStore.update_experiment(id, targetExperiment)
+    except Exception as e:
+        print("ERROR: Could not save experiment: " + str(e))
+        return STATUS_FAILED_FILEIO
+
+    # Print the exit status
+    print("run_experiment(): Experiment (ID: " + str(id) + ") finished.  Exit status: " + str(exit_status))
+
+    # Return
+    return exit_status
@@ -0,0 +1,137 @@
+# ExperimentScheduler.py
+# Decides which waiting experiments to run, and when.  Experiments are submitted (by ID) when they're created, and are started (each in its own thread)
+# as soon as a slot is free -- and a slot is released as soon as an experiment's thread finishes, so the next experiment starts immediately.
+# Fair share: experiments are grouped by their `batch_name` (interactive/single experiments, without a batch name, form their own group), and a free
+# slot goes to the group with the fewest experiments currently running (ties go to the experiment that has been waiting longest).  This way a large
+# benchmark batch can't starve other batches or interactive runs -- though it can use all the slots when nothing else is waiting.
+
+import heapq
+import threading
+import traceback
+
+
+# The group used for experiments that don't have a batch name
+SCHEDULER_GROUP_INTERACTIVE = "(interactive)"
+
+
+class ExperimentScheduler():
+    # Constructor
+    # `run_experiment_fn` is called (in a new thread) with the experiment ID to run an experiment; the slot is released when it returns.
+    def __init__(self, run_experiment_fn, max_running:int):
+        self.run_experiment_fn = run_experiment_fn
+        self.max_running = max_running
+        self.lock = threading.Lock()
+
+        self.queued = {}                # group name -> heap of (submission sequence number, experiment ID)
+        self.running = {}               # group name -> set of running experiment IDs
+        self.known_ids = set()          # All experiment IDs that are queued or running (so the same experiment can't be submitted twice)
+        self.submission_count = 0
+        self.started = False            # Experiments are only dispatched after `start()` is called
+
+
+    # Get the fair-share group for an experiment
+    def _get_group(self, batch_name):
+        if (batch_name is None) or (len(str(batch_name).strip()) == 0):
+            return SCHEDULER_GROUP_INTERACTIVE
+        return str(batch_name)
+
+    # Add an experiment to the queue.  It's started immediately if there's a free slot.  Returns False if it's already queued or running.
+    def submit(self, experiment_id:str, batch_name:str=None):
+        experiment_id = str(experiment_id)
+        with self.lock:
+            if (experiment_id in self.known_ids):
+                return False
+            self.known_ids.add(experiment_id)
+            group = self._get_group(batch_name)
+            if (group not in self.queued):
+                self.queued[group] = []
+            heapq.heappush(self.queued[group], (self.submission_count, experiment_id))
+            self.submission_count += 1
+            self._dispatch()
+        return True
+
+    # Is this experiment currently queued or running?
+    def is_known(self, experiment_id:str):
+        with self.lock:
+            return (str(experiment_id) in self.known_ids)
+
+    # Start dispatching experiments
+    def start(self):
+        with self.lock:
+            self.started = True
+            self._dispatch()
+
+    # Change the maximum number of experiments that can run at once.  Raising it starts waiting experiments immediately; lowering it doesn't stop running experiments.
+    def set_max_running(self, max_running:int):
+        with self.lock:
+            if (max_running != self.max_running):
+                print("Experiment scheduler: changing maximum running experiments from " + str(self.max_running) + " to " + str(max_running))
+                self.max_running = max_running
+            self._dispatch()
+
+    # NOTE: Must be called with `self.lock` held
+    def _num_running(self):
+        return sum([len(ids) for ids in self.running.values()])
+
+    # Start as many waiting experiments as there are free slots.
+    # NOTE: Must be called with `self.lock` held
+    def _dispatch(self):
+        if (not self.started):
+            return
+
+        while (self._num_running() < self.max_running):
+            # Pick the group with the fewest running experiments (ties: the one whose next experiment has been waiting longest)
+            best_group = None
+            best_key = None
+            for group, heap in self.queued.items():
+                if (len(heap) == 0):
+                    continue
+                key = (len(self.running.get(group, [])), heap[0][0])
+                if (best_key is None) or (key < best_key):
+                    best_group = group
+                    best_key = key
+
+            if (best_group is None):
+                return      # Nothing waiting
+
+            _, experiment_id = heapq.heappop(self.queued[best_group])
+            if (len(self.queued[best_group]) == 0):
+                del self.queued[best_group]
+            if (best_group not in self.running):
+                self.running[best_group] = set()
+            self.running[best_group].add(experiment_id)
+
+            print("Experiment scheduler: starting experiment " + str(experiment_id) + " (group: " + str(best_group) + ", running: " + str(self._num_running()) + " / max: " + str(self.max_running) + ")")
+            thread = threading.Thread(target=self._run_experiment, args=(experiment_id, best_group), daemon=True)
+            thread.start()
+
+    # Thread wrapper: run one experiment, then release its slot (and start the next experiment)
+    def _run_experiment(self, experiment_id:str, group:str):
+        try:
+            self.run_experiment_fn(experiment_id)
+        except Exception as e:
+            print("ERROR: Experiment scheduler: exception while running experiment " + str(experiment_id) + ": " + str(e))
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.running[group].discard(experiment_id)
+                if (len(self.running[group]) == 0):
+                    del self.running[group]
+                self.known_ids.discard(experiment_id)
+                self._dispatch()
+
+    # Statistics (for the queue status endpoints)
+    def get_stats(self):
+        with self.lock:
+            groups = {}
+            for group in set(list(self.queued.keys()) + list(self.running.keys())):
+                groups[group] = {
+                    "queued": len(self.queued.get(group, [])),
+                    "running": len(self.running.get(group, [])),
+                }
+            return {
+                "num_running": self._num_running(),
+                "num_queued": sum([len(heap) for heap in self.queued.values()]),
+                "max_running": self.max_running,
+                "groups": groups,
+            }
@@ -0,0 +1,283 @@
+# ExperimentStore.py
+# A storage class for the experiment records (one record per experiment), backed by SQLite.
+# Records are stored as JSON blobs keyed by experiment ID, with the status kept in an indexed column, so that looking up one experiment, updating
+# one experiment, or finding all experiments with a given status doesn't require loading (or rewriting) every experiment.
+# NOTE: Previously the experiments were stored in one JSON file (`data/all-experiments.json`).  That file is imported once (when the database is first
+# created), and afterwards is only written as an (optional) read-only snapshot, for tools that still read it (e.g. the meta-analysis).
+
+import os
+import json
+import random
+import sqlite3
+import threading
+
+
+# Paths
+FILENAME_EXPERIMENTS_DB = "data/all-experiments.sqlite"
+
+# How long to wait on a database that's locked by another writer (e.g. another process) before giving up
+SQLITE_BUSY_TIMEOUT_SEC = 30
+
+# Sort orders for query_experiments() -> the SQL `ORDER BY` clause.  Ties are broken by the order the experiments were added.
+EXPERIMENT_SORT_ORDERS = {
+    "id_asc": "id ASC, seq ASC",
+    "id_desc": "id DESC, seq DESC",
+    "newest_first": "json_extract(record, '$.timestamp_created') DESC, seq DESC",
+    "oldest_first": "json_extract(record, '$.timestamp_created') ASC, seq ASC",
+    "recently_modified": "json_extract(record, '$.timestamp_finished') DESC, seq DESC",
+    "rating_desc": "json_extract(record, '$.rating') DESC, seq DESC",
+    "rating_asc": "json_extract(record, '$.rating') ASC, seq ASC",
+    "added_asc": "seq ASC",
+    "added_desc": "seq DESC",
+}
+
+# The keys of an experiment record needed to show it in a list (i.e. without the (large) copies of the idea, operationalization, benchmark problem, etc.)
+EXPERIMENT_SUMMARY_FIELDS = ["id", "experiment_name_short", "experiment_description", "status", "batch_name", "benchmark", "idea_id", "model_str", "experiment_building_agent_name",
+                             "num_iterations_run", "cost_so_far", "total_cost_build_debug", "total_cost_llm_proxy", "results_summary", "interesting_results", "rating",
+                             "timestamp_created", "timestamp_finished", "runtime_seconds", "experiment_path",
+                             "follow_on_experiment", "follow_on_to_experiment_id", "follow_on_to_experiment_name"]
+
+
+# ExperimentStore storage class
+class ExperimentStore():
+    # Constructor
+    def __init__(self, db_filename:str=None):
+        self.db_filename = db_filename
+        if (self.db_filename is None):
+            self.db_filename = FILENAME_EXPERIMENTS_DB
+
+        # SQLite connections can't be shared between threads, so each thread gets its own
+        self.thread_local = threading.local()
+
+        # Create the database (if needed)
+        dir_path = os.path.dirname(self.db_filename)
+        if not os.path.exists(dir_path) and len(dir_path) > 0:
+            os.makedirs(dir_path, exist_ok=True)
+        self._create_tables()
+
+
+    #
+    #   Database connection
+    #
+
+    # Get the connection for this thread.  Connections are in autocommit mode -- multi-statement updates use explicit transactions (see `_transaction()`).
+    def _get_connection(self):
+        conn = getattr(self.thread_local, "conn", None)
+        if (conn is None):
+            conn = sqlite3.connect(self.db_filename, timeout=SQLITE_BUSY_TIMEOUT_SEC, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")         # Readers don't block writers (and vice versa)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.thread_local.conn = conn
+        return conn
+
+    # A write transaction.  `BEGIN IMMEDIATE` takes the write lock up front, so that read-modify-write updates of a record are atomic (including across processes).
+    def _transaction(self):
+        return _SQLiteTransaction(self._get_connection())
+
+    def _create_tables(self):
+        conn = self._get_connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS experiments (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, status TEXT, record TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_experiments_status ON experiments (status, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+        # A random ID for this database, so that versions (see get_version()) from a different (e.g. re-created) database never match
+        conn.execute("INSERT OR IGNORE INTO metadata (key, value) VALUES ('store_id', ?)", (str(random.randint(1000, 999999999999)),))
+        conn.execute("INSERT OR IGNORE INTO metadata (key, value) VALUES ('version', '0')")
+
+    # Increment the version (called in every write transaction that changes an experiment)
+    def _increment_version(self, conn):
+        conn.execute("UPDATE metadata SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+
+    #
+    #   Reading
+    #
+
+    # Get one experiment record (by ID).  Returns None if the experiment doesn't exist.
+    def get_experiment(self, experiment_id:str):
+        row = self._get_connection().execute("SELECT record FROM experiments WHERE id = ?", (str(experiment_id),)).fetchone()
+        if (row is None):
+            return None
+        return json.loads(row[0])
+
+    # Get all the experiment records (in the order they were added)
+    def get_all_experiments(self):
+        rows = self._get_connection().execute("SELECT record FROM experiments ORDER BY seq").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Get a page of experiment records, optionally filtered (by status, batch name, and/or the date created), sorted (one of EXPERIMENT_SORT_ORDERS), and
+    # projected (only the keys in `fields`, if provided -- keys a record doesn't have are left out).  Returns (records, total), where `total` is the number
+    # of experiments that match the filters (i.e. across all pages).
+    def query_experiments(self, status:str=None, batch_name:str=None, created_after:str=None, created_before:str=None, sort_by:str="added_asc", offset:int=0, limit:int=None, fields:list=None):
+        if (sort_by not in EXPERIMENT_SORT_ORDERS):
+            raise ValueError("Unknown sort order: " + str(sort_by) + " (known: " + ", ".join(EXPERIMENT_SORT_ORDERS.keys()) + ")")
+
+        # Filters.  Timestamps are stored as `YYYY-MM-DD HH:MM:SS` strings, so a date (or a date and time) can be compared directly.
+        conditions = []
+        params = []
+        if (status is not None):
+            conditions.append("status = ?")
+            params.append(status)
+        if (batch_name is not None):
+            conditions.append("json_extract(record, '$.batch_name') = ?")
+            params.append(batch_name)
+        if (created_after is not None):
+            conditions.append("json_extract(record, '$.timestamp_created') >= ?")
+            params.append(created_after)
+        if (created_before is not None):
+            conditions.append("json_extract(record, '$.timestamp_created') < ?")
+            params.append(created_before)
+        whereClause = ""
+        if (len(conditions) > 0):
+            whereClause = " WHERE " + " AND ".join(conditions)
+
+        conn = self._get_connection()
+        total = conn.execute("SELECT COUNT(*) FROM experiments" + whereClause, params).fetchone()[0]
+
+        query = "SELECT record FROM experiments" + whereClause + " ORDER BY " + EXPERIMENT_SORT_ORDERS[sort_by]
+        pageParams = list(params)
+        if (limit is not None) or (offset > 0):
+            query += " LIMIT ? OFFSET ?"
+            pageParams.extend([limit if (limit is not None) else -1, offset])
+        rows = conn.execute(query, pageParams).fetchall()
+
+        records = []
+        for row in rows:
+            record = json.loads(row[0])
+            if (fields is not None):
+                record = {key: record[key] for key in fields if (key in record)}
+            records.append(record)
+        return records, total
+
+    # Get the IDs of all experiments with a given status (in the order they were added).  Uses the status index.
+    def get_experiment_ids_by_status(self, status:str, limit:int=None):
+        query = "SELECT id FROM experiments WHERE status = ? ORDER BY seq"
+        params = (status,)
+        if (limit is not None):
+            query += " LIMIT ?"
+            params = (status, limit)
+        rows = self._get_connection().execute(query, params).fetchall()
+        return [row[0] for row in rows]
+
+    # The current version of the experiment list.  It changes every time any experiment is added or changed (by any process), so it can be used to tell whether
+    # a previously-returned list is still current (e.g. as an HTTP ETag) without reading the experiments.
+    def get_version(self):
+        rows = self._get_connection().execute("SELECT key, value FROM metadata WHERE key IN ('store_id', 'version')").fetchall()
+        values = dict(rows)
+        return str(values.get("store_id", "")) + "-" + str(values.get("version", ""))
+
+    # Count the experiments (optionally, only those with a given status)
+    def count_experiments(self, status:str=None):
+        if (status is None):
+            return self._get_connection().execute("SELECT COUNT(*) FROM experiments").fetchone()[0]
+        return self._get_connection().execute("SELECT COUNT(*) FROM experiments WHERE status = ?", (status,)).fetchone()[0]
+
+
+    #
+    #   Writing
+    #
+
+    # Add a new experiment.  A unique ID is assigned (and stored in the record's `id` key).  Returns the ID.
+    def add_experiment(self, record:dict):
+        with self._transaction() as conn:
+            new_experiment_id = str(random.randint(1000, 999999999999))
+            while (conn.execute("SELECT 1 FROM experiments WHERE id = ?", (new_experiment_id,)).fetchone() is not None):
+                new_experiment_id = str(random.randint(1000, 999999999999))
+            record["id"] = new_experiment_id
+            conn.execute("INSERT INTO experiments (id, status, record) VALUES (?, ?, ?)", (new_experiment_id, record.get("status", None), json.dumps(record)))
+            self._increment_version(conn)
+        return new_experiment_id
+
+    # Update (merge) some keys of one experiment record.  Returns the updated record, or None if the experiment doesn't exist.
+    def update_experiment(self, experiment_id:str, updates:dict):
+        experiment_id = str(experiment_id)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT record FROM experiments WHERE id = ?", (experiment_id,)).fetchone()
+            if (row is None):
+                return None
+            record = json.loads(row[0])
+            record.update(updates)
+            record["id"] = experiment_id        # The ID can't be changed
+            conn.execute("UPDATE experiments SET status = ?, record = ? WHERE id = ?", (record.get("status", None), json.dumps(record), experiment_id))
+            self._increment_version(conn)
+        return record
+
+    # Change an experiment's status string
+    def set_experiment_status(self, experiment_id:str, new_status:str):
+        return self.update_experiment(experiment_id, {"status": new_status})
+
+    # Change the status of every experiment with a given status (e.g. `running` -> `interrupted`).  Returns the number of experiments changed.
+    def change_all_experiment_statuses(self, old_status:str, new_status:str):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, record FROM experiments WHERE status = ?", (old_status,)).fetchall()
+            for experiment_id, record_str in rows:
+                record = json.loads(record_str)
+                record["status"] = new_status
+                conn.execute("UPDATE experiments SET status = ?, record = ? WHERE id = ?", (new_status, json.dumps(record), experiment_id))
+            if (len(rows) > 0):
+                self._increment_version(conn)
+        return len(rows)
+
+
+    #
+    #   Migration/Export
+    #
+
+    # One-time import of the experiments from the legacy JSON file (`{"metadata": {}, "experiment_list": [...]}`).
+    # Only happens once -- after that the database is authoritative, and the JSON file is ignored.
+    # Returns False if the import failed (e.g. duplicate experiment IDs), in which case nothing is imported.
+    def migrate_from_json(self, json_filename:str):
+        conn = self._get_connection()
+        if (conn.execute("SELECT value FROM metadata WHERE key = 'migrated_from_json'").fetchone() is not None):
+            return True
+
+        experiment_list = []
+        if (os.path.exists(json_filename)):
+            print("Migrating experiments from " + str(json_filename) + " to " + str(self.db_filename) + "...")
+            try:
+                with open(json_filename, "r") as f:
+                    experiment_list = json.load(f).get("experiment_list", [])
+            except Exception as e:
+                print("ERROR: Could not load experiments file for migration: " + str(e))
+                return False
+
+        try:
+            with self._transaction() as conn:
+                for experiment in experiment_list:
+                    conn.execute("INSERT INTO experiments (id, status, record) VALUES (?, ?, ?)", (str(experiment["id"]), experiment.get("status", None), json.dumps(experiment)))
+                conn.execute("INSERT INTO metadata (key, value) VALUES ('migrated_from_json', ?)", (json_filename,))
+                self._increment_version(conn)
+        except sqlite3.IntegrityError as e:
+            print("ERROR: Could not migrate experiments -- the experiment IDs are not unique: " + str(e))
+            return False
+
+        if (len(experiment_list) > 0):
+            print("Migrated " + str(len(experiment_list)) + " experiments.")
+        return True
+
+    # Export all the experiments to a JSON file (in the legacy `all-experiments.json` format), e.g. for the meta-analysis tools
+    def export_json(self, json_filename:str):
+        experiments_data = {
+            "metadata": {},
+            "experiment_list": self.get_all_experiments()
+        }
+        filename_tmp = json_filename + ".tmp." + str(threading.get_ident())
+        with open(filename_tmp, "w") as f:
+            json.dump(experiments_data, f, indent=4)
+        os.replace(filename_tmp, json_filename)
+
+
+# Context manager for a write transaction (rolls back on an exception)
+class _SQLiteTransaction():
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if (exc_type is None):
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
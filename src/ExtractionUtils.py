@@ -3,19 +3,26 @@
 import os
 import json
 import time
+import asyncio
+import random
+import hashlib
+import threading
 import traceback
+import collections
+import math
+import multiprocessing
+from multiprocessing.managers import BaseManager
 
-from litellm import completion
+from litellm import acompletion
 from litellm import embedding
 
 import tiktoken
 
-from func_timeout import func_timeout, FunctionTimedOut
-
 
 # Cost Estimates. Note that these are just estimates and may not be accurate -- you should ideally have other methods (like a hard limit on your account) to help limit unexpected costs.
 
 TOTAL_LLM_COST = 0.0            ## Running (estimated) cost of all LLM queries so far. This is a global variable that is updated with each query.
+THREAD_LOCK_TOTAL_LLM_COST = threading.Lock()       ## Responses are parsed concurrently (in the LLM event loop's thread pool), so updates to TOTAL_LLM_COST must hold this lock
 #LLM_COST_HARD_LIMIT = 10
 LLM_COST_HARD_LIMIT = 250       ## Nominally, the HARD COST LIMIT, in dollars.  If the running cost estimate exceeds this value, the program shouuld exit.  This helps (but isn't a perfect solution for) runaway costs.
 
@@ -23,14 +30,100 @@ LLM_COST_HARD_LIMIT = 250       ## Nominally, the HARD COST LIMIT, in dollars.
 DEFAULT_MAX_TOKENS = 8000
 
 
+# LLM response cache.  Responses are stored on disk, keyed by (model, prompt hash, temperature, maxTokens, jsonOut), so that re-running the same
+# deterministic prompt (e.g. re-running a benchmark, or a retried task) does not require another (paid) LLM call.
+LLM_CACHE_ENABLED = True
+PATH_LLM_CACHE = "data/llm-cache/"
+LLM_CACHE_MAX_SIZE_BYTES = 500 * 1024 * 1024       # Maximum size of the cache on disk (500MB).  The least-recently-used entries are evicted when this is exceeded.
+LLM_CACHE_MAX_TEMPERATURE = 0.0                     # By default, only cache deterministic (temperature 0) generations -- higher temperatures are often used specifically to get different responses on retries.
+THREAD_LOCK_LLM_CACHE = threading.Lock()
+llm_cache_size_bytes = {"total": None}              # Running estimate of the cache size (lazily initialized on first write)
+
+
 #
 #   Helper: Counting tokens
 #
 # Use TikToken to measure the number of tokens in an input string
 tiktokenEncoder = tiktoken.encoding_for_model("gpt-4")
+
+# Token counts are cached (keyed by a hash of the string), since the same strings (log lines, prompt components, retried prompts) are often counted repeatedly
+TOKEN_COUNT_CACHE_MAX_ENTRIES = 50000
+THREAD_LOCK_TOKEN_COUNT_CACHE = threading.Lock()
+token_count_cache = collections.OrderedDict()       # Hash -> token count (least-recently-used first)
+
+# Approximate token counting (without tokenizing).  Returns an estimate of (roughly) the upper bound of the token count, from the number of bytes.
+# The bytes-per-token ratio starts at a conservative default, and is calibrated against the exact counts as strings are tokenized: it tracks (close to) the
+# lowest ratio seen, so that the estimate stays on the high side.
+TOKEN_ESTIMATE_DEFAULT_BYTES_PER_TOKEN = 3.0
+TOKEN_ESTIMATE_MIN_CALIBRATION_BYTES = 256          # Only calibrate on strings at least this long (short strings have noisy ratios)
+token_estimate_calibration = {"bytes_per_token": TOKEN_ESTIMATE_DEFAULT_BYTES_PER_TOKEN, "num_samples": 0}
+
+def _getTokenCountCacheKey(inputStr:str):
+    return hashlib.blake2b(inputStr.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+
+def _getCachedTokenCount(key):
+    with THREAD_LOCK_TOKEN_COUNT_CACHE:
+        count = token_count_cache.get(key, None)
+        if (count is not None):
+            token_count_cache.move_to_end(key)
+        return count
+
+def _setCachedTokenCount(key, count:int):
+    with THREAD_LOCK_TOKEN_COUNT_CACHE:
+        token_count_cache[key] = count
+        token_count_cache.move_to_end(key)
+        while (len(token_count_cache) > TOKEN_COUNT_CACHE_MAX_ENTRIES):
+            token_count_cache.popitem(last=False)
+
+# Update the approximate counter's bytes-per-token ratio from an exact count
+def _calibrateTokenEstimate(numBytes:int, numTokens:int):
+    if (numBytes < TOKEN_ESTIMATE_MIN_CALIBRATION_BYTES) or (numTokens <= 0):
+        return
+    ratio = numBytes / numTokens
+    with THREAD_LOCK_TOKEN_COUNT_CACHE:
+        calibration = token_estimate_calibration
+        if (calibration["num_samples"] == 0):
+            calibration["bytes_per_token"] = min(ratio, TOKEN_ESTIMATE_DEFAULT_BYTES_PER_TOKEN)
+        elif (ratio < calibration["bytes_per_token"]):
+            calibration["bytes_per_token"] = ratio                                          # Move down to a lower ratio immediately
+        else:
+            calibration["bytes_per_token"] += 0.01 * (ratio - calibration["bytes_per_token"])   # ... but only drift up slowly
+        calibration["num_samples"] += 1
+
 def countTokens(inputStr:str):
+    key = _getTokenCountCacheKey(inputStr)
+    count = _getCachedTokenCount(key)
+    if (count is not None):
+        return count
     tokens = tiktokenEncoder.encode(inputStr)
-    return len(tokens)
+    count = len(tokens)
+    _setCachedTokenCount(key, count)
+    _calibrateTokenEstimate(len(inputStr.encode("utf-8", errors="surrogatepass")), count)
+    return count
+
+# Count the tokens in a list of strings (the uncached ones are tokenized together, in parallel).  Returns a list of counts.
+def countTokensBatch(inputStrs:list):
+    counts = [None] * len(inputStrs)
+    keys = [_getTokenCountCacheKey(inputStr) for inputStr in inputStrs]
+    missingIdxs = []
+    for idx, key in enumerate(keys):
+        counts[idx] = _getCachedTokenCount(key)
+        if (counts[idx] is None):
+            missingIdxs.append(idx)
+
+    if (len(missingIdxs) > 0):
+        tokenLists = tiktokenEncoder.encode_batch([inputStrs[idx] for idx in missingIdxs])
+        for idx, tokens in zip(missingIdxs, tokenLists):
+            counts[idx] = len(tokens)
+            _setCachedTokenCount(keys[idx], counts[idx])
+            _calibrateTokenEstimate(len(inputStrs[idx].encode("utf-8", errors="surrogatepass")), counts[idx])
+
+    return counts
+
+# Fast approximate token count (an estimate of the upper bound), for when only a rough size is needed (e.g. logging, rate limit reservations)
+def countTokensApprox(inputStr:str):
+    numBytes = len(inputStr.encode("utf-8", errors="surrogatepass"))
+    return int(math.ceil(numBytes / token_estimate_calibration["bytes_per_token"]))
 
 
 def tokenize(inputStr:str):
@@ -75,35 +168,506 @@ def getTotalLLMCost():
     return TOTAL_LLM_COST
 
 
+#
+#   Helper: LLM response cache
+#
+
+# Get the cache key (and filename) for a given request
+def _getLLMCacheFilename(promptStr:str, model:str, temperature:float, maxTokens:int, jsonOut:bool):
+    promptHash = hashlib.sha256(promptStr.encode("utf-8")).hexdigest()
+    # Normalize the temperature, so that (e.g.) `0` and `0.0` map to the same entry
+    if (temperature is not None):
+        temperature = float(temperature)
+    keyStr = json.dumps({"model": model, "prompt_sha256": promptHash, "temperature": temperature, "max_tokens": maxTokens, "json_out": jsonOut}, sort_keys=True)
+    key = hashlib.sha256(keyStr.encode("utf-8")).hexdigest()
+    return os.path.join(PATH_LLM_CACHE, key + ".json")
+
+# Check whether a given request should use the cache.  `useCache` can be None (use the default policy), True (always cache), or False (bypass the cache).
+def _shouldUseLLMCache(temperature:float, useCache:bool=None):
+    if (useCache is not None):
+        return useCache
+    if (not LLM_CACHE_ENABLED):
+        return False
+    if (temperature is None) or (temperature > LLM_CACHE_MAX_TEMPERATURE):
+        return False
+    return True
+
+# Look up a response in the cache.  Returns (responseJSON, responseText, cost) if found, or None otherwise.
+def getLLMCachedResponse(promptStr:str, model:str, temperature:float, maxTokens:int, jsonOut:bool):
+    filename = _getLLMCacheFilename(promptStr, model, temperature, maxTokens, jsonOut)
+    with THREAD_LOCK_LLM_CACHE:
+        if (not os.path.exists(filename)):
+            return None
+        try:
+            with open(filename, 'r') as f:
+                cacheEntry = json.load(f)
+            # Update the access time, so that the least-recently-used entries are evicted first
+            os.utime(filename, None)
+        except Exception as e:
+            print("WARNING: Could not read LLM cache entry (" + filename + "): " + str(e))
+            return None
+
+    return cacheEntry.get("responseJSON", None), cacheEntry.get("responseText", ""), cacheEntry.get("cost", 0)
+
+# Store a response in the cache
+def saveLLMCachedResponse(promptStr:str, model:str, temperature:float, maxTokens:int, jsonOut:bool, responseJSON, responseText:str, cost:float):
+    filename = _getLLMCacheFilename(promptStr, model, temperature, maxTokens, jsonOut)
+    cacheEntry = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": maxTokens,
+        "json_out": jsonOut,
+        "timestamp": time.strftime("%Y%m%d-%H%M%S"),
+        "responseJSON": responseJSON,
+        "responseText": responseText,
+        "cost": cost
+    }
+
+    with THREAD_LOCK_LLM_CACHE:
+        try:
+            if not os.path.exists(PATH_LLM_CACHE):
+                os.makedirs(PATH_LLM_CACHE)
+            # Write to a temporary file first, then rename, so that a partially-written entry is never read
+            filenameTemp = filename + ".tmp." + str(os.getpid())       # Per-process, since experiments run in separate worker processes
+            with open(filenameTemp, 'w') as f:
+                json.dump(cacheEntry, f)
+            os.replace(filenameTemp, filename)
+        except Exception as e:
+            print("WARNING: Could not write LLM cache entry (" + filename + "): " + str(e))
+            return
+
+        # Keep track of the size of the cache, and evict old entries if it's too large
+        if (llm_cache_size_bytes["total"] is None):
+            llm_cache_size_bytes["total"] = _getLLMCacheSizeBytes()
+        else:
+            llm_cache_size_bytes["total"] += os.path.getsize(filename)
+
+        if (llm_cache_size_bytes["total"] > LLM_CACHE_MAX_SIZE_BYTES):
+            _evictLLMCache()
+
+# Get the total size (in bytes) of the cache on disk
+def _getLLMCacheSizeBytes():
+    totalSize = 0
+    for entry in os.scandir(PATH_LLM_CACHE):
+        if (entry.is_file()) and (entry.name.endswith(".json")):
+            totalSize += entry.stat().st_size
+    return totalSize
+
+# Evict the least-recently-used entries from the cache, until it's below 90% of the maximum size.  NOTE: Assumes THREAD_LOCK_LLM_CACHE is held.
+def _evictLLMCache():
+    entries = []
+    for entry in os.scandir(PATH_LLM_CACHE):
+        if (entry.is_file()) and (entry.name.endswith(".json")):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    totalSize = sum([x[1] for x in entries])
+    targetSize = int(LLM_CACHE_MAX_SIZE_BYTES * 0.9)
+    numEvicted = 0
+    for (mtime, size, path) in entries:
+        if (totalSize <= targetSize):
+            break
+        try:
+            os.remove(path)
+            totalSize -= size
+            numEvicted += 1
+        except Exception as e:
+            print("WARNING: Could not evict LLM cache entry (" + path + "): " + str(e))
+
+    llm_cache_size_bytes["total"] = totalSize
+    print("LLM cache: Evicted " + str(numEvicted) + " entries (cache size is now " + str(totalSize) + " bytes).")
+
+
+#
+#   Helper: Shared event loop for LLM requests
+#
+
+# All LLM requests (sync or async) run on a single shared asyncio event loop, in a background thread.  This allows many requests to be in flight at once,
+# with real (cancellation-based) timeouts, instead of blocking one thread per request.
+LLM_EVENT_LOOP = None
+THREAD_LOCK_LLM_EVENT_LOOP = threading.Lock()
+
+def getLLMEventLoop():
+    global LLM_EVENT_LOOP
+    with THREAD_LOCK_LLM_EVENT_LOOP:
+        if (LLM_EVENT_LOOP is None) or (LLM_EVENT_LOOP.is_closed()):
+            loop = asyncio.new_event_loop()
+            loopThread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+            loopThread.start()
+            LLM_EVENT_LOOP = loop
+        return LLM_EVENT_LOOP
+
+
+#
+#   Helper: Rate limiting for LLM requests
+#
+
+# Process-wide rate limits for LLM requests, per provider (or per model, if a model is listed explicitly).  Every call to getLLMResponseJSON goes through
+# the limiter, so callers can use high concurrency without triggering retry storms.  These can be overridden with an `llm_rate_limits` key in `config_threads.json`.
+FILENAME_CONFIG_THREADS = "config_threads.json"
+LLM_RATE_LIMITS = {
+    "default": {"requests_per_minute": 500, "tokens_per_minute": 400000, "max_concurrent": 50},
+    "openai": {"requests_per_minute": 5000, "tokens_per_minute": 2000000, "max_concurrent": 100},
+    "anthropic": {"requests_per_minute": 1000, "tokens_per_minute": 400000, "max_concurrent": 50},
+    "deepseek": {"requests_per_minute": 500, "tokens_per_minute": 400000, "max_concurrent": 50},
+}
+
+
+# Get the provider for a given model string (e.g. "claude-3-5-sonnet-20241022" -> "anthropic")
+def getLLMProvider(model:str):
+    modelLower = model.lower()
+    if ("/" in modelLower):
+        return modelLower.split("/")[0]
+    if ("claude" in modelLower):
+        return "anthropic"
+    if (modelLower.startswith("gpt")) or (modelLower.startswith("o1")) or (modelLower.startswith("o3")) or (modelLower.startswith("text-embedding")):
+        return "openai"
+    if ("deepseek" in modelLower):
+        return "deepseek"
+    return "default"
+
+
+# Check whether an exception from litellm is a rate limit (HTTP 429) error
+def isRateLimitError(e:Exception):
+    if (type(e).__name__ == "RateLimitError"):
+        return True
+    errorStr = str(e).lower()
+    if ("429" in errorStr) or ("rate limit" in errorStr) or ("rate_limit" in errorStr):
+        return True
+    return False
+
+
+# A token bucket rate limiter, keyed by provider and model, that tracks both requests/min and tokens/min, as well as the number of requests in flight.
+# On a rate limit error, the allowed rate for that bucket is halved, and new requests wait for an (exponentially increasing) cooldown.  The rate slowly
+# recovers with each successful request.
+# The limiter can also forward to a shared limiter in another process (see `startSharedLLMRateLimiter()`), so that several processes (e.g. experiment
+# workers) draw from one budget, rather than each getting the full budget.
+# Each request in flight is a lease, held by a process (pid).  If a process dies while holding leases (e.g. a worker is killed), they can be dropped with
+# `releaseHolder()` -- and as a backstop, a lease expires after LLM_RATE_LIMIT_LEASE_TTL_SEC (longer than any request is allowed to take).
+LLM_RATE_LIMIT_LEASE_TTL_SEC = 60 * 10
+
+class LLMRateLimiter():
+    # Constructor
+    def __init__(self, rateLimits:dict):
+        self.rateLimits = rateLimits
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.remote = None              # If set, a proxy for the shared limiter that this limiter forwards to
+
+    # Forward all requests to a shared limiter (a proxy from `startSharedLLMRateLimiter()`)
+    def setRemote(self, remote):
+        self.remote = remote
+
+    # Call a method on the shared limiter.  If the shared limiter can't be reached (e.g. the server is shutting down), stop using it, and fall back to this process's own limits.
+    def _callRemote(self, methodName:str, *args):
+        remote = self.remote
+        if (remote is None):
+            return False, None
+        try:
+            return True, getattr(remote, methodName)(*args)
+        except Exception as e:
+            print("WARNING: Could not reach the shared LLM rate limiter (" + str(e) + ").  Using this process's own rate limits instead.")
+            self.remote = None
+            return False, None
+
+    # Get the limits for a given model (an exact model match takes priority over the provider)
+    def getLimits(self, model:str):
+        if (model in self.rateLimits):
+            return self.rateLimits[model]
+        provider = getLLMProvider(model)
+        if (provider in self.rateLimits):
+            return self.rateLimits[provider]
+        return self.rateLimits["default"]
+
+    # Get (or create) the bucket for a given model.  NOTE: Assumes self.lock is held.
+    def _getBucket(self, model:str):
+        key = getLLMProvider(model) + ":" + model
+        if (key not in self.buckets):
+            limits = self.getLimits(model)
+            self.buckets[key] = {
+                "limits": limits,
+                "request_tokens": float(limits["requests_per_minute"]),
+                "llm_tokens": float(limits["tokens_per_minute"]),
+                "last_refill": time.time(),
+                "leases": {},                       # holder (pid) -> list of times that each of its requests in flight was acquired
+                "rate_multiplier": 1.0,             # Reduced on rate limit errors, and slowly recovers on success
+                "cooldown_until": 0,
+                "consecutive_rate_limit_errors": 0,
+            }
+        return self.buckets[key]
+
+    # Refill the bucket based on the time since it was last refilled.  NOTE: Assumes self.lock is held.
+    def _refill(self, bucket:dict):
+        now = time.time()
+        deltaMinutes = (now - bucket["last_refill"]) / 60.0
+        bucket["last_refill"] = now
+        limits = bucket["limits"]
+        multiplier = bucket["rate_multiplier"]
+        bucket["request_tokens"] = min(float(limits["requests_per_minute"]), bucket["request_tokens"] + deltaMinutes * limits["requests_per_minute"] * multiplier)
+        bucket["llm_tokens"] = min(float(limits["tokens_per_minute"]), bucket["llm_tokens"] + deltaMinutes * limits["tokens_per_minute"] * multiplier)
+
+    # Drop any leases older than LLM_RATE_LIMIT_LEASE_TTL_SEC, and return the number of requests in flight.  NOTE: Assumes self.lock is held.
+    def _expireLeases(self, bucket:dict):
+        minAcquired = time.time() - LLM_RATE_LIMIT_LEASE_TTL_SEC
+        numInFlight = 0
+        for holder in list(bucket["leases"].keys()):
+            leases = [t for t in bucket["leases"][holder] if (t >= minAcquired)]
+            if (len(leases) < len(bucket["leases"][holder])):
+                print("WARNING: LLM rate limiter: expired " + str(len(bucket["leases"][holder]) - len(leases)) + " lease(s) held by process " + str(holder) + " for more than " + str(LLM_RATE_LIMIT_LEASE_TTL_SEC) + " seconds.")
+            if (len(leases) == 0):
+                del bucket["leases"][holder]
+            else:
+                bucket["leases"][holder] = leases
+                numInFlight += len(leases)
+        return numInFlight
+
+    # Try to reserve capacity for one request.  Returns 0 if the request can proceed, or otherwise the number of seconds to wait before trying again.
+    # `holder`: The process that will hold the lease (defaults to this process).
+    def _tryAcquire(self, model:str, numTokens:int, holder:int=None):
+        if (holder is None):
+            holder = os.getpid()
+        forwarded, result = self._callRemote("_tryAcquire", model, numTokens, holder)
+        if (forwarded):
+            return result
+        with self.lock:
+            bucket = self._getBucket(model)
+            self._refill(bucket)
+            limits = bucket["limits"]
+            now = time.time()
+
+            if (now < bucket["cooldown_until"]):
+                return bucket["cooldown_until"] - now
+            if (self._expireLeases(bucket) >= limits["max_concurrent"]):
+                return 0.1
+
+            # A single request larger than the whole per-minute budget is allowed through once the bucket is full
+            numTokens = min(numTokens, limits["tokens_per_minute"])
+            requestRatePerSec = limits["requests_per_minute"] * bucket["rate_multiplier"] / 60.0
+            tokenRatePerSec = limits["tokens_per_minute"] * bucket["rate_multiplier"] / 60.0
+            waitTime = 0
+            if (bucket["request_tokens"] < 1):
+                waitTime = max(waitTime, (1 - bucket["request_tokens"]) / requestRatePerSec)
+            if (bucket["llm_tokens"] < numTokens):
+                waitTime = max(waitTime, (numTokens - bucket["llm_tokens"]) / tokenRatePerSec)
+            if (waitTime > 0):
+                return max(waitTime, 0.05)
+
+            bucket["request_tokens"] -= 1
+            bucket["llm_tokens"] -= numTokens
+            if (holder not in bucket["leases"]):
+                bucket["leases"][holder] = []
+            bucket["leases"][holder].append(now)
+            return 0
+
+    # Wait until capacity is available for one request (async).  Calls to the shared limiter are made from the loop's thread pool, so they don't block the event loop.
+    async def aacquire(self, model:str, numTokens:int):
+        loop = asyncio.get_running_loop()
+        while True:
+            if (self.remote is not None):
+                waitTime = await loop.run_in_executor(None, self._tryAcquire, model, numTokens)
+            else:
+                waitTime = self._tryAcquire(model, numTokens)
+            if (waitTime <= 0):
+                return
+            await asyncio.sleep(waitTime)
+
+    # Wait until capacity is available for one request (sync)
+    def acquire(self, model:str, numTokens:int):
+        while True:
+            waitTime = self._tryAcquire(model, numTokens)
+            if (waitTime <= 0):
+                return
+            time.sleep(waitTime)
+
+    # Release a request (must be called once for every successful acquire).  `extraTokens` is the difference between the actual number of tokens
+    # used (prompt + completion) and the estimate that was reserved, so the tokens/min budget reflects actual usage.
+    def release(self, model:str, extraTokens:int=0, success:bool=True, holder:int=None):
+        if (holder is None):
+            holder = os.getpid()
+        forwarded, result = self._callRemote("release", model, extraTokens, success, holder)
+        if (forwarded):
+            return
+        with self.lock:
+            bucket = self._getBucket(model)
+            if (len(bucket["leases"].get(holder, [])) > 0):
+                bucket["leases"][holder].pop(0)
+                if (len(bucket["leases"][holder]) == 0):
+                    del bucket["leases"][holder]
+            bucket["llm_tokens"] -= extraTokens
+            if (success):
+                bucket["consecutive_rate_limit_errors"] = 0
+                bucket["rate_multiplier"] = min(1.0, bucket["rate_multiplier"] * 1.1)
+
+    # Release (from an event loop).  Calls to the shared limiter are handed to the loop's thread pool without waiting for them, so they neither block the
+    # event loop, nor get lost if the calling task is cancelled.
+    def releaseFromLoop(self, model:str, extraTokens:int=0, success:bool=True):
+        if (self.remote is not None):
+            asyncio.get_running_loop().run_in_executor(None, self.release, model, extraTokens, success, os.getpid())
+        else:
+            self.release(model, extraTokens, success)
+
+    # Drop all the leases held by a process (e.g. a worker process that has exited, and can't release them itself).  Returns the number of leases dropped.
+    def releaseHolder(self, holder:int):
+        forwarded, result = self._callRemote("releaseHolder", holder)
+        if (forwarded):
+            return result
+        numDropped = 0
+        with self.lock:
+            for key in self.buckets:
+                numDropped += len(self.buckets[key]["leases"].pop(holder, []))
+        if (numDropped > 0):
+            print("LLM rate limiter: released " + str(numDropped) + " lease(s) held by process " + str(holder) + ".")
+        return numDropped
+
+    # Note that a request was rate limited by the provider: reduce the allowed rate, and back off (exponentially, with jitter) before the next request
+    def reportRateLimited(self, model:str):
+        forwarded, result = self._callRemote("reportRateLimited", model)
+        if (forwarded):
+            return
+        with self.lock:
+            bucket = self._getBucket(model)
+            bucket["consecutive_rate_limit_errors"] += 1
+            bucket["rate_multiplier"] = max(0.1, bucket["rate_multiplier"] * 0.5)
+            backoffSeconds = min(60, 2 ** bucket["consecutive_rate_limit_errors"]) * (0.5 + random.random() / 2)
+            bucket["cooldown_until"] = max(bucket["cooldown_until"], time.time() + backoffSeconds)
+            print("Rate limited by provider (model: " + str(model) + ").  Reducing request rate to " + str(round(bucket["rate_multiplier"] * 100)) + "% and backing off for " + str(round(backoffSeconds, 1)) + " seconds.")
+
+    # Get a summary of the current state of each bucket (e.g. for status reporting)
+    def getStatus(self):
+        forwarded, result = self._callRemote("getStatus")
+        if (forwarded):
+            return result
+        with self.lock:
+            status = {}
+            for key in self.buckets:
+                bucket = self.buckets[key]
+                status[key] = {
+                    "in_flight": self._expireLeases(bucket),
+                    "rate_multiplier": round(bucket["rate_multiplier"], 3),
+                    "cooldown_seconds_remaining": max(0, round(bucket["cooldown_until"] - time.time(), 1)),
+                }
+            return status
+
+
+# Load the rate limits (with any overrides from `config_threads.json`)
+def loadLLMRateLimits():
+    rateLimits = {}
+    for key in LLM_RATE_LIMITS:
+        rateLimits[key] = dict(LLM_RATE_LIMITS[key])
+    try:
+        if os.path.exists(FILENAME_CONFIG_THREADS):
+            with open(FILENAME_CONFIG_THREADS, "r") as f:
+                configData = json.load(f)
+            overrides = configData.get("llm_rate_limits", {})
+            for key in overrides:
+                if (key not in rateLimits):
+                    rateLimits[key] = dict(rateLimits["default"])
+                rateLimits[key].update(overrides[key])
+    except Exception as e:
+        print("ERROR: Could not load LLM rate limits from '" + FILENAME_CONFIG_THREADS + "'.  Using defaults: " + str(e))
+    return rateLimits
+
+LLM_RATE_LIMITER = LLMRateLimiter(loadLLMRateLimits())
+
+
+# Shared rate limiter: a single limiter, hosted in a (multiprocessing) manager process, that other processes forward to.  The server starts it,
+# and passes the proxy to each experiment worker process, which calls `useSharedLLMRateLimiter()` -- so N workers share one budget, rather than getting N budgets.
+class LLMRateLimiterManager(BaseManager):
+    pass
+
+LLMRateLimiterManager.register("LLMRateLimiter", LLMRateLimiter, exposed=["_tryAcquire", "release", "releaseHolder", "reportRateLimited", "getStatus"])
+
+shared_llm_rate_limiter = {"manager": None, "proxy": None}
+THREAD_LOCK_SHARED_LLM_RATE_LIMITER = threading.Lock()
+
+# Start the shared rate limiter (if it isn't already running), and have this process use it.  Returns the proxy (to pass to other processes), or None if it couldn't be started.
+def startSharedLLMRateLimiter():
+    with THREAD_LOCK_SHARED_LLM_RATE_LIMITER:
+        if (shared_llm_rate_limiter["proxy"] is None):
+            try:
+                manager = LLMRateLimiterManager(ctx=multiprocessing.get_context("spawn"))
+                manager.start()
+                shared_llm_rate_limiter["proxy"] = manager.LLMRateLimiter(LLM_RATE_LIMITER.rateLimits)
+                shared_llm_rate_limiter["manager"] = manager
+                print("Started the shared LLM rate limiter.")
+            except Exception as e:
+                print("ERROR: Could not start the shared LLM rate limiter.  Each process will use its own rate limits: " + str(e))
+                return None
+        LLM_RATE_LIMITER.setRemote(shared_llm_rate_limiter["proxy"])
+        return shared_llm_rate_limiter["proxy"]
+
+# (In another process) Forward this process's LLM requests to the shared rate limiter
+def useSharedLLMRateLimiter(proxy):
+    if (proxy is not None):
+        LLM_RATE_LIMITER.setRemote(proxy)
+
+
+# An unrecoverable error (e.g. hard cost limit reached, too many timeouts) -- the caller should exit.
+class LLMFatalError(Exception):
+    pass
+
+
 #
 #   Helper: Get a response from an LLM model
 #
 
 
-# Get a response from an LLM model using litellm
-def getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True):
+# Get a response from an LLM model using litellm (synchronous version, for existing callers).  The request itself runs on the shared LLM event loop.
+# `useCache`: None uses the default cache policy (only deterministic/temperature 0 requests are cached), True always uses the cache, and False bypasses it.
+def getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True, useCache:bool=None):
+    future = asyncio.run_coroutine_threadsafe(_agetLLMResponseJSONWithRetries(promptStr, model, temperature, maxTokens, jsonOut, useCache), getLLMEventLoop())
+    try:
+        return future.result()
+    except LLMFatalError as e:
+        print(str(e))
+        exit(1)
+    # Keyboard exception
+    except KeyboardInterrupt:
+        future.cancel()
+        exit(1)
+
+
+# Get a response from an LLM model using litellm (asynchronous version).  Can be awaited from any event loop, e.g. to keep many requests in flight with asyncio.gather().
+# NOTE: Unlike the synchronous version, this does not exit on an unrecoverable error -- it raises LLMFatalError, which the caller should handle.
+async def agetLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True, useCache:bool=None):
+    return await _agetLLMResponseJSONWithRetries(promptStr, model, temperature, maxTokens, jsonOut, useCache)
+
+
+async def _agetLLMResponseJSONWithRetries(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True, useCache:bool=None):
+    # Check the cache
+    # NOTE: The blocking work (cache file I/O, prompt dumps) runs in the loop's thread pool, so it doesn't stall the other requests in flight on the event loop
+    loop = asyncio.get_running_loop()
+    cacheEnabled = _shouldUseLLMCache(temperature, useCache)
+    if (cacheEnabled):
+        cachedResponse = await loop.run_in_executor(None, getLLMCachedResponse, promptStr, model, temperature, maxTokens, jsonOut)
+        if (cachedResponse is not None):
+            print("LLM cache hit (model: " + str(model) + ", prompt length: " + str(len(promptStr)) + ")")
+            return cachedResponse
+
     MAX_RETRIES = 10
     MAX_GENERATION_TIME_SECONDS = 60 * 5        # Maximum of 5 minutes per generation (guard against long hangs)
     count_too_long_errors = 0
 
     for retryIdx in range(MAX_RETRIES):
         try:
-            # Use timeout
-            responseJSON, responseText, cost = func_timeout(MAX_GENERATION_TIME_SECONDS, _getLLMResponseJSON, args=(promptStr, model, temperature, maxTokens, jsonOut))
+            # Use timeout (the request is cancelled if it takes too long).  NOTE: Only the generation itself is timed, not the time spent waiting on the rate limiter.
+            responseJSON, responseText, cost = await _agetLLMResponseJSON(promptStr, model, temperature, maxTokens, jsonOut, timeout=MAX_GENERATION_TIME_SECONDS)
+            # Store the response in the cache (but not responses that failed to parse, so that they can be retried)
+            if (cacheEnabled) and ((responseJSON is not None) or (jsonOut == False)):
+                await loop.run_in_executor(None, saveLLMCachedResponse, promptStr, model, temperature, maxTokens, jsonOut, responseJSON, responseText, cost)
             return responseJSON, responseText, cost
 
         # timeout
-        except FunctionTimedOut:
+        except asyncio.TimeoutError:
             errorInfo = "Time: " + str(time.strftime("%Y%m%d-%H%M%S")) + "  count_too_long_errors: " + str(count_too_long_errors) + "  model: " + model + "  prompt length: " + str(len(promptStr))
             print("ERROR: LLM Generation timed out. " + str(errorInfo))
             count_too_long_errors += 1
             if (count_too_long_errors >= 3):
-                print("ERROR: LLM Generation time out: Too many timeouts. Exiting.")
-                exit(1)
+                raise LLMFatalError("ERROR: LLM Generation time out: Too many timeouts. Exiting.")
 
-        # Keyboard exception
-        except KeyboardInterrupt:
-            exit(1)
+        except LLMFatalError:
+            raise
         except Exception as e:
             print("ERROR: Could not get LLM response. Retrying... ")
             print("ERROR MESSAGE:")
@@ -116,25 +680,54 @@ def getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:
                 print("ERROR: Prompt is too long. Exiting.")
                 return None, "", 0
 
+            # Rate limit errors: the rate limiter reduces the request rate and applies an (exponential) backoff before the next request is allowed through
+            if (isRateLimitError(e)):
+                await loop.run_in_executor(None, LLM_RATE_LIMITER.reportRateLimited, model)
+                print("Attempt " + str(retryIdx) + " of " + str(MAX_RETRIES))
+                continue
+
         # Short delay before retrying
         print("Delaying for a few seconds before retrying...")
         print("Attempt " + str(retryIdx) + " of " + str(MAX_RETRIES))
-        time.sleep(retryIdx * 15)
+        await asyncio.sleep(retryIdx * 15)
 
     # If we reach here, something terrible happened
-    print("ERROR: Could not get LLM response. Exiting.")
-    exit(1)
+    raise LLMFatalError("ERROR: Could not get LLM response. Exiting.")
 
 
-def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True):
-    global TOTAL_LLM_COST
+# `timeout`: Maximum time (in seconds) for the generation itself (raises asyncio.TimeoutError).  Time spent queued on the rate limiter does not count towards it.
+async def _agetLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True, timeout:float=None):
+    loop = asyncio.get_running_loop()
+    completionArgs, timestamp, promptTokens = await loop.run_in_executor(None, _prepareLLMRequest, promptStr, model, temperature, maxTokens, jsonOut)
+
+    # Wait for capacity from the (process-wide) rate limiter
+    await LLM_RATE_LIMITER.aacquire(model, promptTokens)
+    response = None
+    try:
+        response = await asyncio.wait_for(acompletion(**completionArgs), timeout=timeout)
+    finally:
+        # Always release the capacity (including on timeout or cancellation), and record the actual number of tokens used against the tokens/min budget
+        extraTokens = 0
+        if (response is not None):
+            try:
+                extraTokens = response["usage"].get("total_tokens", 0) - promptTokens
+            except Exception as e:
+                pass
+        LLM_RATE_LIMITER.releaseFromLoop(model, extraTokens=extraTokens, success=(response is not None))
+
+    return await loop.run_in_executor(None, _parseLLMResponse, response, model, timestamp)
+
+
+# Assemble the arguments for a litellm completion call (and dump the prompt to the `prompts` directory, for debugging).  Also returns the prompt token count.
+def _prepareLLMRequest(promptStr:str, model:str, temperature:float=0, maxTokens:int=DEFAULT_MAX_TOKENS, jsonOut:bool=True):
     print("Querying LLM model (" + str(model) + ")... ")
 
     # Note the running cost of all LLM queries
     print("(Running cost of all LLM generations so far: " + str(round(TOTAL_LLM_COST, 2)) + ")")
 
-    # Measure the number of tokens in the prompt
-    print("Prompt tokens: " + str(countTokens(promptStr)))
+    # Estimate the number of tokens in the prompt (for the log, and the rate limiter -- which corrects it to the actual usage afterwards)
+    promptTokens = countTokensApprox(promptStr)
+    print("Prompt tokens (estimated): " + str(promptTokens))
 
     messages=[
         {"role": "user",
@@ -164,11 +757,10 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
     if (model == "claude-3-5-sonnet-20240620") and (maxTokens > 4096):
         extra_headers={"anthropic-beta": "max-tokens-3-5-sonnet-2024-07-15"}
 
-    response = None
-
     # New (special handling for different models)
+    completionArgs = {"model": model, "messages": messages, "extra_headers": extra_headers}
     if (model == "deepseek/deepseek-reasoner"):
-        response = completion(model=model, messages=messages, temperature=temperature, max_tokens=maxTokens, response_format={"type": "json_object"}, extra_headers=extra_headers)
+        completionArgs.update({"temperature": temperature, "max_tokens": maxTokens, "response_format": {"type": "json_object"}})
 
     elif ("o3-mini" in model):
         # needs max_completion_tokens
@@ -178,29 +770,28 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
         #reasoning_effort = "medium"
         reasoning_effort = "high"
 
+        completionArgs["max_completion_tokens"] = maxTokens
         if (jsonOut):
-            if (reasoning_effort == None):
-                response = completion(model=model, messages=messages, max_completion_tokens=maxTokens, response_format={"type": "json_object"}, extra_headers=extra_headers)
-            else:
-                response = completion(model=model, messages=messages, max_completion_tokens=maxTokens, response_format={"type": "json_object"}, extra_headers=extra_headers, reasoning_effort=reasoning_effort)
-        else:
-            if (reasoning_effort == None):
-                response = completion(model=model, messages=messages, max_completion_tokens=maxTokens, extra_headers=extra_headers)
-            else:
-                response = completion(model=model, messages=messages, max_completion_tokens=maxTokens, extra_headers=extra_headers, reasoning_effort=reasoning_effort)
+            completionArgs["response_format"] = {"type": "json_object"}
+        if (reasoning_effort != None):
+            completionArgs["reasoning_effort"] = reasoning_effort
 
     elif ("claude" in model):
         #print("** SPECIAL HANDLING FOR CLAUDE **")
         # Do not use special JSON model for claude -- it seems to do better at adhering to the schema without it
-        response = completion(model=model, messages=messages, temperature=temperature, max_tokens=maxTokens, extra_headers=extra_headers)
+        completionArgs.update({"temperature": temperature, "max_tokens": maxTokens})
 
     else:
+        completionArgs.update({"temperature": temperature, "max_tokens": maxTokens})
         if (jsonOut):
-            response = completion(model=model, messages=messages, temperature=temperature, max_tokens=maxTokens, response_format={"type": "json_object"}, extra_headers=extra_headers)
-        else:
-            response = completion(model=model, messages=messages, temperature=temperature, max_tokens=maxTokens, extra_headers=extra_headers)
+            completionArgs["response_format"] = {"type": "json_object"}
+
+    return completionArgs, timestamp, promptTokens
 
 
+# Parse the response from a litellm completion call, and keep track of the cost
+def _parseLLMResponse(response, model:str, timestamp:str):
+    global TOTAL_LLM_COST
     print(response._hidden_params["response_cost"])
 
     # Get the response text
@@ -213,7 +804,6 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
     cost = 0
     if ("response_cost" in response._hidden_params) and (response._hidden_params["response_cost"] != None):
         cost = response._hidden_params["response_cost"]
-        TOTAL_LLM_COST += cost
     else:
         # For models without cost information, try to estimate the cost based on the number of tokens
         prompt_tokens = response["usage"].get("prompt_tokens", 0)
@@ -270,7 +860,12 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
         # Calculate the cost
         cost = (prompt_tokens * cost_prompt_tokens_per_million / 1000000) + (completion_tokens * cost_completion_tokens_per_million / 1000000)
 
-    print("Completed.  Cost: " + str(round(cost, 2)) + "  (Total Cost: " + str(round(TOTAL_LLM_COST, 2)) + ")")
+    # Keep track of the running cost (both reported and estimated costs count towards the hard limit)
+    with THREAD_LOCK_TOTAL_LLM_COST:
+        TOTAL_LLM_COST += cost
+        totalCost = TOTAL_LLM_COST
+
+    print("Completed.  Cost: " + str(round(cost, 2)) + "  (Total Cost: " + str(round(totalCost, 2)) + ")")
 
     # Also dump the response (timestamped)
     filenameOut = "prompts/prompt-debug." + timestamp + ".response.txt"
@@ -278,9 +873,8 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
         f.write(responseText)
 
     ## DEBUG: HARD LIMIT CHECKER
-    if (TOTAL_LLM_COST > LLM_COST_HARD_LIMIT):
-        print("WARNING: HARD LIMIT ($" + str(LLM_COST_HARD_LIMIT) + ") REACHED. EXITING.")
-        exit(1)
+    if (totalCost > LLM_COST_HARD_LIMIT):
+        raise LLMFatalError("WARNING: HARD LIMIT ($" + str(LLM_COST_HARD_LIMIT) + ") REACHED. EXITING.")
 
     responseOutJSON = None
     # Convert the response text to JSON
@@ -324,10 +918,15 @@ def _getLLMResponseJSON(promptStr:str, model:str, temperature:float=0, maxTokens
 # OpenAI Embeddings
 def getEmbedding(textStr:str, model:str = "text-embedding-3-small"):
     # Get the embedding from the model
-    response = embedding(
-        model=model,
-        input=textStr,
-    )
+    LLM_RATE_LIMITER.acquire(model, countTokens(textStr))
+    response = None
+    try:
+        response = embedding(
+            model=model,
+            input=textStr,
+        )
+    finally:
+        LLM_RATE_LIMITER.release(model, success=(response is not None))
 
     try:
         vectorOut = response["data"][0]["embedding"]
@@ -4,7 +4,10 @@
 import os
 import json
 import random
+import hashlib
 import threading
+import fcntl
+from contextlib import contextmanager
 
 from ExtractionUtils import *
 
@@ -12,15 +15,41 @@ from ExtractionUtils import *
 PATH_IDEASTORE = "data/"
 FILE_IDEASTORE = "ideastore.json"
 
+# New ideas are appended to a log file next to the idea store (one JSON idea per line), rather than re-writing the whole idea store for every idea.
+# When the log gets long, it is compacted back into the idea store file.
+FILE_IDEASTORE_LOG_SUFFIX = ".log.jsonl"
+IDEASTORE_LOG_MAX_ENTRIES = 500
+
+# The idea store can be shared by several processes (e.g. the web server and the experiment workers), so anything that reads and then modifies the
+# idea store or its log (refreshing, assigning IDs, appending, compacting) also holds an exclusive (fcntl) lock on a lock file next to the idea store.
+FILE_IDEASTORE_LOCK_SUFFIX = ".lock"
+
 # Thread locks
 THREAD_LOCK_FILE_IDEASTORE_JSON = threading.Lock()
 THREAD_LOCK_IDEA_COUNTER = threading.Lock()
 
+# Shared IdeaStore instances (one per idea store file), so callers don't each have to re-load the whole idea store
+THREAD_LOCK_SHARED_IDEASTORES = threading.Lock()
+shared_ideastores = {}
+
 # Codeblock store
 from CodeBlockStore import *
 PATH_CODEBLOCKS = "codeblocks/"
 
 
+# Get the shared (process-wide) IdeaStore for an idea store file
+def getIdeaStore(ideastore_filename:str=None):
+    if (ideastore_filename is None):
+        ideastore_filename = PATH_IDEASTORE + FILE_IDEASTORE
+    with THREAD_LOCK_SHARED_IDEASTORES:
+        if (ideastore_filename not in shared_ideastores):
+            shared_ideastores[ideastore_filename] = IdeaStore(ideastore_filename=ideastore_filename)
+        ideaStore = shared_ideastores[ideastore_filename]
+    # Pick up any ideas added by other processes
+    ideaStore.refresh()
+    return ideaStore
+
+
 # IdeaStore storage class
 class IdeaStore():
     # Constructor
@@ -29,94 +58,254 @@ class IdeaStore():
         self.ideastore_filename = ideastore_filename
         if (self.ideastore_filename is None):
             self.ideastore_filename = PATH_IDEASTORE + FILE_IDEASTORE
-        self.load_ideas()
+        self.log_filename = self.ideastore_filename + FILE_IDEASTORE_LOG_SUFFIX
+        self.lock_filename = self.ideastore_filename + FILE_IDEASTORE_LOCK_SUFFIX
+
+        # Indices
+        self.ideas_by_id = {}
+        self.ideas_by_batch_name = {}
         self.existing_idea_names = {}
+        self.max_idea_number = 0            # The largest number in any idea ID (e.g. `idea-123`, `batchidea-123`).  New ideas are numbered after this.
 
+        # How much of the idea store/log has been loaded (to detect changes made by other processes)
+        self.loaded_ideastore_mtime = None
+        self.loaded_log_offset = 0
+        self.log_num_entries = 0
+        self.loaded_idea_hashes = {}        # idea ID -> hash of the idea as it was last read from (or written to) disk, to find the ideas changed in memory
+
+        self.load_ideas()
+
+
+    # Hold both the thread lock and the inter-process lock on the idea store
+    @contextmanager
+    def _locked(self):
+        with THREAD_LOCK_FILE_IDEASTORE_JSON:
+            dir_path = os.path.dirname(self.lock_filename)
+            if not os.path.exists(dir_path) and len(dir_path) > 0:
+                os.makedirs(dir_path)
+            with open(self.lock_filename, 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
     # Load ideas
     def load_ideas(self):
-        print ("Loading ideas from ideas store (" + self.ideastore_filename + ")")
-        with THREAD_LOCK_FILE_IDEASTORE_JSON:
-            # Load the ideas from the JSON file
-            if os.path.exists(self.ideastore_filename):
-                with open(self.ideastore_filename, 'r') as file:
-                    self.ideas = json.load(file)
-            else:
-                self.ideas = []
+        with self._locked():
+            self._load_ideas()
 
-        # Collect the names of all existing ideas
+    # NOTE: Assumes the idea store is locked (see _locked()).
+    def _load_ideas(self):
+        print ("Loading ideas from ideas store (" + self.ideastore_filename + ")")
+        self.ideas = []
+        self.ideas_by_id = {}
+        self.ideas_by_batch_name = {}
         self.existing_idea_names = {}
-        for idea in self.ideas:
-            if ("research_idea_name") in idea:
-                self.existing_idea_names[idea["research_idea_name"]] = True
+        self.max_idea_number = 0
+        self.loaded_ideastore_mtime = None
+        self.loaded_log_offset = 0
+        self.log_num_entries = 0
+        self.loaded_idea_hashes = {}
+
+        # Load the ideas from the JSON file
+        if os.path.exists(self.ideastore_filename):
+            self.loaded_ideastore_mtime = os.path.getmtime(self.ideastore_filename)
+            with open(self.ideastore_filename, 'r') as file:
+                for idea in json.load(file):
+                    self._index_idea(idea)
+
+        # Then, any ideas that have been added since the idea store file was last written
+        self._load_log()
 
         print("Loaded " + str(len(self.ideas)) + " ideas from the idea store.")
 
+    # Load any new entries from the log (from the last position that was read).  NOTE: Assumes the idea store is locked (see _locked()).
+    def _load_log(self):
+        if (not os.path.exists(self.log_filename)):
+            return
+        with open(self.log_filename, 'r') as file:
+            file.seek(self.loaded_log_offset)
+            while True:
+                line = file.readline()
+                # Stop at the end of the file, or at a partially-written line (which will be read the next time)
+                if (not line.endswith("\n")):
+                    break
+                self.loaded_log_offset = file.tell()
+                if (len(line.strip()) == 0):
+                    continue
+                self._index_idea(json.loads(line))
+                self.log_num_entries += 1
+
+    # Add an idea to the in-memory list and indices.  If an idea with the same ID already exists, it's replaced.  `from_disk` notes that this is the
+    # version of the idea that's on disk (i.e. it hasn't been changed in memory).  NOTE: Assumes the idea store is locked (see _locked()).
+    def _index_idea(self, idea:dict, from_disk:bool=True):
+        idea_id = idea.get("id", None)
+        if (from_disk):
+            self.loaded_idea_hashes[idea_id] = self._get_idea_hash(idea)
+        if (idea_id in self.ideas_by_id):
+            existing_idea = self.ideas_by_id[idea_id]
+            self.ideas[self.ideas.index(existing_idea)] = idea
+            batch_name = self._get_batch_name(existing_idea)
+            if (batch_name in self.ideas_by_batch_name):
+                self.ideas_by_batch_name[batch_name] = [x for x in self.ideas_by_batch_name[batch_name] if x is not existing_idea]
+        else:
+            self.ideas.append(idea)
+        self.ideas_by_id[idea_id] = idea
+
+        batch_name = self._get_batch_name(idea)
+        if (batch_name is not None):
+            if (batch_name not in self.ideas_by_batch_name):
+                self.ideas_by_batch_name[batch_name] = []
+            self.ideas_by_batch_name[batch_name].append(idea)
+
+        if ("research_idea_name" in idea):
+            self.existing_idea_names[idea["research_idea_name"]] = True
+
+        # Keep track of the largest idea number, by extracting the number between the first and (optionally) second hyphen
+        try:
+            idea_number = int(idea_id.split("-")[1])
+            if (idea_number > self.max_idea_number):
+                self.max_idea_number = idea_number
+        except:
+            pass
+
+    # A hash of an idea's contents (to detect ideas that have been changed in memory)
+    def _get_idea_hash(self, idea:dict):
+        return hashlib.sha256(json.dumps(idea, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    # Re-load everything from disk (the idea store file, and the log), but keep the ideas that this process has changed in memory (or that only exist in memory).
+    # NOTE: Assumes the idea store is locked (see _locked()).
+    def _reload_ideas(self):
+        modified_ideas = [idea for idea in self.ideas if (self.loaded_idea_hashes.get(idea.get("id", None), None) != self._get_idea_hash(idea))]
+        self._load_ideas()
+        for idea in modified_ideas:
+            self._index_idea(idea, from_disk=False)
+        if (len(modified_ideas) > 0):
+            print("Kept " + str(len(modified_ideas)) + " idea(s) that were changed in memory, while re-loading the idea store.")
+
+    # The batch name of an idea (stored either in the idea's metadata, or directly in the idea)
+    def _get_batch_name(self, idea:dict):
+        if ("metadata" in idea) and (isinstance(idea["metadata"], dict)) and ("batch_name" in idea["metadata"]):
+            return idea["metadata"]["batch_name"]
+        return idea.get("batch_name", None)
+
+    # Pick up any changes that other processes have made to the idea store (cheap if there are none)
+    def refresh(self):
+        with self._locked():
+            self._refresh()
+
+    # NOTE: Assumes the idea store is locked (see _locked()).
+    def _refresh(self):
+        if (self._get_ideastore_mtime() != self.loaded_ideastore_mtime):
+            # The idea store file itself was re-written (e.g. compacted by another process) -- re-load everything (keeping any changes made in memory)
+            self._reload_ideas()
+            return
+        if os.path.exists(self.log_filename) and (os.path.getsize(self.log_filename) != self.loaded_log_offset):
+            if (os.path.getsize(self.log_filename) < self.loaded_log_offset):
+                # The log was truncated without the idea store being re-written -- shouldn't happen, but re-read it from the start
+                self.loaded_log_offset = 0
+            self._load_log()
+
+    # The modification time of the idea store file (or None, if it doesn't exist yet)
+    def _get_ideastore_mtime(self):
+        if os.path.exists(self.ideastore_filename):
+            return os.path.getmtime(self.ideastore_filename)
+        return None
+
 
-    # Save ideas
+    # Save ideas (re-writes the whole idea store file, and clears the log)
     def save_ideas(self):
         print ("Saving ideas to ideas store (" + self.ideastore_filename + ")")
-        with THREAD_LOCK_FILE_IDEASTORE_JSON:
-            # Check that the path exists
-            dir_path = os.path.dirname(self.ideastore_filename)
-            if not os.path.exists(dir_path) and len(dir_path) > 0:
-                os.makedirs(dir_path)
-            # Save the ideas to the JSON file
-            with open(self.ideastore_filename, 'w') as file:
-                json.dump(self.ideas, file, indent=4)
+        with self._locked():
+            # Merge in what's on disk (the idea store file, which another process may have re-written, and the log), so that ideas added by other
+            # processes aren't lost -- while keeping this process's changes
+            self._reload_ideas()
+            self._save_ideas()
+
+    # NOTE: Assumes the idea store is locked (see _locked()).
+    def _save_ideas(self):
+        # Check that the path exists
+        dir_path = os.path.dirname(self.ideastore_filename)
+        if not os.path.exists(dir_path) and len(dir_path) > 0:
+            os.makedirs(dir_path)
+        # Save the ideas to the JSON file (to a temporary file first, so that the idea store is never left partially written)
+        filename_tmp = self.ideastore_filename + ".tmp"
+        with open(filename_tmp, 'w') as file:
+            json.dump(self.ideas, file, indent=4)
+        os.replace(filename_tmp, self.ideastore_filename)
+        self.loaded_ideastore_mtime = os.path.getmtime(self.ideastore_filename)
+        self.loaded_idea_hashes = {idea.get("id", None): self._get_idea_hash(idea) for idea in self.ideas}
+
+        # The log is now part of the idea store file.  (If we're interrupted before it's cleared, replaying it again on load is harmless, since ideas are keyed by ID.)
+        # NOTE: Other processes only append to the log while holding the idea store lock, so nothing can be appended between reading the log and removing it.
+        if os.path.exists(self.log_filename):
+            os.remove(self.log_filename)
+        self.loaded_log_offset = 0
+        self.log_num_entries = 0
+
+    # Append one idea to the log.  NOTE: Assumes the idea store is locked (see _locked()).
+    def _append_to_log(self, idea:dict):
+        dir_path = os.path.dirname(self.log_filename)
+        if not os.path.exists(dir_path) and len(dir_path) > 0:
+            os.makedirs(dir_path)
+        with open(self.log_filename, 'a') as file:
+            file.write(json.dumps(idea) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.loaded_log_offset = os.path.getsize(self.log_filename)
+        self.log_num_entries += 1
 
     # Get the next idea id
     def get_next_idea_id(self):
-        with THREAD_LOCK_FILE_IDEASTORE_JSON:
-            with THREAD_LOCK_IDEA_COUNTER:
-                # Find the maximum idea id
-                max_id = 0
-                for idea in self.ideas:
-                    # Convert the idea id into an integer by extracting the number between the first and (optionally) second hyphen
-                    idea_id = 0
-                    try:
-                        idea_id = int(idea['id'].split("-")[1])
-                    except:
-                        pass
-                    if idea_id > max_id:
-                        max_id = idea_id
-
-                # Return the next idea id
-                next_idea_id = max_id + 1
-                return "idea-" + str(next_idea_id)
+        with THREAD_LOCK_IDEA_COUNTER:
+            return "idea-" + str(self.max_idea_number + 1)
 
     # Add a new idea. Automatically assigns an ID to the idea, and returns the ID.
     def add_idea(self, idea, batch_idea:bool=False):
-        # Get an ID for the idea
-        idea_id = self.get_next_idea_id()
-        if (batch_idea):
-            idea_id = idea_id.replace("idea-", "batchidea-")    # Replace 'idea' with 'batch_idea'
-        idea['id'] = idea_id
-
-        # Check to make sure that the idea name is unique
-        if ("research_idea_name" in idea) and (idea["research_idea_name"] in self.existing_idea_names):
-            # Add an integer to the end of the name to make it unique
-            baseName = idea["research_idea_name"]
-            for i in range(1, 1000):
-                newName = baseName + "-" + str(i)
-                if (newName not in self.existing_idea_names):
-                    idea["research_idea_name"] = newName
-                    break
+        with self._locked():
+            # Make sure we have any ideas added by other processes, so the ID is unique
+            self._refresh()
+
+            # Get an ID for the idea
+            with THREAD_LOCK_IDEA_COUNTER:
+                self.max_idea_number += 1
+                idea_id = "idea-" + str(self.max_idea_number)
+            if (batch_idea):
+                idea_id = idea_id.replace("idea-", "batchidea-")    # Replace 'idea' with 'batch_idea'
+            idea['id'] = idea_id
+
+            # Check to make sure that the idea name is unique
+            if ("research_idea_name" in idea) and (idea["research_idea_name"] in self.existing_idea_names):
+                # Add an integer to the end of the name to make it unique
+                baseName = idea["research_idea_name"]
+                for i in range(1, 1000):
+                    newName = baseName + "-" + str(i)
+                    if (newName not in self.existing_idea_names):
+                        idea["research_idea_name"] = newName
+                        break
+
+            self._index_idea(idea)
+            self._append_to_log(idea)
+
+            # Compact the log into the idea store file, if it's getting long
+            if (self.log_num_entries >= IDEASTORE_LOG_MAX_ENTRIES):
+                print ("Compacting the idea store log into the idea store (" + self.ideastore_filename + ")")
+                self._save_ideas()
 
-        self.ideas.append(idea)
-        self.save_ideas()
         return idea_id
 
     # Get all ideas
     def get_all_ideas(self):
-        return self.ideas
+        return list(self.ideas)
 
     # Get idea by id
     def get_idea_by_id(self, id):
-        for idea in self.ideas:
-            if idea['id'] == id:
-                return idea
-        return None
+        return self.ideas_by_id.get(id, None)
+
+    # Get all the ideas in a batch
+    def get_ideas_by_batch_name(self, batch_name:str):
+        return list(self.ideas_by_batch_name.get(batch_name, []))
 
 
     #
@@ -130,7 +319,7 @@ class IdeaStore():
         # Load the codeblock store
         codeblockStore = None
         if (condition_on_codeblocks):
-            codeblockStore = CodeBlockStore(PATH_CODEBLOCKS)
+            codeblockStore = getCodeBlockStore(PATH_CODEBLOCKS)
 
         prompt = ""
         max_tokens = 8191
@@ -257,15 +446,9 @@ class IdeaStore():
                 existingIdeasInBatch = []
                 print("Looking for existing ideas in batch: " + batch_name)
                 print("DEBUG: Current length of existing ideas: " + str(len(self.ideas)))
-                for idx, idea in enumerate(self.ideas):
-                    existing_idea_batch_name = None
-                    if ("metadata" in idea) and ("batch_name" in idea["metadata"]):
-                        existing_idea_batch_name = idea["metadata"]["batch_name"]
-                    if (existing_idea_batch_name == batch_name):
-                        print("Found idea in batch: " + idea["research_idea_name"])
-                        existingIdeasInBatch.append(idea)
-                    else:
-                        print("Skipping idea not in batch: " + idea["research_idea_name"])
+                for idea in self.get_ideas_by_batch_name(batch_name):
+                    print("Found idea in batch: " + idea["research_idea_name"])
+                    existingIdeasInBatch.append(idea)
                 # Add the existing ideas to the prompt
                 if (len(existingIdeasInBatch) > 0):
                     prompt += "YOU ARE ASKED TO NOT DUPLICATE ANY IDEAS THAT YOU HAVE ALREADY GENERATED IN THIS BATCH. "
@@ -512,7 +695,7 @@ class IdeaStore():
         # Load the codeblock store
         codeblockStore = None
         if (condition_on_codeblocks):
-            codeblockStore = CodeBlockStore(PATH_CODEBLOCKS)
+            codeblockStore = getCodeBlockStore(PATH_CODEBLOCKS)
 
         temperature = 0.1
 
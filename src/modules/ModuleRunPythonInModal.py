@@ -5,6 +5,10 @@ import time
 import datetime
 import json
 import random
+import hashlib
+import threading
+import io
+import concurrent.futures
 
 import modal
 from modal import *
@@ -19,6 +23,201 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from Module import Module
+from SandboxLiveLog import *
+from SandboxWatchdog import *
+
+
+# Image cache: Container images are keyed by (python version, apt packages, hash of requirements.txt), and have the dependencies pre-installed,
+# so that later debug iterations with the same requirements can skip the environment setup.  The registry maps each key to a (Modal) image ID.
+FILENAME_MODAL_IMAGE_CACHE = "data/modal-image-cache.json"
+MODAL_IMAGE_CACHE_MAX_AGE_DAYS = 7          # Images that haven't been used in this many days are evicted from the registry
+MODAL_IMAGE_CACHE_MAX_ENTRIES = 200         # Maximum number of images to keep in the registry (least-recently-used are evicted first)
+THREAD_LOCK_MODAL_IMAGE_CACHE = threading.Lock()
+# Failed image builds: a failure that is clearly caused by the requirements themselves (e.g. pip can't resolve them) is remembered for as long as the entry
+# lives, so it isn't retried every iteration.  Any other failure (e.g. a network or Modal error) may be transient, so it is only remembered briefly.
+MODAL_IMAGE_BUILD_FAILURE_RETRY_SEC = 30 * 60
+MODAL_IMAGE_BUILD_DETERMINISTIC_ERRORS = ["ResolutionImpossible", "No matching distribution found", "Could not find a version that satisfies", "Invalid requirement", "conflicting dependencies", "subprocess-exited-with-error"]
+PATH_REQUIREMENTS_HASH_IN_IMAGE = "/opt/codescientist/requirements.sha256"     # Written into images that have the requirements pre-installed
+
+# Downloading the output files from the volume: files are downloaded concurrently (most important files first), and a failed download is retried,
+# continuing from where it stopped.  Anything that isn't downloaded (too big, out of time, or an error) is listed, with the reason, in the download manifest.
+MODAL_DOWNLOAD_MAX_WORKERS = 8
+MODAL_DOWNLOAD_MAX_ATTEMPTS = 3
+MODAL_DOWNLOAD_PRIORITY_FILES = ["log.json", "results.json"]        # Downloaded before anything else
+FILENAME_DOWNLOAD_MANIFEST = "download-manifest.json"               # Written to the output folder
+
+# Experiment volumes: Each experiment (i.e. each output `base_path`) keeps one Modal Volume across its debug iterations.  Files are uploaded by content
+# hash, so only the files that changed since the last iteration (usually just `main.py`, and any retained files) are uploaded -- and the outputs of the
+# previous iteration are removed before the next one starts.  The volume is deleted with `deleteExperimentVolume()` when the experiment finishes.
+MODAL_EXPERIMENT_VOLUME_PREFIX = "volume-exp-"
+THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES = threading.Lock()
+modal_experiment_volumes = {}       # volume name -> {remote path: (sha256, size)} of the files uploaded to that volume
+
+# Get the name of the (persistent) volume for an experiment
+def getExperimentVolumeName(basePath:str):
+    return MODAL_EXPERIMENT_VOLUME_PREFIX + hashlib.sha256(os.path.abspath(basePath).encode("utf-8")).hexdigest()[:24]
+
+# Delete an experiment's volume (when the experiment is finished)
+def deleteExperimentVolume(basePath:str):
+    volumeName = getExperimentVolumeName(basePath)
+    with THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES:
+        if (volumeName in modal_experiment_volumes):
+            del modal_experiment_volumes[volumeName]
+    try:
+        print("MODAL DEBUG: Deleting experiment volume (Volume Name: " + str(volumeName) + ", base path: " + str(basePath) + ")")
+        modal.Volume.delete(volumeName)
+    except Exception as e:
+        print("WARNING: Could not delete experiment volume (" + str(volumeName) + "): " + str(e))
+
+# Make one entry in a file bundle (a dictionary of remote path -> entry).  Files are uploaded from `local_path` if it's provided (so they keep their
+# permissions, e.g. for `run.sh`), otherwise from `contents`.
+def makeBundleEntry(contents:str, local_path:str=None):
+    contentsBytes = contents.encode("utf-8")
+    return {"sha256": hashlib.sha256(contentsBytes).hexdigest(), "size": len(contentsBytes), "contents": contentsBytes, "local_path": local_path}
+
+
+# Warm sandboxes: Optionally, an experiment can keep one sandbox running for all of its debug iterations (rather than creating a new app, volume, and
+# sandbox for each one).  Each iteration's files are pushed into the running sandbox (again, only the ones that changed), the program is run with
+# `exec`, and the requirements are only re-installed if they changed.  The LLM proxy is also kept running between iterations.
+# The warm sandbox is stopped with `releaseWarmSandbox()` when the experiment finishes (or after MODAL_WARM_SANDBOX_TIMEOUT_SEC, as a backstop).
+# The app name of each warm sandbox is also recorded on disk (in PATH_MODAL_WARM_SANDBOX_RECORDS), so that if the process that started it crashes, another
+# process (i.e. the server) can still stop it.
+MODAL_WARM_SANDBOX_TIMEOUT_SEC = 60*60*8
+MODAL_WARM_SANDBOX_ROOT = "/app"
+PATH_MODAL_WARM_SANDBOX_RECORDS = "data/modal-warm-sandboxes/"
+THREAD_LOCK_MODAL_WARM_SANDBOXES = threading.Lock()
+modal_warm_sandboxes = {}           # experiment volume name -> {"app_name", "app", "sandbox", "config", "files"}
+
+# Stop an experiment's warm sandbox (if it has one)
+def releaseWarmSandbox(basePath:str):
+    stopWarmSandbox(getExperimentVolumeName(basePath))
+
+def stopWarmSandbox(warmKey:str):
+    with THREAD_LOCK_MODAL_WARM_SANDBOXES:
+        warm = modal_warm_sandboxes.pop(warmKey, None)
+    with THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES:
+        modal_experiment_volumes.pop(warmKey, None)
+    recordedAppName = _popWarmSandboxRecord(warmKey)
+    if (warm is None):
+        # Not started by this process -- but if another process started one (and didn't get to stop it, e.g. it crashed), stop it by name
+        if (recordedAppName is not None):
+            print("MODAL DEBUG: Stopping warm sandbox started by another process (App Name: " + str(recordedAppName) + ")")
+            os.system("modal app stop " + recordedAppName)
+        return
+    print("MODAL DEBUG: Stopping warm sandbox (App Name: " + str(warm["app_name"]) + ")")
+    try:
+        warm["sandbox"].terminate()
+    except Exception as e:
+        print("WARNING: Could not terminate warm sandbox (" + str(warm["app_name"]) + "): " + str(e))
+    os.system("modal app stop " + warm["app_name"])
+
+# Record the app name of a warm sandbox on disk
+def _saveWarmSandboxRecord(warmKey:str, appName:str):
+    try:
+        if (not os.path.exists(PATH_MODAL_WARM_SANDBOX_RECORDS)):
+            os.makedirs(PATH_MODAL_WARM_SANDBOX_RECORDS, exist_ok=True)
+        with open(os.path.join(PATH_MODAL_WARM_SANDBOX_RECORDS, warmKey + ".json"), "w") as f:
+            json.dump({"app_name": appName, "pid": os.getpid(), "started": time.time()}, f)
+    except Exception as e:
+        print("WARNING: Could not record warm sandbox (" + str(appName) + "): " + str(e))
+
+# Remove the on-disk record of a warm sandbox.  Returns the recorded app name (or None, if there wasn't one).
+def _popWarmSandboxRecord(warmKey:str):
+    filename = os.path.join(PATH_MODAL_WARM_SANDBOX_RECORDS, warmKey + ".json")
+    if (not os.path.exists(filename)):
+        return None
+    appName = None
+    try:
+        with open(filename, "r") as f:
+            appName = json.load(f).get("app_name", None)
+        os.remove(filename)
+    except Exception as e:
+        print("WARNING: Could not read warm sandbox record (" + filename + "): " + str(e))
+    return appName
+
+
+# A file entry in a sandbox's file system (the same fields as the volume entries used here)
+class SandboxFileEntry():
+    def __init__(self, path:str, size:int):
+        self.path = path
+        self.size = size
+        self.type = modal.volume.FileEntryType.FILE
+
+    def __repr__(self):
+        return "SandboxFileEntry(path=" + str(self.path) + ", size=" + str(self.size) + ")"
+
+# The file system of a running sandbox, with the (subset of the) Volume interface used for uploading/downloading the files of a run -- so that a warm
+# sandbox can be used in place of a volume.
+class ModalSandboxFiles():
+    def __init__(self, sandbox, root:str=MODAL_WARM_SANDBOX_ROOT):
+        self.sandbox = sandbox
+        self.root = root
+
+    def _exec(self, cmd:str):
+        process = self.sandbox.exec("bash", "-c", cmd)
+        process.wait()
+        return process.stdout.read(), process.returncode
+
+    def _remotePath(self, path:str):
+        return self.root + "/" + path.lstrip("/")
+
+    def iterdir(self, path:str="/", recursive:bool=True):
+        out, returncode = self._exec("mkdir -p " + self.root + " && cd " + self._remotePath(path) + " && find . " + ("" if recursive else "-maxdepth 1 ") + "-type f -printf '%P\\t%s\\n'")
+        entries = []
+        for line in out.splitlines():
+            if ("\t" not in line):
+                continue
+            filename, size = line.rsplit("\t", 1)
+            entries.append(SandboxFileEntry(filename, int(size)))
+        return entries
+
+    def read_file(self, path:str, chunk_size:int=1024*1024):
+        with self.sandbox.open(self._remotePath(path), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if (not chunk):
+                    break
+                yield chunk
+
+    def remove_file(self, path:str):
+        self._exec("rm -f '" + self._remotePath(path) + "'")
+
+    def batch_upload(self, force:bool=False):
+        return ModalSandboxFilesUpload(self)
+
+# Collects the files to upload (like `Volume.batch_upload()`), and writes them into the sandbox when the `with` block exits
+class ModalSandboxFilesUpload():
+    def __init__(self, files:ModalSandboxFiles):
+        self.files = files
+        self.toUpload = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if (exc_type is not None) or (len(self.toUpload) == 0):
+            return False
+        # Make the directories first (in one call), then write the files
+        dirs = sorted(set([os.path.dirname(self.files._remotePath(remotePath)) for _, remotePath in self.toUpload]))
+        self.files._exec("mkdir -p " + " ".join(["'" + d + "'" for d in dirs]))
+        executable = []
+        for source, remotePath in self.toUpload:
+            if (isinstance(source, str)):
+                with open(source, "rb") as f:
+                    data = f.read()
+                if (os.access(source, os.X_OK)):
+                    executable.append(self.files._remotePath(remotePath))
+            else:
+                data = source.read()
+            with self.files.sandbox.open(self.files._remotePath(remotePath), "wb") as f:
+                f.write(data)
+        # Keep any permissions that matter (i.e. runscripts)
+        if (len(executable) > 0):
+            self.files._exec("chmod +x " + " ".join(["'" + p + "'" for p in executable]))
+        return False
+
+    def put_file(self, source, remotePath:str):
+        self.toUpload.append((source, remotePath))
 
 
 class ModuleRunPythonInModal(Module):
@@ -153,42 +352,263 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
             return None #"An error occurred while loading the log file: " + str(e)
 
 
+    #
+    #   Image cache
+    #
+
+    # Get the image cache key for a given environment
+    def getImageCacheKey(self, pythonVersion:str, apt_packages:list, requirementsStr:str):
+        requirementsHash = hashlib.sha256(requirementsStr.encode("utf-8")).hexdigest()
+        keyStr = json.dumps({"python_version": pythonVersion, "apt_packages": sorted(apt_packages), "requirements_sha256": requirementsHash}, sort_keys=True)
+        return hashlib.sha256(keyStr.encode("utf-8")).hexdigest(), requirementsHash
+
+    # Load the image cache registry, evicting any stale entries.  NOTE: Assumes THREAD_LOCK_MODAL_IMAGE_CACHE is held.
+    def _loadImageCacheRegistry(self):
+        registry = {}
+        try:
+            if os.path.exists(FILENAME_MODAL_IMAGE_CACHE):
+                with open(FILENAME_MODAL_IMAGE_CACHE, "r") as f:
+                    registry = json.load(f)
+        except Exception as e:
+            print("WARNING: Could not load the Modal image cache registry (" + FILENAME_MODAL_IMAGE_CACHE + "): " + str(e))
+            return {}
+
+        # Evict images that haven't been used recently
+        minLastUsed = time.time() - (MODAL_IMAGE_CACHE_MAX_AGE_DAYS * 24 * 60 * 60)
+        registry = {key: entry for key, entry in registry.items() if entry.get("last_used", 0) >= minLastUsed}
+        # Evict the least-recently-used images, if there are too many
+        if (len(registry) > MODAL_IMAGE_CACHE_MAX_ENTRIES):
+            keysByLastUsed = sorted(registry.keys(), key=lambda key: registry[key].get("last_used", 0), reverse=True)
+            registry = {key: registry[key] for key in keysByLastUsed[:MODAL_IMAGE_CACHE_MAX_ENTRIES]}
+        return registry
+
+    # Save the image cache registry.  NOTE: Assumes THREAD_LOCK_MODAL_IMAGE_CACHE is held.
+    def _saveImageCacheRegistry(self, registry:dict):
+        try:
+            dirPath = os.path.dirname(FILENAME_MODAL_IMAGE_CACHE)
+            if (len(dirPath) > 0) and (not os.path.exists(dirPath)):
+                os.makedirs(dirPath)
+            filenameTemp = FILENAME_MODAL_IMAGE_CACHE + ".tmp"
+            with open(filenameTemp, "w") as f:
+                json.dump(registry, f, indent=4)
+            os.replace(filenameTemp, FILENAME_MODAL_IMAGE_CACHE)
+        except Exception as e:
+            print("WARNING: Could not save the Modal image cache registry (" + FILENAME_MODAL_IMAGE_CACHE + "): " + str(e))
+
+    # Look up a previously built image in the cache.  Returns the image, or None if it's not in the cache.
+    def getCachedImage(self, cacheKey:str):
+        with THREAD_LOCK_MODAL_IMAGE_CACHE:
+            registry = self._loadImageCacheRegistry()
+            if (cacheKey not in registry) or (registry[cacheKey].get("build_failed", False) == True):
+                self._saveImageCacheRegistry(registry)      # Persist any evictions
+                return None
+            try:
+                image = modal.Image.from_id(registry[cacheKey]["image_id"])
+            except Exception as e:
+                print("WARNING: Could not load cached Modal image (" + str(registry[cacheKey].get("image_id", None)) + "), removing it from the cache: " + str(e))
+                del registry[cacheKey]
+                self._saveImageCacheRegistry(registry)
+                return None
+            registry[cacheKey]["last_used"] = time.time()
+            registry[cacheKey]["num_uses"] = registry[cacheKey].get("num_uses", 0) + 1
+            self._saveImageCacheRegistry(registry)
+            return image
+
+    # Check whether an image build error is (very likely) caused by the requirements themselves, so retrying the build with the same requirements won't help
+    def isDeterministicBuildError(self, errorStr:str):
+        for marker in MODAL_IMAGE_BUILD_DETERMINISTIC_ERRORS:
+            if (marker.lower() in errorStr.lower()):
+                return True
+        return False
+
+    # Check whether building an image for this key has previously failed (e.g. due to an error in the requirements), so it isn't retried every iteration.
+    # Failures that may have been transient are only remembered for MODAL_IMAGE_BUILD_FAILURE_RETRY_SEC, after which the build is tried again.
+    def isImageBuildKnownToFail(self, cacheKey:str):
+        with THREAD_LOCK_MODAL_IMAGE_CACHE:
+            registry = self._loadImageCacheRegistry()
+            if (cacheKey not in registry) or (registry[cacheKey].get("build_failed", False) == False):
+                return False
+            if (registry[cacheKey].get("build_failure_deterministic", False) == True):
+                return True
+            if (time.time() - registry[cacheKey].get("created", 0) < MODAL_IMAGE_BUILD_FAILURE_RETRY_SEC):
+                return True
+            return False
+
+    # Add a (built) image to the cache.  If `image` is None, the build is recorded as having failed (`deterministicFailure` notes whether the failure was caused by the requirements themselves).
+    def addImageToCache(self, cacheKey:str, image, pythonVersion:str, apt_packages:list, requirementsHash:str, deterministicFailure:bool=False):
+        with THREAD_LOCK_MODAL_IMAGE_CACHE:
+            registry = self._loadImageCacheRegistry()
+            registry[cacheKey] = {
+                "image_id": image.object_id if (image is not None) else None,
+                "build_failed": (image is None),
+                "build_failure_deterministic": (image is None) and (deterministicFailure == True),
+                "python_version": pythonVersion,
+                "apt_packages": apt_packages,
+                "requirements_sha256": requirementsHash,
+                "created": time.time(),
+                "last_used": time.time(),
+                "num_uses": 1
+            }
+            self._saveImageCacheRegistry(registry)
+
+    # Get an image with the apt packages and Python requirements pre-installed, either from the cache, or by building it.
+    # If the image with the requirements can't be built (e.g. there's an error in the requirements.txt file), falls back to the base image (apt packages only),
+    # and the requirements are installed by the runscript instead (so that any installation errors are captured in `stderr.pip.txt`).
+    def getOrBuildImage(self, app, pythonVersion:str, apt_packages:list, requirements_file:str):
+        requirementsStr = ""
+        try:
+            with open(requirements_file, "r") as f:
+                requirementsStr = f.read()
+        except Exception as e:
+            print("WARNING: Could not read requirements file (" + str(requirements_file) + "): " + str(e))
+
+        cacheKey, requirementsHash = self.getImageCacheKey(pythonVersion, apt_packages, requirementsStr)
+        image = self.getCachedImage(cacheKey)
+        if (image is not None):
+            print("MODAL DEBUG: Using cached image (key: " + str(cacheKey) + ")")
+            return image
+
+        baseImage = modal.Image.from_registry("ubuntu:22.04", add_python=pythonVersion).apt_install(apt_packages)
+        if (self.isImageBuildKnownToFail(cacheKey)):
+            print("MODAL DEBUG: Image with pre-installed requirements previously failed to build -- installing them at runtime (key: " + str(cacheKey) + ")")
+            return baseImage
+
+        try:
+            print("MODAL DEBUG: Building image with pre-installed requirements (key: " + str(cacheKey) + ")")
+            image = baseImage.pip_install("litellm").pip_install_from_requirements(requirements_file).run_commands(
+                "mkdir -p " + os.path.dirname(PATH_REQUIREMENTS_HASH_IN_IMAGE) + " && echo " + requirementsHash + " > " + PATH_REQUIREMENTS_HASH_IN_IMAGE
+            )
+            image.build(app)
+            self.addImageToCache(cacheKey, image, pythonVersion, apt_packages, requirementsHash)
+            return image
+        except Exception as e:
+            deterministicFailure = self.isDeterministicBuildError(str(e))
+            print("MODAL DEBUG: Could not build image with pre-installed requirements -- falling back to installing them at runtime (" + ("requirements error" if deterministicFailure else "possibly transient, will retry the build later") + "): " + str(e))
+            self.addImageToCache(cacheKey, None, pythonVersion, apt_packages, requirementsHash, deterministicFailure=deterministicFailure)
+            return baseImage
+
+
+    # Bring an experiment volume up to date with a file bundle: upload the files whose contents changed, and remove any other files (i.e. the outputs
+    # of the previous run).  NOTE: A file is also re-uploaded if its size on the volume differs from what was uploaded (e.g. the program modified it).
+    def syncBundleToVolume(self, volume, volumeName:str, bundle:dict):
+        with THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES:
+            uploaded = dict(modal_experiment_volumes.get(volumeName, {}))
+
+        # What's currently on the volume
+        volumeFileSizes = {}
+        for entry in volume.iterdir(path="/", recursive=True):
+            if (entry.type == modal.volume.FileEntryType.FILE):
+                volumeFileSizes[entry.path.lstrip("/")] = entry.size
+
+        # Remove anything that isn't part of the bundle
+        numRemoved = 0
+        for remotePath in volumeFileSizes.keys():
+            if (remotePath not in bundle):
+                volume.remove_file(remotePath)
+                numRemoved += 1
+                if (remotePath in uploaded):
+                    del uploaded[remotePath]
+
+        # Upload the files that are new or changed
+        toUpload = []
+        for remotePath, entry in bundle.items():
+            if (remotePath in uploaded) and (uploaded[remotePath] == (entry["sha256"], entry["size"])) and (volumeFileSizes.get(remotePath, None) == entry["size"]):
+                continue
+            toUpload.append(remotePath)
+
+        if (len(toUpload) > 0):
+            with volume.batch_upload(force=True) as batchUpload:
+                for remotePath in toUpload:
+                    entry = bundle[remotePath]
+                    if (entry["local_path"] is not None):
+                        batchUpload.put_file(entry["local_path"], remotePath)
+                    else:
+                        batchUpload.put_file(io.BytesIO(entry["contents"]), remotePath)
+            for remotePath in toUpload:
+                uploaded[remotePath] = (bundle[remotePath]["sha256"], bundle[remotePath]["size"])
+
+        with THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES:
+            modal_experiment_volumes[volumeName] = uploaded
+
+        print("MODAL DEBUG: Synced files to volume " + str(volumeName) + " (uploaded: " + str(len(toUpload)) + ", unchanged: " + str(len(bundle) - len(toUpload)) + ", removed: " + str(numRemoved) + ")")
+
+
+    # Get the warm sandbox for an experiment, if there's one that's still running with the same configuration.  Otherwise, returns None.
+    def getWarmSandbox(self, warmKey:str, config:dict):
+        with THREAD_LOCK_MODAL_WARM_SANDBOXES:
+            warm = modal_warm_sandboxes.get(warmKey, None)
+        if (warm is None):
+            return None
+        stillRunning = False
+        try:
+            stillRunning = (warm["sandbox"].poll() is None)
+        except Exception as e:
+            print("WARNING: Could not check warm sandbox (" + str(warm["app_name"]) + "): " + str(e))
+        if (stillRunning) and (warm["config"] == config):
+            return warm
+        # Stopped (e.g. timed out), or the configuration changed -- start a new one
+        print("MODAL DEBUG: Warm sandbox can't be reused (still running: " + str(stillRunning) + ") -- starting a new one")
+        stopWarmSandbox(warmKey)
+        return None
+
+
     # An example/test of using the Modal Sandboxes
-    def runModalSandbox(self, mount_folder:str, pythonVersion="3.10", apt_packages=["git", "wget", "curl"], workingDir:str="/", runscriptName="echo 'Hello, World!'", requirements_file="requirements.txt", OUTPUT_SUBFOLDER = "results", filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "log.json"], timeout_seconds=600, save_folder="to_save/"):
+    # If `bundle` and `experimentVolumeName` are provided, the files in `bundle` are synced to that (persistent) experiment volume -- see `syncBundleToVolume()`.
+    # Otherwise, the files in `mount_folder` are uploaded to a new volume, which is deleted afterwards.
+    # If `warmSandbox` is also True, the experiment's warm sandbox is used instead (started if needed), and the runscript is run in it with `exec`.
+    def runModalSandbox(self, mount_folder:str, pythonVersion="3.10", apt_packages=["git", "wget", "curl"], workingDir:str="/", runscriptName="echo 'Hello, World!'", requirements_file="requirements.txt", OUTPUT_SUBFOLDER = "results", filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "log.json"], timeout_seconds=600, save_folder="to_save/", bundle:dict=None, experimentVolumeName:str=None, watchdog_config:dict=None, warmSandbox:bool=False):
         RETAIN_FOLDER = "retain"
 
         # Error tracking
         sandboxErrors = []
         failure = False
 
+        # Warm sandbox: reuse the experiment's sandbox (and its app), if it's still running
+        useWarmSandbox = (warmSandbox) and (bundle is not None) and (experimentVolumeName is not None)
+        warmConfig = {"python_version": pythonVersion, "apt_packages": list(apt_packages)}
+        warm = None
+        if (useWarmSandbox):
+            warm = self.getWarmSandbox(experimentVolumeName, warmConfig)
+
         # Step 1: Create a new "app" with a unique name
         appNamePrefix = "modal-app-"
         appName = appNamePrefix + time.strftime("%Y%m%d-%H%M%S") + "-" + str(random.randint(10000, 99999))        # Create the app name with the time (in YYYYMMDD-HHMMSS format) and a random 5-digit number
-        try:
-            print("MODAL DEBUG: Creating app with name: " + str(appName) + " (mount_folder: " + str(mount_folder) + ")")
-            app = modal.App.lookup(appName, create_if_missing=True)
-        except Exception as e:
-            error_str = "An error occurred while creating the Modal app: " + str(e) + "\n" + traceback.format_exc()
-            print(error_str)
-            sandboxErrors.append(error_str)
-            failure = True
+        if (warm is not None):
+            appName = warm["app_name"]
+            app = warm["app"]
+            print("MODAL DEBUG: Reusing warm sandbox (App Name: " + str(appName) + ", mount_folder: " + str(mount_folder) + ")")
+        else:
+            try:
+                print("MODAL DEBUG: Creating app with name: " + str(appName) + " (mount_folder: " + str(mount_folder) + ")")
+                app = modal.App.lookup(appName, create_if_missing=True)
+            except Exception as e:
+                error_str = "An error occurred while creating the Modal app: " + str(e) + "\n" + traceback.format_exc()
+                print(error_str)
+                sandboxErrors.append(error_str)
+                failure = True
 
-        # Step 2: Create a new Volume for the file system
+        # Step 2: Create a new Volume for the file system (for a warm sandbox, the files are pushed into the sandbox instead -- see Step 3A)
         volumeName = None
         volume = None
-        if (not failure):
+        if (not failure) and (not useWarmSandbox):
             print("MODAL DEBUG: Creating volume with name: " + str(volumeName) + " (mount_folder: " + str(mount_folder) + ")")
             try:
-                volumeName = "volume-" + appName
-                volume = modal.Volume.from_name(volumeName, create_if_missing=True)
-                # Upload the files in the mount_folder to the volume
-                with volume.batch_upload() as batchUpload:
-                    for root, dirs, files in os.walk(mount_folder):
-                        for file in files:
-                            localPath = os.path.join(root, file)
-                            remotePath = os.path.relpath(localPath, mount_folder)
-                            batchUpload.put_file(localPath, remotePath)
-                    #volume.commit()
+                if (experimentVolumeName is not None) and (bundle is not None):
+                    # Persistent experiment volume: only upload what changed
+                    volumeName = experimentVolumeName
+                    volume = modal.Volume.from_name(volumeName, create_if_missing=True)
+                    self.syncBundleToVolume(volume, volumeName, bundle)
+                else:
+                    volumeName = "volume-" + appName
+                    volume = modal.Volume.from_name(volumeName, create_if_missing=True)
+                    # Upload the files in the mount_folder to the volume
+                    with volume.batch_upload() as batchUpload:
+                        for root, dirs, files in os.walk(mount_folder):
+                            for file in files:
+                                localPath = os.path.join(root, file)
+                                remotePath = os.path.relpath(localPath, mount_folder)
+                                batchUpload.put_file(localPath, remotePath)
+                        #volume.commit()
             except Exception as e:
                 error_str = "An error occurred while creating the Modal volume: " + str(e) + "\n" + traceback.format_exc()
                 print(error_str)
@@ -197,7 +617,7 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
 
         # Step 3: Create a new image for the sandbox
         image = None
-        if (not failure):
+        if (not failure) and (warm is None):
             print("MODAL DEBUG: Creating image (App Name: " + str(appName) + ", mount_folder: " + str(mount_folder) + ")")
             try:
                 # Requirements file (should be in the mount folder)
@@ -205,10 +625,9 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 # The base image (Ubuntu 22.04 with the requested Python version, and any additional apt packages/pip packages)
                 # Check if the requirements file exists
                 #if (not os.path.exists(requirements_file)):
-                # Build without the requirements file
-                image=modal.Image.from_registry("ubuntu:22.04", add_python=pythonVersion).apt_install(apt_packages)
-                # NOTE: Always uses the above, then does a manual `pip install -r requirements.txt` in the runscript.  REASON: If there are any errors in the requirements.txt file, then the Image creation will fail (but only throws a generic error).
-                #image=modal.Image.from_registry("ubuntu:22.04", add_python=pythonVersion).apt_install(apt_packages).pip_install_from_requirements(requirements_file)
+                # Use a (cached) image with the requirements pre-installed, if possible.  The runscript checks whether the image's requirements match, and only
+                # does a manual `pip install -r requirements.txt` if they don't.  REASON: If there are any errors in the requirements.txt file, then the Image creation will fail (but only throws a generic error).
+                image = self.getOrBuildImage(app, pythonVersion, apt_packages, requirements_file)
 
                 # Mount the folder.  TODO: Read back the results from the sandbox.
                 #mounts = [modal.Mount.from_local_dir(mount_folder, remote_path="/app")]
@@ -218,8 +637,34 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 sandboxErrors.append(error_str)
                 failure = True
 
+        # Step 3A: Warm sandbox: start it (if it isn't already running), and push the files that changed into it
+        if (not failure) and (useWarmSandbox):
+            try:
+                if (warm is None):
+                    print("MODAL DEBUG: Starting warm sandbox (App Name: " + str(appName) + ")")
+                    with modal.enable_output():
+                        sandbox_ = modal.Sandbox.create("sleep", "infinity", image=image, timeout=MODAL_WARM_SANDBOX_TIMEOUT_SEC, app=app)
+                    warm = {"app_name": appName, "app": app, "sandbox": sandbox_, "config": warmConfig, "files": ModalSandboxFiles(sandbox_)}
+                    with THREAD_LOCK_MODAL_WARM_SANDBOXES:
+                        modal_warm_sandboxes[experimentVolumeName] = warm
+                    _saveWarmSandboxRecord(experimentVolumeName, appName)
+                    with THREAD_LOCK_MODAL_EXPERIMENT_VOLUMES:
+                        modal_experiment_volumes.pop(experimentVolumeName, None)
+                volumeName = "warm-sandbox-" + appName
+                volume = warm["files"]
+                self.syncBundleToVolume(volume, experimentVolumeName, bundle)
+            except Exception as e:
+                error_str = "An error occurred while preparing the warm Modal sandbox: " + str(e) + "\n" + traceback.format_exc()
+                print(error_str)
+                sandboxErrors.append(error_str)
+                failure = True
+                warm = None
+                stopWarmSandbox(experimentVolumeName)
+
         # Step 4: Run the sandbox
         sandbox = None
+        liveLog = None
+        watchdog = None
         if (not failure):
             print("MODAL DEBUG: Starting sandbox (App Name: " + str(appName) + ", mount_folder: " + str(mount_folder) + ")")
             print("MODAL: Starting sandbox (App Name: " + str(appName) + ", Volume Name: " + str(volumeName) + ")")
@@ -230,18 +675,27 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 failure_ = False
                 try:
                     with modal.enable_output():
-                        sandbox = modal.Sandbox.create(
-                            "bash",
-                            "-c",
-                            "cd " + workingDir + " && " + runscriptName,
-                            image=image,
-                            volumes={"/app": volume},
-                            timeout=timeout_seconds,
-                            app=app
-                        )
-
-                        # Wait for the sandbox to finish
+                        if (useWarmSandbox):
+                            # Run the runscript in the (already running) warm sandbox.  If it has to be stopped early, only the program is stopped.
+                            warmSandbox_ = warm["sandbox"]
+                            sandbox = warmSandbox_.exec("bash", "-c", "cd " + workingDir + " && " + runscriptName, timeout=timeout_seconds)
+                            watchdog.set_abort_action(lambda: warmSandbox_.exec("pkill", "-f", "python main.py"))
+                        else:
+                            sandbox = modal.Sandbox.create(
+                                "bash",
+                                "-c",
+                                "cd " + workingDir + " && " + runscriptName,
+                                image=image,
+                                volumes={"/app": volume},
+                                timeout=timeout_seconds,
+                                app=app
+                            )
+                            watchdog.set_abort_action(sandbox.terminate)
+
+                        # Follow the sandbox's output while it runs (into the live log, and the watchdog, which can stop it early), and wait for it to finish
+                        liveLog.follow_sandbox(sandbox)
                         sandbox.wait()
+                        liveLog.join()
                         print("MODAL: Sandbox finished without error. (App Name: " + str(appName) + ", Volume Name: " + str(volumeName) + ")")
                         return sandbox, sandboxErrors_, failure_
                 # SandboxTimeoutError
@@ -254,13 +708,21 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
 
                 # All over
                 except Exception as e:
+                    failure_ = True
+                    if (watchdog.get_abort_info() is not None):
+                        # The sandbox was terminated by the watchdog (recorded below)
+                        liveLog.join()
+                        return sandbox, sandboxErrors_, failure_
                     error_str = "An error occurred while running the Modal sandbox: " + str(e) + "\n" + traceback.format_exc()
                     print(error_str)
                     sandboxErrors_.append(error_str)
-                    failure_ = True
                     return sandbox, sandboxErrors_, failure_
 
             # Try to run the above, with a timeout
+            liveLog = SandboxLiveLog(mount_folder)
+            liveLog.start()
+            watchdog = SandboxWatchdog(watchdog_config)
+            watchdog.watch(liveLog)
             try:
                 sandbox, sandboxErrors_, failure = func_timeout(timeout_seconds, run_sandbox, args=(sandbox, image, volume, app, workingDir, runscriptName, timeout_seconds + 120))  # + 120 for a 2-minute buffer
                 sandboxErrors.extend(sandboxErrors_)
@@ -268,11 +730,22 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 error_str = "The Modal sandbox timed out after " + str(timeout_seconds) + " seconds.  Stopping the sandbox. (hard stop)"
                 sandboxErrors.append(error_str)
                 failure = True
+                if (useWarmSandbox):
+                    # The warm sandbox keeps running, so stop the program in it
+                    try:
+                        warm["sandbox"].exec("pkill", "-f", "python main.py")
+                    except Exception as e:
+                        print("WARNING: Could not stop the program in the warm sandbox: " + str(e))
             except Exception as e:
                 error_str = "An error occurred while running the Modal sandbox: " + str(e) + "\n" + traceback.format_exc()
                 print(error_str)
                 sandboxErrors.append(error_str)
                 failure = True
+            watchdog.stop()
+            if (watchdog.get_abort_info() is not None):
+                sandboxErrors.append(watchdog.get_abort_error_str())
+                failure = True
+            liveLog.finish(extra={"watchdog_abort": watchdog.get_abort_info()})
 
 
 
@@ -281,6 +754,7 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
 
         def download_sandbox_files(volume, mount_folder:str, OUTPUT_SUBFOLDER:str, filesToDownload:list, save_folder:str):
             sandboxErrors_ = []
+            fileSizes = {}
 
             # List all the files in the Volume (and, store their sizes for when we want to download some of them)
             if (volume != None):
@@ -324,6 +798,7 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
             # Try to read back specific files from the sandbox Volume
             filesDownloaded = []
             fileErrors = []
+            filesSkipped = {}       # File -> reason it wasn't downloaded
             # Maximum file size to download is 5MB
             maxFileSize = 5 * 1024 * 1024
             always_download_files = ["log.json", "results.json", "experiment-llm-usage.json", "stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt"] # The file size limit does not apply to these files
@@ -331,9 +806,54 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
             startTimeDownload = time.time()
             download_exceeded_max_time = False
 
+            def is_file_always_download(fileToRead:str):
+                for always_download_file in always_download_files:
+                    if (fileToRead.lower().endswith(always_download_file.lower())):
+                        return True
+                return False
+
+            # Download order: the log and results first, then the other files that are always downloaded, then everything else (smallest first)
+            def download_priority(fileToRead:str):
+                if (os.path.basename(fileToRead).lower() in MODAL_DOWNLOAD_PRIORITY_FILES):
+                    return (0, fileSizes.get(fileToRead, 0))
+                if (is_file_always_download(fileToRead)):
+                    return (1, fileSizes.get(fileToRead, 0))
+                return (2, fileSizes.get(fileToRead, 0))
+
+            # Download one file (retrying if needed).  Returns None if successful, otherwise the reason it wasn't (fully) downloaded.
+            def download_file(fileToRead:str):
+                filenameOut = os.path.join(mount_folder, OUTPUT_SUBFOLDER, fileToRead)
+                os.makedirs(os.path.dirname(filenameOut), exist_ok=True)
+
+                bytesWritten = 0
+                lastError = None
+                for attempt in range(MODAL_DOWNLOAD_MAX_ATTEMPTS):
+                    if (time.time() - startTimeDownload > MAX_DOWNLOAD_TIME_SEC):
+                        return "time limit reached (" + str(MAX_DOWNLOAD_TIME_SEC) + " seconds) after " + str(bytesWritten) + " bytes"
+                    try:
+                        # Resume: on a retry, the part of the file that's already been written is skipped
+                        mode = "wb" if (bytesWritten == 0) else "ab"
+                        bytesToSkip = bytesWritten
+                        with open(filenameOut, mode) as fileOut:
+                            for chunk in volume.read_file(fileToRead):
+                                if (time.time() - startTimeDownload > MAX_DOWNLOAD_TIME_SEC):
+                                    return "time limit reached (" + str(MAX_DOWNLOAD_TIME_SEC) + " seconds) after " + str(bytesWritten) + " bytes"
+                                if (bytesToSkip > 0):
+                                    if (len(chunk) <= bytesToSkip):
+                                        bytesToSkip -= len(chunk)
+                                        continue
+                                    chunk = chunk[bytesToSkip:]
+                                    bytesToSkip = 0
+                                fileOut.write(chunk)
+                                bytesWritten += len(chunk)
+                        return None
+                    except Exception as e:
+                        lastError = e
+                        print("Error downloading " + str(fileToRead) + " (attempt " + str(attempt+1) + " of " + str(MODAL_DOWNLOAD_MAX_ATTEMPTS) + ", " + str(bytesWritten) + " bytes received): " + str(e))
+                return "error: " + str(lastError)
+
             if (volume != None):
                 print("MODAL DEBUG: Downloading files from the volume (App Name: " + str(appName) + ", Volume Name: " + str(volumeName) + ")")
-                print("Downloading " + str(len(filesToDownload)) + " files from the volume " + str(volumeName) + "...")
                 # Manually create the output folder
                 try:
                     # Create a /results/ folder in the mount folder
@@ -347,74 +867,59 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                     sandboxErrors_.append(error_str)
                     print(error_str)
 
+                # Skip any files that are too big
+                filesToQueue = []
                 for fileToRead in filesToDownload:
-                    try:
-                        # Write the file to the /results/ folder
-                        filenameOut = os.path.join(mount_folder, OUTPUT_SUBFOLDER, fileToRead)
-                        print("Retrieving " + fileToRead + " to " + filenameOut)
-
-                        # Get the file size (for the progress bar)
-                        totalFileSize = 1
-                        if (fileToRead in fileSizes):
-                            totalFileSize = fileSizes[fileToRead]
-
-                        is_file_always_download = False
-                        for always_download_file in always_download_files:
-                            if (fileToRead.lower().endswith(always_download_file.lower())):
-                                is_file_always_download = True
-                                break
-                        if (totalFileSize > maxFileSize):
-                            if (not is_file_always_download):
-                                print("Skipping " + fileToRead + " because it is too large (" + str(totalFileSize) + " bytes). Maximum size is " + str(maxFileSize) + " bytes.")
-                                filesTooBig.append(fileToRead)
-                                continue
+                    totalFileSize = fileSizes.get(fileToRead, 1)
+                    if (totalFileSize > maxFileSize):
+                        if (not is_file_always_download(fileToRead)):
+                            print("Skipping " + fileToRead + " because it is too large (" + str(totalFileSize) + " bytes). Maximum size is " + str(maxFileSize) + " bytes.")
+                            filesTooBig.append(fileToRead)
+                            filesSkipped[fileToRead] = "too large (" + str(totalFileSize) + " bytes, maximum is " + str(maxFileSize) + " bytes)"
+                            continue
+                        else:
+                            print("Downloading " + fileToRead + " even though it exceeds size limitations (" + str(totalFileSize) + " bytes). Maximum size is " + str(maxFileSize) + " bytes.")
+                    filesToQueue.append(fileToRead)
+                filesToQueue = sorted(filesToQueue, key=download_priority)
+
+                # Download concurrently.  Files are submitted in priority order, so the most important ones are started first.
+                print("Downloading " + str(len(filesToQueue)) + " files from the volume " + str(volumeName) + " (" + str(MODAL_DOWNLOAD_MAX_WORKERS) + " at a time)...")
+                with concurrent.futures.ThreadPoolExecutor(max_workers=MODAL_DOWNLOAD_MAX_WORKERS) as executor:
+                    futures = {executor.submit(download_file, fileToRead): fileToRead for fileToRead in filesToQueue}
+                    for future in concurrent.futures.as_completed(futures):
+                        fileToRead = futures[future]
+                        try:
+                            reason = future.result()
+                        except Exception as e:
+                            reason = "error: " + str(e)
+                        if (reason is None):
+                            filesDownloaded.append(fileToRead)
+                        else:
+                            filesSkipped[fileToRead] = reason
+                            if (reason.startswith("time limit")):
+                                download_exceeded_max_time = True
                             else:
-                                print("Downloading " + fileToRead + " even though it exceeds size limitations (" + str(totalFileSize) + " bytes). Maximum size is " + str(maxFileSize) + " bytes.")
-
-                        # Get the remote file path (e.g. /x/y/z/filename.txt). Make the directory if it doesn't exist
-                        lastSlashIndex = fileToRead.rfind("/")      # Remove everything past the last "/"
-                        if (lastSlashIndex != -1):
-                            folder = fileToRead[:lastSlashIndex+1]
-                            if (len(folder) > 0):
-                                # Make the directory
-                                try:
-                                    outFolder = os.path.join(mount_folder, OUTPUT_SUBFOLDER, folder)
-                                    print("Creating directory: " + str(outFolder))
-                                    os.makedirs(outFolder, exist_ok=True)
-                                except Exception as e:
-                                    error_str = "An error occurred while making the directory: " + str(e)
-                                    sandboxErrors_.append(error_str)
-                                    print("Error making the directory: " + str(e))
-
-                        # Download the file, chunk by chunk
-                        with open(filenameOut, 'wb') as fileOut:
-                            print("Downloading " + filenameOut)
-                            with tqdm(total=totalFileSize, unit='B', unit_scale=True, unit_divisor=1024, desc=fileToRead) as pbar:
-                                for chunk in volume.read_file(fileToRead):
-                                    if (time.time() - startTimeDownload > MAX_DOWNLOAD_TIME_SEC):
-                                        download_exceeded_max_time = True
-                                        break
-                                    with open(filenameOut, 'ab') as fileOut:
-                                        fileOut.write(chunk)
-                                        pbar.update(len(chunk))
-
-                        if (download_exceeded_max_time):
-                            print("Download exceeded maximum time of " + str(MAX_DOWNLOAD_TIME_SEC) + " seconds.  Stopping download.")
-                            break
-
-                        filesDownloaded.append(fileToRead)
+                                error_str = "An error occurred while downloading the file (" + str(fileToRead) + "): " + reason
+                                sandboxErrors_.append(error_str)
+                                fileErrors.append(fileToRead)
+                                print(error_str)
 
-                    except Exception as e:
-                        # If there's an error downloading the file for whatever reason, print it
-                        error_str = "An error occurred while downloading the file (" + str(fileToRead) + "): " + str(e)
-                        sandboxErrors_.append(error_str)
-                        fileErrors.append(fileToRead)
-                        print(f"Error reading {fileToRead}: {e}")
-                        pass
-
-                print(f"Downloaded {len(filesDownloaded)} files from Volume " + str(volumeName))
+                print(f"Downloaded {len(filesDownloaded)} files from Volume " + str(volumeName) + " in " + str(round(time.time() - startTimeDownload, 1)) + " seconds")
                 print(f"Errors downloading {len(fileErrors)} files.")
                 print("MODAL DEBUG: Downloaded " + str(len(filesDownloaded)) + " files from the volume (App Name: " + str(appName) + ", Volume Name: " + str(volumeName) + ")")
+
+                # Save the manifest of what was (and wasn't) downloaded
+                try:
+                    downloadManifest = {
+                        "downloaded": sorted(filesDownloaded),
+                        "skipped": filesSkipped,
+                        "download_time_seconds": round(time.time() - startTimeDownload, 1),
+                        "max_download_time_seconds": MAX_DOWNLOAD_TIME_SEC
+                    }
+                    with open(os.path.join(mount_folder, OUTPUT_SUBFOLDER, FILENAME_DOWNLOAD_MANIFEST), "w") as f:
+                        json.dump(downloadManifest, f, indent=4)
+                except Exception as e:
+                    print("WARNING: Could not save the download manifest: " + str(e))
             else:
                 print("WARNING: Did not download files from Modal volume (Volume is `None`: No volume to download files from).")
 
@@ -444,7 +949,7 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 print(error_str)
 
             if (download_exceeded_max_time):
-                error_str = "The download of files from the Modal volume exceeded the maximum time of " + str(MAX_DOWNLOAD_TIME_SEC) + " seconds.  Stopping download."
+                error_str = "The download of files from the Modal volume exceeded the maximum time of " + str(MAX_DOWNLOAD_TIME_SEC) + " seconds.  Files not downloaded: " + str(sorted([file for file, reason in filesSkipped.items() if reason.startswith("time limit")]))
                 sandboxErrors_.append(error_str)
                 print(error_str)
             if (len(filesTooBig) > 0):
@@ -458,7 +963,8 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 "fileErrors": fileErrors,
                 "filesTooBig": filesTooBig,
                 "download_exceeded_max_time": download_exceeded_max_time,
-                "files_and_sizes": fileSizes
+                "files_and_sizes": fileSizes,
+                "files_skipped": filesSkipped
             }
             return packed_file_info, sandboxErrors_
 
@@ -467,10 +973,13 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
         filesDownloaded = {}    # Super hacky -- starts as a [] but should return as a {} above
         filesTooBig = []
         fileSizes = {}
+        filesSkipped = {}
         download_exceeded_max_time = False
         try:
-            file_info, sandboxErrors_ = func_timeout(MAX_DOWNLOAD_TIME_SEC, download_sandbox_files, args=(volume, mount_folder, OUTPUT_SUBFOLDER, filesToDownload, save_folder))
+            # (The downloads stop themselves at MAX_DOWNLOAD_TIME_SEC -- this is a backstop, in case the volume stops responding)
+            file_info, sandboxErrors_ = func_timeout(MAX_DOWNLOAD_TIME_SEC + 60, download_sandbox_files, args=(volume, mount_folder, OUTPUT_SUBFOLDER, filesToDownload, save_folder))
             fileErrors = file_info["fileErrors"]
+            filesSkipped = file_info["files_skipped"]
             filesDownloaded = file_info["filesDownloaded"]
             filesTooBig = file_info["filesTooBig"]
             download_exceeded_max_time = file_info["download_exceeded_max_time"]
@@ -493,7 +1002,10 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
             sandbox_stderr = None
             sandbox_returncode = None
             try:
-                sandbox_stdout = sandbox.stdout.read()
+                if (liveLog is not None) and (len(liveLog.reader_threads) > 0):
+                    sandbox_stdout = liveLog.get_captured_stdout()      # (The stream has already been read into the live log)
+                else:
+                    sandbox_stdout = sandbox.stdout.read()
             except Exception as e:
                 error_str = "An error occurred while reading the sandbox stdout: " + str(e)
                 sandboxErrors_.append(error_str)
@@ -501,7 +1013,10 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 sandbox_stdout = error_str
 
             try:
-                sandbox_stderr = sandbox.stderr.read()
+                if (liveLog is not None) and (len(liveLog.reader_threads) > 0):
+                    sandbox_stderr = liveLog.get_captured_stderr()
+                else:
+                    sandbox_stderr = sandbox.stderr.read()
             except Exception as e:
                 error_str = "An error occurred while reading the sandbox stderr: " + str(e)
                 sandboxErrors_.append(error_str)
@@ -585,8 +1100,10 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
             packedOut["filesTooBig"] = filesTooBig
             packedOut["download_exceeded_max_time"] = download_exceeded_max_time
             packedOut["files_and_sizes"] = fileSizes
+            packedOut["files_skipped"] = filesSkipped
             packedOut["retain_files"] = retain_files
             packedOut["sandbox_errors"] = sandboxErrors
+            packedOut["watchdog_abort"] = watchdog.get_abort_info() if (watchdog is not None) else None
         except Exception as e:
             error_str = "An error occurred while packing the Modal output: " + str(e) + "\n" + traceback.format_exc()
             print(error_str)
@@ -606,15 +1123,16 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 sandboxErrors_.append(error_str)
             return sandboxErrors_
 
-        # Try to run the above, with a timeout
+        # Try to run the above, with a timeout.  (A warm sandbox's app is kept until the sandbox is released)
         MAX_DELETE_APP_TIME_SEC = 60
-        try:
-            sandboxErrors_ = func_timeout(MAX_DELETE_APP_TIME_SEC, delete_sandbox_app, args=(appName,))
-            sandboxErrors.extend(sandboxErrors_)
-        except FunctionTimedOut:
-            error_str = "The deletion of the Modal app exceeded the maximum time of " + str(MAX_DELETE_APP_TIME_SEC) + " seconds.  Stopping deletion."
-            sandboxErrors.append(error_str)
-            print(error_str)
+        if (not useWarmSandbox) or (warm is None):
+            try:
+                sandboxErrors_ = func_timeout(MAX_DELETE_APP_TIME_SEC, delete_sandbox_app, args=(appName,))
+                sandboxErrors.extend(sandboxErrors_)
+            except FunctionTimedOut:
+                error_str = "The deletion of the Modal app exceeded the maximum time of " + str(MAX_DELETE_APP_TIME_SEC) + " seconds.  Stopping deletion."
+                sandboxErrors.append(error_str)
+                print(error_str)
 
         # Delete the volume
         def delete_sandbox_volume(volumeName):
@@ -628,15 +1146,16 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 sandboxErrors_.append(error_str)
             return sandboxErrors_
 
-        # Try to run the above, with a timeout
+        # Try to run the above, with a timeout.  (Experiment volumes are kept for the next iteration, and deleted when the experiment finishes)
         MAX_DELETE_VOLUME_TIME_SEC = 60
-        try:
-            sandboxErrors_ = func_timeout(MAX_DELETE_VOLUME_TIME_SEC, delete_sandbox_volume, args=(volumeName,))
-            sandboxErrors.extend(sandboxErrors_)
-        except FunctionTimedOut:
-            error_str = "The deletion of the Modal volume exceeded the maximum time of " + str(MAX_DELETE_VOLUME_TIME_SEC) + " seconds.  Stopping deletion."
-            sandboxErrors.append(error_str)
-            print(error_str)
+        if (experimentVolumeName is None) and (not useWarmSandbox):
+            try:
+                sandboxErrors_ = func_timeout(MAX_DELETE_VOLUME_TIME_SEC, delete_sandbox_volume, args=(volumeName,))
+                sandboxErrors.extend(sandboxErrors_)
+            except FunctionTimedOut:
+                error_str = "The deletion of the Modal volume exceeded the maximum time of " + str(MAX_DELETE_VOLUME_TIME_SEC) + " seconds.  Stopping deletion."
+                sandboxErrors.append(error_str)
+                print(error_str)
 
 
         # Update the sandbox errors (if any)
@@ -704,35 +1223,19 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
                 "errors": errors
             }
 
-        # Step 2A: Write any supporting files
+        # Step 2A: Add any supporting files to the bundle of files to upload.  These aren't written to the output folder -- they're uploaded directly
+        # (and only if they've changed since the last run of this experiment).
         if ("supporting_files" not in inputData):
             inputData["supporting_files"] = []
 
+        bundle = {}
+        bundle["requirements.txt"] = makeBundleEntry(inputData["requirements.txt"], local_path=requirementsFile)
         supportingFiles = inputData["supporting_files"]
         for supportingFile in supportingFiles:
-            supportingFilename = folderOut + "/" + supportingFile["filename"]
-            # Get any sub-directories, e.g. for `/x/y/z/filename.txt`, create the `/x/y/z` path
-            supportingDir = os.path.dirname(supportingFilename)
-            try:
-                os.makedirs(supportingDir)
-            except FileExistsError:
-                pass
-            # Catch all other errors
-            except Exception as e:
-                errors.append("An error occurred while creating the supporting file directory (" + supportingDir + "): " + str(e) + "\n" + traceback.format_exc())
-                return {
-                    "input": inputData,
-                    "output": None,
-                    "errors": errors
-                }
-
-            # Write the file
-            supportingFileContents = supportingFile["contents"]
             try:
-                with open(supportingFilename, "w") as f:
-                    f.write(supportingFileContents)
+                bundle[supportingFile["filename"].lstrip("/")] = makeBundleEntry(supportingFile["contents"])
             except Exception as e:
-                errors.append("An error occurred while writing the supporting file (" + supportingFilename + "): " + str(e) + "\n" + traceback.format_exc())
+                errors.append("An error occurred while preparing the supporting file (" + str(supportingFile.get("filename", None)) + "): " + str(e) + "\n" + traceback.format_exc())
                 return {
                     "input": inputData,
                     "output": None,
@@ -745,6 +1248,7 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
         try:
             with open(codeFile, "w") as f:
                 f.write(inputData["code"])
+            bundle["main.py"] = makeBundleEntry(inputData["code"], local_path=codeFile)
         except Exception as e:
             errors.append("An error occurred while writing the code file: " + str(e) + "\n" + traceback.format_exc())
             return {
@@ -759,11 +1263,19 @@ Keys are accessed in the normal way.  For example `print(data["0"])` will print
         runScriptFile = folderOut + "/run.sh"
         runScript = """#!/bin/bash
 
-# Create the conda environment
-conda create -y -n """ + envName + """ python=""" + str(inputData["python_version"]) + """
+# Check whether the dependencies are already installed in the container image (i.e. the image was built from the same requirements.txt)
+DEPS_PREINSTALLED=0
+if [ -f """ + PATH_REQUIREMENTS_HASH_IN_IMAGE + """ ] && [ "$(sha256sum requirements.txt | cut -d' ' -f1)" == "$(cat """ + PATH_REQUIREMENTS_HASH_IN_IMAGE + """)" ]; then
+    DEPS_PREINSTALLED=1
+fi
+
+if [ $DEPS_PREINSTALLED -eq 0 ]; then
+    # Create the conda environment
+    conda create -y -n """ + envName + """ python=""" + str(inputData["python_version"]) + """
 
-# Activate the conda environment
-source activate """ + envName + """
+    # Activate the conda environment
+    source activate """ + envName + """
+fi
 
 # Make a directory for any files to be saved
 mkdir to_save
@@ -774,12 +1286,18 @@ mkdir retain
 # Install any dependencies using pip or conda install
 # Ignore the warning about installing as root
 export PIP_ROOT_USER_ACTION=ignore
-# Redirect stdout to stdout.pip.txt and stderr to stderr.pip.txt
-pip install -r requirements.txt >stdout.pip.txt 2>stderr.pip.txt
+if [ $DEPS_PREINSTALLED -eq 0 ]; then
+    # Redirect stdout to stdout.pip.txt and stderr to stderr.pip.txt
+    pip install -r requirements.txt >stdout.pip.txt 2>stderr.pip.txt
+
+    # Required for the LLM proxy
+    pip install litellm
+else
+    echo "Requirements (requirements.txt) are pre-installed in the container image." >stdout.pip.txt
+    touch stderr.pip.txt
+fi
 
 # Run the LLM proxy in the background, but save it's output to a file
-# Required for the LLM proxy
-pip install litellm
 cd llm-proxy
 # Uses the -u option to immediately write to the logfiles, and the & to run in the background
 #python -u llm-proxy-server.py >stdout.llm-proxy.txt 2>stderr.llm-proxy.txt &
@@ -790,13 +1308,18 @@ LLM_PROXY_PID=$!  # Capture the process ID of llm-proxy-server.py
 sleep 5
 cd ..
 
+# Stream the log entries while the program runs
+""" + LIVE_LOG_STREAMER_RUNSCRIPT + """
 # Run the python script
-# Redirect stdout to stdout.python.txt and stderr to stderr.python.txt
-python main.py >stdout.python.txt 2>stderr.python.txt
+# Save stdout to stdout.python.txt and stderr to stderr.python.txt (and also stream them, unbuffered, to the sandbox's output so they can be followed live)
+PYTHONUNBUFFERED=1 python main.py > >(tee stdout.python.txt) 2> >(tee stderr.python.txt >&2)
 
 # Wait for any log files to be written
 sleep 3
 
+# Stop streaming the log
+kill $LIVE_LOG_PID
+
 # Kill the LLM proxy process
 echo "Stopping llm-proxy-server.py (PID: $LLM_PROXY_PID)..."
 kill $LLM_PROXY_PID
@@ -810,12 +1333,84 @@ fi
 
 echo "Script completed."
         """
+
+        # Warm sandbox: the sandbox (and the LLM proxy in it) are kept running between the runs of this experiment, so the requirements are only installed
+        # if they're different from those already installed (in the image, or by a previous run), and the LLM proxy is only started once.
+        keepSandboxWarm = (inputData.get("keep_sandbox_warm", False) == True)
+        if (keepSandboxWarm):
+            runScript = """#!/bin/bash
+
+# Check whether the dependencies are already installed in the (warm) sandbox
+REQUIREMENTS_HASH=$(sha256sum requirements.txt | cut -d' ' -f1)
+DEPS_PREINSTALLED=0
+if [ -f """ + PATH_REQUIREMENTS_HASH_IN_IMAGE + """ ] && [ "$REQUIREMENTS_HASH" == "$(cat """ + PATH_REQUIREMENTS_HASH_IN_IMAGE + """)" ]; then
+    DEPS_PREINSTALLED=1
+fi
+
+# Make a directory for any files to be saved
+mkdir to_save
+
+# Make a directory for any datasets to be retained
+mkdir retain
+
+# Install any dependencies using pip
+# Ignore the warning about installing as root
+export PIP_ROOT_USER_ACTION=ignore
+if [ $DEPS_PREINSTALLED -eq 0 ]; then
+    # Redirect stdout to stdout.pip.txt and stderr to stderr.pip.txt
+    pip install -r requirements.txt >stdout.pip.txt 2>stderr.pip.txt
+    if [ $? -eq 0 ]; then
+        # Record what's installed, so the next run can skip this
+        mkdir -p """ + os.path.dirname(PATH_REQUIREMENTS_HASH_IN_IMAGE) + """
+        echo $REQUIREMENTS_HASH > """ + PATH_REQUIREMENTS_HASH_IN_IMAGE + """
+    fi
+
+    # Required for the LLM proxy
+    pip install litellm
+else
+    echo "Requirements (requirements.txt) are already installed in the (warm) sandbox." >stdout.pip.txt
+    touch stderr.pip.txt
+fi
+
+# The LLM proxy is started once, and kept running between runs.  Each later run tells it to start counting the usage (and cost limit) for that run.
+LLM_PROXY_LOG_DIR=/tmp/llm-proxy-log
+if [ -f $LLM_PROXY_LOG_DIR/pid ] && kill -0 $(cat $LLM_PROXY_LOG_DIR/pid) 2>/dev/null; then
+    python -c "import json, urllib.request; print(urllib.request.urlopen(urllib.request.Request('http://localhost:${LLM_PROXY_PORT:-4000}/start-run', data=json.dumps({'path': '$(pwd)/llm-proxy'}).encode('utf-8'), headers={'Content-Type': 'application/json'})).read().decode('utf-8'))"
+else
+    mkdir -p $LLM_PROXY_LOG_DIR
+    cd llm-proxy
+    setsid nohup python -u llm-proxy-server.py >$LLM_PROXY_LOG_DIR/stdout.llm-proxy.txt 2>$LLM_PROXY_LOG_DIR/stderr.llm-proxy.txt &
+    echo $! > $LLM_PROXY_LOG_DIR/pid
+
+    # Wait for the LLM proxy to start up
+    sleep 5
+    cd ..
+fi
+
+# Stream the log entries while the program runs
+""" + LIVE_LOG_STREAMER_RUNSCRIPT + """
+# Run the python script
+# Save stdout to stdout.python.txt and stderr to stderr.python.txt (and also stream them, unbuffered, to the sandbox's output so they can be followed live)
+PYTHONUNBUFFERED=1 python main.py > >(tee stdout.python.txt) 2> >(tee stderr.python.txt >&2)
+
+# Wait for any log files to be written
+sleep 3
+
+# Stop streaming the log
+kill $LIVE_LOG_PID
+
+# Keep a copy of the LLM proxy's output (from all the runs so far) with this run's output
+cp $LLM_PROXY_LOG_DIR/stdout.llm-proxy.txt $LLM_PROXY_LOG_DIR/stderr.llm-proxy.txt llm-proxy/
+
+echo "Script completed."
+"""
         try:
             # Export the runscript
             with open(runScriptFile, "w") as f:
                 f.write(runScript)
             # Change its permission to be executable
             os.chmod(runScriptFile, 0o755)
+            bundle["run.sh"] = makeBundleEntry(runScript, local_path=runScriptFile)
 
         except Exception as e:
             errors.append("An error occurred while writing the runscript file: " + str(e) + "\n" + traceback.format_exc())
@@ -846,6 +1441,9 @@ echo "Script completed."
         if ("apt_packages" in inputData) and (type(inputData["apt_packages"]) == list):
             apt_packages = inputData["apt_packages"]
 
+        # Step 5C: Get the watchdog configuration (when to stop a run early -- see SandboxWatchdog), if any
+        watchdog_config = inputData.get("watchdog", None)
+
 
         # Run the container
         MODAL_OUTPUT_SUBFOLDER = "modal-output"
@@ -871,8 +1469,12 @@ echo "Script completed."
                                 runscriptName="./run.sh",
                                 requirements_file="requirements.txt",
                                 OUTPUT_SUBFOLDER = MODAL_OUTPUT_SUBFOLDER,
-                                filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "llm-proxy/stdout.llm-proxy.txt", "llm-proxy/stderr.llm-proxy.txt", "llm-proxy/experiment-llm-usage.json", "log.json", "results.json"],
-                                timeout_seconds=max_runtime_seconds)
+                                filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "llm-proxy/stdout.llm-proxy.txt", "llm-proxy/stderr.llm-proxy.txt", "llm-proxy/experiment-llm-usage.json", "llm-proxy/llm-proxy-response-cache.json", "log.json", "results.json"],
+                                timeout_seconds=max_runtime_seconds,
+                                bundle=bundle,
+                                experimentVolumeName=getExperimentVolumeName(basePath),
+                                watchdog_config=watchdog_config,
+                                warmSandbox=keepSandboxWarm)
 
             print("Modal container finished.")
             modal_container_completed = True
@@ -931,13 +1533,17 @@ echo "Script completed."
         files_errors = []
         files_and_sizes = []
         files_too_big = []
+        files_skipped = {}
         retain_files = {}
+        watchdog_abort = None
         if (result != None):
             files_downloaded = result.get("filesDownloaded", [])
             files_errors = result.get("fileErrors", [])
             files_and_sizes = result.get("files_and_sizes", [])
             files_too_big = result.get("filesTooBig", [])
+            files_skipped = result.get("files_skipped", {})
             retain_files = result.get("retain_files", {})
+            watchdog_abort = result.get("watchdog_abort", None)
 
         # Try to load the 'results.json' file
         resultsJson = None
@@ -968,7 +1574,9 @@ echo "Script completed."
             "files_errors": files_errors,
             "files_and_sizes": files_and_sizes,
             "files_too_big": files_too_big,
+            "files_skipped": files_skipped,
             "retain_files": retain_files,
+            "watchdog_abort": watchdog_abort,
             "file_path": folderOut + "/" + MODAL_OUTPUT_SUBFOLDER,
             "return_code": return_code,
             "other_errors": other_errors,
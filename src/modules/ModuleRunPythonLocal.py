@@ -0,0 +1,885 @@
+# ModuleRunPythonLocal.py
+# Runs arbitrary Python programs on the local machine -- either in an isolated virtual environment (venv), or in a local container runtime (docker/podman).
+# Implements the same action/input/output contract as ModuleRunPythonInModal, so the two can be used interchangeably by ExperimentMaker.executeExperiment().
+import os
+import traceback
+import time
+import datetime
+import json
+import random
+import hashlib
+import threading
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+
+
+# Add the parent directory to the path, so that we can import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Module import Module
+from SandboxLiveLog import *
+from SandboxWatchdog import *
+
+
+# Runtimes
+LOCAL_RUNTIME_VENV = "venv"                 # Run in a (cached) Python virtual environment on this machine
+LOCAL_RUNTIME_DOCKER = "docker"             # Run in a local container (dependencies are installed on each run, as in a fresh Modal container)
+LOCAL_RUNTIME_PODMAN = "podman"
+LOCAL_RUNTIMES = [LOCAL_RUNTIME_VENV, LOCAL_RUNTIME_DOCKER, LOCAL_RUNTIME_PODMAN]
+LOCAL_CONTAINER_IMAGE_PREFIX = "python:"    # e.g. `python:3.12`
+
+# Sandbox environment: The generated code only gets these variables from the server's environment (not e.g. any provider/cloud credentials) --
+# in the venv runtime it runs directly on this machine.  The LLM proxy reads its keys from `api_keys.donotcommit.json` instead.
+LOCAL_SANDBOX_ENV_PASSTHROUGH = ["PATH", "HOME", "LANG", "LC_ALL", "TMPDIR"]
+# The container runtimes' CLIs also need these to reach their daemon (the containers themselves don't inherit the environment)
+LOCAL_CONTAINER_ENV_PASSTHROUGH = ["DOCKER_HOST", "DOCKER_CONTEXT", "DOCKER_CONFIG", "DOCKER_CERT_PATH", "DOCKER_TLS_VERIFY", "CONTAINER_HOST", "CONTAINER_CONNECTION", "XDG_RUNTIME_DIR"]
+
+# Virtual environment cache: Environments are keyed by (Python interpreter, hash of requirements.txt), and have the dependencies pre-installed,
+# so that later debug iterations with the same requirements can skip the environment setup.
+PATH_LOCAL_VENV_CACHE = "data/local-venv-cache/"
+LOCAL_VENV_CACHE_MAX_AGE_DAYS = 7           # Environments that haven't been used in this many days are deleted
+FILENAME_VENV_REQUIREMENTS_HASH = "requirements.sha256"      # Written into environments that have the requirements installed
+MAX_PIP_INSTALL_TIME_SEC = 60*20            # 20 minutes
+THREAD_LOCK_LOCAL_VENV_CACHE = threading.Lock()
+local_venv_locks = {}                       # One lock per environment, so that concurrent experiments don't install into the same environment at the same time
+
+# File retrieval limits (the same as the Modal sandbox)
+RETAIN_FOLDER = "retain"
+MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024       # 5MB
+ALWAYS_KEEP_FILES = ["log.json", "results.json", "experiment-llm-usage.json", "stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt"] # The file size limit does not apply to these files
+FILE_PREFIXES_TO_FILTER = ["llm-proxy", "prompt", "__pycache__"]      # Files the debug agent shouldn't know about (e.g. that might contain API keys)
+
+# Warm containers (container runtimes only): Optionally, an experiment can keep one container running for all of its debug iterations.  The experiment's
+# folder is mounted into it, each run is started with `exec`, the requirements are only re-installed if they changed, and the LLM proxy is kept running.
+# The container is stopped with `releaseWarmContainer()` when the experiment finishes.  Its name is derived from the experiment path, so that another process
+# (i.e. the server, if the experiment's worker process crashes) can still stop it.
+LOCAL_WARM_CONTAINER_MOUNT = "/experiment"
+LOCAL_WARM_REQUIREMENTS_HASH_FILE = "/opt/codescientist/requirements.sha256"
+THREAD_LOCK_LOCAL_WARM_CONTAINERS = threading.Lock()
+local_warm_containers = {}                  # experiment path -> {"name", "runtime", "python_version"}
+
+# Get the name of an experiment's warm container
+def getWarmContainerName(basePath:str):
+    return "local-sandbox-warm-" + hashlib.sha256(os.path.abspath(basePath).encode("utf-8")).hexdigest()[:24]
+
+# Stop an experiment's warm container (if it has one).  `runtime`: If the container wasn't started by this process, it's removed (by name) using this runtime.
+def releaseWarmContainer(basePath:str, runtime:str=None):
+    with THREAD_LOCK_LOCAL_WARM_CONTAINERS:
+        warm = local_warm_containers.pop(os.path.abspath(basePath), None)
+    if (warm is None):
+        if (runtime is not None) and (runtime != LOCAL_RUNTIME_VENV):
+            subprocess.run([runtime, "rm", "-f", getWarmContainerName(basePath)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    print("LOCAL DEBUG: Stopping warm container (" + str(warm["name"]) + ")")
+    subprocess.run([warm["runtime"], "rm", "-f", warm["name"]], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class ModuleRunPythonLocal(Module):
+    #
+    #   Constructor
+    #
+    def __init__(self, runtime:str=LOCAL_RUNTIME_VENV):
+        # Set the name of the module
+        self.MODULE_NAME = "ModuleRunPythonLocal"
+        self.MODULE_DESC = "A module for running arbitrary Python programs, provided as strings to this module (then run locally, in an isolated virtual environment or a local container)"
+        self.MODULE_VERSION = "0.1"
+        self.MODULE_AUTHOR = "Nora"
+
+        # A list of other modules that this module prefers input from
+        self.preferedModules = {
+            "input": [],            # Other modules that this module prefers to get input from
+            "output": []            # Other modules that this module perfers to provide input for
+        }
+
+        # Register actions
+        self.actions = {}
+
+        # Action: Run Program (the same contract as ModuleRunPythonInModal)
+        self.ACTION_RUN_PROGRAM = {
+            "name": "run_python_program",
+            "description": "creates a local sandbox (virtual environment or container), and executes a python program in it, reporting the output/results.",
+            "input_format": "The input is a dictionary with three keys: 'python_version', `requirements.txt`, and `code`.  Optional keys are `supporting_files`, `base_path`, `max_runtime_seconds`, and `apt_packages` (only used by container runtimes).",
+            "example": {"python_version": "3.11", "requirements.txt": "numpy==1.26.4\nscikit-learn==1.3.2\n", "code": "import numpy\nprint(\"hello world\")\n" },
+            "output_format": "The output is a copy of the stdout and stderr after running the program."
+        }
+        self.actions[self.ACTION_RUN_PROGRAM["name"]] = self.ACTION_RUN_PROGRAM
+
+        # Run checks to ensure that the module is properly initialized
+        self.initializationChecks()
+
+        # Run runtime-specific initialization checks
+        self.runtime = runtime
+        _errors = self.initializeRuntime()
+        self.errors.extend(_errors)
+
+
+    # Runtime-specific initialization checks
+    def initializeRuntime(self):
+        errors = []
+        if (self.runtime not in LOCAL_RUNTIMES):
+            errors.append("Unknown local runtime (" + str(self.runtime) + ").  Valid runtimes are: " + str(LOCAL_RUNTIMES))
+        elif (self.runtime != LOCAL_RUNTIME_VENV) and (shutil.which(self.runtime) is None):
+            errors.append("The local container runtime (" + str(self.runtime) + ") was not found on the PATH.")
+
+        # Return
+        return errors
+
+
+    #
+    #   Run an action in this module
+    #
+    def runAction(self, actionName:str, payload:dict):
+        # Payload is passed with one key
+        #   "input": the input data
+        # Additional key(s) are added after running:
+        #   "output": the output of the module
+        #   "errors": a list contianing any errors that occurred
+
+        # Check that the action is valid
+        invalidActionCheck = self._checkIfValidAction(actionName, payload)
+        if (invalidActionCheck != None):
+            return invalidActionCheck
+
+        # Action interpeter: Call the appropriate action
+
+        # Action: Run Program
+        if (actionName == self.ACTION_RUN_PROGRAM["name"]):
+            return self.actionRunProgram(payload)
+        else:
+            return {
+                "input": payload["input"],
+                "output": None,
+                "errors": ["The requested action (" + actionName + ") has no interpreter available to run it."]
+            }
+
+
+    #
+    #   Module Actions
+    #
+
+    # Check the input data is in the correct format
+    def checkInputRunProgram(self, inputDict:dict):
+        errors = []
+        # Any runtime errors (e.g. the container runtime isn't installed)
+        errors.extend(self.errors)
+
+        # Check for the 'python_version' key
+        if ('python_version' not in inputDict):
+            # Default to Python 3.10
+            inputDict['python_version'] = "3.10"
+
+        # Check that the 'python_version' key is a string
+        if (type(inputDict['python_version']) != str):
+            errors.append("The 'python_version' key is not a string, but rather a " + str(type(inputDict['python_version'])))
+
+        # Check for the 'requirements.txt' key
+        if ('requirements.txt' not in inputDict):
+            inputDict['requirements.txt'] = ""
+
+        # Check that the 'requirements.txt' key is a string
+        if (type(inputDict['requirements.txt']) != str):
+            errors.append("The 'requirements.txt' key is not a string, but rather a " + str(type(inputDict['requirements.txt'])))
+
+        # Check for the 'code' key
+        if ('code' not in inputDict):
+            errors.append("The 'code' key is missing from the input data.")
+        else:
+            # Check that the 'code' key is a string
+            if (type(inputDict['code']) != str):
+                errors.append("The 'code' key is not a string, but rather a " + str(type(inputDict['code'])))
+
+        # Check for 'base_path' key
+        if ('base_path' not in inputDict):
+            inputDict['base_path'] = ""
+
+        return errors
+
+    # Load a logfile
+    def loadLogFile(self, logFile:str):
+        try:
+            with open(logFile, "r") as f:
+                return f.read()
+        except Exception as e:
+            return None
+
+
+    #
+    #   Virtual environment cache
+    #
+
+    # Find a Python interpreter for the requested version (falling back to the interpreter running this code)
+    def getPythonInterpreter(self, pythonVersion:str):
+        interpreter = shutil.which("python" + str(pythonVersion))
+        if (interpreter is None):
+            interpreter = sys.executable
+        return interpreter
+
+    # Get the cache key for a given environment
+    def getVenvCacheKey(self, interpreter:str, requirementsStr:str):
+        requirementsHash = hashlib.sha256(requirementsStr.encode("utf-8")).hexdigest()
+        keyStr = json.dumps({"interpreter": os.path.realpath(interpreter), "requirements_sha256": requirementsHash}, sort_keys=True)
+        return hashlib.sha256(keyStr.encode("utf-8")).hexdigest()[:32], requirementsHash
+
+    # Delete any environments that haven't been used recently
+    def evictStaleVenvs(self, keepKey:str=None):
+        if (not os.path.exists(PATH_LOCAL_VENV_CACHE)):
+            return
+        minLastUsed = time.time() - (LOCAL_VENV_CACHE_MAX_AGE_DAYS * 24 * 60 * 60)
+        for cacheKey in os.listdir(PATH_LOCAL_VENV_CACHE):
+            if (cacheKey == keepKey):
+                continue
+            venvPath = os.path.join(PATH_LOCAL_VENV_CACHE, cacheKey)
+            try:
+                if (os.path.getmtime(venvPath) < minLastUsed) and (not self._getVenvLock(cacheKey).locked()):
+                    print("Evicting stale local virtual environment: " + venvPath)
+                    shutil.rmtree(venvPath, ignore_errors=True)
+            except Exception as e:
+                print("WARNING: Could not evict local virtual environment (" + venvPath + "): " + str(e))
+
+    def _getVenvLock(self, cacheKey:str):
+        with THREAD_LOCK_LOCAL_VENV_CACHE:
+            if (cacheKey not in local_venv_locks):
+                local_venv_locks[cacheKey] = threading.Lock()
+            return local_venv_locks[cacheKey]
+
+    # Get a virtual environment with the requirements installed, creating it if needed.  The pip output is written to `pipStdoutFile`/`pipStderrFile`.
+    # Returns (venvPath, errors).  If the requirements could not be installed the environment is still returned (so the program can run, and the
+    # debugger can see the pip errors), but it is not marked as complete, so the next run will try the installation again.
+    def getOrCreateVenv(self, pythonVersion:str, requirementsFile:str, pipStdoutFile:str, pipStderrFile:str):
+        errors = []
+        with open(requirementsFile, "r") as f:
+            requirementsStr = f.read()
+
+        interpreter = self.getPythonInterpreter(pythonVersion)
+        cacheKey, requirementsHash = self.getVenvCacheKey(interpreter, requirementsStr)
+        venvPath = os.path.abspath(os.path.join(PATH_LOCAL_VENV_CACHE, cacheKey))
+        hashFile = os.path.join(venvPath, FILENAME_VENV_REQUIREMENTS_HASH)
+
+        with self._getVenvLock(cacheKey):
+            # Check for a complete environment
+            if (os.path.exists(hashFile)):
+                with open(hashFile, "r") as f:
+                    if (f.read().strip() == requirementsHash):
+                        print("Using cached local virtual environment (" + venvPath + ")")
+                        os.utime(venvPath, None)        # Mark as recently used
+                        with open(pipStdoutFile, "w") as fOut:
+                            fOut.write("Requirements (requirements.txt) are pre-installed in the virtual environment.\n")
+                        open(pipStderrFile, "w").close()
+                        return venvPath, errors
+
+            # Create the environment
+            print("Creating local virtual environment (" + venvPath + ") using " + str(interpreter))
+            if (interpreter == sys.executable) and (not sys.version.startswith(str(pythonVersion))):
+                print("WARNING: Python " + str(pythonVersion) + " was not found on the PATH.  Using " + str(interpreter) + " (Python " + sys.version.split()[0] + ") instead.")
+            venvPython = os.path.join(venvPath, "bin", "python")
+            with open(pipStdoutFile, "w") as fStdout, open(pipStderrFile, "w") as fStderr:
+                try:
+                    if (not os.path.exists(venvPython)):
+                        os.makedirs(PATH_LOCAL_VENV_CACHE, exist_ok=True)
+                        subprocess.run([interpreter, "-m", "venv", venvPath], stdout=fStdout, stderr=fStderr, check=True, timeout=MAX_PIP_INSTALL_TIME_SEC)
+
+                    # Install the requirements, and the packages required for the LLM proxy
+                    pipResult = subprocess.run([venvPython, "-m", "pip", "install", "-r", os.path.abspath(requirementsFile)], stdout=fStdout, stderr=fStderr, timeout=MAX_PIP_INSTALL_TIME_SEC)
+                    pipResultProxy = subprocess.run([venvPython, "-m", "pip", "install", "litellm"], stdout=fStdout, stderr=fStderr, timeout=MAX_PIP_INSTALL_TIME_SEC)
+                    if (pipResult.returncode == 0) and (pipResultProxy.returncode == 0):
+                        with open(hashFile, "w") as f:
+                            f.write(requirementsHash)
+                except subprocess.TimeoutExpired:
+                    error_str = "Creating the local virtual environment exceeded the maximum time of " + str(MAX_PIP_INSTALL_TIME_SEC) + " seconds."
+                    print(error_str)
+                    errors.append(error_str)
+                except Exception as e:
+                    error_str = "An error occurred while creating the local virtual environment: " + str(e) + "\n" + traceback.format_exc()
+                    print(error_str)
+                    errors.append(error_str)
+
+        # Clean up any old environments
+        self.evictStaleVenvs(keepKey=cacheKey)
+
+        if (not os.path.exists(venvPython)):
+            return None, errors
+        return venvPath, errors
+
+
+    #
+    #   Local sandbox
+    #
+
+    # Find a free local port (for the LLM proxy, so that several local sandboxes can run at the same time)
+    def getFreePort(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(("localhost", 0))
+            return s.getsockname()[1]
+
+    # Get the warm container for an experiment, starting one if there isn't one running (with the same Python version) already.  Returns (container, errors).
+    def getOrStartWarmContainer(self, basePath:str, pythonVersion:str):
+        basePath = os.path.abspath(basePath)
+        with THREAD_LOCK_LOCAL_WARM_CONTAINERS:
+            warm = local_warm_containers.get(basePath, None)
+        if (warm is not None):
+            result = subprocess.run([self.runtime, "inspect", "-f", "{{.State.Running}}", warm["name"]], capture_output=True, text=True)
+            if (result.returncode == 0) and (result.stdout.strip() == "true") and (warm["runtime"] == self.runtime) and (warm["python_version"] == pythonVersion):
+                return warm, []
+            releaseWarmContainer(basePath)
+
+        containerName = getWarmContainerName(basePath)
+        # Remove any leftover container with the same name (e.g. from a worker process that crashed)
+        subprocess.run([self.runtime, "rm", "-f", containerName], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        image = LOCAL_CONTAINER_IMAGE_PREFIX + str(pythonVersion)
+        print("LOCAL DEBUG: Starting warm container (" + containerName + ", image: " + image + ")")
+        result = subprocess.run([self.runtime, "run", "-d", "--name", containerName, "-v", basePath + ":" + LOCAL_WARM_CONTAINER_MOUNT, image, "sleep", "infinity"], capture_output=True, text=True)
+        if (result.returncode != 0):
+            return None, ["An error occurred while starting the warm container: " + str(result.stderr)]
+        warm = {"name": containerName, "runtime": self.runtime, "python_version": pythonVersion}
+        with THREAD_LOCK_LOCAL_WARM_CONTAINERS:
+            local_warm_containers[basePath] = warm
+        return warm, []
+
+
+    # Run the runscript in a local sandbox.  Unlike Modal there's no volume to upload to/download from: the program runs directly in the output
+    # folder (a copy of the mount folder).  Afterwards, files over MAX_FILE_SIZE_BYTES (other than ALWAYS_KEEP_FILES) are removed, matching Modal's download size limit.
+    def runLocalSandbox(self, mount_folder:str, pythonVersion="3.10", apt_packages=["git", "wget", "curl"], runscriptName="./run.sh", requirements_file="requirements.txt", OUTPUT_SUBFOLDER = "results", filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "log.json"], timeout_seconds=600, save_folder="to_save/", watchdog_config:dict=None, warmContainerPath:str=None):
+        # Error tracking
+        sandboxErrors = []
+        failure = False
+
+        # Step 1: Copy the mount folder to the output folder, which is used as the working directory
+        workingDir = os.path.abspath(os.path.join(mount_folder, OUTPUT_SUBFOLDER))
+        try:
+            shutil.copytree(mount_folder, workingDir, ignore=shutil.ignore_patterns(OUTPUT_SUBFOLDER), dirs_exist_ok=True)
+        except Exception as e:
+            error_str = "An error occurred while creating the local sandbox working directory: " + str(e) + "\n" + traceback.format_exc()
+            print(error_str)
+            sandboxErrors.append(error_str)
+            failure = True
+
+        # Step 2: Prepare the environment
+        passthrough = LOCAL_SANDBOX_ENV_PASSTHROUGH
+        if (self.runtime != LOCAL_RUNTIME_VENV):
+            passthrough = passthrough + LOCAL_CONTAINER_ENV_PASSTHROUGH
+        env = {key: os.environ[key] for key in passthrough if (key in os.environ)}
+        env["PYTHONUNBUFFERED"] = "1"
+        cmd = None
+        containerName = None
+        warmContainer = None
+        if (not failure) and (self.runtime != LOCAL_RUNTIME_VENV) and (warmContainerPath is not None):
+            # Warm container: run in the experiment's (already running) container, where its folder is mounted
+            warmContainer, warmErrors = self.getOrStartWarmContainer(warmContainerPath, pythonVersion)
+            sandboxErrors.extend(warmErrors)
+            if (warmContainer is None):
+                failure = True
+            else:
+                containerWorkingDir = LOCAL_WARM_CONTAINER_MOUNT + "/" + os.path.relpath(workingDir, os.path.abspath(warmContainerPath))
+                cmd = [self.runtime, "exec", "-e", "PYTHONUNBUFFERED=1", "-e", "WARM_SANDBOX=1", "-w", containerWorkingDir, warmContainer["name"], "bash", runscriptName]
+        elif (not failure) and (self.runtime == LOCAL_RUNTIME_VENV):
+            print("LOCAL DEBUG: Preparing virtual environment (mount_folder: " + str(mount_folder) + ")")
+            venvPath, venvErrors = self.getOrCreateVenv(pythonVersion, os.path.join(workingDir, requirements_file), os.path.join(workingDir, "stdout.pip.txt"), os.path.join(workingDir, "stderr.pip.txt"))
+            sandboxErrors.extend(venvErrors)
+            if (venvPath is None):
+                failure = True
+            else:
+                env["LOCAL_VENV_PATH"] = venvPath
+                env["LLM_PROXY_PORT"] = str(self.getFreePort())
+                cmd = ["bash", runscriptName]
+        elif (not failure):
+            # Container runtime: the dependencies are installed by the runscript, as in a fresh Modal container.
+            # NOTE: `apt_packages` are not installed -- use an image that already has them, if they're needed.
+            containerName = "local-sandbox-" + time.strftime("%Y%m%d-%H%M%S") + "-" + str(random.randint(10000, 99999))
+            image = LOCAL_CONTAINER_IMAGE_PREFIX + str(pythonVersion)
+            cmd = [self.runtime, "run", "--rm", "--name", containerName, "-e", "PYTHONUNBUFFERED=1", "-v", workingDir + ":/app", "-w", "/app", image, "bash", runscriptName]
+
+        # Step 3: Run the sandbox
+        sandbox_returncode = None
+        sandbox_stdout = None
+        sandbox_stderr = None
+        watchdog = None
+        if (not failure):
+            print("LOCAL: Starting sandbox (runtime: " + str(self.runtime) + ", working directory: " + str(workingDir) + ")")
+            # Live log: the program writes its output directly into the working directory, so it can be followed from there
+            liveLog = SandboxLiveLog(mount_folder, sources={
+                "stdout": os.path.join(OUTPUT_SUBFOLDER, "stdout.python.txt"),
+                "stderr": os.path.join(OUTPUT_SUBFOLDER, "stderr.python.txt"),
+                "log": os.path.join(OUTPUT_SUBFOLDER, "log.json"),
+            }, log_format=LIVE_LOG_FORMAT_JSON)
+            liveLog.start()
+            watchdog = SandboxWatchdog(watchdog_config)
+            try:
+                # Start in a new session, so the whole process group (runscript, LLM proxy, and program) can be stopped on a timeout
+                process = subprocess.Popen(cmd, cwd=workingDir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+
+                def stop_sandbox():
+                    if (containerName is not None):
+                        subprocess.run([self.runtime, "kill", containerName], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    if (warmContainer is not None):
+                        # Only stop the program -- the container is kept for the next run (unless the program can't be stopped)
+                        result = subprocess.run([self.runtime, "exec", warmContainer["name"], "pkill", "-f", "python main.py"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                        if (result.returncode not in [0, 1]):
+                            releaseWarmContainer(warmContainerPath)
+                    try:
+                        os.killpg(process.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+
+                # Follow the output files while the program runs, so the watchdog can stop it early
+                watchdog.set_abort_action(stop_sandbox)
+                watchdog.watch(liveLog)
+                if (watchdog.config["enabled"]):
+                    liveLog.follow_files()
+
+                try:
+                    sandbox_stdout, sandbox_stderr = process.communicate(timeout=timeout_seconds)
+                    sandbox_returncode = process.returncode
+                except subprocess.TimeoutExpired:
+                    error_str = "The local sandbox timed out after " + str(timeout_seconds) + " seconds.  Stopping the sandbox. (hard stop)"
+                    print(error_str)
+                    sandboxErrors.append(error_str)
+                    stop_sandbox()
+                    sandbox_stdout, sandbox_stderr = process.communicate()
+                    sandbox_returncode = process.returncode
+            except Exception as e:
+                error_str = "An error occurred while running the local sandbox: " + str(e) + "\n" + traceback.format_exc()
+                print(error_str)
+                sandboxErrors.append(error_str)
+            watchdog.stop()
+            if (watchdog.get_abort_info() is not None):
+                sandboxErrors.append(watchdog.get_abort_error_str())
+            liveLog.finish(extra={"watchdog_abort": watchdog.get_abort_info()})
+            liveLog.join()
+
+        # Step 4: List the files that were produced, and apply the same retrieval rules as the Modal sandbox
+        fileSizes = {}
+        filesDownloaded = {}
+        fileErrors = []
+        filesTooBig = []
+        if (os.path.exists(workingDir)):
+            for root, dirs, files in os.walk(workingDir):
+                for file in files:
+                    localPath = os.path.join(root, file)
+                    relPath = os.path.relpath(localPath, workingDir)
+                    try:
+                        fileSizes[relPath] = os.path.getsize(localPath)
+                    except Exception as e:
+                        fileErrors.append(relPath)
+
+            filesToKeep = set(filesToDownload)
+            for filename in fileSizes.keys():
+                if (save_folder != "") and (filename.startswith(save_folder)):
+                    filesToKeep.add(filename)
+                if (RETAIN_FOLDER in filename):
+                    filesToKeep.add(filename)
+
+            for filename in sorted(fileSizes.keys()):
+                if (filename not in filesToKeep):
+                    continue
+                is_file_always_download = False
+                for always_download_file in ALWAYS_KEEP_FILES:
+                    if (filename.lower().endswith(always_download_file.lower())):
+                        is_file_always_download = True
+                        break
+                if (fileSizes[filename] > MAX_FILE_SIZE_BYTES) and (not is_file_always_download):
+                    print("Removing " + filename + " because it is too large (" + str(fileSizes[filename]) + " bytes). Maximum size is " + str(MAX_FILE_SIZE_BYTES) + " bytes.")
+                    filesTooBig.append(filename)
+                    try:
+                        os.remove(os.path.join(workingDir, filename))
+                    except Exception as e:
+                        pass
+                    continue
+                filesDownloaded[filename] = fileSizes[filename]
+
+        # Filter out certain files we don't want the debug agent to know about, that might contain sensitive information (like API keys)
+        for filePrefix in FILE_PREFIXES_TO_FILTER:
+            fileSizes = {file: size for file, size in fileSizes.items() if (not file.lower().startswith(filePrefix.lower()))}
+            filesDownloaded = {file: size for file, size in filesDownloaded.items() if (not file.lower().startswith(filePrefix.lower()))}
+
+        if (len(filesTooBig) > 0):
+            error_str = "The following files were too large to download (exceeded the maximum size of " + str(MAX_FILE_SIZE_BYTES) + " bytes): " + str(filesTooBig)
+            sandboxErrors.append(error_str)
+            print(error_str)
+
+        # Step 5: Load any files in the 'RETAIN' folder, that should be retained across runs
+        retain_files = {}
+        for file in filesDownloaded:
+            if (RETAIN_FOLDER in file and file.lower().endswith(".json")):
+                try:
+                    with open(os.path.join(workingDir, file), "r") as f:
+                        retain_files[file] = json.load(f)
+                except Exception as e:
+                    error_str = "An error occurred while attempting to load the retained file: " + str(e)
+                    sandboxErrors.append(error_str)
+                    print(error_str)
+
+        # Pack the output (the same keys as ModuleRunPythonInModal.runModalSandbox())
+        packedOut = {
+            "stdout": sandbox_stdout,
+            "stderr": sandbox_stderr,
+            "return_code": sandbox_returncode,
+            "filesDownloaded": filesDownloaded,
+            "fileErrors": fileErrors,
+            "filesTooBig": filesTooBig,
+            "download_exceeded_max_time": False,
+            "files_and_sizes": fileSizes,
+            "retain_files": retain_files,
+            "sandbox_errors": sandboxErrors,
+            "watchdog_abort": watchdog.get_abort_info() if (watchdog is not None) else None
+        }
+
+        # Return
+        print("LOCAL DEBUG: runLocalSandbox() completed (working directory: " + str(workingDir) + ")")
+        return packedOut
+
+
+    # Action: Run Program
+    def actionRunProgram(self, payload:dict):
+        errors = []
+        other_errors = []
+
+        # Get the input data
+        inputData = payload["input"]
+        # Check the input data
+        errors = self.checkInputRunProgram(inputData)
+
+        # If errors, append usage and exit
+        if (len(errors) > 0):
+            errors.append("USAGE: " + str(self.actions[self.ACTION_RUN_PROGRAM["name"]]))
+            return {
+                "input": inputData,
+                "output": None,
+                "errors": errors
+            }
+
+        # Step 1: Output directory: Create an output directory for this job
+        basePath = inputData["base_path"]
+        dateTimeStr = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        folderOut = basePath + "/local-python-" + dateTimeStr
+        try:
+            os.makedirs(folderOut, exist_ok=True)
+        except Exception as e:
+            errors.append("An error occurred while creating the output directory: " + str(e) + "\n" + traceback.format_exc())
+            return {
+                "input": inputData,
+                "output": None,
+                "errors": errors
+            }
+
+        # Step 2: Write the requirements.txt file, any supporting files, and the code as 'main.py'
+        filesToWrite = [{"filename": "requirements.txt", "contents": inputData["requirements.txt"]}]
+        filesToWrite.extend(inputData.get("supporting_files", []))
+        filesToWrite.append({"filename": "main.py", "contents": inputData["code"]})
+        for fileToWrite in filesToWrite:
+            filenameOut = folderOut + "/" + fileToWrite["filename"]
+            try:
+                os.makedirs(os.path.dirname(filenameOut), exist_ok=True)
+                with open(filenameOut, "w") as f:
+                    f.write(fileToWrite["contents"])
+            except Exception as e:
+                errors.append("An error occurred while writing the file (" + filenameOut + "): " + str(e) + "\n" + traceback.format_exc())
+                return {
+                    "input": inputData,
+                    "output": None,
+                    "errors": errors
+                }
+
+        # Step 3: Add the runscript.  In a virtual environment (LOCAL_VENV_PATH is set) the dependencies have already been installed; in a container they're installed here.
+        runScriptFile = folderOut + "/run.sh"
+        runScript = """#!/bin/bash
+
+# Make a directory for any files to be saved
+mkdir -p to_save
+
+# Make a directory for any datasets to be retained
+mkdir -p retain
+
+if [ -n "$LOCAL_VENV_PATH" ]; then
+    # Activate the (cached) virtual environment
+    source "$LOCAL_VENV_PATH/bin/activate"
+else
+    # Install any dependencies using pip
+    # Ignore the warning about installing as root
+    export PIP_ROOT_USER_ACTION=ignore
+    pip install -r requirements.txt >stdout.pip.txt 2>stderr.pip.txt
+
+    # Required for the LLM proxy
+    pip install litellm
+fi
+
+# Run the LLM proxy in the background, but save it's output to a file
+cd llm-proxy
+python -u llm-proxy-server.py >stdout.llm-proxy.txt 2>stderr.llm-proxy.txt &
+LLM_PROXY_PID=$!  # Capture the process ID of llm-proxy-server.py
+
+# Wait for the LLM proxy to start up
+sleep 5
+cd ..
+
+# Run the python script
+# Redirect stdout to stdout.python.txt and stderr to stderr.python.txt
+python main.py >stdout.python.txt 2>stderr.python.txt
+
+# Wait for any log files to be written
+sleep 3
+
+# Kill the LLM proxy process
+echo "Stopping llm-proxy-server.py (PID: $LLM_PROXY_PID)..."
+kill $LLM_PROXY_PID
+
+# Optional: Ensure the process is really terminated
+sleep 2
+if ps -p $LLM_PROXY_PID > /dev/null; then
+    echo "Force killing llm-proxy-server.py..."
+    kill -9 $LLM_PROXY_PID
+fi
+
+echo "Script completed."
+"""
+        # Warm container (see LOCAL_WARM_CONTAINER_MOUNT): The dependencies are only installed if they changed since the last run, and the LLM proxy is kept running between runs.
+        # (The virtual environment runtime already caches its environments, so it always uses the runscript above.)
+        keepSandboxWarm = (inputData.get("keep_sandbox_warm", False) == True) and (self.runtime != LOCAL_RUNTIME_VENV)
+        if (keepSandboxWarm):
+            runScript = """#!/bin/bash
+
+# Make a directory for any files to be saved
+mkdir -p to_save
+
+# Make a directory for any datasets to be retained
+mkdir -p retain
+
+# Install any dependencies using pip, unless they're already installed in the (warm) container
+# Ignore the warning about installing as root
+export PIP_ROOT_USER_ACTION=ignore
+REQUIREMENTS_HASH=$(sha256sum requirements.txt | cut -d' ' -f1)
+if [ -f """ + LOCAL_WARM_REQUIREMENTS_HASH_FILE + """ ] && [ "$REQUIREMENTS_HASH" == "$(cat """ + LOCAL_WARM_REQUIREMENTS_HASH_FILE + """)" ]; then
+    echo "Requirements (requirements.txt) are already installed in the (warm) container." >stdout.pip.txt
+    touch stderr.pip.txt
+else
+    pip install -r requirements.txt >stdout.pip.txt 2>stderr.pip.txt
+    if [ $? -eq 0 ]; then
+        # Record what's installed, so the next run can skip this
+        mkdir -p """ + os.path.dirname(LOCAL_WARM_REQUIREMENTS_HASH_FILE) + """
+        echo $REQUIREMENTS_HASH > """ + LOCAL_WARM_REQUIREMENTS_HASH_FILE + """
+    fi
+
+    # Required for the LLM proxy
+    pip install litellm
+fi
+
+# The LLM proxy is started once, and kept running between runs.  Each later run tells it to start counting the usage (and cost limit) for that run.
+LLM_PROXY_LOG_DIR=/tmp/llm-proxy-log
+if [ -f $LLM_PROXY_LOG_DIR/pid ] && kill -0 $(cat $LLM_PROXY_LOG_DIR/pid) 2>/dev/null; then
+    python -c "import json, urllib.request; print(urllib.request.urlopen(urllib.request.Request('http://localhost:${LLM_PROXY_PORT:-4000}/start-run', data=json.dumps({'path': '$(pwd)/llm-proxy'}).encode('utf-8'), headers={'Content-Type': 'application/json'})).read().decode('utf-8'))"
+else
+    mkdir -p $LLM_PROXY_LOG_DIR
+    cd llm-proxy
+    setsid nohup python -u llm-proxy-server.py >$LLM_PROXY_LOG_DIR/stdout.llm-proxy.txt 2>$LLM_PROXY_LOG_DIR/stderr.llm-proxy.txt &
+    echo $! > $LLM_PROXY_LOG_DIR/pid
+
+    # Wait for the LLM proxy to start up
+    sleep 5
+    cd ..
+fi
+
+# Run the python script
+# Redirect stdout to stdout.python.txt and stderr to stderr.python.txt
+python main.py >stdout.python.txt 2>stderr.python.txt
+
+# Wait for any log files to be written
+sleep 3
+
+# Keep a copy of the LLM proxy's output (from all the runs so far) with this run's output
+cp $LLM_PROXY_LOG_DIR/stdout.llm-proxy.txt $LLM_PROXY_LOG_DIR/stderr.llm-proxy.txt llm-proxy/
+
+echo "Script completed."
+"""
+        try:
+            with open(runScriptFile, "w") as f:
+                f.write(runScript)
+            os.chmod(runScriptFile, 0o755)
+        except Exception as e:
+            errors.append("An error occurred while writing the runscript file: " + str(e) + "\n" + traceback.format_exc())
+            return {
+                "input": inputData,
+                "output": None,
+                "errors": errors
+            }
+
+        # Step 4: Get the maximum runtime in seconds from the payload (`max_runtime_seconds`)
+        max_runtime_seconds = 600       # Default of 10 minutes
+        if ("max_runtime_seconds" in inputData) and (type(inputData["max_runtime_seconds"]) == int):
+            max_runtime_seconds = inputData["max_runtime_seconds"]
+            if (max_runtime_seconds < 1):
+                max_runtime_seconds = 1
+
+        apt_packages = ["git", "wget", "curl", "openjdk-17-jre"]    # Default packages
+        if ("apt_packages" in inputData) and (type(inputData["apt_packages"]) == list):
+            apt_packages = inputData["apt_packages"]
+
+        # Get the watchdog configuration (when to stop a run early -- see SandboxWatchdog), if any
+        watchdog_config = inputData.get("watchdog", None)
+
+        # Step 5: Run the sandbox
+        LOCAL_OUTPUT_SUBFOLDER = "local-output"
+        outputPath = folderOut + "/" + LOCAL_OUTPUT_SUBFOLDER
+        print("Running the local sandbox (" + str(self.runtime) + ")... (output is supressed to log files, in the output directory: " + outputPath + ")")
+        startTime = time.time()
+        result = None
+        container_completed = False
+        try:
+            result = self.runLocalSandbox(mount_folder = folderOut,
+                                pythonVersion=inputData["python_version"],
+                                apt_packages=apt_packages,
+                                runscriptName="./run.sh",
+                                requirements_file="requirements.txt",
+                                OUTPUT_SUBFOLDER = LOCAL_OUTPUT_SUBFOLDER,
+                                filesToDownload = ["stdout.python.txt", "stderr.python.txt", "stdout.pip.txt", "stderr.pip.txt", "llm-proxy/stdout.llm-proxy.txt", "llm-proxy/stderr.llm-proxy.txt", "llm-proxy/experiment-llm-usage.json", "llm-proxy/llm-proxy-response-cache.json", "log.json", "results.json"],
+                                timeout_seconds=max_runtime_seconds,
+                                watchdog_config=watchdog_config,
+                                warmContainerPath=(basePath if keepSandboxWarm else None))
+            print("Local sandbox finished.")
+            container_completed = True
+        except Exception as e:
+            errorStr = "An error occurred while running the local sandbox: " + str(e) + "\n" + traceback.format_exc()
+            print(errorStr)
+            other_errors.append(errorStr)
+
+        deltaTimeSeconds = round(time.time() - startTime, 1)
+
+        # Also try to re-import the log file, if it exists (log.json, in the output directory)
+        log = None
+        try:
+            with open(outputPath + "/log.json", "r") as f:
+                log = json.load(f)
+        except Exception as e:
+            pass
+
+        # Step 6: Pack the output
+        return_code = None
+        sandbox_errors = []
+        files_downloaded = []
+        files_errors = []
+        files_and_sizes = []
+        files_too_big = []
+        retain_files = {}
+        watchdog_abort = None
+        if (result == None):
+            other_errors.append("No result was returned from the local sandbox used to run this experiment.")
+        else:
+            return_code = result.get("return_code", None)
+            if (return_code == None):
+                other_errors.append("No return code was returned from the local sandbox used to run this experiment.")
+            sandbox_errors = result.get("sandbox_errors", [])
+            other_errors.extend(sandbox_errors)
+            files_downloaded = result.get("filesDownloaded", [])
+            files_errors = result.get("fileErrors", [])
+            files_and_sizes = result.get("files_and_sizes", [])
+            files_too_big = result.get("filesTooBig", [])
+            retain_files = result.get("retain_files", {})
+            watchdog_abort = result.get("watchdog_abort", None)
+
+        # Try to load the 'results.json' file
+        resultsJson = None
+        try:
+            with open(outputPath + "/results.json", "r") as f:
+                resultsJson = json.load(f)
+        except Exception as e:
+            pass
+
+        # Load the LLM proxy usage
+        llm_proxy_usage = None
+        try:
+            with open(outputPath + "/llm-proxy/experiment-llm-usage.json", "r") as f:
+                llm_proxy_usage = json.load(f)
+        except Exception as e:
+            pass
+
+        output = {
+            "pip.stdout": self.loadLogFile(outputPath + "/stdout.pip.txt"),
+            "pip.stderr": self.loadLogFile(outputPath + "/stderr.pip.txt"),
+            "python.stdout": self.loadLogFile(outputPath + "/stdout.python.txt"),
+            "python.stderr": self.loadLogFile(outputPath + "/stderr.python.txt"),
+            "log": log,
+            "results_json": resultsJson,
+            "llm_proxy_usage": llm_proxy_usage,
+            "files_downloaded": files_downloaded,
+            "files_errors": files_errors,
+            "files_and_sizes": files_and_sizes,
+            "files_too_big": files_too_big,
+            "retain_files": retain_files,
+            "watchdog_abort": watchdog_abort,
+            "file_path": outputPath,
+            "return_code": return_code,
+            "other_errors": other_errors,
+            "sandbox_errors": sandbox_errors,
+            "modal_container_completed": container_completed,      # Same key as the Modal module, for compatibility
+            "sandbox_backend": "local-" + str(self.runtime),
+            "statistics": {
+                "runtime_seconds": deltaTimeSeconds
+            }
+        }
+
+        print("LOCAL DEBUG: Finished actionRunProgram() (" + str(folderOut) + ")")
+        # Return
+        return {
+            "input": inputData,
+            "output": output,
+            "errors": errors
+        }
+
+
+    #
+    #   Tests
+    #
+
+    def runTestRunPythonLocal(self):
+        # Faux payload
+        payload = {
+            "input": {
+                "python_version": "3.12",
+                "requirements.txt": "numpy==1.26.4\n",
+                "code": "import numpy\nprint(\"hello world\")",
+                "supporting_files": [{"filename": "llm-proxy/llm-proxy-server.py", "contents": ""}],
+                "base_path": "generated/local-test",
+            }
+        }
+
+        # Run the action
+        result = self.runAction(self.ACTION_RUN_PROGRAM["name"], payload)
+
+        print("runTestRunPythonLocal result:")
+        print(json.dumps(result, indent=4))
+
+        # Check the result
+        if (result["output"] == None):
+            return False
+        if (len(result["errors"]) > 0):
+            return False
+        if ("return_code" not in result["output"]):
+            return False
+        if (result["output"]["return_code"] != 0):
+            return False
+
+        # Otherwise, assume OK
+        return True
+
+
+    def runTests(self):
+        # Run the tests
+        testResults = {}
+
+        # Test 1: Run a small program in the local sandbox
+        testResults[self.ACTION_RUN_PROGRAM["name"]] = self.runTestRunPythonLocal()
+
+        return testResults
+
+
+
+# Standalone entry point for testing this module independently
+if __name__ == "__main__":
+
+    # Instantiate the module
+    module = ModuleRunPythonLocal()
+    # Run the tests
+    result = module.runTests()
+    print("\n\n" + "-" * 80 + "\n\n")
+    print(result)
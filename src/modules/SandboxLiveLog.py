@@ -0,0 +1,359 @@
+# SandboxLiveLog.py
+# Live logs for sandbox runs.  While a program is running, its stdout, stderr, and `Logger` log entries are made available in the run folder (in `live/`),
+# so that an experiment can be followed while it runs (e.g. through the server's `/experimentlivelog` endpoint), rather than only after the run has finished.
+# `live/status.json` records whether the run is still going, and where its stdout, stderr, and log can be read from (relative to the run folder).
+import os
+import json
+import time
+import threading
+
+
+LIVE_LOG_FOLDER = "live"
+FILENAME_LIVE_STATUS = "status.json"
+LIVE_LOG_MAX_BYTES = 20 * 1024 * 1024           # Maximum size of each live stream (stdout, stderr) -- anything past this is dropped (the full output is still downloaded at the end)
+LIVE_LOG_ENTRY_MARKER = "@@CODESCIENTIST_LOG@@ "    # Prefix for the `Logger` log entries that are streamed through the sandbox's stdout
+LIVE_LOG_USAGE_MARKER = "@@CODESCIENTIST_LLM_USAGE@@ "      # Prefix for the LLM proxy usage (the `metadata` of `experiment-llm-usage.json`), streamed when it changes
+LIVE_LOG_PROGRAM_STARTED_MARKER = "@@CODESCIENTIST_PROGRAM_STARTED@@"   # Marks the point where the program starts running (i.e. after the dependencies are installed)
+LIVE_LOG_FORMAT_JSONL = "jsonl"                 # One log entry per line (streamed)
+LIVE_LOG_FORMAT_JSON = "json"                   # A `log.json` file, as written by the `Logger` (rewritten after each entry)
+
+# The events that listeners receive, as (eventType, data)
+LIVE_EVENT_STDOUT = "stdout"                    # data: a line of stdout
+LIVE_EVENT_STDERR = "stderr"                    # data: a line of stderr
+LIVE_EVENT_LOG = "log"                          # data: a `Logger` log entry (dict)
+LIVE_EVENT_LLM_USAGE = "llm_usage"              # data: the LLM proxy usage metadata (dict, e.g. `total_cost_usd`, `llm_cost_exceeded`)
+LIVE_EVENT_PROGRAM_STARTED = "program_started"  # data: None
+
+# Where the LLM proxy keeps its usage, relative to the run folder
+LIVE_LOG_LLM_USAGE_FILE = "llm-proxy/experiment-llm-usage.json"
+
+# A runscript snippet that streams the `Logger` entries (from `log.json`) to stdout as they're written, prefixed with LIVE_LOG_ENTRY_MARKER, and the
+# LLM proxy usage whenever it changes (prefixed with LIVE_LOG_USAGE_MARKER).  Run it immediately before the program.
+# Starts in the background, and sets LIVE_LOG_PID.
+LIVE_LOG_STREAMER_RUNSCRIPT = """
+# Stream any new log entries (from log.json) and LLM usage to stdout, so they can be followed while the program runs
+python -u - <<'CODESCIENTIST_LIVE_LOG_EOF' &
+import json, time
+print("%LIVE_LOG_PROGRAM_STARTED_MARKER%", flush=True)
+numSent = 0
+lastUsage = None
+while True:
+    try:
+        with open("log.json", "r") as f:
+            entries = json.load(f)
+        if (len(entries) < numSent):
+            numSent = 0
+        for entry in entries[numSent:]:
+            print("%LIVE_LOG_ENTRY_MARKER%" + json.dumps(entry), flush=True)
+        numSent = len(entries)
+    except Exception:
+        pass
+    try:
+        with open("%LIVE_LOG_LLM_USAGE_FILE%", "r") as f:
+            usage = json.dumps(json.load(f).get("metadata", {}))
+        if (usage != lastUsage):
+            print("%LIVE_LOG_USAGE_MARKER%" + usage, flush=True)
+            lastUsage = usage
+    except Exception:
+        pass
+    time.sleep(2)
+CODESCIENTIST_LIVE_LOG_EOF
+LIVE_LOG_PID=$!
+""".replace("%LIVE_LOG_ENTRY_MARKER%", LIVE_LOG_ENTRY_MARKER).replace("%LIVE_LOG_USAGE_MARKER%", LIVE_LOG_USAGE_MARKER).replace("%LIVE_LOG_PROGRAM_STARTED_MARKER%", LIVE_LOG_PROGRAM_STARTED_MARKER).replace("%LIVE_LOG_LLM_USAGE_FILE%", LIVE_LOG_LLM_USAGE_FILE)
+
+
+#
+#   Writing live logs
+#
+class SandboxLiveLog():
+    # Constructor.  `sources` are the files (relative to the run folder) that the stdout/stderr/log are read from.  By default, they're the files in the
+    # `live/` folder that are written by this class (e.g. from a sandbox's output streams).
+    def __init__(self, run_folder:str, sources:dict=None, log_format:str=LIVE_LOG_FORMAT_JSONL):
+        self.run_folder = run_folder
+        self.path_live = os.path.join(run_folder, LIVE_LOG_FOLDER)
+        os.makedirs(self.path_live, exist_ok=True)
+
+        self.sources = sources
+        if (self.sources is None):
+            self.sources = {
+                "stdout": os.path.join(LIVE_LOG_FOLDER, "stdout.txt"),
+                "stderr": os.path.join(LIVE_LOG_FOLDER, "stderr.txt"),
+                "log": os.path.join(LIVE_LOG_FOLDER, "log.jsonl"),
+            }
+        self.log_format = log_format
+
+        self.lock = threading.Lock()
+        self.bytes_written = {"stdout": 0, "stderr": 0}
+        self.captured_stdout = []       # The (non-log) stdout lines, so the caller still has the stdout after the stream has been consumed
+        self.captured_stderr = []
+        self.reader_threads = []
+        self.started = time.time()
+
+        self.listeners = []             # Called with (eventType, data) for everything seen while following a run (see LIVE_EVENT_*)
+        self.stop_event = threading.Event()
+
+
+    # Write the status file
+    def _save_status(self, running:bool, extra:dict=None):
+        status = {
+            "running": running,
+            "started": self.started,
+            "updated": time.time(),
+            "sources": self.sources,
+            "log_format": self.log_format,
+        }
+        if (extra is not None):
+            status.update(extra)
+        filenameOut = os.path.join(self.path_live, FILENAME_LIVE_STATUS)
+        filenameTemp = filenameOut + ".tmp"
+        with open(filenameTemp, "w") as f:
+            json.dump(status, f, indent=4)
+        os.replace(filenameTemp, filenameOut)
+
+    # Mark the run as started
+    def start(self):
+        self._save_status(running=True)
+
+    # Mark the run as finished
+    def finish(self, extra:dict=None):
+        self.stop_event.set()
+        self._save_status(running=False, extra=extra)
+
+
+    # Add a listener, that's called with (eventType, data) for each line of output, log entry, or LLM usage update, as it's seen
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, eventType:str, data):
+        for listener in self.listeners:
+            try:
+                listener(eventType, data)
+            except Exception as e:
+                print("WARNING: Live log listener raised an exception: " + str(e))
+
+
+    # Append text to one of the live streams ("stdout" or "stderr")
+    def write(self, streamName:str, text:str):
+        with self.lock:
+            data = text.encode("utf-8", errors="replace")
+            if (self.bytes_written[streamName] + len(data) > LIVE_LOG_MAX_BYTES):
+                data = data[:max(0, LIVE_LOG_MAX_BYTES - self.bytes_written[streamName])]
+                if (self.bytes_written[streamName] < LIVE_LOG_MAX_BYTES):
+                    data += ("\n(live " + streamName + " truncated at " + str(LIVE_LOG_MAX_BYTES) + " bytes)\n").encode("utf-8")
+
+            if (len(data) > 0):
+                if (streamName == "stdout"):
+                    self.captured_stdout.append(data.decode("utf-8", errors="replace"))
+                else:
+                    self.captured_stderr.append(data.decode("utf-8", errors="replace"))
+                with open(os.path.join(self.run_folder, self.sources[streamName]), "ab") as f:
+                    f.write(data)
+                self.bytes_written[streamName] += len(data)
+        # (Listeners still see everything, even past the size limit)
+        self._notify(streamName, text)
+
+    # Append one `Logger` entry to the live log
+    def add_log_entry(self, entry):
+        with self.lock:
+            with open(os.path.join(self.run_folder, self.sources["log"]), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        self._notify(LIVE_EVENT_LOG, entry)
+
+
+    # Follow the output streams of a (Modal) sandbox, in background threads.  Lines that start with LIVE_LOG_ENTRY_MARKER are log entries, and
+    # those that start with LIVE_LOG_USAGE_MARKER are LLM usage updates (see LIVE_LOG_STREAMER_RUNSCRIPT).
+    def follow_sandbox(self, sandbox):
+        def handle_line(line:str, streamName:str):
+            if (streamName == "stdout") and (line.startswith(LIVE_LOG_PROGRAM_STARTED_MARKER)):
+                self._notify(LIVE_EVENT_PROGRAM_STARTED, None)
+                return
+            if (streamName == "stdout") and (line.startswith(LIVE_LOG_ENTRY_MARKER)):
+                try:
+                    self.add_log_entry(json.loads(line[len(LIVE_LOG_ENTRY_MARKER):]))
+                    return
+                except json.JSONDecodeError:
+                    pass
+            if (streamName == "stdout") and (line.startswith(LIVE_LOG_USAGE_MARKER)):
+                try:
+                    self._notify(LIVE_EVENT_LLM_USAGE, json.loads(line[len(LIVE_LOG_USAGE_MARKER):]))
+                    return
+                except json.JSONDecodeError:
+                    pass
+            self.write(streamName, line)
+
+        def follow_stream(stream, streamName:str):
+            # The stream is read in chunks, which don't necessarily end on a line boundary
+            buffer = ""
+            try:
+                for chunk in stream:
+                    buffer += chunk
+                    while ("\n" in buffer):
+                        line, buffer = buffer.split("\n", 1)
+                        handle_line(line + "\n", streamName)
+            except Exception as e:
+                print("WARNING: Stopped following the sandbox " + streamName + ": " + str(e))
+            if (len(buffer) > 0):
+                handle_line(buffer, streamName)
+
+        self.reader_threads = [
+            threading.Thread(target=follow_stream, args=(sandbox.stdout, "stdout"), daemon=True),
+            threading.Thread(target=follow_stream, args=(sandbox.stderr, "stderr"), daemon=True),
+        ]
+        for thread in self.reader_threads:
+            thread.start()
+
+    # Follow a run that writes its output directly to the `sources` files (e.g. a local sandbox), by polling them in a background thread until
+    # the run is finished.  Only needed if there are listeners -- the files can be read directly otherwise.
+    def follow_files(self, poll_interval_seconds:float=1.0):
+        def poll_files():
+            offsets = {"stdout": 0, "stderr": 0}
+            partial = {"stdout": "", "stderr": ""}
+            numLogEntries = 0
+            logMtime = None
+            lastUsage = None
+            programStarted = False
+            filenameUsage = os.path.join(os.path.dirname(os.path.join(self.run_folder, self.sources["log"])), LIVE_LOG_LLM_USAGE_FILE)
+
+            while True:
+                finished = self.stop_event.is_set()     # (checked before reading, so that everything written before the run finished is seen)
+
+                # stdout/stderr (the program redirects its output to these, so they appear once it has started)
+                for streamName in ["stdout", "stderr"]:
+                    filenameIn = os.path.join(self.run_folder, self.sources[streamName])
+                    if (not os.path.exists(filenameIn)):
+                        continue
+                    if (not programStarted):
+                        programStarted = True
+                        self._notify(LIVE_EVENT_PROGRAM_STARTED, None)
+                    with open(filenameIn, "rb") as f:
+                        f.seek(offsets[streamName])
+                        data = f.read()
+                    offsets[streamName] += len(data)
+                    partial[streamName] += data.decode("utf-8", errors="replace")
+                    while ("\n" in partial[streamName]):
+                        line, partial[streamName] = partial[streamName].split("\n", 1)
+                        self._notify(streamName, line + "\n")
+
+                # Log entries
+                filenameLog = os.path.join(self.run_folder, self.sources["log"])
+                try:
+                    mtime = os.path.getmtime(filenameLog)
+                    if (mtime != logMtime):
+                        with open(filenameLog, "r") as f:
+                            if (self.log_format == LIVE_LOG_FORMAT_JSON):
+                                entries = json.load(f)
+                            else:
+                                entries = [json.loads(line) for line in f if (len(line.strip()) > 0)]
+                        logMtime = mtime
+                        for entry in entries[numLogEntries:]:
+                            self._notify(LIVE_EVENT_LOG, entry)
+                        numLogEntries = max(numLogEntries, len(entries))
+                except Exception:
+                    pass        # Not written yet, or in the middle of being rewritten
+
+                # LLM usage
+                try:
+                    with open(filenameUsage, "r") as f:
+                        usage = json.load(f).get("metadata", {})
+                    if (usage != lastUsage):
+                        self._notify(LIVE_EVENT_LLM_USAGE, usage)
+                        lastUsage = usage
+                except Exception:
+                    pass
+
+                if (finished):
+                    break
+                self.stop_event.wait(poll_interval_seconds)
+
+        thread = threading.Thread(target=poll_files, daemon=True)
+        self.reader_threads.append(thread)
+        thread.start()
+
+    # Wait for the output streams to finish (after the sandbox has exited)
+    def join(self, timeout_seconds:float=10):
+        for thread in self.reader_threads:
+            thread.join(timeout=timeout_seconds)
+
+    # The stdout/stderr seen so far
+    def get_captured_stdout(self):
+        with self.lock:
+            return "".join(self.captured_stdout)
+
+    def get_captured_stderr(self):
+        with self.lock:
+            return "".join(self.captured_stderr)
+
+
+#
+#   Reading live logs
+#
+
+# Find the most recently started run (with a live log) in an experiment folder.  Returns None if there isn't one.
+def findLatestLiveRunFolder(experimentPath:str):
+    latestFolder = None
+    latestStarted = None
+    for name in os.listdir(experimentPath):
+        filenameStatus = os.path.join(experimentPath, name, LIVE_LOG_FOLDER, FILENAME_LIVE_STATUS)
+        if (not os.path.exists(filenameStatus)):
+            continue
+        try:
+            with open(filenameStatus, "r") as f:
+                started = json.load(f).get("started", 0)
+        except Exception:
+            continue
+        if (latestStarted is None) or (started > latestStarted):
+            latestFolder = os.path.join(experimentPath, name)
+            latestStarted = started
+    return latestFolder
+
+# Read (up to `max_bytes` of) a text file, starting at a byte offset.  Only complete lines are returned, unless a single line is longer than `max_bytes`.
+def _readFromOffset(filenameIn:str, offset:int, max_bytes:int):
+    if (not os.path.exists(filenameIn)):
+        return "", offset
+    with open(filenameIn, "rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    if (len(data) == max_bytes):
+        lastNewline = data.rfind(b"\n")
+        if (lastNewline >= 0):
+            data = data[:lastNewline+1]
+    return data.decode("utf-8", errors="replace"), offset + len(data)
+
+# Read a run's live log, from the given offsets (byte offsets for stdout/stderr, the number of entries already seen for the log).  Returns the new
+# content, and the offsets to use for the next read.
+def readLiveLog(runFolder:str, stdout_offset:int=0, stderr_offset:int=0, log_offset:int=0, max_bytes:int=65536):
+    with open(os.path.join(runFolder, LIVE_LOG_FOLDER, FILENAME_LIVE_STATUS), "r") as f:
+        status = json.load(f)
+    sources = status.get("sources", {})
+
+    stdout, stdout_offset = _readFromOffset(os.path.join(runFolder, sources.get("stdout", "")), stdout_offset, max_bytes)
+    stderr, stderr_offset = _readFromOffset(os.path.join(runFolder, sources.get("stderr", "")), stderr_offset, max_bytes)
+
+    # Log entries
+    entries = []
+    filenameLog = os.path.join(runFolder, sources.get("log", ""))
+    if (os.path.isfile(filenameLog)):
+        try:
+            with open(filenameLog, "r") as f:
+                if (status.get("log_format", LIVE_LOG_FORMAT_JSONL) == LIVE_LOG_FORMAT_JSON):
+                    entries = json.load(f)
+                else:
+                    entries = [json.loads(line) for line in f if (len(line.strip()) > 0)]
+        except Exception:
+            entries = []        # e.g. the log is in the middle of being rewritten -- try again on the next read
+    newEntries = entries[log_offset:]
+    if (len(entries) < log_offset):
+        newEntries = []
+
+    return {
+        "run_folder": runFolder,
+        "running": status.get("running", False),
+        "started": status.get("started", None),
+        "updated": status.get("updated", None),
+        "stdout": stdout,
+        "stdout_offset": stdout_offset,
+        "stderr": stderr,
+        "stderr_offset": stderr_offset,
+        "log": newEntries,
+        "log_offset": log_offset + len(newEntries),
+    }
@@ -0,0 +1,170 @@
+# SandboxWatchdog.py
+# Stops a sandbox run early, when it's clear that letting it continue until its timeout won't produce anything useful.  The watchdog listens to a
+# run's live log (see SandboxLiveLog), and aborts the run if:
+#   - The LLM proxy's cost limit has been exceeded (every further LLM call will just be refused)
+#   - The same error is reported many times in a row (e.g. the program is stuck retrying something that will never work)
+#   - The program hasn't produced any output (stdout, stderr, or log entries) for a long time
+# The reason for the abort is recorded, so that it can be passed back in the execution result (and shown to the reflection step).
+import re
+import time
+import threading
+
+from SandboxLiveLog import *
+
+
+WATCHDOG_REASON_COST_LIMIT = "llm_cost_limit_exceeded"
+WATCHDOG_REASON_REPEATED_ERRORS = "repeated_errors"
+WATCHDOG_REASON_NO_OUTPUT = "no_output"
+
+# Defaults (each can be changed through the `watchdog` configuration in the run payload -- see parseWatchdogConfig())
+WATCHDOG_DEFAULT_CONFIG = {
+    "enabled": True,
+    "abort_on_cost_limit": True,            # Abort once the LLM proxy reports that the cost limit has been exceeded
+    "max_identical_errors": 20,             # Abort after this many identical errors in a row (0 to disable)
+    "max_silence_seconds": 60*15,           # Abort if the program produces no output for this long (0 to disable).  Only counted once the program has started (i.e. not while installing dependencies).
+    "check_interval_seconds": 5,
+}
+
+# Lines on stderr that look like the last line of a Python traceback (e.g. "ValueError: ...")
+REGEX_STDERR_ERROR = re.compile(r"^([A-Za-z_][\w.]*(Error|Exception|Exit|Interrupt)):\s*(.*)$")
+
+
+# Fill in any missing/invalid values in a watchdog configuration with the defaults
+def parseWatchdogConfig(config:dict=None):
+    parsed = dict(WATCHDOG_DEFAULT_CONFIG)
+    if (type(config) != dict):
+        return parsed
+    for key, defaultValue in WATCHDOG_DEFAULT_CONFIG.items():
+        if (key not in config):
+            continue
+        if (type(defaultValue) == bool) and (type(config[key]) == bool):
+            parsed[key] = config[key]
+        elif (type(defaultValue) != bool) and (type(config[key]) in [int, float]) and (config[key] >= 0):
+            parsed[key] = config[key]
+    return parsed
+
+
+class SandboxWatchdog():
+    # Constructor.  `abort_action` is called (once, with no arguments) to stop the run if any of the abort conditions are met.
+    def __init__(self, config:dict=None, abort_action=None):
+        self.config = parseWatchdogConfig(config)
+        self.abort_action = abort_action
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.monitor_thread = None
+
+        self.time_started = time.time()
+        self.time_program_started = None
+        self.time_last_output = None
+        self.last_error = None
+        self.num_identical_errors = 0
+        self.abort_info = None
+
+
+    # Set (or change) the action used to stop the run -- e.g. once the sandbox has been created
+    def set_abort_action(self, abort_action):
+        with self.lock:
+            self.abort_action = abort_action
+
+    # Follow a live log
+    def watch(self, liveLog):
+        if (not self.config["enabled"]):
+            return
+        liveLog.add_listener(self.handle_event)
+        self.monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self.monitor_thread.start()
+
+    # Stop watching (e.g. once the run has finished)
+    def stop(self):
+        self.stop_event.set()
+
+
+    # Live log listener
+    def handle_event(self, eventType:str, data):
+        now = time.time()
+        errorMessage = None
+        with self.lock:
+            if (eventType == LIVE_EVENT_PROGRAM_STARTED):
+                self.time_program_started = now
+                self.time_last_output = now
+                return
+            if (eventType in [LIVE_EVENT_STDOUT, LIVE_EVENT_STDERR, LIVE_EVENT_LOG]):
+                self.time_last_output = now
+
+        if (eventType == LIVE_EVENT_LLM_USAGE):
+            if (self.config["abort_on_cost_limit"]) and (type(data) == dict) and (data.get("llm_cost_exceeded", False) == True):
+                self.abort(WATCHDOG_REASON_COST_LIMIT, "The LLM proxy cost limit was exceeded (total cost: $" + str(data.get("total_cost_usd", None)) + ", limit: $" + str(data.get("max_cost_usd", None)) + "), so any further LLM calls would be refused.")
+            return
+
+        # Errors: either `Logger` entries of type "error", or the last line of a traceback on stderr
+        if (eventType == LIVE_EVENT_LOG) and (type(data) == dict) and (str(data.get("type", "")).lower() == "error"):
+            errorMessage = str(data.get("message", ""))
+        elif (eventType == LIVE_EVENT_STDERR):
+            match = REGEX_STDERR_ERROR.match(data.strip())
+            if (match is not None):
+                errorMessage = data.strip()
+        if (errorMessage is None):
+            # Progress (anything on stdout, or a non-error log entry) ends a streak of identical errors, so only consecutive errors are counted.
+            # Other stderr lines (e.g. the rest of a traceback, or warnings) don't, since they are usually printed alongside each error.
+            if (eventType in [LIVE_EVENT_STDOUT, LIVE_EVENT_LOG]):
+                with self.lock:
+                    self.last_error = None
+                    self.num_identical_errors = 0
+            return
+
+        maxIdentical = self.config["max_identical_errors"]
+        with self.lock:
+            if (errorMessage == self.last_error):
+                self.num_identical_errors += 1
+            else:
+                self.last_error = errorMessage
+                self.num_identical_errors = 1
+            numIdentical = self.num_identical_errors
+        if (maxIdentical > 0) and (numIdentical >= maxIdentical):
+            self.abort(WATCHDOG_REASON_REPEATED_ERRORS, "The same error was reported " + str(numIdentical) + " times in a row: " + errorMessage[:1000])
+
+
+    # Periodically check for a lack of output
+    def _monitor(self):
+        while (not self.stop_event.wait(self.config["check_interval_seconds"])):
+            maxSilence = self.config["max_silence_seconds"]
+            with self.lock:
+                timeLastOutput = self.time_last_output
+            if (maxSilence > 0) and (timeLastOutput is not None) and (time.time() - timeLastOutput > maxSilence):
+                self.abort(WATCHDOG_REASON_NO_OUTPUT, "The program did not produce any output (stdout, stderr, or log entries) for more than " + str(maxSilence) + " seconds.")
+            if (self.abort_info is not None):
+                return
+
+
+    # Abort the run (only the first reason is kept)
+    def abort(self, reason:str, message:str):
+        with self.lock:
+            if (self.abort_info is not None):
+                return
+            self.abort_info = {
+                "reason": reason,
+                "message": message,
+                "elapsed_seconds": round(time.time() - self.time_started, 1),
+            }
+            abortAction = self.abort_action
+
+        print("WATCHDOG: Aborting the run early (" + reason + "): " + message)
+        self.stop_event.set()
+        if (abortAction is not None):
+            try:
+                abortAction()
+            except Exception as e:
+                print("WARNING: The watchdog could not stop the run: " + str(e))
+
+    # The reason the run was aborted (or None, if it wasn't)
+    def get_abort_info(self):
+        with self.lock:
+            return self.abort_info
+
+    # A short description of the abort, for the list of sandbox errors
+    def get_abort_error_str(self):
+        abortInfo = self.get_abort_info()
+        if (abortInfo is None):
+            return None
+        return "The run was stopped early by the watchdog after " + str(abortInfo["elapsed_seconds"]) + " seconds (" + abortInfo["reason"] + "): " + abortInfo["message"]